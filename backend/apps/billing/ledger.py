@@ -0,0 +1,132 @@
+"""
+账单每日累计台账
+
+BillDailyLedger 为每张账单的账期内每天保存一行：当日明细金额/数量与账期开始至当天的累计值（前缀和），
+"截至某日的应收费用"变成按 (账单, 日期) 的一次索引查询，不再加载当月全部明细求和。
+
+台账由以下途径维护：
+  - 账单明细保存/删除后，在事务提交时重建所属账单的台账（同一事务内的多次变更只重建一次）
+  - 每日计费（information_systems.billing.run_daily_billing）完成后重建账期包含计费日期的账单台账，
+    兜底 queryset.update() / bulk_create 等不触发信号的批量写入
+重建以账单为单位：一次分组聚合取出明细的每日金额，在内存中计算前缀和后整体替换。
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, Sum
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+_pending = threading.local()
+
+
+def build_entries(bills):
+    """
+    计算账单的台账行（未保存）
+
+    Args:
+        bills: 可迭代的 (bill_id, billing_period_start, billing_period_end)
+    """
+    from .models import BillDailyLedger, BillItem
+
+    periods = {bill_id: (start, end) for bill_id, start, end in bills}
+    if not periods:
+        return []
+
+    daily = {}
+    totals = BillItem.objects.filter(bill_id__in=list(periods)).order_by().values(
+        'bill_id', 'billing_date'
+    ).annotate(day_amount=Sum('amount'), day_count=Count('pk')).values_list(
+        'bill_id', 'billing_date', 'day_amount', 'day_count'
+    )
+    for bill_id, billing_date, amount, count in totals:
+        daily[(bill_id, billing_date)] = (amount or Decimal('0'), count)
+
+    entries = []
+    for bill_id, (start, end) in periods.items():
+        cumulative_amount, cumulative_count = Decimal('0'), 0
+        day = start
+        while day <= end:
+            amount, count = daily.get((bill_id, day), (Decimal('0'), 0))
+            cumulative_amount += amount
+            cumulative_count += count
+            entries.append(BillDailyLedger(
+                bill_id=bill_id,
+                billing_date=day,
+                item_count=count,
+                amount=amount,
+                cumulative_item_count=cumulative_count,
+                cumulative_amount=cumulative_amount,
+            ))
+            day += timedelta(days=1)
+    return entries
+
+
+def refresh_ledgers(bill_ids):
+    """
+    重建指定账单的台账（已删除的账单忽略）
+
+    Returns:
+        int: 重建的账单数
+    """
+    from .models import BillDailyLedger, MonthlyBill
+
+    bill_ids = list(bill_ids)
+    refreshed = 0
+    for offset in range(0, len(bill_ids), BATCH_SIZE):
+        chunk = bill_ids[offset:offset + BATCH_SIZE]
+        bills = list(MonthlyBill.objects.filter(pk__in=chunk).values_list(
+            'id', 'billing_period_start', 'billing_period_end'
+        ))
+        entries = build_entries(bills)
+        with transaction.atomic():
+            BillDailyLedger.objects.filter(bill_id__in=chunk).delete()
+            BillDailyLedger.objects.bulk_create(entries, batch_size=1000)
+        refreshed += len(bills)
+    return refreshed
+
+
+def refresh_ledgers_for_date(billing_date):
+    """重建账期包含 billing_date 的所有账单的台账"""
+    from .models import MonthlyBill
+
+    bill_ids = MonthlyBill.objects.filter(
+        billing_period_start__lte=billing_date, billing_period_end__gte=billing_date
+    ).values_list('id', flat=True)
+    refreshed = refresh_ledgers(bill_ids)
+    logger.info(f'账单累计台账 {billing_date}: 重建 {refreshed} 张账单')
+    return refreshed
+
+
+def schedule_refresh(bill_id):
+    """在当前事务提交后重建账单台账；同一事务内多次调用合并为一次重建"""
+    pending = getattr(_pending, 'bill_ids', None)
+    if pending is None:
+        pending = _pending.bill_ids = set()
+    pending.add(bill_id)
+    # 第一个回调处理全部待重建账单，其余回调为空操作；事务回滚时遗留的账单在下次提交时一并重建
+    transaction.on_commit(_flush)
+
+
+def _flush():
+    bill_ids, _pending.bill_ids = getattr(_pending, 'bill_ids', set()), set()
+    if not bill_ids:
+        return
+    try:
+        refresh_ledgers(bill_ids)
+    except Exception as e:
+        logger.error(f'重建账单累计台账失败: {str(e)}', exc_info=True)
+
+
+def amount_through(bill_id, day):
+    """截至 day（含）的累计金额；台账中没有该日时返回 None"""
+    from .models import BillDailyLedger
+
+    return BillDailyLedger.objects.filter(bill_id=bill_id, billing_date=day).values_list(
+        'cumulative_amount', flat=True
+    ).first()
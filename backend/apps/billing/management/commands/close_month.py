@@ -0,0 +1,62 @@
+"""
+Django管理命令：月末出账（补跑、重跑指定账期或分片，查看进度）
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.billing.month_close import dispatch_month_close, month_close_progress, previous_month, run_month_close
+
+
+class Command(BaseCommand):
+    help = '按租户分片为指定账期生成月度账单，已完成的分片默认跳过'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='账期（YYYY-MM），默认上月')
+        parser.add_argument('--shards', help='只处理指定分片，逗号分隔，如 0,3,7')
+        parser.add_argument('--shard-count', type=int, help='分片总数，默认 settings.MONTH_CLOSE_SHARDS')
+        parser.add_argument('--force', action='store_true', help='已完成的分片也重新出账')
+        parser.add_argument('--async', dest='dispatch', action='store_true', help='派发 Celery 任务而不是在当前进程执行')
+        parser.add_argument('--progress', action='store_true', help='只查看出账进度')
+
+    def handle(self, *args, **options):
+        try:
+            if options['month']:
+                year, month = (int(part) for part in options['month'].split('-'))
+                if not 1 <= month <= 12:
+                    raise ValueError(options['month'])
+            else:
+                year, month = previous_month()
+            shards = [int(shard) for shard in options['shards'].split(',')] if options['shards'] else None
+        except ValueError as e:
+            raise CommandError(f'参数无效: {e}')
+
+        if options['progress']:
+            self._write_progress(year, month, options['shard_count'])
+            return
+
+        if options['dispatch']:
+            dispatched = dispatch_month_close(year, month, options['shard_count'], shards, options['force'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{year}-{month:02d}: 已派发 {len(dispatched)} 个分片任务，可用 --progress 查看进度"
+            ))
+            return
+
+        summary = run_month_close(year, month, options['shard_count'], shards, options['force'])
+        self.stdout.write(
+            f"{summary['period']}: 完成 {len(summary['completed'])} 个分片，"
+            f"跳过 {len(summary['skipped'])} 个，共 {summary['bill_count']} 张账单、"
+            f"{summary['item_count']} 条明细，金额合计 {summary['total_amount']}"
+        )
+        if summary['failed']:
+            self.stdout.write(self.style.ERROR(f"失败分片: {','.join(map(str, summary['failed']))}"))
+        else:
+            self.stdout.write(self.style.SUCCESS('月末出账完成'))
+
+    def _write_progress(self, year, month, shard_count):
+        progress = month_close_progress(year, month, shard_count)
+        self.stdout.write(
+            f"{year}-{month:02d}（{progress['shard_count']} 个分片）: 已完成 {progress['completed']}，"
+            f"执行中 {progress['running']}，等待 {progress['pending']}，失败 {progress['failed']}；"
+            f"共 {progress['bill_count']} 张账单，金额合计 {progress['total_amount']}"
+        )
+        if progress['failed_shards']:
+            self.stdout.write(self.style.ERROR(f"失败分片: {','.join(map(str, progress['failed_shards']))}"))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-17 02:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillDailyLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_date', models.DateField(verbose_name='日期')),
+                ('item_count', models.IntegerField(default=0, verbose_name='当日明细数')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='当日金额')),
+                ('cumulative_item_count', models.IntegerField(default=0, verbose_name='累计明细数')),
+                ('cumulative_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='累计金额')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('bill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='billing.monthlybill', verbose_name='月度账单')),
+            ],
+            options={
+                'verbose_name': '账单每日累计台账',
+                'verbose_name_plural': '账单每日累计台账',
+                'ordering': ['bill', 'billing_date'],
+                'unique_together': {('bill', 'billing_date')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-17 02:31
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """按已有的账单编号（BILL-YYYYMM-租户编号-序号）与支付编号（PAY-YYYYMMDDHHMMSS-序号）初始化计数器"""
+    MonthlyBill = apps.get_model('billing', 'MonthlyBill')
+    Payment = apps.get_model('billing', 'Payment')
+    NumberSequence = apps.get_model('billing', 'NumberSequence')
+
+    last_values = {}
+
+    def track(key, seq):
+        if seq.isdigit():
+            last_values[key] = max(last_values.get(key, 0), int(seq))
+
+    for number in MonthlyBill.objects.values_list('bill_number', flat=True).iterator():
+        head, _, seq = number.rpartition('-')
+        if head.startswith('BILL-') and len(head) > 12:
+            track((f'BILL-{head[12:]}', head[5:11]), seq)
+    for number in Payment.objects.values_list('payment_number', flat=True).iterator():
+        head, _, seq = number.rpartition('-')
+        if head.startswith('PAY-') and len(head) >= 12:
+            track(('PAY', head[4:12]), seq)
+
+    NumberSequence.objects.bulk_create(
+        [NumberSequence(prefix=prefix, period=period, last_value=value) for (prefix, period), value in last_values.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_billdailyledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=100, verbose_name='前缀')),
+                ('period', models.CharField(max_length=20, verbose_name='账期')),
+                ('last_value', models.BigIntegerField(default=0, verbose_name='最大序号')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '编号序列',
+                'verbose_name_plural': '编号序列',
+                'unique_together': {('prefix', 'period')},
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
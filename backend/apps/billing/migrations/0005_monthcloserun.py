@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-17 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_numbersequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthCloseRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_year', models.IntegerField(verbose_name='账期年份')),
+                ('billing_month', models.IntegerField(verbose_name='账期月份')),
+                ('shard', models.IntegerField(verbose_name='分片')),
+                ('shard_count', models.IntegerField(verbose_name='分片总数')),
+                ('status', models.CharField(choices=[('pending', '等待执行'), ('running', '执行中'), ('completed', '已完成'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('tenant_count', models.IntegerField(default=0, verbose_name='租户数')),
+                ('bill_count', models.IntegerField(default=0, verbose_name='生成账单数')),
+                ('item_count', models.IntegerField(default=0, verbose_name='账单明细数')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='账单金额合计')),
+                ('error_message', models.TextField(blank=True, verbose_name='错误信息')),
+                ('celery_task_id', models.CharField(blank=True, max_length=255, verbose_name='Celery任务ID')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+            ],
+            options={
+                'verbose_name': '月末出账运行记录',
+                'verbose_name_plural': '月末出账运行记录',
+                'ordering': ['-billing_year', '-billing_month', 'shard'],
+                'unique_together': {('billing_year', 'billing_month', 'shard', 'shard_count')},
+            },
+        ),
+    ]
@@ -3,6 +3,8 @@
 """
 
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
@@ -127,28 +129,39 @@ class MonthlyBill(models.Model):
         if end_date.month != self.billing_month or end_date.year != self.billing_year:
             return Decimal('0.00')
 
-        # 获取该月的所有账单明细
-        items = self.items.filter(
-            billing_date__gte=self.billing_period_start,
-            billing_date__lte=end_date
+        # 优先读取每日累计台账，台账尚未生成时直接在数据库中汇总
+        from .ledger import amount_through
+        total = amount_through(self.pk, end_date)
+        if total is None:
+            total = self.items.filter(
+                billing_date__gte=self.billing_period_start,
+                billing_date__lte=end_date
+            ).aggregate(total=models.Sum('amount'))['total'] or Decimal('0')
+        return total.quantize(Decimal('0.01'))
+
+    @property
+    def number_sequence_key(self):
+        """账单编号序列 (前缀, 账期)：每个租户每个账期一个序列"""
+        return f"BILL-{self.tenant.code}", f"{self.billing_year}{self.billing_month:02d}"
+
+    @classmethod
+    def assign_numbers(cls, bills):
+        """为一批尚未编号的账单分配编号（一次往返，需已加载 tenant）"""
+        from .numbering import assign_numbers
+        assign_numbers(
+            [bill for bill in bills if not bill.bill_number],
+            key=lambda bill: bill.number_sequence_key,
+            assign=lambda bill, seq: setattr(bill, 'bill_number', bill.format_number(seq)),
         )
 
-        # 累计费用
-        total = sum([item.amount for item in items])
-        return total
+    def format_number(self, seq):
+        # 账单编号格式: BILL-YYYYMM-租户编号-序号
+        return f"BILL-{self.billing_year}{self.billing_month:02d}-{self.tenant.code}-{seq:04d}"
 
     def save(self, *args, **kwargs):
         """保存时自动生成账单编号"""
         if not self.bill_number:
-            # 生成账单编号格式: BILL-YYYYMM-租户编号-序号
-            prefix = f"BILL-{self.billing_year}{self.billing_month:02d}-{self.tenant.code}"
-            # 查找同月同租户的账单数量
-            count = MonthlyBill.objects.filter(
-                tenant=self.tenant,
-                billing_year=self.billing_year,
-                billing_month=self.billing_month
-            ).count()
-            self.bill_number = f"{prefix}-{count + 1:04d}"
+            MonthlyBill.assign_numbers([self])
 
         super().save(*args, **kwargs)
 
@@ -260,6 +273,101 @@ class BillItem(models.Model):
         super().save(*args, **kwargs)
 
 
+class MonthCloseRun(models.Model):
+    """月末出账运行记录（按租户分片，已完成的分片在重跑时跳过）"""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('等待执行')
+        RUNNING = 'running', _('执行中')
+        COMPLETED = 'completed', _('已完成')
+        FAILED = 'failed', _('失败')
+
+    billing_year = models.IntegerField(verbose_name=_('账期年份'))
+    billing_month = models.IntegerField(verbose_name=_('账期月份'))
+    shard = models.IntegerField(verbose_name=_('分片'))
+    shard_count = models.IntegerField(verbose_name=_('分片总数'))
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name=_('状态')
+    )
+    tenant_count = models.IntegerField(default=0, verbose_name=_('租户数'))
+    bill_count = models.IntegerField(default=0, verbose_name=_('生成账单数'))
+    item_count = models.IntegerField(default=0, verbose_name=_('账单明细数'))
+    total_amount = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('账单金额合计')
+    )
+    error_message = models.TextField(blank=True, verbose_name=_('错误信息'))
+    celery_task_id = models.CharField(max_length=255, blank=True, verbose_name=_('Celery任务ID'))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_('开始时间'))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_('结束时间'))
+
+    class Meta:
+        verbose_name = _('月末出账运行记录')
+        verbose_name_plural = _('月末出账运行记录')
+        ordering = ['-billing_year', '-billing_month', 'shard']
+        unique_together = ['billing_year', 'billing_month', 'shard', 'shard_count']
+
+    def __str__(self):
+        return f"{self.billing_year}-{self.billing_month:02d} - {self.shard}/{self.shard_count} - {self.get_status_display()}"
+
+
+class NumberSequence(models.Model):
+    """
+    编号序列计数器（账单编号、支付编号的序号）
+
+    按 (前缀, 账期) 计数，last_value 为已分配的最大序号；分配方式见 numbering.allocate_numbers。
+    """
+
+    prefix = models.CharField(max_length=100, verbose_name=_('前缀'))
+    period = models.CharField(max_length=20, verbose_name=_('账期'))
+    last_value = models.BigIntegerField(default=0, verbose_name=_('最大序号'))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('更新时间'))
+
+    class Meta:
+        verbose_name = _('编号序列')
+        verbose_name_plural = _('编号序列')
+        unique_together = ['prefix', 'period']
+
+    def __str__(self):
+        return f"{self.prefix}/{self.period}: {self.last_value}"
+
+
+class BillDailyLedger(models.Model):
+    """
+    账单每日累计台账
+
+    账期内每天一行，累计金额为账期开始到当天（含）所有账单明细金额之和，
+    "截至某日的应收费用"按 (账单, 日期) 直接读取。账单明细变化后由 ledger.refresh_ledgers 重建。
+    """
+
+    bill = models.ForeignKey(
+        MonthlyBill,
+        on_delete=models.CASCADE,
+        related_name='ledger_entries',
+        verbose_name=_('月度账单')
+    )
+    billing_date = models.DateField(verbose_name=_('日期'))
+    item_count = models.IntegerField(default=0, verbose_name=_('当日明细数'))
+    amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name=_('当日金额'))
+    cumulative_item_count = models.IntegerField(default=0, verbose_name=_('累计明细数'))
+    cumulative_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name=_('累计金额'))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('更新时间'))
+
+    class Meta:
+        verbose_name = _('账单每日累计台账')
+        verbose_name_plural = _('账单每日累计台账')
+        ordering = ['bill', 'billing_date']
+        unique_together = ['bill', 'billing_date']
+
+    def __str__(self):
+        return f"{self.bill_id} - {self.billing_date.strftime('%Y-%m-%d')} - ¥{self.cumulative_amount}"
+
+
 
 
 class Payment(models.Model):
@@ -370,17 +478,29 @@ class Payment(models.Model):
     def __str__(self):
         return f"{self.payment_number} - ¥{self.amount}"
 
+    @classmethod
+    def assign_numbers(cls, payments, now=None):
+        """为一批尚未编号的支付记录分配编号（一次往返），序号按天递增"""
+        from .numbering import assign_numbers
+        now = now or timezone.now()
+        # 生成支付编号格式: PAY-YYYYMMDDHHMMSS-序号
+        stamp = now.strftime('%Y%m%d%H%M%S')
+        assign_numbers(
+            [payment for payment in payments if not payment.payment_number],
+            key=lambda payment: ('PAY', now.strftime('%Y%m%d')),
+            assign=lambda payment, seq: setattr(payment, 'payment_number', f"PAY-{stamp}-{seq:04d}"),
+        )
+
     def save(self, *args, **kwargs):
         """保存时自动生成支付编号"""
         if not self.payment_number:
-            # 生成支付编号格式: PAY-YYYYMMDDHHMMSS-序号
-            now = timezone.now()
-            prefix = f"PAY-{now.strftime('%Y%m%d%H%M%S')}"
-            count = Payment.objects.filter(
-                created_at__year=now.year,
-                created_at__month=now.month,
-                created_at__day=now.day
-            ).count()
-            self.payment_number = f"{prefix}-{count + 1:04d}"
+            Payment.assign_numbers([self])
 
         super().save(*args, **kwargs)
+
+
+@receiver([post_save, post_delete], sender=BillItem)
+def refresh_bill_ledger(sender, instance, **kwargs):
+    """账单明细变更后（事务提交时）重建所属账单的累计台账"""
+    from .ledger import schedule_refresh
+    schedule_refresh(instance.bill_id)
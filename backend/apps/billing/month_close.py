@@ -0,0 +1,409 @@
+"""
+月末出账
+
+为每个租户生成上月的 MonthlyBill 与 BillItem：
+  - 租户按 ID 哈希分成 shard_count 个分片（与每日计费相同的分片函数），每个分片一个 Celery 任务、一个事务
+  - 分片内三类费用各用一条分组聚合查询取出：
+      计算资源：DailyBillingRecord 按信息系统汇总运行小时、日费用与折后费用
+      产品订阅：账期内有效的 ProductSubscription 按产品汇总
+      服务订阅：账期内有效的 ServiceSubscription 按服务汇总
+  - 新账单一次分配编号（numbering）后 bulk_create，明细直接算好金额后 bulk_create，
+    账单总金额与折扣金额用一条带子查询的 UPDATE 回写，随后重建账单每日累计台账
+  - 每个分片的进度记录在 MonthCloseRun 中；重跑时跳过已完成的分片，失败的分片可以单独重跑，
+    执行中超过 MONTH_CLOSE_STALE_SECONDS 仍未结束的分片（worker 中途退出）视为失败，重新派发
+已有账单只有在草稿/待支付且尚未付款时才会重新生成（删除旧明细后重建），其余账单保持不变。
+计入账单的每日计费记录在同一事务中标记为已处理（is_processed），之后重跑每日计费不会再改动。
+"""
+
+import calendar
+import logging
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD_COUNT = 16
+DEFAULT_STALE_SECONDS = 3600
+BATCH_SIZE = 1000
+
+# 账单到期日：账期结束后的天数
+DUE_DAYS = 15
+
+AMOUNT_QUANTUM = Decimal('0.01')
+RATE_QUANTUM = Decimal('0.0001')
+
+MONEY = DecimalField(max_digits=15, decimal_places=2)
+
+
+def billing_period(year, month):
+    """账期 (开始日期, 结束日期)"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def previous_month(today=None):
+    """上一个自然月 (年, 月)"""
+    first = (today or timezone.localdate()).replace(day=1)
+    last_month = first - timedelta(days=1)
+    return last_month.year, last_month.month
+
+
+def _money(value):
+    return Decimal(value or 0).quantize(AMOUNT_QUANTUM, rounding=ROUND_HALF_UP)
+
+
+def _item(item_type, name, quantity, unit, amount, final_amount, billing_date, description='', information_system_id=None):
+    """BillItem 字段（金额已算好，bulk_create 不经过 BillItem.save()）"""
+    quantity = Decimal(quantity or 0)
+    amount = _money(amount)
+    final_amount = _money(final_amount)
+    return {
+        'item_type': item_type,
+        'name': name,
+        'description': description,
+        'information_system_id': information_system_id,
+        'billing_date': billing_date,
+        'quantity': quantity,
+        'unit': unit,
+        'unit_price': (amount / quantity).quantize(RATE_QUANTUM, rounding=ROUND_HALF_UP) if quantity else Decimal('0'),
+        'amount': amount,
+        'discount_rate': (final_amount / amount).quantize(RATE_QUANTUM, rounding=ROUND_HALF_UP) if amount else Decimal('1'),
+        'discount_amount': amount - final_amount,
+        'final_amount': final_amount,
+    }
+
+
+def compute_charges(tenant_ids, start, end):
+    """计算资源：按信息系统汇总账期内的每日计费记录"""
+    from apps.information_systems.models import DailyBillingRecord
+    from .models import BillItem
+
+    rows = DailyBillingRecord.objects.filter(
+        information_system__tenant_id__in=tenant_ids,
+        billing_date__gte=start,
+        billing_date__lte=end,
+    ).order_by().values(
+        'information_system_id', 'information_system__tenant_id', 'information_system__name'
+    ).annotate(
+        days=Count('pk'),
+        hours=Sum('running_hours'),
+        total_amount=Sum('daily_cost'),
+        total_final_amount=Sum('actual_daily_cost'),
+    )
+    for row in rows:
+        yield row['information_system__tenant_id'], _item(
+            BillItem.ItemType.COMPUTE,
+            f"{row['information_system__name']} 资源使用费",
+            row['hours'], '小时', row['total_amount'], row['total_final_amount'], end,
+            description=f"计费 {row['days']} 天，运行 {row['hours']} 小时",
+            information_system_id=row['information_system_id'],
+        )
+
+
+def product_charges(tenant_ids, start, end):
+    """产品订阅：账期内有效的订阅按产品汇总（整月计费）"""
+    from apps.products.models import ProductSubscription
+    from .models import BillItem
+
+    Status = ProductSubscription.SubscriptionStatus
+    rows = ProductSubscription.objects.filter(
+        tenant_id__in=tenant_ids,
+        status__in=[Status.ACTIVE, Status.EXPIRED],
+        start_date__lte=end,
+        end_date__gte=start,
+    ).order_by().values('tenant_id', 'product_id', 'product__name').annotate(
+        total_quantity=Sum('quantity'),
+        total_amount=Sum(F('unit_price') * F('quantity'), output_field=MONEY),
+        total_final_amount=Sum(F('unit_price') * F('quantity') * F('discount_rate'), output_field=MONEY),
+    )
+    for row in rows:
+        yield row['tenant_id'], _item(
+            BillItem.ItemType.PRODUCT, row['product__name'],
+            row['total_quantity'], '月', row['total_amount'], row['total_final_amount'], end,
+        )
+
+
+def service_charges(tenant_ids, start, end):
+    """服务订阅：账期内有效的订阅按服务汇总（整月计费）"""
+    from apps.services.models import ServiceSubscription
+    from .models import BillItem
+
+    Status = ServiceSubscription.SubscriptionStatus
+    rows = ServiceSubscription.objects.filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=start),
+        tenant_id__in=tenant_ids,
+        status__in=[Status.ACTIVE, Status.EXPIRED],
+        start_date__lte=end,
+    ).order_by().values('tenant_id', 'service_id', 'service__name').annotate(
+        total_quantity=Count('pk'),
+        total_amount=Sum('unit_price'),
+        total_final_amount=Sum(F('unit_price') * F('discount_rate'), output_field=MONEY),
+    )
+    for row in rows:
+        yield row['tenant_id'], _item(
+            BillItem.ItemType.SERVICE, row['service__name'],
+            row['total_quantity'], '月', row['total_amount'], row['total_final_amount'], end,
+        )
+
+
+CHARGE_SOURCES = (compute_charges, product_charges, service_charges)
+
+
+def update_bill_totals(bill_ids):
+    """一条 UPDATE 按明细汇总回写账单总金额（折后）与折扣金额"""
+    from .models import BillItem, MonthlyBill
+
+    def item_sum(field):
+        return Coalesce(
+            Subquery(
+                BillItem.objects.filter(bill=OuterRef('pk')).order_by().values('bill')
+                .annotate(value=Sum(field)).values('value')[:1]
+            ),
+            Decimal('0'),
+            output_field=MONEY,
+        )
+
+    return MonthlyBill.objects.filter(pk__in=bill_ids).update(
+        total_amount=item_sum('final_amount'),
+        discount_amount=item_sum('discount_amount'),
+        updated_at=timezone.now(),
+    )
+
+
+def close_tenants(year, month, tenant_ids):
+    """
+    为一批租户生成账单（需在事务中调用）
+
+    Returns:
+        dict: {'bill_count', 'item_count', 'total_amount'}
+    """
+    from apps.information_systems.models import DailyBillingRecord
+    from apps.tenants.models import Tenant
+    from .ledger import refresh_ledgers
+    from .models import BillItem, MonthlyBill
+
+    start, end = billing_period(year, month)
+    existing = {
+        bill.tenant_id: bill for bill in MonthlyBill.objects.select_for_update().filter(
+            tenant_id__in=tenant_ids, billing_year=year, billing_month=month
+        )
+    }
+    # 已开始付款或已取消的账单不再改动
+    regenerated = {
+        tenant_id: bill for tenant_id, bill in existing.items()
+        if bill.status in (MonthlyBill.BillStatus.DRAFT, MonthlyBill.BillStatus.PENDING) and not bill.paid_amount
+    }
+
+    charges = {}
+    for source in CHARGE_SOURCES:
+        for tenant_id, item in source(tenant_ids, start, end):
+            if tenant_id in existing and tenant_id not in regenerated:
+                continue
+            charges.setdefault(tenant_id, []).append(item)
+
+    BillItem.objects.filter(bill_id__in=[bill.pk for bill in regenerated.values()]).delete()
+
+    tenants = Tenant.objects.only('id', 'code').in_bulk([tenant_id for tenant_id in charges if tenant_id not in existing])
+    new_bills = [
+        MonthlyBill(
+            tenant=tenant,
+            billing_year=year,
+            billing_month=month,
+            billing_period_start=start,
+            billing_period_end=end,
+            due_date=end + timedelta(days=DUE_DAYS),
+            status=MonthlyBill.BillStatus.PENDING,
+        )
+        for tenant in tenants.values()
+    ]
+    MonthlyBill.assign_numbers(new_bills)
+    MonthlyBill.objects.bulk_create(new_bills, batch_size=BATCH_SIZE)
+
+    bills = {**regenerated, **{bill.tenant_id: bill for bill in new_bills}}
+    items = [
+        BillItem(bill=bills[tenant_id], **item)
+        for tenant_id, tenant_items in charges.items() if tenant_id in bills
+        for item in tenant_items
+    ]
+    BillItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+
+    # 已出账的日计费记录不再被每日计费覆盖
+    now = timezone.now()
+    DailyBillingRecord.objects.filter(
+        information_system__tenant_id__in=list(bills), billing_date__gte=start, billing_date__lte=end,
+        is_processed=False,
+    ).update(is_processed=True, processed_at=now, updated_at=now)
+
+    bill_ids = [bill.pk for bill in bills.values()]
+    update_bill_totals(bill_ids)
+    refresh_ledgers(bill_ids)
+    total = MonthlyBill.objects.filter(pk__in=bill_ids).aggregate(total=Sum('total_amount'))['total']
+    return {
+        'bill_count': len(bill_ids),
+        'item_count': len(items),
+        'total_amount': _money(total),
+    }
+
+
+def close_shard(year, month, shard, shard_count, tenant_ids=None, force=False, celery_task_id=''):
+    """
+    出账一个分片
+
+    Returns:
+        tuple: (MonthCloseRun, 是否执行了出账)；已完成且未指定 force 时不重新执行
+    """
+    from apps.information_systems.billing import shard_of
+    from apps.tenants.models import Tenant
+    from .models import MonthCloseRun
+
+    run, _ = MonthCloseRun.objects.get_or_create(
+        billing_year=year, billing_month=month, shard=shard, shard_count=shard_count
+    )
+    if run.status == MonthCloseRun.Status.COMPLETED and not force:
+        return run, False
+
+    if tenant_ids is None:
+        tenant_ids = [
+            tenant_id for tenant_id in Tenant.objects.values_list('id', flat=True).iterator()
+            if shard_of(tenant_id, shard_count) == shard
+        ]
+
+    run.status = MonthCloseRun.Status.RUNNING
+    run.started_at = timezone.now()
+    run.finished_at = None
+    run.error_message = ''
+    run.tenant_count = len(tenant_ids)
+    update_fields = ['status', 'started_at', 'finished_at', 'error_message', 'tenant_count']
+    if celery_task_id:
+        run.celery_task_id = celery_task_id
+        update_fields.append('celery_task_id')
+    run.save(update_fields=update_fields)
+
+    try:
+        with transaction.atomic():
+            result = close_tenants(year, month, tenant_ids)
+            # 账单与完成状态在同一事务中提交
+            run.status = MonthCloseRun.Status.COMPLETED
+            run.bill_count = result['bill_count']
+            run.item_count = result['item_count']
+            run.total_amount = result['total_amount']
+            run.finished_at = timezone.now()
+            run.save(update_fields=['status', 'bill_count', 'item_count', 'total_amount', 'finished_at'])
+    except Exception as e:
+        logger.error(f'月末出账分片失败: {year}-{month:02d} {shard}/{shard_count}: {str(e)}', exc_info=True)
+        run.status = MonthCloseRun.Status.FAILED
+        run.error_message = str(e)
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'error_message', 'finished_at'])
+    return run, True
+
+
+def _shards(shard_count, shards):
+    shard_count = shard_count or getattr(settings, 'MONTH_CLOSE_SHARDS', DEFAULT_SHARD_COUNT)
+    return shard_count, list(shards if shards is not None else range(shard_count))
+
+
+def is_stale(run, now=None):
+    """执行中的分片超过 MONTH_CLOSE_STALE_SECONDS 未结束（worker 被杀或重启），视为失败"""
+    if run.status != run.Status.RUNNING:
+        return False
+    stale_seconds = getattr(settings, 'MONTH_CLOSE_STALE_SECONDS', DEFAULT_STALE_SECONDS)
+    return not run.started_at or run.started_at < (now or timezone.now()) - timedelta(seconds=stale_seconds)
+
+
+def run_month_close(year, month, shard_count=None, shards=None, force=False):
+    """
+    在当前进程中依次出账各分片
+
+    Returns:
+        dict: {'period', 'completed', 'skipped', 'failed', 'bill_count', 'item_count', 'total_amount'}
+    """
+    from apps.information_systems.billing import tenant_shards
+    from .models import MonthCloseRun
+
+    shard_count, shards = _shards(shard_count, shards)
+    tenants = tenant_shards(shard_count)
+    summary = {
+        'period': f'{year}-{month:02d}',
+        'completed': [], 'skipped': [], 'failed': [],
+        'bill_count': 0, 'item_count': 0, 'total_amount': Decimal('0'),
+    }
+    for shard in shards:
+        run, executed = close_shard(year, month, shard, shard_count, tenants.get(shard, []), force)
+        if run.status == MonthCloseRun.Status.FAILED:
+            summary['failed'].append(shard)
+            continue
+        summary['completed' if executed else 'skipped'].append(shard)
+        summary['bill_count'] += run.bill_count
+        summary['item_count'] += run.item_count
+        summary['total_amount'] += _money(run.total_amount)
+
+    logger.info(
+        f"月末出账 {summary['period']}: 完成 {len(summary['completed'])} 个分片，跳过 {len(summary['skipped'])} 个，"
+        f"失败 {len(summary['failed'])} 个，共 {summary['bill_count']} 张账单"
+    )
+    return summary
+
+
+def dispatch_month_close(year, month, shard_count=None, shards=None, force=False):
+    """
+    为每个分片派发一个 Celery 任务（close_month_shard），已完成或正在执行的分片不重复派发；
+    执行超时（is_stale）的分片按失败处理，重新派发
+
+    Returns:
+        list: 已派发的分片
+    """
+    from .models import MonthCloseRun
+    from .tasks import close_month_shard
+
+    shard_count, shards = _shards(shard_count, shards)
+    dispatched = []
+    for shard in shards:
+        run, _ = MonthCloseRun.objects.get_or_create(
+            billing_year=year, billing_month=month, shard=shard, shard_count=shard_count
+        )
+        if not force:
+            if run.status == MonthCloseRun.Status.COMPLETED:
+                continue
+            if run.status == MonthCloseRun.Status.RUNNING:
+                if not is_stale(run):
+                    continue
+                logger.warning(
+                    f'月末出账分片执行超时，重新派发: {year}-{month:02d} {shard}/{shard_count}'
+                    f'（开始于 {run.started_at}）'
+                )
+        run.status = MonthCloseRun.Status.PENDING
+        run.error_message = ''
+        run.save(update_fields=['status', 'error_message'])
+        result = close_month_shard.delay(year, month, shard, shard_count, force)
+        MonthCloseRun.objects.filter(pk=run.pk).update(celery_task_id=result.id)
+        dispatched.append(shard)
+
+    logger.info(f'月末出账 {year}-{month:02d}: 派发 {len(dispatched)} 个分片任务')
+    return dispatched
+
+
+def month_close_progress(year, month, shard_count=None):
+    """
+    出账进度
+
+    Returns:
+        dict: {'shard_count', 状态: 分片数, 'failed_shards', 'bill_count', 'total_amount'}
+    """
+    from .models import MonthCloseRun
+
+    shard_count, _ = _shards(shard_count, None)
+    runs = MonthCloseRun.objects.filter(billing_year=year, billing_month=month, shard_count=shard_count)
+    progress = {'shard_count': shard_count, **{status: 0 for status in MonthCloseRun.Status.values}}
+    for status, count in runs.order_by().values_list('status').annotate(count=Count('pk')):
+        progress[status] = count
+    progress.update(runs.aggregate(bill_count=Coalesce(Sum('bill_count'), 0), total_amount=Sum('total_amount')))
+    progress['total_amount'] = _money(progress['total_amount'])
+    progress['failed_shards'] = list(
+        runs.filter(status=MonthCloseRun.Status.FAILED).order_by('shard').values_list('shard', flat=True)
+    )
+    return progress
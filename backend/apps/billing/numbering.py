@@ -0,0 +1,109 @@
+"""
+编号序列分配
+
+账单编号、支付编号的序号由 NumberSequence 计数器按 (前缀, 账期) 分配，不再用 COUNT(*) + 1
+（并发生成时会得到重复编号，且每次插入都要扫描整个账期）：
+  - PostgreSQL：一条 INSERT ... ON CONFLICT DO UPDATE ... RETURNING 同时为多个序列各预留一段连续序号，
+    计数器行的更新是原子的，并发分配不会重复
+  - 其他数据库：SELECT ... FOR UPDATE 锁定计数器行后更新
+批量生成（如月末出账）一次为所有序列预留整段序号，数千个编号只需一次往返。
+计数器行锁持有到所在事务提交，多行分配按键排序加锁，避免并发批量分配互相死锁。
+序号只增不减，事务回滚或预留后未使用会留下空号。
+"""
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+# PostgreSQL 单条语句最多携带的序列数
+UPSERT_BATCH_SIZE = 1000
+
+
+def allocate_numbers(requests):
+    """
+    为多个序列各预留一段连续序号
+
+    Args:
+        requests: {(prefix, period): 数量}
+    Returns:
+        dict: {(prefix, period): range(首个序号, 末个序号 + 1)}
+    """
+    requests = {key: count for key, count in requests.items() if count > 0}
+    if not requests:
+        return {}
+    if connection.vendor == 'postgresql':
+        last_values = _allocate_postgresql(requests)
+    else:
+        last_values = _allocate_locked(requests)
+    return {
+        key: range(last_values[key] - count + 1, last_values[key] + 1)
+        for key, count in requests.items()
+    }
+
+
+def allocate(prefix, period, count=1):
+    """为单个序列预留 count 个序号"""
+    return allocate_numbers({(prefix, period): count})[(prefix, period)]
+
+
+def assign_numbers(objects, key, assign):
+    """
+    按 key(obj) 分组为对象分配序号，再调用 assign(obj, 序号) 写入编号
+
+    同一序列中的对象按传入顺序获得递增的序号。
+    """
+    counts = {}
+    for obj in objects:
+        counts[key(obj)] = counts.get(key(obj), 0) + 1
+    blocks = {sequence: iter(numbers) for sequence, numbers in allocate_numbers(counts).items()}
+    for obj in objects:
+        assign(obj, next(blocks[key(obj)]))
+
+
+def _allocate_postgresql(requests):
+    from .models import NumberSequence
+
+    table = connection.ops.quote_name(NumberSequence._meta.db_table)
+    now = timezone.now()
+    keys = sorted(requests)
+    last_values = {}
+    with connection.cursor() as cursor:
+        for offset in range(0, len(keys), UPSERT_BATCH_SIZE):
+            chunk = keys[offset:offset + UPSERT_BATCH_SIZE]
+            params = []
+            for prefix, period in chunk:
+                params.extend([prefix, period, requests[(prefix, period)], now])
+            cursor.execute(
+                f'INSERT INTO {table} (prefix, period, last_value, updated_at) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s)"] * len(chunk))} '
+                f'ON CONFLICT (prefix, period) DO UPDATE '
+                f'SET last_value = {table}.last_value + EXCLUDED.last_value, updated_at = EXCLUDED.updated_at '
+                f'RETURNING prefix, period, last_value',
+                params,
+            )
+            for prefix, period, last_value in cursor.fetchall():
+                last_values[(prefix, period)] = last_value
+    return last_values
+
+
+def _allocate_locked(requests):
+    from .models import NumberSequence
+
+    prefixes = {prefix for prefix, _ in requests}
+    periods = {period for _, period in requests}
+    with transaction.atomic():
+        NumberSequence.objects.bulk_create(
+            [NumberSequence(prefix=prefix, period=period) for prefix, period in sorted(requests)],
+            ignore_conflicts=True,
+        )
+        sequences = [
+            sequence for sequence in NumberSequence.objects.select_for_update().filter(
+                prefix__in=prefixes, period__in=periods
+            ).order_by('prefix', 'period')
+            if (sequence.prefix, sequence.period) in requests
+        ]
+        now = timezone.now()
+        for sequence in sequences:
+            sequence.last_value += requests[(sequence.prefix, sequence.period)]
+            sequence.updated_at = now
+        NumberSequence.objects.bulk_update(sequences, ['last_value', 'updated_at'], batch_size=UPSERT_BATCH_SIZE)
+    return {(sequence.prefix, sequence.period): sequence.last_value for sequence in sequences}
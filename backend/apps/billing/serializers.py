@@ -5,6 +5,17 @@
 from rest_framework import serializers
 from .models import MonthlyBill, BillItem, Payment
 from datetime import date
+from decimal import Decimal
+
+
+def query_date_from_request(request):
+    """请求参数 query_date（YYYY-MM-DD），缺省或格式错误时为今天"""
+    if request and 'query_date' in request.query_params:
+        try:
+            return date.fromisoformat(request.query_params['query_date'])
+        except ValueError:
+            pass
+    return date.today()
 
 
 class BillItemSerializer(serializers.ModelSerializer):
@@ -48,18 +59,11 @@ class MonthlyBillSerializer(serializers.ModelSerializer):
 
     def get_current_month_amount(self, obj):
         """获取当月应收费用（截至查询日期前一日）"""
-        # 从请求中获取查询日期，默认为今天
-        request = self.context.get('request')
-        if request and 'query_date' in request.query_params:
-            query_date_str = request.query_params['query_date']
-            try:
-                query_date = date.fromisoformat(query_date_str)
-            except ValueError:
-                query_date = date.today()
-        else:
-            query_date = date.today()
-
-        return str(obj.calculate_current_month_amount(query_date))
+        # 视图已从累计台账中带出时直接使用
+        ledger_amount = getattr(obj, 'ledger_amount', None)
+        if ledger_amount is not None:
+            return str(ledger_amount.quantize(Decimal('0.01')))
+        return str(obj.calculate_current_month_amount(query_date_from_request(self.context.get('request'))))
 
 
 class MonthlyBillListSerializer(serializers.ModelSerializer):
@@ -82,8 +86,9 @@ class MonthlyBillListSerializer(serializers.ModelSerializer):
         ]
 
     def get_items_count(self, obj):
-        """获取账单明细数量"""
-        return obj.items.count()
+        """获取账单明细数量（列表查询已用 Count 带出）"""
+        items_count = getattr(obj, 'items_count', None)
+        return items_count if items_count is not None else obj.items.count()
 
 
 
@@ -0,0 +1,42 @@
+"""
+计费模块 Celery 任务
+"""
+
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='apps.billing.tasks.close_month')
+def close_month(year=None, month=None, shards=None, force=False):
+    """
+    月末出账（默认上月）：为每个租户分片派发一个 close_month_shard 任务
+    失败的分片可以用 close_month 管理命令的 --shards 参数单独重跑
+    """
+    from apps.billing.month_close import dispatch_month_close, previous_month
+
+    if not (year and month):
+        year, month = previous_month()
+    dispatched = dispatch_month_close(year, month, shards=shards, force=force)
+    return {'period': f'{year}-{month:02d}', 'dispatched': dispatched}
+
+
+@shared_task(bind=True, name='apps.billing.tasks.close_month_shard')
+def close_month_shard(self, year, month, shard, shard_count, force=False):
+    """出账一个租户分片，结果记录在 MonthCloseRun 中"""
+    from apps.billing.month_close import close_shard
+
+    run, executed = close_shard(
+        year, month, shard, shard_count, force=force, celery_task_id=self.request.id or ''
+    )
+    if run.status == run.Status.FAILED:
+        logger.error(f'月末出账分片失败: {year}-{month:02d} {shard}/{shard_count}: {run.error_message}')
+    return {
+        'period': f'{year}-{month:02d}',
+        'shard': shard,
+        'status': run.status,
+        'executed': executed,
+        'bill_count': run.bill_count,
+        'total_amount': str(run.total_amount),
+    }
@@ -1,3 +1,180 @@
+import importlib
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.apps import apps
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.billing.month_close import close_tenants, dispatch_month_close
+from apps.billing.models import BillItem, MonthCloseRun, MonthlyBill, NumberSequence, Payment
+from apps.billing.numbering import allocate, allocate_numbers
+from apps.information_systems.models import DailyBillingRecord, InformationSystem
+from apps.tenants.models import Tenant
+
+
+def create_tenant(code):
+    now = timezone.now()
+    return Tenant.objects.create(
+        name=f'{code}租户', code=code, contact_person='测试', contact_phone='1',
+        start_time=now, end_time=now + timedelta(days=365),
+    )
+
+
+class CloseTenantsTests(TestCase):
+    """月末出账：账单生成、重新生成规则与日计费记录的处理标记"""
+
+    year, month = 2026, 9
+
+    def setUp(self):
+        self.tenants = {code: create_tenant(code) for code in ('fresh', 'paid', 'pending')}
+        for tenant in self.tenants.values():
+            system = InformationSystem.objects.create(name=f'{tenant.code}系统', code=tenant.code, tenant=tenant)
+            for day in (1, 2, 3):
+                # 每小时 0.2 + 0.2 + 0.2 = 0.6，24 小时 14.40，九折 12.96
+                DailyBillingRecord.objects.create(
+                    information_system=system, billing_date=date(self.year, self.month, day),
+                    cpu_cores=2, memory_gb=4, storage_gb=20, running_hours=24, discount_rate=Decimal('0.9'),
+                )
+
+    def create_bill(self, code, **fields):
+        bill = MonthlyBill.objects.create(
+            tenant=self.tenants[code], billing_year=self.year, billing_month=self.month,
+            billing_period_start=date(self.year, self.month, 1), billing_period_end=date(self.year, self.month, 30),
+            due_date=date(self.year, 10, 15), **fields,
+        )
+        BillItem.objects.create(
+            bill=bill, item_type=BillItem.ItemType.OTHER, name='旧明细', billing_date=date(self.year, self.month, 1),
+            quantity=Decimal('1'), unit_price=Decimal('999'), discount_rate=Decimal('1'),
+        )
+        return bill
+
+    def close(self):
+        with transaction.atomic():
+            return close_tenants(self.year, self.month, [tenant.pk for tenant in self.tenants.values()])
+
+    def records(self, code):
+        return DailyBillingRecord.objects.filter(information_system__tenant=self.tenants[code])
+
+    def test_generates_regenerates_and_keeps_paid_bills(self):
+        paid = self.create_bill('paid', status=MonthlyBill.BillStatus.PAID,
+                                total_amount=Decimal('999'), paid_amount=Decimal('999'))
+        pending = self.create_bill('pending', status=MonthlyBill.BillStatus.PENDING)
+
+        result = self.close()
+        self.assertEqual(result['bill_count'], 2)
+        self.assertEqual(result['total_amount'], Decimal('77.76'))
+
+        fresh = MonthlyBill.objects.get(tenant=self.tenants['fresh'])
+        self.assertEqual(fresh.bill_number, 'BILL-202609-fresh-0001')
+        self.assertEqual(fresh.status, MonthlyBill.BillStatus.PENDING)
+        self.assertEqual((fresh.total_amount, fresh.discount_amount), (Decimal('38.88'), Decimal('4.32')))
+        item = fresh.items.get()
+        self.assertEqual((item.item_type, item.quantity, item.amount), (BillItem.ItemType.COMPUTE, 72, Decimal('43.20')))
+
+        pending.refresh_from_db()
+        self.assertEqual(pending.total_amount, Decimal('38.88'))
+        self.assertEqual(list(pending.items.values_list('name', flat=True)), ['pending系统 资源使用费'])
+
+        paid.refresh_from_db()
+        self.assertEqual(paid.total_amount, Decimal('999'))
+        self.assertEqual(list(paid.items.values_list('name', flat=True)), ['旧明细'])
+
+    def test_billed_records_are_marked_processed(self):
+        self.create_bill('paid', status=MonthlyBill.BillStatus.PAID, paid_amount=Decimal('999'))
+        self.close()
+
+        for code in ('fresh', 'pending'):
+            self.assertFalse(self.records(code).filter(is_processed=False).exists())
+            self.assertFalse(self.records(code).filter(processed_at__isnull=True).exists())
+        # 未重新生成的账单不改动其记录
+        self.assertFalse(self.records('paid').filter(is_processed=True).exists())
+
+
+@mock.patch('apps.billing.tasks.close_month_shard.delay', return_value=mock.Mock(id='task-id'))
+class DispatchMonthCloseTests(TestCase):
+    """月末出账派发：已完成、正在执行的分片跳过，执行超时的分片重新派发"""
+
+    def create_run(self, shard, status, started_at=None):
+        return MonthCloseRun.objects.create(
+            billing_year=2026, billing_month=9, shard=shard, shard_count=4, status=status, started_at=started_at,
+        )
+
+    def test_stale_running_shard_is_redispatched(self, delay):
+        now = timezone.now()
+        self.create_run(0, MonthCloseRun.Status.COMPLETED, now - timedelta(hours=3))
+        self.create_run(1, MonthCloseRun.Status.RUNNING, now - timedelta(minutes=5))
+        stale = self.create_run(2, MonthCloseRun.Status.RUNNING, now - timedelta(hours=2))
+
+        with self.settings(MONTH_CLOSE_STALE_SECONDS=3600):
+            dispatched = dispatch_month_close(2026, 9, shard_count=4)
+
+        self.assertEqual(dispatched, [2, 3])
+        self.assertEqual([call.args[2] for call in delay.call_args_list], [2, 3])
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.celery_task_id), (MonthCloseRun.Status.PENDING, 'task-id'))
+
+    def test_force_redispatches_everything(self, delay):
+        self.create_run(0, MonthCloseRun.Status.COMPLETED)
+        self.create_run(1, MonthCloseRun.Status.RUNNING, timezone.now())
+        self.assertEqual(dispatch_month_close(2026, 9, shard_count=4, force=True), [0, 1, 2, 3])
+
+
+class NumberAllocationTests(TestCase):
+    """编号序列：按序列预留连续序号段，与已有编号衔接"""
+
+    def test_allocate_numbers_reserves_consecutive_blocks(self):
+        bill_key, pay_key = ('BILL-acme', '202609'), ('PAY', '20260930')
+        self.assertEqual(allocate_numbers({bill_key: 3, pay_key: 2, ('BILL-idle', '202609'): 0}),
+                         {bill_key: range(1, 4), pay_key: range(1, 3)})
+        self.assertEqual(allocate_numbers({bill_key: 2}), {bill_key: range(4, 6)})
+        self.assertEqual(list(allocate(*pay_key)), [3])
+        self.assertFalse(NumberSequence.objects.filter(prefix='BILL-idle').exists())
+
+    def test_assign_numbers_per_tenant_and_period(self):
+        acme, beta = create_tenant('acme'), create_tenant('beta')
+        bills = [
+            MonthlyBill(tenant=tenant, billing_year=2026, billing_month=month,
+                        billing_period_start=date(2026, month, 1), billing_period_end=date(2026, month, 28),
+                        due_date=date(2026, month, 28))
+            for tenant, month in ((acme, 8), (acme, 9), (beta, 9), (acme, 9))
+        ]
+        MonthlyBill.assign_numbers(bills)
+        self.assertEqual([bill.bill_number for bill in bills], [
+            'BILL-202608-acme-0001', 'BILL-202609-acme-0001', 'BILL-202609-beta-0001', 'BILL-202609-acme-0002',
+        ])
+
+        payments = [Payment(amount=Decimal('1')) for _ in range(2)]
+        now = timezone.make_aware(datetime(2026, 9, 30, 8, 15, 0))
+        Payment.assign_numbers(payments, now=now)
+        stamp = now.strftime('%Y%m%d%H%M%S')
+        self.assertEqual([payment.payment_number for payment in payments], [f'PAY-{stamp}-0001', f'PAY-{stamp}-0002'])
+
+    def test_migration_seeds_counters_from_existing_numbers(self):
+        seed_sequences = importlib.import_module('apps.billing.migrations.0004_numbersequence').seed_sequences
+        acme, dashed = create_tenant('acme'), create_tenant('a-b')
+        for tenant, number, month in (
+            (acme, 'BILL-202608-acme-0007', 8),
+            (dashed, 'BILL-202608-a-b-0005', 8),
+            (acme, 'BILL-202609-acme-0002', 9),
+            (dashed, 'LEGACY-0042', 9),
+        ):
+            MonthlyBill.objects.create(
+                tenant=tenant, bill_number=number, billing_year=2026, billing_month=month,
+                billing_period_start=date(2026, month, 1), billing_period_end=date(2026, month, 28),
+                due_date=date(2026, month, 28),
+            )
+        for number in ('PAY-20260930081500-0003', 'PAY-20260930231000-0011', 'PAY-20261001000000-x'):
+            Payment.objects.create(payment_number=number, amount=Decimal('1'))
+
+        seed_sequences(apps, None)
 
-# Create your tests here.
+        self.assertEqual(
+            set(NumberSequence.objects.values_list('prefix', 'period', 'last_value')),
+            {('BILL-acme', '202608', 7), ('BILL-a-b', '202608', 5), ('BILL-acme', '202609', 2),
+             ('PAY', '20260930', 11)},
+        )
+        # 新编号接在已有编号之后
+        self.assertEqual(list(allocate('BILL-acme', '202608')), [8])
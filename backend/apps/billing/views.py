@@ -6,15 +6,15 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q, Sum
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery, Sum
 from django.utils import timezone
 from datetime import date, timedelta
 from decimal import Decimal
 
-from .models import MonthlyBill, BillItem, Payment
+from .models import BillDailyLedger, MonthlyBill, BillItem, Payment
 from .serializers import (
     MonthlyBillSerializer, MonthlyBillListSerializer, BillItemSerializer,
-    PaymentSerializer
+    PaymentSerializer, query_date_from_request
 )
 
 
@@ -56,6 +56,20 @@ class MonthlyBillViewSet(viewsets.ModelViewSet):
         if status_param:
             queryset = queryset.filter(status=status_param)
 
+        if self.action == 'list':
+            queryset = queryset.select_related('tenant').annotate(items_count=Count('items'))
+        elif self.action == 'retrieve':
+            # 当月应收费用（截至查询日期前一日）从累计台账中带出，明细与关联信息系统一次预取
+            end_date = query_date_from_request(self.request) - timedelta(days=1)
+            queryset = queryset.select_related('tenant').annotate(
+                ledger_amount=Subquery(
+                    BillDailyLedger.objects.filter(bill=OuterRef('pk'), billing_date=end_date)
+                    .values('cumulative_amount')[:1]
+                )
+            ).prefetch_related(
+                Prefetch('items', queryset=BillItem.objects.select_related('information_system'))
+            )
+
         return queryset.order_by('-billing_year', '-billing_month')
 
     @action(detail=True, methods=['get'])
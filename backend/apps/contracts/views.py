@@ -161,49 +161,13 @@ class ContractViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """获取合同统计信息"""
+        from ..monitoring.dashboard import contract_statistics, get_dashboard_section
         queryset = self.get_queryset()
 
-        # 基本统计
-        total_count = queryset.count()
-        draft_count = queryset.filter(status=Contract.Status.DRAFT).count()
-        pending_count = queryset.filter(status=Contract.Status.PENDING).count()
-        active_count = queryset.filter(status=Contract.Status.ACTIVE).count()
-        suspended_count = queryset.filter(status=Contract.Status.SUSPENDED).count()
-        terminated_count = queryset.filter(status=Contract.Status.TERMINATED).count()
-        expired_count = queryset.filter(status=Contract.Status.EXPIRED).count()
-
-        # 金额统计
-        amount_stats = queryset.aggregate(
-            total_contract_amount=Sum('total_amount'),
-            total_paid_amount=Sum('paid_amount')
-        )
-
-        total_contract_amount = amount_stats['total_contract_amount'] or 0
-        total_paid_amount = amount_stats['total_paid_amount'] or 0
-        total_remaining_amount = total_contract_amount - total_paid_amount
-
-        # 类型统计
-        standard_count = queryset.filter(contract_type=Contract.ContractType.STANDARD).count()
-        custom_count = queryset.filter(contract_type=Contract.ContractType.CUSTOM).count()
-        trial_count = queryset.filter(contract_type=Contract.ContractType.TRIAL).count()
-        upgrade_count = queryset.filter(contract_type=Contract.ContractType.UPGRADE).count()
-
-        stats_data = {
-            'total_count': total_count,
-            'draft_count': draft_count,
-            'pending_count': pending_count,
-            'active_count': active_count,
-            'suspended_count': suspended_count,
-            'terminated_count': terminated_count,
-            'expired_count': expired_count,
-            'total_contract_amount': total_contract_amount,
-            'total_paid_amount': total_paid_amount,
-            'total_remaining_amount': total_remaining_amount,
-            'standard_count': standard_count,
-            'custom_count': custom_count,
-            'trial_count': trial_count,
-            'upgrade_count': upgrade_count,
-        }
+        if queryset.query.has_filters():
+            stats_data = contract_statistics(queryset)
+        else:
+            stats_data = get_dashboard_section('contracts')
 
         serializer = ContractStatisticsSerializer(data=stats_data)
         serializer.is_valid(raise_exception=True)
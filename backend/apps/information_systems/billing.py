@@ -0,0 +1,256 @@
+"""
+每日计费
+
+run_daily_billing 以集合方式生成某一天的 DailyBillingRecord：
+  - 租户按 ID 哈希分成 shard_count 个分片，每个分片在一个事务内完成
+  - 一条查询取出分片内所有信息系统的资源快照（资源总量、运行模式、状态、运行中虚拟机数、租户折扣级别）
+  - 费用用 Decimal 计算（费率保留 4 位小数，金额保留 2 位小数，四舍五入），
+    bulk_create(update_conflicts=True) 按 (information_system, billing_date) 一次写入
+  - 每个分片完成后记录 DailyBillingRun；重跑同一天时跳过已完成的分片，
+    未完成或失败的分片重新计算（写入是幂等的）
+已处理（is_processed）的记录不会被覆盖；完成后刷新相关月度账单的每日累计台账（apps.billing.ledger）。
+
+运行小时数优先取运行时长计量（metering.compute_daily_usage 写入的 SystemDailyUsage，
+各虚拟机运行区间合并后的时长，不足一小时按一小时计）；计费前先计算当天的计量数据。
+没有任何状态变化记录的信息系统按运行模式推算：7x24 每天 24 小时，5x8 工作日 8 小时、周末 0；
+没有运行中的虚拟机且系统状态不是运行中时为 0。
+"""
+
+import logging
+import math
+import zlib
+from datetime import datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 每小时单价：CPU 每核、内存每 GB、存储每 GB
+CPU_HOURLY_RATE = Decimal('0.1')
+MEMORY_HOURLY_RATE = Decimal('0.05')
+STORAGE_HOURLY_RATE = Decimal('0.01')
+
+RATE_QUANTUM = Decimal('0.0001')
+AMOUNT_QUANTUM = Decimal('0.01')
+
+DEFAULT_SHARD_COUNT = 16
+BATCH_SIZE = 1000
+
+RECORD_UPDATE_FIELDS = [
+    'cpu_cores', 'memory_gb', 'storage_gb', 'running_hours',
+    'cpu_usage_hours', 'memory_usage_hours', 'storage_usage_hours',
+    'hourly_rate', 'daily_cost', 'discount_rate', 'actual_daily_cost', 'updated_at',
+]
+
+
+def compute_daily_cost(cpu_cores, memory_gb, storage_gb, running_hours, discount_rate):
+    """
+    计算一天的费用
+
+    Returns:
+        tuple: (hourly_rate, daily_cost, actual_daily_cost)，均为 Decimal
+    """
+    hourly_rate = (
+        cpu_cores * CPU_HOURLY_RATE + memory_gb * MEMORY_HOURLY_RATE + storage_gb * STORAGE_HOURLY_RATE
+    ).quantize(RATE_QUANTUM, rounding=ROUND_HALF_UP)
+    daily_cost = (hourly_rate * running_hours).quantize(AMOUNT_QUANTUM, rounding=ROUND_HALF_UP)
+    actual_daily_cost = (daily_cost * Decimal(str(discount_rate))).quantize(AMOUNT_QUANTUM, rounding=ROUND_HALF_UP)
+    return hourly_rate, daily_cost, actual_daily_cost
+
+
+def running_hours_for(operation_mode, billing_date, running):
+    from .models import InformationSystem
+
+    if not running:
+        return 0
+    if operation_mode == InformationSystem.OperationMode.HOURS_5X8:
+        return 8 if billing_date.weekday() < 5 else 0
+    return 24
+
+
+def metered_hours(running_seconds):
+    """计量秒数 -> 计费小时数（不足一小时按一小时计）"""
+    return min(24, math.ceil(running_seconds / 3600))
+
+
+def discount_rates():
+    """{折扣级别: Decimal 折扣率}，与 Tenant.discount_rate 一致"""
+    from apps.tenants.models import Tenant
+    return {
+        level: Decimal(str(Tenant(discount_level=level).discount_rate)).quantize(RATE_QUANTUM)
+        for level in Tenant.DiscountLevel.values
+    }
+
+
+def shard_of(tenant_id, shard_count):
+    return zlib.crc32(str(tenant_id).encode()) % shard_count
+
+
+def tenant_shards(shard_count):
+    """{分片: [租户ID]}"""
+    from apps.tenants.models import Tenant
+
+    shards = {shard: [] for shard in range(shard_count)}
+    for tenant_id in Tenant.objects.values_list('id', flat=True).iterator():
+        shards[shard_of(tenant_id, shard_count)].append(tenant_id)
+    return shards
+
+
+def build_records(billing_date, tenant_ids, rates=None):
+    """
+    一条查询取出资源快照并计算当天的计费记录（未保存）
+
+    Returns:
+        list: DailyBillingRecord 实例
+    """
+    from .models import DailyBillingRecord, InformationSystem, SystemDailyUsage, VirtualMachine
+
+    rates = rates or discount_rates()
+    day_end = timezone.make_aware(datetime.combine(billing_date + timedelta(days=1), time.min))
+    snapshot = InformationSystem.objects.filter(
+        tenant_id__in=tenant_ids,
+        created_at__lt=day_end,
+    ).annotate(
+        running_vms=Count('virtual_machines', filter=Q(virtual_machines__status=VirtualMachine.VMStatus.RUNNING)),
+        processed=Exists(DailyBillingRecord.objects.filter(
+            information_system=OuterRef('pk'), billing_date=billing_date, is_processed=True
+        )),
+        metered_seconds=Subquery(SystemDailyUsage.objects.filter(
+            information_system=OuterRef('pk'), usage_date=billing_date
+        ).values('running_seconds')[:1]),
+    ).order_by().values_list(
+        'id', 'total_cpu', 'total_memory', 'total_storage', 'operation_mode', 'status',
+        'tenant__discount_level', 'running_vms', 'processed', 'metered_seconds',
+    )
+
+    records = []
+    for system_id, cpu, memory, storage, mode, status, level, running_vms, processed, metered in snapshot:
+        if processed:
+            continue
+        if metered is not None:
+            hours = metered_hours(metered)
+        else:
+            running = running_vms > 0 or status == InformationSystem.Status.RUNNING
+            hours = running_hours_for(mode, billing_date, running)
+        discount = rates.get(level, Decimal('1'))
+        hourly_rate, daily_cost, actual_cost = compute_daily_cost(cpu, memory, storage, hours, discount)
+        records.append(DailyBillingRecord(
+            information_system_id=system_id,
+            billing_date=billing_date,
+            cpu_cores=cpu,
+            memory_gb=memory,
+            storage_gb=storage,
+            running_hours=hours,
+            cpu_usage_hours=cpu * hours,
+            memory_usage_hours=memory * hours,
+            storage_usage_hours=storage * hours,
+            hourly_rate=hourly_rate,
+            daily_cost=daily_cost,
+            discount_rate=discount,
+            actual_daily_cost=actual_cost,
+        ))
+    return records
+
+
+def upsert_records(records):
+    from .models import DailyBillingRecord
+
+    DailyBillingRecord.objects.bulk_create(
+        records,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['information_system', 'billing_date'],
+        update_fields=RECORD_UPDATE_FIELDS,
+    )
+
+
+def bill_shard(billing_date, shard, shard_count, tenant_ids, rates=None, force=False):
+    """
+    计费一个分片
+
+    Returns:
+        tuple: (DailyBillingRun, 是否执行了计算)；已完成且未指定 force 时不重新计算
+    """
+    from .models import DailyBillingRun
+
+    run, _ = DailyBillingRun.objects.get_or_create(
+        billing_date=billing_date, shard=shard, shard_count=shard_count
+    )
+    if run.status == DailyBillingRun.Status.COMPLETED and not force:
+        return run, False
+
+    run.status = DailyBillingRun.Status.RUNNING
+    run.started_at = timezone.now()
+    run.error_message = ''
+    run.save(update_fields=['status', 'started_at', 'error_message'])
+
+    try:
+        with transaction.atomic():
+            records = build_records(billing_date, tenant_ids, rates)
+            upsert_records(records)
+            # 记录与完成状态在同一事务中提交
+            run.status = DailyBillingRun.Status.COMPLETED
+            run.system_count = len(records)
+            run.total_cost = sum((record.actual_daily_cost for record in records), Decimal('0'))
+            run.finished_at = timezone.now()
+            run.save(update_fields=['status', 'system_count', 'total_cost', 'finished_at'])
+    except Exception as e:
+        logger.error(f'每日计费分片失败: {billing_date} {shard}/{shard_count}: {str(e)}', exc_info=True)
+        run.status = DailyBillingRun.Status.FAILED
+        run.error_message = str(e)
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'error_message', 'finished_at'])
+    return run, True
+
+
+def run_daily_billing(billing_date=None, shard_count=None, shards=None, force=False, meter=True):
+    """
+    生成某一天（默认昨天）的每日计费记录
+
+    Args:
+        shards: 只处理指定的分片（默认全部）
+        force: 已完成的分片也重新计算
+        meter: 计费前重新计算当天的运行时长计量
+
+    Returns:
+        dict: {'billing_date', 'completed', 'skipped', 'failed', 'system_count', 'total_cost'}
+    """
+    from .metering import compute_daily_usage
+    from .models import DailyBillingRun
+
+    billing_date = billing_date or timezone.localdate() - timedelta(days=1)
+    shard_count = shard_count or getattr(settings, 'DAILY_BILLING_SHARDS', DEFAULT_SHARD_COUNT)
+    if meter:
+        compute_daily_usage(billing_date)
+    tenants = tenant_shards(shard_count)
+    rates = discount_rates()
+
+    summary = {
+        'billing_date': billing_date.isoformat(),
+        'completed': [], 'skipped': [], 'failed': [],
+        'system_count': 0, 'total_cost': Decimal('0'),
+    }
+    for shard in (shards if shards is not None else range(shard_count)):
+        run, executed = bill_shard(billing_date, shard, shard_count, tenants.get(shard, []), rates, force)
+        if run.status == DailyBillingRun.Status.FAILED:
+            summary['failed'].append(shard)
+            continue
+        summary['completed' if executed else 'skipped'].append(shard)
+        summary['system_count'] += run.system_count
+        summary['total_cost'] += run.total_cost
+
+    # 账期包含计费日期的月度账单的每日累计台账随计费一起刷新
+    try:
+        from apps.billing.ledger import refresh_ledgers_for_date
+        refresh_ledgers_for_date(billing_date)
+    except Exception as e:
+        logger.error(f'刷新账单累计台账失败: {billing_date}: {str(e)}', exc_info=True)
+
+    logger.info(
+        f"每日计费 {billing_date}: 完成 {len(summary['completed'])} 个分片，跳过 {len(summary['skipped'])} 个，"
+        f"失败 {len(summary['failed'])} 个，共 {summary['system_count']} 个系统"
+    )
+    return summary
@@ -0,0 +1,266 @@
+"""
+信息系统详情加载
+
+detailed_info 接口的数据由 load_system_detail 一次性加载：
+  - 主查询：信息系统 + 租户/创建者（JOIN），当月费用（Sum）与虚拟机数量（Count）以子查询附带
+  - 产品、服务、虚拟机、最近 30 条日计费、最近 10 条资源调整各一次预取
+共 6 条查询，与虚拟机/计费记录数量无关。
+
+detail_version 用一条查询计算详情的版本（各相关表的最大更新时间 + 行数），
+供条件 GET（ETag / Last-Modified）使用，详情未变化时直接返回 304，不再加载数据。
+运行中系统的 basic_info.running_time(_display) 随时间变化，版本中另含当前小时，304 最多沿用一小时。
+"""
+
+import hashlib
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from django.db.models import Count, DateTimeField, DecimalField, F, IntegerField, Max, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import DailyBillingRecord, InformationSystem, ResourceAdjustmentLog, VirtualMachine
+
+DAILY_BILLING_LIMIT = 30
+ADJUSTMENT_LIMIT = 10
+
+
+@dataclass
+class SystemDetail:
+    """信息系统详情（detailed_info 的响应内容）"""
+
+    basic_info: dict
+    products: list = field(default_factory=list)
+    services: list = field(default_factory=list)
+    virtual_machines: list = field(default_factory=list)
+    daily_billing: list = field(default_factory=list)
+    resource_adjustments: list = field(default_factory=list)
+    monthly_cost: Decimal = Decimal('0')
+    total_vms: int = 0
+    running_vms: int = 0
+
+    @property
+    def vms_by_datacenter(self):
+        """按数据中心类型分组的虚拟机"""
+        groups = {}
+        for vm in self.virtual_machines:
+            groups.setdefault(vm['data_center_type_display'], []).append(vm)
+        return groups
+
+    def to_dict(self):
+        return {
+            'basic_info': self.basic_info,
+            'products': self.products,
+            'services': self.services,
+            'virtual_machines': self.virtual_machines,
+            'vms_by_datacenter': self.vms_by_datacenter,
+            'daily_billing': self.daily_billing,
+            'resource_adjustments': self.resource_adjustments,
+            'monthly_cost': float(self.monthly_cost),
+            'total_vms': self.total_vms,
+            'running_vms': self.running_vms,
+        }
+
+
+@dataclass(frozen=True)
+class DetailVersion:
+    last_modified: object
+    etag: str
+
+
+def _related_subquery(model, expression, **filters):
+    """按 information_system 分组的相关子查询（单值）"""
+    return Subquery(
+        model.objects.filter(information_system=OuterRef('pk'), **filters)
+        .order_by()
+        .values('information_system')
+        .annotate(value=expression)
+        .values('value')[:1]
+    )
+
+
+def _m2m_subquery(through, expression):
+    return Subquery(
+        through.objects.filter(informationsystem=OuterRef('pk'))
+        .order_by()
+        .values('informationsystem')
+        .annotate(value=expression)
+        .values('value')[:1]
+    )
+
+
+def detail_version(queryset, pk):
+    """
+    详情的版本；系统不存在时返回 None
+
+    Last-Modified 取信息系统、租户、虚拟机、日计费、资源调整、关联产品/服务的最大更新时间；
+    ETag 另外包含各相关表的行数（删除不会改变最大更新时间）和当月月份（当月费用的统计范围）。
+    系统运行中时 basic_info 的运行时长随时间变化，ETag 与 Last-Modified 再加上当前小时（整点），
+    缓存的运行时长最多滞后一小时。
+    """
+    products = InformationSystem.products.through
+    services = InformationSystem.services.through
+    updated = F('updated_at')
+    timestamps = {
+        'tenant_updated': F('tenant__updated_at'),
+        'vm_updated': _related_subquery(VirtualMachine, Max('updated_at')),
+        'billing_updated': _related_subquery(DailyBillingRecord, Max('updated_at')),
+        'adjustment_updated': _related_subquery(ResourceAdjustmentLog, Max('created_at')),
+        'product_updated': _m2m_subquery(products, Max('product__updated_at')),
+        'service_updated': _m2m_subquery(services, Max('service__updated_at')),
+    }
+    counts = {
+        'vm_count': _related_subquery(VirtualMachine, Count('pk')),
+        'billing_count': _related_subquery(DailyBillingRecord, Count('pk')),
+        'adjustment_count': _related_subquery(ResourceAdjustmentLog, Count('pk')),
+        'product_count': _m2m_subquery(products, Count('pk')),
+        'service_count': _m2m_subquery(services, Count('pk')),
+    }
+    # SQLite/MySQL 的 GREATEST 遇到 NULL 返回 NULL，没有相关数据时以信息系统自身的更新时间代替
+    row = queryset.filter(pk=pk).annotate(
+        last_modified=Greatest(
+            updated,
+            *[Coalesce(value, updated, output_field=DateTimeField()) for value in timestamps.values()],
+        ),
+        **{name: Coalesce(value, 0, output_field=IntegerField()) for name, value in counts.items()},
+    ).values('last_modified', 'status', 'last_start_time', *counts).first()
+    if row is None:
+        return None
+
+    last_modified = row['last_modified']
+    month = date.today().replace(day=1)
+    parts = [str(pk), last_modified.isoformat(), month.isoformat()] + [str(row[name]) for name in counts]
+    if row['status'] == InformationSystem.Status.RUNNING and row['last_start_time']:
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        parts.append(hour.isoformat())
+        # 只带 If-Modified-Since 的请求同样按小时失效
+        last_modified = max(last_modified, hour)
+    return DetailVersion(last_modified, hashlib.md5('|'.join(parts).encode()).hexdigest())
+
+
+def load_system_detail(queryset, pk):
+    """
+    加载信息系统详情
+
+    Raises:
+        InformationSystem.DoesNotExist: 系统不存在
+    """
+    from .serializers import InformationSystemSerializer
+
+    current_month = date.today().replace(day=1)
+    system = queryset.filter(pk=pk).select_related('tenant', 'created_by').annotate(
+        month_cost=Coalesce(
+            _related_subquery(DailyBillingRecord, Sum('actual_daily_cost'), billing_date__gte=current_month),
+            Decimal('0'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        vm_total=Coalesce(_related_subquery(VirtualMachine, Count('pk')), 0),
+        vm_running=Coalesce(
+            _related_subquery(VirtualMachine, Count('pk'), status=VirtualMachine.VMStatus.RUNNING), 0
+        ),
+    ).prefetch_related(
+        'products',
+        'services',
+        Prefetch('virtual_machines', queryset=VirtualMachine.objects.order_by('-created_at')),
+        Prefetch(
+            'daily_billing_records',
+            queryset=DailyBillingRecord.objects.order_by('-billing_date')[:DAILY_BILLING_LIMIT],
+            to_attr='recent_billing',
+        ),
+        Prefetch(
+            'resource_adjustments',
+            queryset=ResourceAdjustmentLog.objects.select_related('operator').order_by('-adjustment_date')[:ADJUSTMENT_LIMIT],
+            to_attr='recent_adjustments',
+        ),
+    ).get()
+
+    return SystemDetail(
+        basic_info=InformationSystemSerializer(system).data,
+        products=[_product_data(product) for product in system.products.all()],
+        services=[_service_data(service) for service in system.services.all()],
+        virtual_machines=[_vm_data(vm) for vm in system.virtual_machines.all()],
+        daily_billing=[_billing_data(record) for record in system.recent_billing],
+        resource_adjustments=[_adjustment_data(adj) for adj in system.recent_adjustments],
+        monthly_cost=system.month_cost,
+        total_vms=system.vm_total,
+        running_vms=system.vm_running,
+    )
+
+
+def _product_data(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'product_type': product.product_type,
+        'product_type_display': product.get_product_type_display(),
+        'base_price': str(product.base_price),
+        'billing_unit': product.get_billing_unit_display(),
+        'cpu_capacity': product.cpu_capacity,
+        'memory_capacity': product.memory_capacity,
+        'storage_capacity': product.storage_capacity
+    }
+
+
+def _service_data(service):
+    return {
+        'id': service.id,
+        'name': service.name,
+        'service_type': service.service_type,
+        'service_type_display': service.get_service_type_display(),
+        'base_price': str(service.base_price),
+        'billing_cycle': service.get_billing_cycle_display(),
+        'sla_level': service.get_sla_level_display(),
+        'description': service.description
+    }
+
+
+def _vm_data(vm):
+    return {
+        'id': str(vm.id),
+        'name': vm.name,
+        'ip_address': vm.ip_address or '未分配',
+        'cpu_cores': vm.cpu_cores,
+        'memory_gb': vm.memory_gb,
+        'disk_gb': vm.disk_gb,
+        'status': vm.status,
+        'status_display': vm.get_status_display(),
+        'data_center_type': vm.data_center_type,
+        'data_center_type_display': vm.get_data_center_type_display(),
+        'availability_zone': vm.availability_zone or '-',
+        'region': vm.region or '-',
+        'runtime_display': vm.runtime_display,
+        'os_type': vm.os_type or '未知',
+        'last_start_time': vm.last_start_time.strftime('%Y-%m-%d %H:%M:%S') if vm.last_start_time else None,
+        'created_at': vm.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def _billing_data(record):
+    return {
+        'billing_date': record.billing_date.strftime('%Y-%m-%d'),
+        'cpu_cores': record.cpu_cores,
+        'memory_gb': record.memory_gb,
+        'storage_gb': record.storage_gb,
+        'running_hours': record.running_hours,
+        'hourly_rate': str(record.hourly_rate),
+        'daily_cost': str(record.daily_cost),
+        'actual_daily_cost': str(record.actual_daily_cost),
+        'discount_rate': str(record.discount_rate)
+    }
+
+
+def _adjustment_data(adj):
+    return {
+        'adjustment_type': adj.get_adjustment_type_display(),
+        'old_cpu': adj.old_cpu_cores,
+        'new_cpu': adj.new_cpu_cores,
+        'old_memory': adj.old_memory_gb,
+        'new_memory': adj.new_memory_gb,
+        'old_storage': adj.old_storage_gb,
+        'new_storage': adj.new_storage_gb,
+        'adjustment_date': adj.adjustment_date.strftime('%Y-%m-%d %H:%M:%S'),
+        'effective_date': adj.effective_date.strftime('%Y-%m-%d'),
+        'adjustment_detail': adj.adjustment_detail,
+        'operator': adj.operator.username if adj.operator else '系统',
+        'cost_impact': str(adj.cost_impact)
+    }
@@ -0,0 +1,423 @@
+"""
+虚拟机异步操作任务
+
+创建虚拟机、创建快照、调整配置、重启等操作在 OpenStack 侧需要几十秒到数分钟，
+视图只负责校验参数并提交 VMOperationJob，立即返回任务ID；
+实际的 OpenStack 调用和状态轮询由 Celery 任务 run_vm_job 执行，
+进度与结果通过 push_vm_status_update 推送到租户/管理员 WebSocket 组，
+也可以通过任务状态接口查询。
+"""
+
+import logging
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .metering import record_transition
+from .models import VirtualMachine, VMOperationJob, VMOperationLog, VMSnapshot, VMStatusTransition
+from .sync import OPENSTACK_STATUS_MAP, first_address
+
+logger = logging.getLogger(__name__)
+
+# 轮询 OpenStack 状态的间隔（秒）
+POLL_INTERVAL = 3
+
+# 各类任务等待完成的超时时间（秒）
+JOB_TIMEOUTS = {
+    VMOperationJob.JobType.CREATE: 600,
+    VMOperationJob.JobType.SNAPSHOT: 1800,
+    VMOperationJob.JobType.RESIZE: 600,
+    VMOperationJob.JobType.REBOOT: 300,
+}
+
+
+class VMJobConflictError(Exception):
+    """同一虚拟机已有操作在执行"""
+    pass
+
+
+class VMJobError(Exception):
+    """任务执行失败"""
+    pass
+
+
+def _lock_key(vm_id):
+    # 与租户门户 vm_operation_lock 使用同一个键，同步操作与异步任务互斥
+    return f'vm_operation_lock:{vm_id}'
+
+
+def submit_vm_job(job_type, vm=None, openstack_id='', params=None, user=None, lock=True):
+    """
+    提交虚拟机异步任务
+
+    Args:
+        job_type: VMOperationJob.JobType
+        vm: 关联的 VirtualMachine（可为空，如直接操作 OpenStack 实例）
+        openstack_id: OpenStack 实例ID，默认取 vm.openstack_id
+        params: 任务参数（需可 JSON 序列化）
+        user: 操作者
+        lock: 是否持有虚拟机操作锁直到任务结束
+
+    Raises:
+        VMJobConflictError: 该虚拟机正在执行其他操作
+    """
+    job = VMOperationJob(
+        job_type=job_type,
+        virtual_machine=vm,
+        openstack_id=openstack_id or (vm.openstack_id if vm else '') or '',
+        params=params or {},
+        created_by=user,
+    )
+
+    if lock and vm is not None:
+        if not cache.add(_lock_key(vm.id), str(job.id), JOB_TIMEOUTS[job_type] + 60):
+            raise VMJobConflictError('该虚拟机正在执行其他操作，请稍后重试')
+        job.params['_locked'] = True
+
+    job.save()
+
+    def enqueue():
+        from .tasks import run_vm_job
+        result = run_vm_job.delay(str(job.id))
+        VMOperationJob.objects.filter(pk=job.pk).update(celery_task_id=result.id or '')
+
+    transaction.on_commit(enqueue)
+    push_job_update(job)
+    return job
+
+
+def push_job_update(job):
+    """推送任务进度（没有关联虚拟机时只更新数据库）"""
+    vm = job.virtual_machine
+    if vm is None:
+        return
+    from apps.tenants.tenant_portal_views import push_vm_status_update
+    push_vm_status_update(vm, action=job.job_type, operating=not job.is_finished, job=job)
+
+
+def _update(job, progress=None, message=None, **fields):
+    """更新任务进度并推送"""
+    if progress is not None:
+        job.progress = max(job.progress, min(int(progress), 100))
+    if message is not None:
+        job.message = message[:255]
+    for field, value in fields.items():
+        setattr(job, field, value)
+    job.save()
+    push_job_update(job)
+
+
+def _log_operation(job, operation_type, detail, success):
+    """记录虚拟机操作日志与活动日志"""
+    vm = job.virtual_machine
+    if vm is None or not vm.pk:
+        return
+    VMOperationLog.objects.create(
+        virtual_machine=vm,
+        operation_type=operation_type,
+        operator=job.created_by,
+        operation_detail=detail,
+        success=success
+    )
+    if success and job.created_by:
+        try:
+            from apps.monitoring.models import ActivityLog
+            ActivityLog.log_activity(
+                action_type='create' if operation_type == 'create' else 'system',
+                description=f'{job.created_by.username} {detail}',
+                user=job.created_by,
+                ip_address=job.params.get('ip_address')
+            )
+        except Exception as e:
+            logger.warning(f'记录活动日志失败: {str(e)}')
+
+
+def _wait_for_server(service, job, is_done, timeout, progress_from, progress_to, message):
+    """
+    轮询服务器状态直到 is_done(server) 为真
+
+    Returns:
+        最后一次获取的服务器详情
+
+    Raises:
+        VMJobError: 服务器进入 ERROR 状态、消失或等待超时
+    """
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        server = service.get_server(job.openstack_id)
+        if server is None:
+            raise VMJobError('OpenStack 中找不到该实例')
+        server_status = (server.get('status') or '').upper()
+        if server_status == 'ERROR':
+            fault = (server.get('fault') or {}).get('message', '')
+            raise VMJobError(f'实例进入 ERROR 状态{": " + fault if fault else ""}')
+        if is_done(server, time.time() - start_time):
+            return server
+
+        # Nova 在构建/迁移期间会返回 progress（0-100），没有时按耗时估算
+        nova_progress = server.get('progress') or int(100 * (time.time() - start_time) / timeout)
+        _update(
+            job,
+            progress=progress_from + (progress_to - progress_from) * min(nova_progress, 100) / 100,
+            message=f'{message}（{server_status}）'
+        )
+        time.sleep(POLL_INTERVAL)
+    raise VMJobError('等待 OpenStack 操作完成超时')
+
+
+# ==================== 各类任务 ====================
+
+def _run_create(service, job):
+    """创建虚拟机"""
+    vm = job.virtual_machine
+    params = job.params
+    source_type = params.get('source_type', 'image')
+    extra_kwargs = {}
+    if params.get('availability_zone'):
+        extra_kwargs['availability_zone'] = params['availability_zone']
+
+    try:
+        _update(job, progress=5, message='正在提交创建请求')
+        if source_type in ['image', 'instance_snapshot']:
+            server = service.create_server(
+                name=vm.name,
+                image_id=params['image_id'],
+                flavor_id=params['flavor_id'],
+                network_ids=[params['network_id']],
+                wait=False,
+                **extra_kwargs
+            )
+        elif source_type == 'volume':
+            server = service.create_server_from_volume(
+                name=vm.name,
+                volume_id=params['volume_id'],
+                flavor_id=params['flavor_id'],
+                network_ids=[params['network_id']],
+                wait=False,
+                **extra_kwargs
+            )
+        elif source_type == 'volume_snapshot':
+            server = service.create_server_from_snapshot(
+                name=vm.name,
+                snapshot_id=params['snapshot_id'],
+                flavor_id=params['flavor_id'],
+                network_ids=[params['network_id']],
+                wait=False,
+                **extra_kwargs
+            )
+        else:
+            raise VMJobError(f'不支持的启动源类型: {source_type}')
+
+        # 先记录实例ID，避免同步任务把构建中的实例当作"数据库中没有的虚拟机"
+        vm.openstack_id = server.get('id')
+        vm.save(update_fields=['openstack_id', 'updated_at'])
+        job.openstack_id = vm.openstack_id
+        _update(job, progress=20, message='实例构建中')
+
+        server = _wait_for_server(
+            service, job,
+            lambda s, elapsed: (s.get('status') or '').upper() == 'ACTIVE',
+            JOB_TIMEOUTS[job.job_type], 20, 95, '实例构建中'
+        )
+    except Exception as e:
+        # OpenStack 创建失败，删除数据库记录（与同步创建时的处理一致），删除前推送失败结果
+        logger.error(f"OpenStack 创建虚拟机失败: {str(e)}")
+        job.status = VMOperationJob.Status.FAILED
+        job.error_message = str(e)
+        push_job_update(job)
+        job.virtual_machine = None
+        vm.delete()
+        raise
+
+    ip_address, mac_address = first_address(server)
+    if ip_address:
+        vm.ip_address = ip_address
+    if mac_address:
+        vm.mac_address = mac_address
+    old_status = vm.status
+    vm.status = VirtualMachine.VMStatus.RUNNING
+    vm.last_start_time = timezone.now()
+    vm.save()
+    record_transition(vm, old_status, vm.status, VMStatusTransition.Source.JOB, vm.last_start_time)
+
+    _log_operation(job, 'create', f'创建了虚拟机 {vm.name}，实例ID: {vm.openstack_id}', True)
+    return {
+        'vm_id': str(vm.id),
+        'openstack_id': vm.openstack_id,
+        'ip_address': vm.ip_address,
+        'mac_address': vm.mac_address,
+        'status': vm.status,
+    }
+
+
+def _run_snapshot(service, job):
+    """创建虚拟机快照"""
+    snapshot = VMSnapshot.objects.get(pk=job.params['snapshot_id'])
+    try:
+        _update(job, progress=5, message='正在提交快照请求')
+        image_id = service.create_server_snapshot(job.openstack_id, snapshot.name, wait=False)
+        if not image_id:
+            raise VMJobError('OpenStack returned no image ID')
+        snapshot.openstack_image_id = image_id
+        snapshot.save(update_fields=['openstack_image_id'])
+        _update(job, progress=15, message='快照上传中')
+
+        start_time = time.time()
+        timeout = JOB_TIMEOUTS[job.job_type]
+        while True:
+            image = service.get_image(image_id)
+            image_status = ((image or {}).get('status') or '').lower()
+            if image_status == 'active':
+                break
+            if image_status in ['error', 'killed', 'deleted']:
+                raise VMJobError(f'快照创建失败，状态: {image_status}')
+            elapsed = time.time() - start_time
+            if elapsed >= timeout:
+                raise VMJobError('等待快照创建超时')
+            _update(job, progress=15 + 80 * elapsed / timeout, message=f'快照上传中（{image_status or "queued"}）')
+            time.sleep(POLL_INTERVAL)
+    except Exception as e:
+        snapshot.status = 'error'
+        snapshot.description = (snapshot.description or '') + f" (Error: {str(e)})"
+        snapshot.save()
+        raise
+
+    snapshot.status = 'available'
+    snapshot.size_gb = int(((image.get('size') or 0) + 1024 ** 3 - 1) / 1024 ** 3)
+    snapshot.save()
+    return {'snapshot_id': str(snapshot.id), 'image_id': image_id}
+
+
+def _run_resize(service, job):
+    """调整虚拟机配置"""
+    params = job.params
+    auto_confirm = params.get('auto_confirm', True)
+
+    _update(job, progress=5, message='正在提交调整请求')
+    if not service.resize_server(job.openstack_id, params['flavor_id'], auto_confirm=False):
+        raise VMJobError('OpenStack 配置调整失败')
+
+    seen_resize = []
+
+    def is_done(server, elapsed):
+        server_status = (server.get('status') or '').upper()
+        if server_status == 'VERIFY_RESIZE':
+            return True
+        if server_status == 'RESIZE':
+            seen_resize.append(True)
+            return False
+        # 部分 OpenStack 版本会自动确认，直接回到 ACTIVE/SHUTOFF；
+        # 没观察到 RESIZE 时以 task_state 清空为准，避免把提交前的状态误判为完成
+        return server_status in ('ACTIVE', 'SHUTOFF') and (
+            seen_resize or (not server.get('task_state') and elapsed > 10)
+        )
+
+    server = _wait_for_server(service, job, is_done, JOB_TIMEOUTS[job.job_type], 10, 90, '配置调整中')
+    if (server.get('status') or '').upper() == 'VERIFY_RESIZE' and auto_confirm:
+        _update(job, progress=95, message='正在确认配置调整')
+        if not service.confirm_server_resize(job.openstack_id):
+            raise VMJobError('确认配置调整失败')
+
+    vm = job.virtual_machine
+    if vm is not None and params.get('cpu_cores'):
+        old_config = f'{vm.cpu_cores}核/{vm.memory_gb}GB/{vm.disk_gb}GB'
+        vm.cpu_cores = params['cpu_cores']
+        vm.memory_gb = params['memory_gb']
+        vm.disk_gb = params['disk_gb']
+        vm.save()
+        _log_operation(
+            job, 'resize',
+            f'调整配置: {old_config} -> {vm.cpu_cores}核/{vm.memory_gb}GB/{vm.disk_gb}GB', True
+        )
+    return {'flavor_id': params['flavor_id'], 'status': server.get('status')}
+
+
+def _run_reboot(service, job):
+    """重启虚拟机"""
+    reboot_type = job.params.get('reboot_type', 'SOFT')
+    _update(job, progress=10, message='正在提交重启请求')
+    if not service.reboot_server(job.openstack_id, reboot_type, wait=False):
+        raise VMJobError('重启虚拟机失败')
+
+    seen_reboot = []
+
+    def is_done(server, elapsed):
+        server_status = (server.get('status') or '').upper()
+        if server_status in ('REBOOT', 'HARD_REBOOT'):
+            seen_reboot.append(True)
+            return False
+        # 5秒后仍是 ACTIVE 可能没有观察到 REBOOT 状态，也认为完成
+        return server_status == 'ACTIVE' and (seen_reboot or elapsed > 5)
+
+    _wait_for_server(service, job, is_done, JOB_TIMEOUTS[job.job_type], 20, 95, '重启中')
+
+    vm = job.virtual_machine
+    if vm is not None:
+        old_status = vm.status
+        vm.status = VirtualMachine.VMStatus.RUNNING
+        vm.last_start_time = timezone.now()
+        vm.save()
+        record_transition(vm, old_status, vm.status, VMStatusTransition.Source.JOB, vm.last_start_time)
+        _log_operation(job, 'restart', f'重启了虚拟机 {vm.name}', True)
+    return {'status': 'ACTIVE'}
+
+
+JOB_HANDLERS = {
+    VMOperationJob.JobType.CREATE: _run_create,
+    VMOperationJob.JobType.SNAPSHOT: _run_snapshot,
+    VMOperationJob.JobType.RESIZE: _run_resize,
+    VMOperationJob.JobType.REBOOT: _run_reboot,
+}
+
+
+def execute_vm_job(job_id):
+    """执行异步任务（由 Celery 任务 run_vm_job 调用）"""
+    from apps.openstack.services import get_openstack_service
+
+    job = VMOperationJob.objects.select_related(
+        'virtual_machine__information_system__tenant', 'created_by'
+    ).get(pk=job_id)
+    if job.status != VMOperationJob.Status.PENDING:
+        logger.warning(f'任务 {job_id} 状态为 {job.status}，跳过')
+        return
+
+    vm_id = job.virtual_machine_id
+    _update(job, progress=0, message='任务开始执行', status=VMOperationJob.Status.RUNNING, started_at=timezone.now())
+
+    try:
+        result = JOB_HANDLERS[job.job_type](get_openstack_service(), job)
+        _update(
+            job, progress=100, message='任务完成', result=result or {},
+            status=VMOperationJob.Status.SUCCEEDED, finished_at=timezone.now()
+        )
+        logger.info(f'虚拟机任务完成: {job}')
+    except Exception as e:
+        logger.error(f'虚拟机任务失败: {job}: {str(e)}', exc_info=True)
+        if job.virtual_machine is not None:
+            # 失败后以 OpenStack 实际状态为准刷新本地状态
+            _refresh_vm_status(job)
+            _log_operation(job, job.job_type, f'{job.get_job_type_display()}失败: {str(e)}', False)
+        _update(
+            job, message='任务失败', error_message=str(e),
+            status=VMOperationJob.Status.FAILED, finished_at=timezone.now()
+        )
+    finally:
+        if job.params.get('_locked') and vm_id:
+            cache.delete(_lock_key(vm_id))
+
+
+def _refresh_vm_status(job):
+    try:
+        from apps.openstack.services import get_openstack_service
+        server = get_openstack_service().get_server(job.openstack_id) if job.openstack_id else None
+        if server:
+            vm = job.virtual_machine
+            new_status = OPENSTACK_STATUS_MAP.get((server.get('status') or '').upper())
+            if new_status and new_status != vm.status:
+                old_status = vm.status
+                vm.status = new_status
+                vm.save(update_fields=['status', 'updated_at'])
+                record_transition(vm, old_status, new_status, VMStatusTransition.Source.SYNC)
+    except Exception as e:
+        logger.warning(f'刷新虚拟机状态失败: {str(e)}')
@@ -0,0 +1,35 @@
+"""
+Django管理命令：由虚拟机操作日志回填状态变化记录，并重新计算运行时长计量
+"""
+
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.information_systems.metering import backfill_from_operation_logs, compute_daily_usage
+
+
+class Command(BaseCommand):
+    help = '由 VMOperationLog 回填虚拟机状态变化记录（可重复执行），并按需重新计算最近几天的运行时长'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只统计，不写数据库')
+        parser.add_argument('--no-seed', action='store_true', help='不为没有任何记录的虚拟机补充初始状态')
+        parser.add_argument('--days', type=int, default=0, help='回填后重新计算最近 N 天（不含今天）的运行时长')
+
+    def handle(self, *args, **options):
+        summary = backfill_from_operation_logs(seed=not options['no_seed'], dry_run=options['dry_run'])
+        prefix = '[DRY-RUN] ' if options['dry_run'] else ''
+        self.stdout.write(
+            f"{prefix}操作日志回填 {summary['replayed']} 条，初始状态 {summary['seeded']} 条，"
+            f"涉及 {summary['vm_count']} 台虚拟机"
+        )
+        if options['dry_run']:
+            return
+
+        today = timezone.localdate()
+        for offset in range(options['days'], 0, -1):
+            usage = compute_daily_usage(today - timedelta(days=offset))
+            self.stdout.write(
+                f"{usage['usage_date']}: {usage['vm_count']} 台虚拟机，{usage['system_count']} 个信息系统"
+            )
+        self.stdout.write(self.style.SUCCESS('回填完成'))
@@ -0,0 +1,48 @@
+"""
+Django管理命令：订阅 Nova 版本化通知，实时更新虚拟机状态
+
+需要在 nova.conf 中开启版本化通知：
+    [notifications]
+    notification_format = versioned
+    [oslo_messaging_notifications]
+    driver = messagingv2
+"""
+
+import signal
+from django.core.management.base import BaseCommand
+from apps.information_systems.notifications import NotificationWorker, build_bus, get_notification_config
+
+
+class Command(BaseCommand):
+    help = '订阅 Nova 版本化通知，实时把虚拟机状态变化写入数据库并推送 WebSocket'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='消息总线地址，默认使用 settings.OPENSTACK_NOTIFICATIONS["URL"]',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            bus = build_bus(options.get('url'))
+        except ValueError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+
+        notification_config = get_notification_config()
+        worker = NotificationWorker(bus)
+
+        def shutdown(signum, frame):
+            self.stdout.write(self.style.WARNING('正在停止 Nova 通知接入...'))
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'开始接收 Nova 通知: exchange={notification_config["EXCHANGE"]}, topic={notification_config["TOPIC"]}'
+        ))
+        worker.run()
+        self.stdout.write(self.style.SUCCESS(
+            f'已停止，共处理 {worker.handler.processed} 条通知，忽略 {worker.handler.ignored} 条'
+        ))
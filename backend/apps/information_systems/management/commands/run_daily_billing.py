@@ -0,0 +1,41 @@
+"""
+Django管理命令：生成每日计费记录（补跑、重跑指定日期或分片）
+"""
+
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from apps.information_systems.billing import run_daily_billing
+
+
+class Command(BaseCommand):
+    help = '按租户分片生成指定日期的每日计费记录，已完成的分片默认跳过'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='计费日期（YYYY-MM-DD），默认昨天')
+        parser.add_argument('--shards', help='只处理指定分片，逗号分隔，如 0,3,7')
+        parser.add_argument('--shard-count', type=int, help='分片总数，默认 settings.DAILY_BILLING_SHARDS')
+        parser.add_argument('--force', action='store_true', help='已完成的分片也重新计算')
+
+    def handle(self, *args, **options):
+        try:
+            billing_date = date.fromisoformat(options['date']) if options['date'] else None
+            shards = [int(shard) for shard in options['shards'].split(',')] if options['shards'] else None
+        except ValueError as e:
+            raise CommandError(f'参数无效: {e}')
+
+        summary = run_daily_billing(
+            billing_date=billing_date,
+            shard_count=options['shard_count'],
+            shards=shards,
+            force=options['force'],
+        )
+
+        self.stdout.write(
+            f"{summary['billing_date']}: 完成 {len(summary['completed'])} 个分片，"
+            f"跳过 {len(summary['skipped'])} 个，共 {summary['system_count']} 个系统，"
+            f"实际费用合计 {summary['total_cost']}"
+        )
+        if summary['failed']:
+            self.stdout.write(self.style.ERROR(f"失败分片: {','.join(map(str, summary['failed']))}"))
+        else:
+            self.stdout.write(self.style.SUCCESS('每日计费完成'))
@@ -0,0 +1,269 @@
+"""
+虚拟机运行时长计量
+
+状态同步、控制操作、异步任务和 Nova 通知在改变虚拟机状态时调用 record_transitions，
+把状态变化追加写入 VMStatusTransition；compute_daily_usage 按天把状态变化还原为运行区间：
+  - 每台虚拟机的状态序列中，状态为运行中的一段记为区间 [变化时间, 下一次变化时间)，截取到当天范围内
+  - 同一台虚拟机的区间合并后求和得到 VMDailyUsage.running_seconds
+    （多个来源先后记录同一次启动时产生的重叠区间只计一次）
+  - 同一信息系统下所有虚拟机的区间合并后求和得到 SystemDailyUsage.running_seconds
+每日计费直接读取 SystemDailyUsage，不再根据当前状态和运行模式推算运行时长。
+
+当天开始时的状态取当天之前最后一条状态变化；没有更早记录时取当天第一条记录的原状态。
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def record_transitions(transitions, source):
+    """
+    追加状态变化记录，状态未变化的条目会被忽略
+
+    Args:
+        transitions: 可迭代的 (vm, from_status, to_status, occurred_at)；occurred_at 为 None 时使用当前时间
+        source: VMStatusTransition.Source
+    """
+    from .models import VMStatusTransition
+
+    now = timezone.now()
+    rows = [
+        VMStatusTransition(
+            virtual_machine_id=vm.pk,
+            information_system_id=vm.information_system_id,
+            from_status=from_status or '',
+            to_status=to_status,
+            occurred_at=occurred_at or now,
+            source=source,
+        )
+        for vm, from_status, to_status, occurred_at in transitions
+        if from_status != to_status
+    ]
+    if rows:
+        VMStatusTransition.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def record_transition(vm, from_status, to_status, source, occurred_at=None):
+    return record_transitions([(vm, from_status, to_status, occurred_at)], source)
+
+
+def day_bounds(usage_date):
+    start = timezone.make_aware(datetime.combine(usage_date, time.min))
+    return start, start + timedelta(days=1)
+
+
+def running_intervals(initial_status, changes, start, end):
+    """
+    状态序列 -> 运行区间
+
+    Args:
+        initial_status: start 时刻的状态
+        changes: 按时间排序的 [(occurred_at, to_status)]，均位于 [start, end) 内
+    Returns:
+        list: [(开始, 结束)]
+    """
+    from .models import VirtualMachine
+
+    running = VirtualMachine.VMStatus.RUNNING
+    intervals = []
+    since, status = start, initial_status
+    for occurred_at, to_status in changes:
+        if status == running and occurred_at > since:
+            intervals.append((since, occurred_at))
+        since, status = occurred_at, to_status
+    if status == running and end > since:
+        intervals.append((since, end))
+    return intervals
+
+
+def merge_intervals(intervals):
+    """合并重叠或相接的区间"""
+    merged = []
+    for begin, finish in sorted(intervals):
+        if merged and begin <= merged[-1][1]:
+            if finish > merged[-1][1]:
+                merged[-1] = (merged[-1][0], finish)
+        else:
+            merged.append((begin, finish))
+    return merged
+
+
+def interval_seconds(intervals):
+    return int(sum((finish - begin).total_seconds() for begin, finish in merge_intervals(intervals)))
+
+
+def compute_daily_usage(usage_date, now=None):
+    """
+    计算某一天的虚拟机/信息系统运行时长并写入 VMDailyUsage、SystemDailyUsage（可重复执行）
+    当天尚未结束时只计算到当前时间。
+
+    Returns:
+        dict: {'usage_date', 'vm_count', 'system_count', 'running_seconds'}
+    """
+    from .models import InformationSystem, SystemDailyUsage, VirtualMachine, VMDailyUsage, VMStatusTransition
+
+    start, day_end = day_bounds(usage_date)
+    end = min(day_end, now or timezone.now())
+
+    # 当天开始时各虚拟机的状态（当天之前最后一条状态变化）
+    carried = VirtualMachine.objects.annotate(
+        carried_status=Subquery(
+            VMStatusTransition.objects.filter(
+                virtual_machine_id=OuterRef('pk'), occurred_at__lt=start
+            ).order_by('-occurred_at', '-id').values('to_status')[:1]
+        )
+    ).filter(carried_status__isnull=False).values_list('id', 'information_system_id', 'carried_status')
+
+    # {vm_id: [information_system_id, 初始状态, [(occurred_at, to_status)]]}
+    timelines = {vm_id: [system_id, status, []] for vm_id, system_id, status in carried}
+    changes = VMStatusTransition.objects.filter(
+        occurred_at__gte=start, occurred_at__lt=end
+    ).order_by('occurred_at', 'id').values_list(
+        'virtual_machine_id', 'information_system_id', 'from_status', 'occurred_at', 'to_status'
+    )
+    for vm_id, system_id, from_status, occurred_at, to_status in changes.iterator():
+        timeline = timelines.setdefault(vm_id, [system_id, from_status, []])
+        timeline[0] = system_id
+        timeline[2].append((occurred_at, to_status))
+
+    # 已删除的信息系统不再计量
+    existing_systems = set(InformationSystem.objects.values_list('pk', flat=True))
+
+    vm_rows = []
+    system_intervals = {}
+    for vm_id, (system_id, initial_status, vm_changes) in timelines.items():
+        if system_id not in existing_systems or (initial_status == VMStatusTransition.DELETED and not vm_changes):
+            continue
+        intervals = running_intervals(initial_status, vm_changes, start, end)
+        system_intervals.setdefault(system_id, []).extend(intervals)
+        vm_rows.append(VMDailyUsage(
+            virtual_machine_id=vm_id,
+            information_system_id=system_id,
+            usage_date=usage_date,
+            running_seconds=interval_seconds(intervals),
+        ))
+
+    vm_counts = {}
+    for row in vm_rows:
+        vm_counts[row.information_system_id] = vm_counts.get(row.information_system_id, 0) + 1
+    system_rows = [
+        SystemDailyUsage(
+            information_system_id=system_id,
+            usage_date=usage_date,
+            running_seconds=interval_seconds(intervals),
+            vm_count=vm_counts[system_id],
+        )
+        for system_id, intervals in system_intervals.items()
+    ]
+
+    with transaction.atomic():
+        VMDailyUsage.objects.filter(usage_date=usage_date).delete()
+        SystemDailyUsage.objects.filter(usage_date=usage_date).delete()
+        VMDailyUsage.objects.bulk_create(vm_rows, batch_size=BATCH_SIZE)
+        SystemDailyUsage.objects.bulk_create(system_rows, batch_size=BATCH_SIZE)
+
+    total = sum(row.running_seconds for row in vm_rows)
+    logger.info(f'运行时长计量 {usage_date}: {len(vm_rows)} 台虚拟机，{len(system_rows)} 个信息系统')
+    return {
+        'usage_date': usage_date.isoformat(),
+        'vm_count': len(vm_rows),
+        'system_count': len(system_rows),
+        'running_seconds': total,
+    }
+
+
+def backfill_from_operation_logs(seed=True, dry_run=False):
+    """
+    由 VMOperationLog 中成功的启动/停止/暂停/恢复/重启/创建/删除操作回填状态变化记录
+
+    回填记录（source=backfill）是派生数据，重新回填时先删除此前的回填记录再重新生成；
+    某台虚拟机开始有实时记录后，以实时记录为准，更晚的操作日志不再回填。
+    seed 为 True 时，为仍然没有任何状态变化记录的虚拟机按当前状态补一条初始记录
+    （运行中取最后启动时间，否则取最后停止时间或创建时间）。
+
+    Returns:
+        dict: {'replayed', 'seeded', 'vm_count'}
+    """
+    from django.db.models import Min
+    from .models import VirtualMachine, VMOperationLog, VMStatusTransition
+
+    Operation = VMOperationLog.OperationType
+    running = VirtualMachine.VMStatus.RUNNING
+    operation_status = {
+        Operation.START: running,
+        Operation.RESTART: running,
+        Operation.RESUME: running,
+        'create': running,
+        Operation.STOP: VirtualMachine.VMStatus.STOPPED,
+        Operation.PAUSE: VirtualMachine.VMStatus.PAUSED,
+        Operation.DELETE: VMStatusTransition.DELETED,
+    }
+    backfilled = VMStatusTransition.objects.filter(source=VMStatusTransition.Source.BACKFILL)
+    live_since = dict(
+        VMStatusTransition.objects.exclude(source=VMStatusTransition.Source.BACKFILL)
+        .values('virtual_machine_id').annotate(first=Min('occurred_at')).values_list('virtual_machine_id', 'first')
+    )
+
+    logs = VMOperationLog.objects.filter(
+        success=True, operation_type__in=list(operation_status)
+    ).order_by('virtual_machine_id', 'operation_time', 'id').values_list(
+        'virtual_machine_id', 'virtual_machine__information_system_id', 'operation_type', 'operation_time'
+    )
+
+    rows = []
+    current = {}
+    for vm_id, system_id, operation_type, operation_time in logs.iterator():
+        if vm_id in live_since and operation_time >= live_since[vm_id]:
+            continue
+        from_status = current.get(vm_id, '')
+        to_status = operation_status[operation_type]
+        if from_status == to_status:
+            continue
+        current[vm_id] = to_status
+        rows.append(VMStatusTransition(
+            virtual_machine_id=vm_id,
+            information_system_id=system_id,
+            from_status=from_status,
+            to_status=to_status,
+            occurred_at=operation_time,
+            source=VMStatusTransition.Source.BACKFILL,
+        ))
+    replayed = len(rows)
+
+    if seed:
+        tracked = set(live_since) | set(current)
+        vms = VirtualMachine.objects.values_list(
+            'id', 'information_system_id', 'status', 'last_start_time', 'last_stop_time', 'created_at'
+        )
+        for vm_id, system_id, status, last_start, last_stop, created_at in vms.iterator():
+            if vm_id in tracked:
+                continue
+            since = last_start if status == running else last_stop
+            rows.append(VMStatusTransition(
+                virtual_machine_id=vm_id,
+                information_system_id=system_id,
+                from_status='',
+                to_status=status,
+                occurred_at=since or created_at,
+                source=VMStatusTransition.Source.BACKFILL,
+            ))
+
+    summary = {
+        'replayed': replayed,
+        'seeded': len(rows) - replayed,
+        'vm_count': len({row.virtual_machine_id for row in rows}),
+    }
+    if not dry_run:
+        with transaction.atomic():
+            backfilled.delete()
+            VMStatusTransition.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        logger.info(f"状态变化回填: 操作日志 {summary['replayed']} 条，初始状态 {summary['seeded']} 条")
+    return summary
@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-17 01:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('information_systems', '0006_vmsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VMOperationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('job_type', models.CharField(choices=[('create', '创建'), ('snapshot', '快照'), ('resize', '调整配置'), ('reboot', '重启')], max_length=20, verbose_name='任务类型')),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('running', '执行中'), ('succeeded', '成功'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('progress', models.IntegerField(default=0, verbose_name='进度(%)')),
+                ('message', models.CharField(blank=True, max_length=255, verbose_name='进度说明')),
+                ('openstack_id', models.CharField(blank=True, max_length=100, verbose_name='OpenStack实例ID')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='任务参数')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='任务结果')),
+                ('error_message', models.TextField(blank=True, verbose_name='错误信息')),
+                ('celery_task_id', models.CharField(blank=True, max_length=255, verbose_name='Celery任务ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vm_operation_jobs', to=settings.AUTH_USER_MODEL, verbose_name='创建者')),
+                ('virtual_machine', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='operation_jobs', to='information_systems.virtualmachine', verbose_name='虚拟机')),
+            ],
+            options={
+                'verbose_name': '虚拟机异步任务',
+                'verbose_name_plural': '虚拟机异步任务',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-17 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('information_systems', '0007_vmoperationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBillingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_date', models.DateField(verbose_name='计费日期')),
+                ('shard', models.IntegerField(verbose_name='分片')),
+                ('shard_count', models.IntegerField(verbose_name='分片总数')),
+                ('status', models.CharField(choices=[('running', '执行中'), ('completed', '已完成'), ('failed', '失败')], default='running', max_length=20, verbose_name='状态')),
+                ('system_count', models.IntegerField(default=0, verbose_name='计费系统数')),
+                ('total_cost', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='实际费用合计')),
+                ('error_message', models.TextField(blank=True, verbose_name='错误信息')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+            ],
+            options={
+                'verbose_name': '每日计费运行记录',
+                'verbose_name_plural': '每日计费运行记录',
+                'ordering': ['-billing_date', 'shard'],
+                'unique_together': {('billing_date', 'shard', 'shard_count')},
+            },
+        ),
+    ]
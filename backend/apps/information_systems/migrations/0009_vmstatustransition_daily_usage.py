@@ -0,0 +1,80 @@
+# Generated by Django 4.2 on 2026-10-17 02:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('information_systems', '0008_dailybillingrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VMStatusTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('running', '运行中'), ('stopped', '已停止'), ('paused', '已暂停'), ('error', '异常'), ('deleted', '已删除')], max_length=20, verbose_name='原状态')),
+                ('to_status', models.CharField(choices=[('running', '运行中'), ('stopped', '已停止'), ('paused', '已暂停'), ('error', '异常'), ('deleted', '已删除')], max_length=20, verbose_name='新状态')),
+                ('occurred_at', models.DateTimeField(verbose_name='发生时间')),
+                ('source', models.CharField(choices=[('sync', '状态同步'), ('notification', 'Nova通知'), ('control', '控制操作'), ('job', '异步任务'), ('backfill', '历史回填')], max_length=20, verbose_name='来源')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='记录时间')),
+                ('information_system', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='vm_status_transitions', to='information_systems.informationsystem', verbose_name='信息系统')),
+                ('virtual_machine', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='status_transitions', to='information_systems.virtualmachine', verbose_name='虚拟机')),
+            ],
+            options={
+                'verbose_name': '虚拟机状态变化',
+                'verbose_name_plural': '虚拟机状态变化',
+                'ordering': ['occurred_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='VMDailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('usage_date', models.DateField(verbose_name='日期')),
+                ('running_seconds', models.IntegerField(default=0, verbose_name='运行秒数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('information_system', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vm_daily_usages', to='information_systems.informationsystem', verbose_name='信息系统')),
+                ('virtual_machine', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='daily_usages', to='information_systems.virtualmachine', verbose_name='虚拟机')),
+            ],
+            options={
+                'verbose_name': '虚拟机每日运行时长',
+                'verbose_name_plural': '虚拟机每日运行时长',
+                'ordering': ['-usage_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SystemDailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('usage_date', models.DateField(verbose_name='日期')),
+                ('running_seconds', models.IntegerField(default=0, verbose_name='运行秒数')),
+                ('vm_count', models.IntegerField(default=0, verbose_name='计量虚拟机数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('information_system', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usages', to='information_systems.informationsystem', verbose_name='信息系统')),
+            ],
+            options={
+                'verbose_name': '信息系统每日运行时长',
+                'verbose_name_plural': '信息系统每日运行时长',
+                'ordering': ['-usage_date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='vmstatustransition',
+            index=models.Index(fields=['virtual_machine', 'occurred_at'], name='information_virtual_e78e0f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vmstatustransition',
+            index=models.Index(fields=['occurred_at'], name='information_occurre_ecaeaa_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='vmdailyusage',
+            unique_together={('virtual_machine', 'usage_date')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='systemdailyusage',
+            unique_together={('information_system', 'usage_date')},
+        ),
+    ]
@@ -443,16 +443,11 @@ class DailyBillingRecord(models.Model):
         return f"{self.information_system.name} - {self.billing_date.strftime('%Y-%m-%d')}"
 
     def calculate_daily_cost(self):
-        """计算日费用"""
-        # 基础定价模型：CPU * 0.1 + 内存 * 0.05 + 存储 * 0.01 (每小时)
-        cpu_cost = self.cpu_cores * 0.1
-        memory_cost = self.memory_gb * 0.05
-        storage_cost = self.storage_gb * 0.01
-
-        hourly_rate = cpu_cost + memory_cost + storage_cost
-        self.hourly_rate = hourly_rate
-        self.daily_cost = hourly_rate * self.running_hours
-        self.actual_daily_cost = self.daily_cost * self.discount_rate
+        """计算日费用（与批量计费使用同一套 Decimal 计算）"""
+        from .billing import compute_daily_cost
+        self.hourly_rate, self.daily_cost, self.actual_daily_cost = compute_daily_cost(
+            self.cpu_cores, self.memory_gb, self.storage_gb, self.running_hours, self.discount_rate
+        )
 
     def save(self, *args, **kwargs):
         """保存时自动计算费用"""
@@ -461,6 +456,44 @@ class DailyBillingRecord(models.Model):
         super().save(*args, **kwargs)
 
 
+class DailyBillingRun(models.Model):
+    """每日计费运行记录（按租户分片，已完成的分片在重跑时跳过）"""
+
+    class Status(models.TextChoices):
+        RUNNING = 'running', _('执行中')
+        COMPLETED = 'completed', _('已完成')
+        FAILED = 'failed', _('失败')
+
+    billing_date = models.DateField(verbose_name=_('计费日期'))
+    shard = models.IntegerField(verbose_name=_('分片'))
+    shard_count = models.IntegerField(verbose_name=_('分片总数'))
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.RUNNING,
+        verbose_name=_('状态')
+    )
+    system_count = models.IntegerField(default=0, verbose_name=_('计费系统数'))
+    total_cost = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('实际费用合计')
+    )
+    error_message = models.TextField(blank=True, verbose_name=_('错误信息'))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_('开始时间'))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_('结束时间'))
+
+    class Meta:
+        verbose_name = _('每日计费运行记录')
+        verbose_name_plural = _('每日计费运行记录')
+        ordering = ['-billing_date', 'shard']
+        unique_together = ['billing_date', 'shard', 'shard_count']
+
+    def __str__(self):
+        return f"{self.billing_date.strftime('%Y-%m-%d')} - {self.shard}/{self.shard_count} - {self.get_status_display()}"
+
+
 class ResourceAdjustmentLog(models.Model):
     """资源调整日志"""
 
@@ -753,6 +786,115 @@ class VMOperationLog(models.Model):
         return f"{self.virtual_machine.name} - {self.get_operation_type_display()} - {self.operation_time.strftime('%Y-%m-%d %H:%M:%S')}"
 
 
+class VMStatusTransition(models.Model):
+    """
+    虚拟机状态变化记录（只追加，不修改）
+
+    虚拟机删除后记录仍然保留（不建外键约束），用于计算删除当天的运行时长。
+    """
+
+    DELETED = 'deleted'
+    STATUS_CHOICES = VirtualMachine.VMStatus.choices + [(DELETED, _('已删除'))]
+
+    class Source(models.TextChoices):
+        SYNC = 'sync', _('状态同步')
+        NOTIFICATION = 'notification', _('Nova通知')
+        CONTROL = 'control', _('控制操作')
+        JOB = 'job', _('异步任务')
+        BACKFILL = 'backfill', _('历史回填')
+
+    virtual_machine = models.ForeignKey(
+        VirtualMachine,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='status_transitions',
+        verbose_name=_('虚拟机')
+    )
+    information_system = models.ForeignKey(
+        InformationSystem,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='vm_status_transitions',
+        verbose_name=_('信息系统')
+    )
+    from_status = models.CharField(max_length=20, blank=True, choices=STATUS_CHOICES, verbose_name=_('原状态'))
+    to_status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name=_('新状态'))
+    occurred_at = models.DateTimeField(verbose_name=_('发生时间'))
+    source = models.CharField(max_length=20, choices=Source.choices, verbose_name=_('来源'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('记录时间'))
+
+    class Meta:
+        verbose_name = _('虚拟机状态变化')
+        verbose_name_plural = _('虚拟机状态变化')
+        ordering = ['occurred_at', 'id']
+        indexes = [
+            models.Index(fields=['virtual_machine', 'occurred_at']),
+            models.Index(fields=['occurred_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.virtual_machine_id} {self.from_status or '-'} → {self.to_status} ({self.occurred_at.strftime('%Y-%m-%d %H:%M:%S')})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('虚拟机状态变化记录只能追加，不能修改')
+        super().save(*args, **kwargs)
+
+
+class VMDailyUsage(models.Model):
+    """虚拟机每日运行时长（由状态变化记录计算）"""
+
+    virtual_machine = models.ForeignKey(
+        VirtualMachine,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='daily_usages',
+        verbose_name=_('虚拟机')
+    )
+    information_system = models.ForeignKey(
+        InformationSystem,
+        on_delete=models.CASCADE,
+        related_name='vm_daily_usages',
+        verbose_name=_('信息系统')
+    )
+    usage_date = models.DateField(verbose_name=_('日期'))
+    running_seconds = models.IntegerField(default=0, verbose_name=_('运行秒数'))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('更新时间'))
+
+    class Meta:
+        verbose_name = _('虚拟机每日运行时长')
+        verbose_name_plural = _('虚拟机每日运行时长')
+        ordering = ['-usage_date']
+        unique_together = ['virtual_machine', 'usage_date']
+
+    def __str__(self):
+        return f"{self.virtual_machine_id} - {self.usage_date.strftime('%Y-%m-%d')} - {self.running_seconds}s"
+
+
+class SystemDailyUsage(models.Model):
+    """信息系统每日运行时长（任一虚拟机运行即计为运行，各虚拟机运行区间合并后的总时长）"""
+
+    information_system = models.ForeignKey(
+        InformationSystem,
+        on_delete=models.CASCADE,
+        related_name='daily_usages',
+        verbose_name=_('信息系统')
+    )
+    usage_date = models.DateField(verbose_name=_('日期'))
+    running_seconds = models.IntegerField(default=0, verbose_name=_('运行秒数'))
+    vm_count = models.IntegerField(default=0, verbose_name=_('计量虚拟机数'))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('更新时间'))
+
+    class Meta:
+        verbose_name = _('信息系统每日运行时长')
+        verbose_name_plural = _('信息系统每日运行时长')
+        ordering = ['-usage_date']
+        unique_together = ['information_system', 'usage_date']
+
+    def __str__(self):
+        return f"{self.information_system_id} - {self.usage_date.strftime('%Y-%m-%d')} - {self.running_seconds}s"
+
+
 class VMSnapshot(models.Model):
     """虚拟机快照"""
     STATUS_CHOICES = (
@@ -780,4 +922,67 @@ class VMSnapshot(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"{self.virtual_machine.name} - {self.name}"
\ No newline at end of file
+        return f"{self.virtual_machine.name} - {self.name}"
+
+class VMOperationJob(models.Model):
+    """虚拟机异步操作任务（创建、快照、调整配置、重启等耗时操作由 Celery 执行）"""
+
+    class JobType(models.TextChoices):
+        CREATE = 'create', _('创建')
+        SNAPSHOT = 'snapshot', _('快照')
+        RESIZE = 'resize', _('调整配置')
+        REBOOT = 'reboot', _('重启')
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('等待中')
+        RUNNING = 'running', _('执行中')
+        SUCCEEDED = 'succeeded', _('成功')
+        FAILED = 'failed', _('失败')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job_type = models.CharField(max_length=20, choices=JobType.choices, verbose_name=_('任务类型'))
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name=_('状态')
+    )
+    progress = models.IntegerField(default=0, verbose_name=_('进度(%)'))
+    message = models.CharField(max_length=255, blank=True, verbose_name=_('进度说明'))
+
+    virtual_machine = models.ForeignKey(
+        VirtualMachine,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='operation_jobs',
+        verbose_name=_('虚拟机')
+    )
+    openstack_id = models.CharField(max_length=100, blank=True, verbose_name=_('OpenStack实例ID'))
+    params = models.JSONField(default=dict, blank=True, verbose_name=_('任务参数'))
+    result = models.JSONField(default=dict, blank=True, verbose_name=_('任务结果'))
+    error_message = models.TextField(blank=True, verbose_name=_('错误信息'))
+    celery_task_id = models.CharField(max_length=255, blank=True, verbose_name=_('Celery任务ID'))
+
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='vm_operation_jobs',
+        verbose_name=_('创建者')
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('创建时间'))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_('开始时间'))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_('结束时间'))
+
+    class Meta:
+        verbose_name = _('虚拟机异步任务')
+        verbose_name_plural = _('虚拟机异步任务')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_job_type_display()} - {self.get_status_display()} ({self.id})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.SUCCEEDED, self.Status.FAILED)
@@ -0,0 +1,487 @@
+"""
+Nova 版本化通知接入
+
+Nova 在实例状态变化时向消息总线（默认 exchange=nova, topic=versioned_notifications）发布
+instance.power_on.end / instance.delete.end / instance.resize.end 等版本化通知。
+这里的接入进程订阅这些通知，直接把状态写回 VirtualMachine 并推送到 WebSocket 组，
+状态延迟从轮询周期降到亚秒级；接入进程在线时，高频增量同步任务会跳过 changes-since 拉取，
+只保留定期全量对账作为兜底（见 sync.sync_vms_incremental）。
+
+也兼容 notification_format=unversioned/both 时的旧格式通知（compute.instance.*，topic 默认为
+notifications），解析时转换为对应的版本化事件名和正文结构。
+
+消息总线：
+  - KombuNotificationBus：基于 kombu，支持 amqp://（RabbitMQ）和 redis:// 传输
+  - LocalNotificationBus：进程内队列，用于本地调试和测试，通过 publish() 注入通知
+"""
+
+import json
+import logging
+import queue
+import time
+from datetime import timezone as dt_timezone
+from dateutil.parser import parse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .metering import record_transition
+from .models import VirtualMachine, VMStatusTransition
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NOTIFICATION_CONFIG = {
+    'URL': '',
+    'EXCHANGE': 'nova',
+    'TOPIC': 'versioned_notifications',
+    'QUEUE': 'cloud_platform.versioned_notifications',
+    'HEARTBEAT_TTL': 30,
+    'CLEANUP_DELETED': True,
+}
+
+# 接入进程心跳，存在即表示通知流在线
+HEARTBEAT_CACHE_KEY = 'openstack:notifications:heartbeat:{region}'
+# 每个实例最近一次处理的通知时间，用于丢弃乱序到达的旧通知
+EVENT_TS_CACHE_KEY = 'openstack:notifications:last_event:{uuid}'
+EVENT_TS_TIMEOUT = 3600
+
+# 消息总线断开后的重连间隔（秒）
+RECONNECT_INTERVAL = 5
+
+# Nova vm_state -> 本地虚拟机状态（未列出的状态保持本地状态不变）
+VM_STATE_MAP = {
+    'active': VirtualMachine.VMStatus.RUNNING,
+    'stopped': VirtualMachine.VMStatus.STOPPED,
+    'paused': VirtualMachine.VMStatus.PAUSED,
+    'error': VirtualMachine.VMStatus.ERROR,
+}
+
+# 需要处理的事件（其余事件如 *.start、instance.exists 只用于判断通知流是否在线）
+HANDLED_EVENTS = {
+    'instance.create.end',
+    'instance.power_on.end',
+    'instance.power_off.end',
+    'instance.reboot.end',
+    'instance.pause.end',
+    'instance.unpause.end',
+    'instance.suspend.end',
+    'instance.resume.end',
+    'instance.resize.end',
+    'instance.resize_finish.end',
+    'instance.resize_confirm.end',
+    'instance.resize_revert.end',
+    'instance.rebuild.end',
+    'instance.shutdown.end',
+    'instance.update',
+    'instance.delete.end',
+    'instance.soft_delete.end',
+}
+
+DELETE_EVENTS = {'instance.delete.end', 'instance.soft_delete.end'}
+RESIZE_EVENTS = {
+    'instance.resize.end',
+    'instance.resize_finish.end',
+    'instance.resize_confirm.end',
+    'instance.resize_revert.end',
+}
+
+
+def get_notification_config():
+    return {**DEFAULT_NOTIFICATION_CONFIG, **getattr(settings, 'OPENSTACK_NOTIFICATIONS', {})}
+
+
+def _region():
+    return settings.OPENSTACK_CONFIG.get('REGION_NAME') or 'default'
+
+
+def touch_heartbeat():
+    cache.set(HEARTBEAT_CACHE_KEY.format(region=_region()), timezone.now(), get_notification_config()['HEARTBEAT_TTL'])
+
+
+def last_heartbeat():
+    """通知接入进程最近一次心跳时间（心跳已过期时为 None）"""
+    try:
+        return cache.get(HEARTBEAT_CACHE_KEY.format(region=_region()))
+    except Exception:
+        return None
+
+
+def notifications_active():
+    """通知接入进程是否在线（心跳未过期）"""
+    return last_heartbeat() is not None
+
+# 旧格式事件名 -> 版本化事件名（其余 compute.instance.* 去掉 compute. 前缀即可）
+LEGACY_EVENT_PREFIX = 'compute.'
+LEGACY_EVENT_ALIASES = {
+    'compute.instance.finish_resize.end': 'instance.resize_finish.end',
+    'compute.instance.resize.confirm.end': 'instance.resize_confirm.end',
+    'compute.instance.resize.revert.end': 'instance.resize_revert.end',
+}
+
+
+def _object_data(value):
+    """取出 Nova 版本化对象（{'nova_object.data': {...}}）中的数据"""
+    if isinstance(value, dict) and 'nova_object.data' in value:
+        return value['nova_object.data'] or {}
+    return value or {}
+
+
+def parse_notification(body):
+    """
+    解析一条通知
+
+    兼容 oslo.messaging 的 2.0 信封（{'oslo.version': '2.0', 'oslo.message': '<json>'}）
+    和未封装的通知正文。
+
+    Returns:
+        dict: {'event_type', 'payload', 'timestamp'}，无法识别时返回 None
+    """
+    if isinstance(body, (bytes, str)):
+        body = json.loads(body)
+    if 'oslo.message' in body:
+        body = json.loads(body['oslo.message'])
+
+    event_type = body.get('event_type')
+    if not event_type:
+        return None
+
+    timestamp = body.get('timestamp')
+    try:
+        timestamp = parse(timestamp) if timestamp else None
+        if timestamp is not None and timezone.is_naive(timestamp):
+            # Nova 通知中的时间为 UTC
+            timestamp = timestamp.replace(tzinfo=dt_timezone.utc)
+    except (ValueError, OverflowError):
+        timestamp = None
+
+    payload = _object_data(body.get('payload'))
+    if event_type.startswith(LEGACY_EVENT_PREFIX + 'instance.'):
+        event_type = LEGACY_EVENT_ALIASES.get(event_type, event_type[len(LEGACY_EVENT_PREFIX):])
+        payload = _legacy_payload(payload)
+
+    return {
+        'event_type': event_type,
+        'payload': payload,
+        'timestamp': timestamp,
+    }
+
+
+def _legacy_payload(payload):
+    """旧格式通知正文 -> 版本化正文中用到的字段"""
+    return {
+        'uuid': payload.get('instance_id'),
+        'state': payload.get('state'),
+        'flavor': {
+            'vcpus': payload.get('vcpus'),
+            'memory_mb': payload.get('memory_mb'),
+            'root_gb': payload.get('root_gb'),
+        },
+        'ip_addresses': [
+            {'address': ip.get('address'), 'mac': ip.get('vif_mac')}
+            for ip in payload.get('fixed_ips') or []
+        ],
+    }
+
+
+class NovaNotificationHandler:
+    """
+    把 Nova 通知映射为 VirtualMachine 更新并推送 WebSocket
+
+    Args:
+        cleanup_deleted: 收到 instance.delete.end 时是否删除本地记录
+    """
+
+    def __init__(self, cleanup_deleted=True):
+        self.cleanup_deleted = cleanup_deleted
+        self.processed = 0
+        self.ignored = 0
+
+    def handle(self, body):
+        """
+        处理一条通知
+
+        Returns:
+            bool: 是否更新了本地虚拟机
+        """
+        try:
+            notification = parse_notification(body)
+        except (ValueError, TypeError) as e:
+            logger.warning(f'无法解析 Nova 通知: {str(e)}')
+            self.ignored += 1
+            return False
+
+        if notification is None or notification['event_type'] not in HANDLED_EVENTS:
+            self.ignored += 1
+            return False
+
+        payload = notification['payload']
+        instance_id = payload.get('uuid')
+        if not instance_id or self._is_stale(instance_id, notification['timestamp']):
+            self.ignored += 1
+            return False
+
+        vm = VirtualMachine.objects.select_related('information_system__tenant').filter(
+            openstack_id=instance_id
+        ).first()
+        if vm is None:
+            # 本地没有记录（如尚未导入的实例），交给定期全量对账处理
+            self.ignored += 1
+            return False
+
+        self.processed += 1
+        if notification['event_type'] in DELETE_EVENTS:
+            return self._handle_delete(vm, notification)
+        return self._handle_update(vm, notification)
+
+    def _is_stale(self, instance_id, timestamp):
+        """同一实例的通知可能乱序到达，早于已处理通知的直接丢弃"""
+        if timestamp is None:
+            return False
+        key = EVENT_TS_CACHE_KEY.format(uuid=instance_id)
+        last = cache.get(key)
+        if last is not None and timestamp < last:
+            return True
+        cache.set(key, timestamp, EVENT_TS_TIMEOUT)
+        return False
+
+    def _handle_delete(self, vm, notification):
+        old_status = vm.status
+        if not self.cleanup_deleted:
+            return False
+        self._push(vm, old_status, 'deleted', notification)
+        with transaction.atomic():
+            record_transition(
+                vm, old_status, VMStatusTransition.DELETED, VMStatusTransition.Source.NOTIFICATION,
+                notification['timestamp']
+            )
+            vm.delete()
+        logger.info(f'实例 {vm.openstack_id} 已在 OpenStack 中删除，已删除虚拟机记录 {vm.name}')
+        return True
+
+    def _handle_update(self, vm, notification):
+        payload = notification['payload']
+        event_type = notification['event_type']
+        old_status = vm.status
+        update_fields = []
+
+        new_status = VM_STATE_MAP.get((payload.get('state') or '').lower())
+        if new_status and new_status != vm.status:
+            vm.status = new_status
+            update_fields.append('status')
+            if new_status == VirtualMachine.VMStatus.RUNNING and event_type != 'instance.update':
+                vm.last_start_time = notification['timestamp'] or timezone.now()
+                update_fields.append('last_start_time')
+
+        if event_type in RESIZE_EVENTS or event_type == 'instance.create.end':
+            flavor = _object_data(payload.get('flavor'))
+            specs = {
+                'cpu_cores': flavor.get('vcpus'),
+                'memory_gb': flavor['memory_mb'] // 1024 if flavor.get('memory_mb') else None,
+                'disk_gb': flavor.get('root_gb'),
+            }
+            for field, value in specs.items():
+                if value and getattr(vm, field) != value:
+                    setattr(vm, field, value)
+                    update_fields.append(field)
+
+        addresses = [_object_data(item) for item in payload.get('ip_addresses') or []]
+        if addresses:
+            ip_address, mac_address = addresses[0].get('address'), addresses[0].get('mac')
+            if ip_address and vm.ip_address != ip_address:
+                vm.ip_address = ip_address
+                update_fields.append('ip_address')
+            if mac_address and vm.mac_address != mac_address:
+                vm.mac_address = mac_address
+                update_fields.append('mac_address')
+
+        if not update_fields:
+            return False
+
+        with transaction.atomic():
+            vm.save(update_fields=update_fields + ['updated_at'])
+            record_transition(
+                vm, old_status, vm.status, VMStatusTransition.Source.NOTIFICATION, notification['timestamp']
+            )
+        logger.info(f'[{event_type}] 虚拟机 {vm.name} 已更新: {", ".join(update_fields)}')
+        self._push(vm, old_status, vm.status, notification)
+        return True
+
+    def _push(self, vm, old_status, new_status, notification):
+        """推送到全局 vm_status_updates 组和虚拟机所属租户组"""
+        try:
+            from channels.layers import get_channel_layer
+            from asgiref.sync import async_to_sync
+
+            channel_layer = get_channel_layer()
+            if not channel_layer:
+                return
+
+            message = {
+                'type': 'vm_status_update',
+                'data': {
+                    'vm_id': str(vm.id),
+                    'openstack_id': vm.openstack_id,
+                    'name': vm.name,
+                    'old_status': old_status,
+                    'new_status': new_status,
+                    'event_type': notification['event_type'],
+                    'timestamp': (notification['timestamp'] or timezone.now()).isoformat(),
+                }
+            }
+            async_to_sync(channel_layer.group_send)('vm_status_updates', message)
+            tenant = vm.information_system.tenant if vm.information_system_id else None
+            if tenant is not None:
+                async_to_sync(channel_layer.group_send)(f'tenant_{tenant.id}', message)
+        except Exception as e:
+            logger.error(f'推送虚拟机状态变化失败: {str(e)}')
+
+
+class LocalNotificationBus:
+    """进程内通知总线（本地调试/测试用）"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def publish(self, body):
+        self._queue.put(body)
+
+    def drain(self, callback, timeout=1):
+        """
+        等待并处理通知，直到队列为空或超时
+
+        Returns:
+            int: 本次处理的通知数
+        """
+        count = 0
+        try:
+            body = self._queue.get(timeout=timeout)
+            while True:
+                callback(body)
+                count += 1
+                body = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        return count
+
+    def close(self):
+        pass
+
+
+class KombuNotificationBus:
+    """
+    基于 kombu 的通知总线，订阅 <TOPIC>.info 与 <TOPIC>.error
+
+    使用固定名称的持久队列，接入进程重启期间的通知不会丢失；
+    多个接入进程共享同一队列时自动分摊消息。
+    """
+
+    def __init__(self, url, exchange='nova', topic='versioned_notifications', queue_name=None):
+        from kombu import Connection, Exchange, Queue
+
+        self.connection = Connection(url)
+        nova_exchange = Exchange(exchange, type='topic', durable=False)
+        queue_name = queue_name or f'{topic}.cloud_platform'
+        self.queues = [
+            Queue(f'{queue_name}.{priority}', exchange=nova_exchange, routing_key=f'{topic}.{priority}', durable=True)
+            for priority in ('info', 'error')
+        ]
+        self._consumer = None
+
+    def drain(self, callback, timeout=1):
+        import socket
+
+        if self._consumer is None:
+            self.connection.ensure_connection(max_retries=3)
+
+            def on_message(body, message):
+                try:
+                    callback(body)
+                finally:
+                    message.ack()
+
+            self._consumer = self.connection.Consumer(self.queues, callbacks=[on_message], accept=['json'])
+            self._consumer.consume()
+
+        count = 0
+        try:
+            while True:
+                self.connection.drain_events(timeout=timeout if count == 0 else 0)
+                count += 1
+        except socket.timeout:
+            pass
+        return count
+
+    def close(self):
+        try:
+            if self._consumer is not None:
+                self._consumer.cancel()
+            self.connection.release()
+        except Exception:
+            pass
+        self._consumer = None
+
+
+def build_bus(url=None):
+    """按配置创建通知总线，URL 为 local:// 时使用进程内总线"""
+    notification_config = get_notification_config()
+    url = url or notification_config['URL']
+    if not url:
+        raise ValueError('未配置 OPENSTACK_NOTIFICATION_URL')
+    if url.startswith('local://'):
+        return LocalNotificationBus()
+    return KombuNotificationBus(
+        url,
+        exchange=notification_config['EXCHANGE'],
+        topic=notification_config['TOPIC'],
+        queue_name=notification_config['QUEUE'],
+    )
+
+
+class NotificationWorker:
+    """
+    通知接入循环：从总线取通知交给处理器，并定期刷新心跳
+
+    Args:
+        bus: LocalNotificationBus / KombuNotificationBus
+        handler: NovaNotificationHandler，默认按配置创建
+    """
+
+    def __init__(self, bus, handler=None):
+        self.bus = bus
+        self.handler = handler or NovaNotificationHandler(
+            cleanup_deleted=get_notification_config()['CLEANUP_DELETED']
+        )
+        self._stopped = False
+
+    def _handle(self, body):
+        try:
+            self.handler.handle(body)
+        except Exception as e:
+            # 单条通知处理失败不影响后续通知，遗漏的变化由全量对账兜底
+            logger.error(f'处理 Nova 通知失败: {str(e)}', exc_info=True)
+
+    def run_once(self, timeout=1):
+        """处理一批通知并刷新心跳"""
+        count = self.bus.drain(self._handle, timeout=timeout)
+        touch_heartbeat()
+        return count
+
+    def run(self):
+        logger.info('Nova 通知接入进程已启动')
+        try:
+            while not self._stopped:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    # 总线断开时不刷新心跳，高频同步任务会自动恢复 changes-since 拉取
+                    logger.error(f'读取 Nova 通知失败，{RECONNECT_INTERVAL} 秒后重连: {str(e)}')
+                    self.bus.close()
+                    time.sleep(RECONNECT_INTERVAL)
+        finally:
+            self.bus.close()
+            cache.delete(HEARTBEAT_CACHE_KEY.format(region=_region()))
+            logger.info('Nova 通知接入进程已停止')
+
+    def stop(self):
+        self._stopped = True
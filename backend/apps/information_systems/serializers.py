@@ -10,6 +10,7 @@ from .models import (
     SystemBillingRecord,
     VirtualMachine,
     VMOperationLog,
+    VMOperationJob,
     VMSnapshot
 )
 from apps.tenants.models import Tenant
@@ -325,4 +326,22 @@ class VMSnapshotSerializer(serializers.ModelSerializer):
             'openstack_image_id', 'size_gb', 'status', 'status_display',
             'created_at', 'created_by', 'created_by_name'
         ]
-        read_only_fields = ['id', 'openstack_image_id', 'size_gb', 'status', 'created_at', 'created_by']
\ No newline at end of file
+        read_only_fields = ['id', 'openstack_image_id', 'size_gb', 'status', 'created_at', 'created_by']
+
+
+class VMOperationJobSerializer(serializers.ModelSerializer):
+    """虚拟机异步任务序列化器"""
+
+    job_type_display = serializers.CharField(source='get_job_type_display', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    virtual_machine_name = serializers.CharField(source='virtual_machine.name', read_only=True, default=None)
+    created_by_name = serializers.CharField(source='created_by.username', read_only=True, default=None)
+
+    class Meta:
+        model = VMOperationJob
+        fields = [
+            'id', 'job_type', 'job_type_display', 'status', 'status_display', 'progress', 'message',
+            'virtual_machine', 'virtual_machine_name', 'openstack_id', 'result', 'error_message',
+            'created_by', 'created_by_name', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,512 @@
+"""
+OpenStack虚拟机对账引擎
+
+每轮只拉取一次服务器详情列表和一次规格列表，在内存中按 openstack_id 与数据库比对，
+再通过 bulk_update / bulk_create 批量写回，数据库写入量只与发生变化的虚拟机数量有关。
+"""
+
+import logging
+from datetime import timedelta, timezone as dt_timezone
+from dateutil.parser import parse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .metering import record_transition, record_transitions
+from .models import InformationSystem, ResourceAdjustmentLog, VirtualMachine, VMStatusTransition
+
+logger = logging.getLogger(__name__)
+
+# OpenStack 状态 -> 本地虚拟机状态（未列出的状态保持本地状态不变）
+OPENSTACK_STATUS_MAP = {
+    'ACTIVE': VirtualMachine.VMStatus.RUNNING,
+    'SHUTOFF': VirtualMachine.VMStatus.STOPPED,
+    'ERROR': VirtualMachine.VMStatus.ERROR,
+    'PAUSED': VirtualMachine.VMStatus.PAUSED,
+}
+
+# 导入 OpenStack 中已存在但数据库中没有的虚拟机时使用的默认信息系统
+IMPORT_SYSTEM_CODE = 'OS_IMPORT_SYS'
+
+# 增量同步状态（水位线）与互斥锁，存放在共享缓存中，所有 worker 可见
+SYNC_STATE_CACHE_KEY = 'openstack:vm_sync:state:{region}'
+SYNC_LOCK_CACHE_KEY = 'openstack:vm_sync:lock:{region}'
+SYNC_LOCK_TIMEOUT = 300
+
+DEFAULT_SYNC_CONFIG = {
+    'FULL_SYNC_INTERVAL': 600,
+    'MAX_GAP': 120,
+    'OVERLAP': 30,
+    'CLEANUP_DELETED': True,
+}
+
+
+def parse_launch_time(server):
+    """获取 OpenStack 中的真实启动时间（没有 launched_at 时使用创建时间）"""
+    value = server.get('launched_at') or server.get('created_at')
+    return parse(value) if value else None
+
+
+def status_changed_at(server, now):
+    """状态变化时间的估计：服务器的最后更新时间（不晚于 now），没有时使用 now"""
+    value = server.get('updated')
+    try:
+        return min(parse(value), now) if value else now
+    except (ValueError, TypeError, OverflowError):
+        return now
+
+
+def first_address(server):
+    """返回服务器第一个网络的第一个地址 (ip, mac)"""
+    for network_name, addr_list in (server.get('addresses') or {}).items():
+        if addr_list:
+            return addr_list[0].get('addr'), addr_list[0].get('OS-EXT-IPS-MAC:mac_addr')
+    return None, None
+
+
+class ReconcileResult:
+    """一轮对账的结果"""
+
+    def __init__(self):
+        self.server_count = 0     # OpenStack 返回的服务器数量
+        self.total = 0            # 参与比对的本地虚拟机数量
+        self.updated = []         # [(vm, [变更描述])]
+        self.not_found = []       # OpenStack 中已不存在的本地虚拟机
+        self.deleted = 0          # 实际删除的数据库记录数
+        self.errors = []          # [(vm, 错误信息)]
+        self.created = []         # 新建（dry-run 下为将新建）的虚拟机名称
+        self.create_errors = []   # [(服务器名称, 错误信息)]
+        self.import_system = None
+        self.import_skipped_reason = None
+
+
+class VMReconciler:
+    """
+    虚拟机对账引擎
+
+    Args:
+        openstack_service: OpenStackService 实例
+        dry_run: 只计算差异，不写数据库
+        create_missing: 为 OpenStack 中存在但数据库中没有的虚拟机创建记录
+        cleanup_deleted: 删除 OpenStack 中已不存在的虚拟机记录
+    """
+
+    def __init__(self, openstack_service, dry_run=False, create_missing=False,
+                 cleanup_deleted=False, batch_size=500):
+        self.openstack_service = openstack_service
+        self.dry_run = dry_run
+        self.create_missing = create_missing
+        self.cleanup_deleted = cleanup_deleted
+        self.batch_size = batch_size
+
+    def run(self):
+        """执行一次全量对账"""
+        servers = self.openstack_service.list_servers_detailed(all_tenants=True)
+        return self.reconcile(servers)
+
+    def reconcile(self, servers, full=True):
+        """
+        将 OpenStack 服务器列表与数据库中的虚拟机比对并写回变更
+
+        Args:
+            servers: list_servers_detailed 返回的服务器列表
+            full: servers 是否为全量列表；增量列表（changes-since）只比对其中出现的虚拟机，
+                  不在列表中的虚拟机不会被视为已删除
+        """
+        result = ReconcileResult()
+        result.server_count = len(servers)
+        servers_by_id = {server['id']: server for server in servers if server.get('id')}
+        # changes-since 会返回已删除的服务器（状态为 DELETED），按"未找到"处理
+        deleted_ids = {
+            server_id for server_id, server in servers_by_id.items()
+            if (server.get('status') or '').upper() == 'DELETED'
+        }
+        if not servers_by_id and not full:
+            return result
+        flavor_map = self._load_flavor_map()
+
+        vms = VirtualMachine.objects.exclude(openstack_id__isnull=True).exclude(openstack_id='')
+        if not full:
+            vms = vms.filter(openstack_id__in=list(servers_by_id))
+        vms_by_id = {vm.openstack_id: vm for vm in vms}
+        result.total = len(vms_by_id)
+
+        now = timezone.now()
+        changed_vms = []
+        changed_fields = set()
+        transitions = []
+
+        for openstack_id, vm in vms_by_id.items():
+            server = servers_by_id.get(openstack_id)
+            if server is None or openstack_id in deleted_ids:
+                result.not_found.append(vm)
+                continue
+
+            try:
+                changes, updates = self._diff(vm, server, flavor_map, now)
+            except Exception as e:
+                result.errors.append((vm, str(e)))
+                logger.exception(f'同步虚拟机 {vm.name} 失败')
+                continue
+
+            if not changes:
+                continue
+
+            result.updated.append((vm, changes))
+            if not self.dry_run:
+                if 'status' in updates:
+                    transitions.append((vm, vm.status, updates['status'], status_changed_at(server, now)))
+                for field, value in updates.items():
+                    setattr(vm, field, value)
+                vm.updated_at = now
+                changed_vms.append(vm)
+                changed_fields.update(updates)
+
+        if changed_vms:
+            with transaction.atomic():
+                VirtualMachine.objects.bulk_update(
+                    changed_vms, sorted(changed_fields | {'updated_at'}), batch_size=self.batch_size
+                )
+                record_transitions(transitions, VMStatusTransition.Source.SYNC)
+
+        if result.not_found and self.cleanup_deleted and not self.dry_run:
+            result.deleted = self._delete(result.not_found)
+
+        if self.create_missing:
+            missing_servers = [
+                server for server_id, server in servers_by_id.items()
+                if server_id not in vms_by_id and server_id not in deleted_ids
+            ]
+            self._create_missing(missing_servers, flavor_map, result)
+
+        return result
+
+    def _load_flavor_map(self):
+        """一次拉取全部规格，按 ID 建立索引"""
+        return {flavor['id']: flavor for flavor in self.openstack_service.list_flavors() if flavor.get('id')}
+
+    def _resolve_flavor(self, server, flavor_map):
+        """解析服务器规格：优先使用规格列表，其次使用服务器中内嵌的规格信息"""
+        flavor = server.get('flavor') or {}
+        flavor_id = flavor.get('id')
+        if flavor_id:
+            if flavor_id not in flavor_map:
+                # 非公共规格不会出现在列表中，单独查询一次并在本轮内复用
+                flavor_map[flavor_id] = self.openstack_service.get_flavor(flavor_id)
+            if flavor_map[flavor_id]:
+                return flavor_map[flavor_id]
+        # 计算 API 2.47 以上的服务器详情会直接内嵌规格（不含 ID）
+        if 'vcpus' in flavor:
+            return flavor
+        return None
+
+    def _diff(self, vm, server, flavor_map, now):
+        """计算单台虚拟机的变更，返回 (变更描述列表, {字段: 新值})"""
+        changes = []
+        updates = {}
+
+        # 1. 规格
+        flavor = self._resolve_flavor(server, flavor_map)
+        if flavor:
+            actual_vcpus = flavor.get('vcpus', 0)
+            actual_ram_gb = int(flavor.get('ram', 0) / 1024)
+            actual_disk = flavor.get('disk', 0)
+
+            if vm.cpu_cores != actual_vcpus:
+                changes.append(f'CPU: {vm.cpu_cores}核 → {actual_vcpus}核')
+                updates['cpu_cores'] = actual_vcpus
+            if vm.memory_gb != actual_ram_gb:
+                changes.append(f'内存: {vm.memory_gb}GB → {actual_ram_gb}GB')
+                updates['memory_gb'] = actual_ram_gb
+            if vm.disk_gb != actual_disk:
+                changes.append(f'磁盘: {vm.disk_gb}GB → {actual_disk}GB')
+                updates['disk_gb'] = actual_disk
+
+        # 2. 状态与启动时间
+        os_launch_time = parse_launch_time(server)
+        new_status = OPENSTACK_STATUS_MAP.get((server.get('status') or '').upper(), vm.status)
+
+        if vm.status != new_status:
+            changes.append(f'状态: {vm.get_status_display()} → {VirtualMachine.VMStatus(new_status).label}')
+            updates['status'] = new_status
+            if new_status == VirtualMachine.VMStatus.RUNNING and os_launch_time and not vm.last_start_time:
+                changes.append(f'设置启动时间: {os_launch_time.strftime("%Y-%m-%d %H:%M:%S")}')
+                updates['last_start_time'] = os_launch_time
+        elif new_status == VirtualMachine.VMStatus.RUNNING and not vm.last_start_time:
+            if os_launch_time:
+                changes.append(f'设置真实启动时间: {os_launch_time.strftime("%Y-%m-%d %H:%M:%S")}（从OpenStack获取）')
+                updates['last_start_time'] = os_launch_time
+            else:
+                changes.append(f'设置启动时间: {now.strftime("%Y-%m-%d %H:%M:%S")}（OpenStack无数据，使用当前时间）')
+                updates['last_start_time'] = now
+
+        # 3. IP / MAC
+        new_ip, new_mac = first_address(server)
+        if new_ip and vm.ip_address != new_ip:
+            changes.append(f'IP: {vm.ip_address or "无"} → {new_ip}')
+            updates['ip_address'] = new_ip
+        if new_mac and vm.mac_address != new_mac:
+            changes.append(f'MAC: {vm.mac_address or "无"} → {new_mac}')
+            updates['mac_address'] = new_mac
+
+        # 4. 可用区
+        os_az = server.get('OS-EXT-AZ:availability_zone') or server.get('availability_zone')
+        if os_az and vm.availability_zone != os_az:
+            changes.append(f'可用区: {vm.availability_zone or "无"} → {os_az}')
+            updates['availability_zone'] = os_az
+
+        return changes, updates
+
+    def _delete(self, vms):
+        """批量删除 OpenStack 中已不存在的虚拟机记录"""
+        with transaction.atomic():
+            record_transitions(
+                [(vm, vm.status, VMStatusTransition.DELETED, None) for vm in vms], VMStatusTransition.Source.SYNC
+            )
+            deleted, per_model = VirtualMachine.objects.filter(pk__in=[vm.pk for vm in vms]).delete()
+        return per_model.get(VirtualMachine._meta.label, 0)
+
+    def _get_import_system(self, result):
+        """查找（必要时创建）用于存放导入虚拟机的默认信息系统"""
+        system = InformationSystem.objects.filter(code=IMPORT_SYSTEM_CODE).first()
+        if system or self.dry_run:
+            return system
+
+        from apps.tenants.models import Tenant
+        default_tenant = Tenant.objects.first()
+        if not default_tenant:
+            result.import_skipped_reason = '没有找到租户，无法创建默认信息系统'
+            return None
+
+        system, created = InformationSystem.objects.get_or_create(
+            code=IMPORT_SYSTEM_CODE,
+            defaults={
+                'name': 'OpenStack导入系统',
+                'tenant': default_tenant,
+                'system_type': InformationSystem.SystemType.OTHER,
+                'operation_mode': InformationSystem.OperationMode.HOURS_7X24,
+                'status': InformationSystem.Status.RUNNING,
+                'description': '自动导入的OpenStack虚拟机归属系统'
+            }
+        )
+        if created:
+            result.import_system = system
+        return system
+
+    def _create_missing(self, servers, flavor_map, result):
+        """为 OpenStack 中存在但数据库中没有的虚拟机批量创建记录"""
+        if not servers:
+            return
+
+        system = self._get_import_system(result)
+        if system is None and not self.dry_run:
+            return
+
+        existing_names = set(system.virtual_machines.values_list('name', flat=True)) if system else set()
+        new_vms = []
+
+        for server in servers:
+            server_name = server.get('name') or '未命名'
+            if server_name in existing_names:
+                result.create_errors.append((server_name, '同一信息系统中已存在同名虚拟机'))
+                continue
+            existing_names.add(server_name)
+
+            if self.dry_run:
+                result.created.append(f'{server_name} ({server["id"][:8]}...)')
+                continue
+
+            flavor = self._resolve_flavor(server, flavor_map) or {}
+            ram_mb = flavor.get('ram', 0)
+            vm_status = OPENSTACK_STATUS_MAP.get(
+                (server.get('status') or '').upper(), VirtualMachine.VMStatus.STOPPED
+            )
+            ip_address, mac_address = first_address(server)
+
+            new_vms.append(VirtualMachine(
+                name=server_name,
+                openstack_id=server['id'],
+                information_system=system,
+                cpu_cores=flavor.get('vcpus', 0),
+                memory_gb=int(ram_mb / 1024) if ram_mb else 0,
+                disk_gb=flavor.get('disk', 0),
+                ip_address=ip_address or None,
+                mac_address=mac_address or '',
+                availability_zone=server.get('OS-EXT-AZ:availability_zone') or server.get('availability_zone') or '',
+                status=vm_status,
+                os_type='Linux',
+                data_center_type=VirtualMachine.DataCenterType.PRODUCTION,
+                # 运行中的虚拟机记录启动时间，用于显示 uptime
+                last_start_time=parse_launch_time(server) if vm_status == VirtualMachine.VMStatus.RUNNING else None,
+            ))
+
+        if not new_vms:
+            return
+
+        try:
+            with transaction.atomic():
+                VirtualMachine.objects.bulk_create(new_vms, batch_size=self.batch_size)
+                record_transitions(
+                    [(vm, '', vm.status, vm.last_start_time) for vm in new_vms], VMStatusTransition.Source.SYNC
+                )
+            result.created.extend(vm.name for vm in new_vms)
+        except IntegrityError:
+            # 批量插入冲突时逐条回退，定位具体失败的虚拟机
+            for vm in new_vms:
+                try:
+                    with transaction.atomic():
+                        vm.save(force_insert=True)
+                        record_transition(vm, '', vm.status, VMStatusTransition.Source.SYNC, vm.last_start_time)
+                    result.created.append(vm.name)
+                except Exception as e:
+                    result.create_errors.append((vm.name, str(e)))
+
+
+def refresh_system_resource_totals():
+    """
+    按虚拟机汇总刷新所有信息系统的资源总量
+    一次聚合查询完成比对，只写回发生变化的系统，并批量记录 ResourceAdjustmentLog
+
+    Returns:
+        list: [(system, (old_cpu, old_memory, old_storage), (new_cpu, new_memory, new_storage))]
+    """
+    systems = InformationSystem.objects.annotate(
+        vm_cpu=Coalesce(Sum('virtual_machines__cpu_cores'), 0),
+        vm_memory=Coalesce(Sum('virtual_machines__memory_gb'), 0),
+        vm_storage=Coalesce(Sum('virtual_machines__disk_gb'), 0),
+    )
+
+    now = timezone.now()
+    changed = []
+    adjustment_logs = []
+
+    for system in systems:
+        old = (system.total_cpu, system.total_memory, system.total_storage)
+        new = (system.vm_cpu, system.vm_memory, system.vm_storage)
+        if old == new:
+            continue
+
+        old_cpu, old_memory, old_storage = old
+        new_cpu, new_memory, new_storage = new
+
+        if new_cpu > old_cpu:
+            adjustment_type = ResourceAdjustmentLog.AdjustmentType.CPU_UPGRADE
+        elif new_cpu < old_cpu:
+            adjustment_type = ResourceAdjustmentLog.AdjustmentType.CPU_DOWNGRADE
+        elif new_memory > old_memory:
+            adjustment_type = ResourceAdjustmentLog.AdjustmentType.MEMORY_UPGRADE
+        elif new_memory < old_memory:
+            adjustment_type = ResourceAdjustmentLog.AdjustmentType.MEMORY_DOWNGRADE
+        elif new_storage > old_storage:
+            adjustment_type = ResourceAdjustmentLog.AdjustmentType.STORAGE_UPGRADE
+        else:
+            adjustment_type = ResourceAdjustmentLog.AdjustmentType.STORAGE_DOWNGRADE
+
+        system.total_cpu, system.total_memory, system.total_storage = new
+        system.updated_at = now
+        changed.append((system, old, new))
+
+        adjustment_logs.append(ResourceAdjustmentLog(
+            information_system=system,
+            adjustment_type=adjustment_type,
+            old_cpu_cores=old_cpu,
+            old_memory_gb=old_memory,
+            old_storage_gb=old_storage,
+            new_cpu_cores=new_cpu,
+            new_memory_gb=new_memory,
+            new_storage_gb=new_storage,
+            adjustment_detail=f'自动检测到资源变化: CPU {old_cpu}→{new_cpu}核, 内存 {old_memory}→{new_memory}GB, 存储 {old_storage}→{new_storage}GB',
+            adjustment_date=now,
+            effective_date=now.date()
+        ))
+
+    if changed:
+        with transaction.atomic():
+            InformationSystem.objects.bulk_update(
+                [system for system, old, new in changed],
+                ['total_cpu', 'total_memory', 'total_storage', 'updated_at']
+            )
+            ResourceAdjustmentLog.objects.bulk_create(adjustment_logs)
+
+    return changed
+
+
+def sync_vms_incremental(force_full=False):
+    """
+    按区域增量同步虚拟机（供高频定时任务使用）
+
+    每个区域在共享缓存中保存一条水位线（上次成功同步的开始时间），平时只用 Nova 的
+    changes-since 拉取水位线之后变化的虚拟机；以下情况改为全量对账：
+      - 没有水位线（首次运行或缓存被清空）
+      - 距上次同步超过 MAX_GAP（worker 停摆等导致的断档）
+      - 距上次全量对账超过 FULL_SYNC_INTERVAL
+    Nova 通知接入进程在线时跳过增量拉取（水位线前进到接入进程最近一次心跳），只执行定期全量对账。
+    同一区域同一时刻只允许一个同步在执行，其余调用直接跳过。
+
+    Returns:
+        dict: {'mode': 'full' | 'delta' | 'skipped', 'servers': int, 'updated': int, 'deleted': int, 'created': int}
+    """
+    from apps.openstack.services import get_openstack_service
+    from .notifications import last_heartbeat
+
+    sync_config = {**DEFAULT_SYNC_CONFIG, **getattr(settings, 'OPENSTACK_VM_SYNC', {})}
+    region = settings.OPENSTACK_CONFIG.get('REGION_NAME') or 'default'
+    state_key = SYNC_STATE_CACHE_KEY.format(region=region)
+    lock_key = SYNC_LOCK_CACHE_KEY.format(region=region)
+
+    if not cache.add(lock_key, 1, timeout=SYNC_LOCK_TIMEOUT):
+        return {'mode': 'skipped', 'servers': 0, 'updated': 0, 'deleted': 0, 'created': 0}
+
+    try:
+        # 水位线取请求发出前的时间，保证本轮请求期间发生的变化会在下一轮被拉到
+        started_at = timezone.now()
+        state = cache.get(state_key) or {}
+        watermark = state.get('watermark')
+        last_full = state.get('last_full')
+
+        if force_full or not watermark or not last_full:
+            full = True
+        elif started_at - watermark > timedelta(seconds=sync_config['MAX_GAP']):
+            logger.warning(f'区域 {region} 虚拟机同步出现断档（上次同步于 {watermark}），执行全量对账')
+            full = True
+        else:
+            full = started_at - last_full >= timedelta(seconds=sync_config['FULL_SYNC_INTERVAL'])
+
+        # Nova 通知接入进程在线时状态变化已实时写入，只保留定期全量对账兜底。
+        # 通知流覆盖到最近一次心跳，水位线前进到心跳时间，不会误判断档；
+        # 接入进程停止后水位线停在最后一次心跳，下一轮增量拉取从那里补齐
+        heartbeat = None if full else last_heartbeat()
+        if heartbeat is not None:
+            cache.set(state_key, {'watermark': min(heartbeat, started_at), 'last_full': last_full}, timeout=None)
+            return {'mode': 'skipped', 'servers': 0, 'updated': 0, 'deleted': 0, 'created': 0}
+
+        openstack_service = get_openstack_service()
+        reconciler = VMReconciler(openstack_service, cleanup_deleted=sync_config['CLEANUP_DELETED'])
+
+        if full:
+            result = reconciler.run()
+            last_full = started_at
+        else:
+            since = (watermark - timedelta(seconds=sync_config['OVERLAP'])).astimezone(dt_timezone.utc)
+            servers = openstack_service.list_servers_detailed(
+                all_tenants=True, changes_since=since.strftime('%Y-%m-%dT%H:%M:%SZ')
+            )
+            result = reconciler.reconcile(servers, full=False)
+
+        cache.set(state_key, {'watermark': started_at, 'last_full': last_full}, timeout=None)
+    finally:
+        cache.delete(lock_key)
+
+    if result.updated or result.created or result.deleted:
+        refresh_system_resource_totals()
+
+    return {
+        'mode': 'full' if full else 'delta',
+        'servers': result.server_count,
+        'updated': len(result.updated),
+        'deleted': result.deleted,
+        'created': len(result.created),
+    }
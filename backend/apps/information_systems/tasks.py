@@ -25,6 +25,86 @@ def sync_openstack_vms_task():
         logger.error(f'同步OpenStack虚拟机数据失败: {str(e)}', exc_info=True)
 
 
+def _sync_vms_incremental(task_name):
+    """执行一次虚拟机增量同步并记录结果"""
+    from apps.information_systems.sync import sync_vms_incremental
+
+    try:
+        result = sync_vms_incremental()
+        if result['mode'] != 'skipped' and (result['updated'] or result['deleted'] or result['created']):
+            logger.info(
+                f"{task_name}: {result['mode']} 同步完成，OpenStack 返回 {result['servers']} 个虚拟机，"
+                f"更新 {result['updated']} 个，删除 {result['deleted']} 个，新建 {result['created']} 个"
+            )
+        return result
+    except Exception as e:
+        logger.error(f'{task_name}: 虚拟机增量同步失败: {str(e)}', exc_info=True)
+
+
+@shared_task(name='apps.information_systems.tasks.sync_vm_status')
+def sync_vm_status():
+    """
+    高频同步虚拟机状态（每5秒）
+    只拉取 changes-since 水位线之后变化的虚拟机，定期或出现断档时回退为全量对账
+    """
+    return _sync_vms_incremental('sync_vm_status')
+
+
+@shared_task(name='apps.information_systems.tasks.sync_all_openstack_vms')
+def sync_all_openstack_vms():
+    """
+    高频同步 OpenStack 虚拟机（每5秒）
+    与 sync_vm_status 共用同一区域水位线和互斥锁，同一时刻只有一个在执行
+    """
+    return _sync_vms_incremental('sync_all_openstack_vms')
+
+
+@shared_task(name='apps.information_systems.tasks.run_vm_job')
+def run_vm_job(job_id):
+    """
+    执行虚拟机异步操作任务（创建、快照、调整配置、重启）
+    进度通过 WebSocket 推送，结果写入 VMOperationJob
+    """
+    from apps.information_systems.jobs import execute_vm_job
+
+    execute_vm_job(job_id)
+
+
+@shared_task(
+    bind=True,
+    name='apps.information_systems.tasks.create_daily_billing_records',
+    max_retries=3,
+    default_retry_delay=600,
+)
+def create_daily_billing_records(self, billing_date=None, shards=None, force=False):
+    """
+    生成每日计费记录（默认昨天）
+    按租户分片执行；有失败分片时 10 分钟后只重试失败的分片（计费日期固定为首次执行时的日期），
+    最多重试 3 次，仍失败的分片需手动执行 run_daily_billing --date ... --shards ... 补跑
+    """
+    from datetime import date
+    from apps.information_systems.billing import run_daily_billing
+
+    summary = run_daily_billing(
+        billing_date=date.fromisoformat(billing_date) if billing_date else None,
+        shards=shards,
+        force=force,
+    )
+    summary['total_cost'] = str(summary['total_cost'])
+    if summary['failed']:
+        if self.request.retries < self.max_retries:
+            logger.error(f"每日计费存在失败分片，稍后重试: {summary['billing_date']} {summary['failed']}")
+            raise self.retry(kwargs={
+                'billing_date': summary['billing_date'], 'shards': summary['failed'], 'force': force,
+            })
+        shard_list = ','.join(str(shard) for shard in summary['failed'])
+        logger.error(
+            f"每日计费重试次数已用尽，请手动补跑: "
+            f"run_daily_billing --date {summary['billing_date']} --shards {shard_list}"
+        )
+    return summary
+
+
 @shared_task(name='cleanup_old_logs')
 def cleanup_old_logs():
     """
@@ -48,57 +128,15 @@ def cleanup_old_logs():
 @shared_task(name='collect_vm_metrics')
 def collect_vm_metrics():
     """
-    采集虚拟机监控指标 (每5分钟执行一次)
+    采集虚拟机监控指标 (每分钟执行一次)
+    与 monitoring.tasks.collect_vm_metrics_task 同名，两者共用同一个批量采集器
     """
     try:
-        from django.utils import timezone
-        from apps.information_systems.models import VirtualMachine
-        from apps.monitoring.models import VMMetricHistory
-        from apps.openstack.services import get_openstack_service
+        from apps.monitoring.collector import collect_vm_metrics as collect
         
         logger.info('开始采集虚拟机监控指标...')
-        openstack_service = get_openstack_service()
-        
-        # 只采集运行中的虚拟机
-        running_vms = VirtualMachine.objects.filter(status='running', openstack_id__isnull=False)
-        count = 0
-        
-        for vm in running_vms:
-            try:
-                metrics = openstack_service.get_server_metrics(vm.openstack_id)
-                if metrics:
-                    VMMetricHistory.objects.create(
-                        virtual_machine=vm,
-                        cpu_usage=metrics.get('cpu_usage_percent', 0),
-                        memory_usage=metrics.get('memory_usage_percent', 0),
-                        network_in_rate=metrics.get('network_in_bytes', 0) / 1024, # Convert to KB
-                        network_out_rate=metrics.get('network_out_bytes', 0) / 1024, # Convert to KB
-                        timestamp=timezone.now()
-                    )
-                    count += 1
-            except Exception as vm_e:
-                logger.warning(f'采集虚拟机 {vm.name} 指标失败: {str(vm_e)}')
-                continue
-                
-        logger.info(f'监控指标采集完成: 成功采集 {count}/{running_vms.count()} 台')
+        result = collect()
+        logger.info(f"监控指标采集完成: 成功采集 {result['collected']}/{result['total']} 台")
         
     except Exception as e:
         logger.error(f'采集监控指标失败: {str(e)}', exc_info=True)
-
-
-@shared_task(name='cleanup_old_metrics')
-def cleanup_old_metrics():
-    """
-    清理旧的监控数据 (保留最近7天)
-    """
-    try:
-        from datetime import timedelta
-        from django.utils import timezone
-        from apps.monitoring.models import VMMetricHistory
-        
-        cutoff_date = timezone.now() - timedelta(days=7)
-        deleted_count = VMMetricHistory.objects.filter(timestamp__lt=cutoff_date).delete()[0]
-        
-        logger.info(f'清理旧监控数据完成: 删除 {deleted_count} 条记录')
-    except Exception as e:
-        logger.error(f'清理监控数据失败: {str(e)}', exc_info=True)
\ No newline at end of file
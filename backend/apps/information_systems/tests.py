@@ -0,0 +1,329 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.information_systems.billing import compute_daily_cost, metered_hours, run_daily_billing
+from apps.information_systems.metering import (
+    compute_daily_usage, day_bounds, merge_intervals, record_transitions, running_intervals,
+)
+from apps.information_systems.models import (
+    DailyBillingRecord, InformationSystem, SystemDailyUsage, VirtualMachine, VMDailyUsage, VMStatusTransition,
+)
+from apps.information_systems.notifications import LocalNotificationBus, NotificationWorker, touch_heartbeat
+from apps.information_systems.sync import SYNC_STATE_CACHE_KEY, sync_vms_incremental
+from apps.information_systems.tasks import create_daily_billing_records
+from apps.information_systems.views import InformationSystemViewSet
+from apps.tenants.models import Tenant
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_vm(code='notify', status=VirtualMachine.VMStatus.RUNNING):
+    now = timezone.now()
+    tenant = Tenant.objects.create(
+        name=f'{code}租户', code=code, contact_person='测试', contact_phone='1',
+        start_time=now, end_time=now + timedelta(days=365),
+    )
+    system = InformationSystem.objects.create(name=f'{code}系统', code=code, tenant=tenant)
+    return VirtualMachine.objects.create(
+        name=f'{code}-vm', information_system=system, openstack_id=f'{code}-instance',
+        cpu_cores=2, memory_gb=4, disk_gb=20, status=status,
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@mock.patch('apps.information_systems.notifications.NovaNotificationHandler._push')
+class NotificationBusTests(TestCase):
+    """通过进程内通知总线驱动 Nova 通知接入"""
+
+    def setUp(self):
+        cache.clear()
+        self.vm = create_vm()
+        self.bus = LocalNotificationBus()
+        self.worker = NotificationWorker(self.bus)
+
+    def publish(self, event_type, payload, timestamp='2026-10-17 02:00:00.000000'):
+        # oslo.messaging 2.0 信封
+        self.bus.publish({
+            'oslo.version': '2.0',
+            'oslo.message': json.dumps({'event_type': event_type, 'payload': payload, 'timestamp': timestamp}),
+        })
+
+    def test_legacy_compute_instance_event(self, push):
+        self.publish('compute.instance.power_off.end', {
+            'instance_id': self.vm.openstack_id,
+            'state': 'stopped',
+            'fixed_ips': [{'address': '10.0.0.8', 'vif_mac': 'fa:16:3e:00:00:08'}],
+        })
+        self.assertEqual(self.worker.run_once(timeout=0.1), 1)
+
+        self.vm.refresh_from_db()
+        self.assertEqual(self.vm.status, VirtualMachine.VMStatus.STOPPED)
+        self.assertEqual(self.vm.ip_address, '10.0.0.8')
+        transition = VMStatusTransition.objects.get(virtual_machine_id=self.vm.pk)
+        self.assertEqual(
+            (transition.from_status, transition.to_status, transition.source),
+            ('running', 'stopped', VMStatusTransition.Source.NOTIFICATION),
+        )
+        push.assert_called_once()
+
+    def test_legacy_resize_event_updates_flavor(self, push):
+        self.publish('compute.instance.finish_resize.end', {
+            'instance_id': self.vm.openstack_id, 'state': 'active', 'vcpus': 8, 'memory_mb': 16384, 'root_gb': 80,
+        })
+        self.worker.run_once(timeout=0.1)
+
+        self.vm.refresh_from_db()
+        self.assertEqual((self.vm.cpu_cores, self.vm.memory_gb, self.vm.disk_gb), (8, 16, 80))
+
+    def test_versioned_delete_event(self, push):
+        self.publish('instance.delete.end', {
+            'nova_object.data': {'uuid': self.vm.openstack_id, 'state': 'deleted'},
+        })
+        self.worker.run_once(timeout=0.1)
+
+        self.assertFalse(VirtualMachine.objects.filter(pk=self.vm.pk).exists())
+        self.assertTrue(VMStatusTransition.objects.filter(
+            virtual_machine_id=self.vm.pk, to_status=VMStatusTransition.DELETED
+        ).exists())
+
+    def test_out_of_order_event_is_ignored(self, push):
+        self.publish('compute.instance.power_off.end', {'instance_id': self.vm.openstack_id, 'state': 'stopped'},
+                     timestamp='2026-10-17 02:00:05.000000')
+        self.publish('compute.instance.power_on.end', {'instance_id': self.vm.openstack_id, 'state': 'active'},
+                     timestamp='2026-10-17 02:00:01.000000')
+        self.worker.run_once(timeout=0.1)
+
+        self.vm.refresh_from_db()
+        self.assertEqual(self.vm.status, VirtualMachine.VMStatus.STOPPED)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IncrementalSyncWatermarkTests(TestCase):
+    """通知接入进程在线时，增量同步跳过拉取但水位线继续前进"""
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.state_key = SYNC_STATE_CACHE_KEY.format(region='RegionOne')
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+    def run_sync(self, openstack):
+        with mock.patch('django.utils.timezone.now', return_value=self.now), \
+                mock.patch('apps.openstack.services.get_openstack_service', return_value=openstack), \
+                self.settings(OPENSTACK_CONFIG={'REGION_NAME': 'RegionOne'}):
+            touch_heartbeat()
+            return sync_vms_incremental()
+
+    def test_skip_path_advances_watermark(self):
+        cache.set(self.state_key, {'watermark': self.now, 'last_full': self.now}, timeout=None)
+        openstack = mock.Mock()
+
+        # 5 分钟内（超过 MAX_GAP，未到 FULL_SYNC_INTERVAL）每 5 秒一轮，全部跳过，不误判断档
+        for _ in range(60):
+            self.advance(5)
+            self.assertEqual(self.run_sync(openstack)['mode'], 'skipped')
+        openstack.list_servers_detailed.assert_not_called()
+        self.assertEqual(cache.get(self.state_key)['watermark'], self.now)
+        self.assertEqual(cache.get(self.state_key)['last_full'], self.now - timedelta(seconds=300))
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class DetailedInfoConditionalGetTests(TestCase):
+    """detailed_info 条件 GET：运行中系统的运行时长不会被 304 一直冻结"""
+
+    def setUp(self):
+        self.system = create_vm('detail').information_system
+        self.url = f'/api/information-systems/{self.system.pk}/detailed_info/'
+        user = User.objects.create_user('detail-admin', password='x', is_staff=True)
+        self.auth = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        self.now = timezone.now().replace(minute=10, second=0, microsecond=0)
+
+    def get(self, at, etag=None):
+        headers = dict(self.auth, **({'If-None-Match': etag} if etag else {}))
+        with mock.patch('django.utils.timezone.now', return_value=at):
+            return self.client.get(self.url, headers=headers)
+
+    def test_malformed_id_is_not_found(self):
+        # URL 以 uuid 转换器匹配，直接调用视图模拟其他路由传入的任意字符串
+        request = APIRequestFactory().get('/detailed_info/')
+        force_authenticate(request, user=User.objects.get(username='detail-admin'))
+        response = InformationSystemViewSet.as_view({'get': 'detailed_info'})(request, pk='not-a-uuid')
+        self.assertEqual(response.status_code, 404)
+
+    def test_stopped_system_revalidates(self):
+        etag = self.get(self.now)['ETag']
+        self.assertEqual(self.get(self.now + timedelta(hours=3), etag).status_code, 304)
+
+    def test_running_system_expires_every_hour(self):
+        InformationSystem.objects.filter(pk=self.system.pk).update(
+            status=InformationSystem.Status.RUNNING, last_start_time=self.now - timedelta(days=1),
+        )
+        response = self.get(self.now)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.get(self.now + timedelta(minutes=30), etag).status_code, 304)
+
+        response = self.get(self.now + timedelta(hours=1), etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['basic_info']['running_time'], 25 * 3600)
+
+
+class DailyBillingTests(TestCase):
+    """每日计费：Decimal 费用计算与已处理记录的保护"""
+
+    def test_compute_daily_cost_rounding(self):
+        # 3 核 0.3 + 5G 0.25 + 17G 0.17 = 0.72/小时，24 小时 17.28，85 折 14.688
+        self.assertEqual(compute_daily_cost(3, 5, 17, 24, Decimal('0.85')),
+                         (Decimal('0.7200'), Decimal('17.28'), Decimal('14.69')))
+        # Tenant.discount_rate 为 float，按字符串转换，结果与 Decimal 一致
+        self.assertEqual(compute_daily_cost(3, 5, 17, 24, 0.85), compute_daily_cost(3, 5, 17, 24, Decimal('0.85')))
+        # 0.30 * 0.95 = 0.285，四舍五入而非银行家舍入
+        self.assertEqual(compute_daily_cost(1, 0, 0, 3, Decimal('0.95'))[2], Decimal('0.29'))
+        self.assertEqual(compute_daily_cost(2, 4, 20, 0, Decimal('0.9')), (Decimal('0.6000'), Decimal('0.00'), Decimal('0.00')))
+
+    @mock.patch('apps.information_systems.billing.run_daily_billing')
+    def test_task_retries_only_failed_shards_for_the_same_day(self, run):
+        def summary(failed):
+            return {'billing_date': '2026-10-16', 'completed': [], 'skipped': [], 'failed': failed,
+                    'system_count': 0, 'total_cost': Decimal('0')}
+
+        run.side_effect = [summary([1, 3]), summary([3]), summary([])]
+        with mock.patch.object(create_daily_billing_records, 'default_retry_delay', 0):
+            result = create_daily_billing_records.apply().get()
+
+        self.assertEqual(result['failed'], [])
+        self.assertEqual(
+            [(call.kwargs['billing_date'], call.kwargs['shards']) for call in run.call_args_list],
+            [(None, None), (date(2026, 10, 16), [1, 3]), (date(2026, 10, 16), [3])],
+        )
+
+    @mock.patch('apps.information_systems.billing.run_daily_billing')
+    def test_task_gives_up_after_max_retries(self, run):
+        run.return_value = {'billing_date': '2026-10-16', 'completed': [], 'skipped': [], 'failed': [2],
+                            'system_count': 0, 'total_cost': Decimal('0')}
+        with mock.patch.object(create_daily_billing_records, 'default_retry_delay', 0):
+            result = create_daily_billing_records.apply().get()
+
+        self.assertEqual(result['failed'], [2])
+        self.assertEqual(run.call_count, create_daily_billing_records.max_retries + 1)
+
+    def test_processed_records_are_not_overwritten(self):
+        today = timezone.localdate()
+        system = create_vm('billing').information_system
+        Tenant.objects.filter(pk=system.tenant_id).update(discount_level=Tenant.DiscountLevel.LEVEL_A)
+        InformationSystem.objects.filter(pk=system.pk).update(total_cpu=2, total_memory=4, total_storage=20)
+        closed = create_vm('closed').information_system
+        processed = DailyBillingRecord.objects.create(
+            information_system=closed, billing_date=today, running_hours=1, is_processed=True,
+        )
+
+        for force in (False, True):
+            summary = run_daily_billing(today, shard_count=2, meter=False, force=force)
+            self.assertEqual(summary['failed'], [])
+
+        record = DailyBillingRecord.objects.get(information_system=system, billing_date=today)
+        self.assertEqual((record.running_hours, record.daily_cost, record.actual_daily_cost),
+                         (24, Decimal('14.40'), Decimal('12.96')))
+        self.assertEqual(record.discount_rate, Decimal('0.9'))
+        self.assertEqual(DailyBillingRecord.objects.get(pk=processed.pk).running_hours, 1)
+
+
+class RunningTimeMeteringTests(TestCase):
+    """运行时长计量：状态序列还原为运行区间，重叠区间只计一次"""
+
+    def setUp(self):
+        self.day = timezone.localdate() - timedelta(days=1)
+        self.start, self.end = day_bounds(self.day)
+
+    def at(self, hours):
+        return self.start + timedelta(hours=hours)
+
+    def test_metered_hours_rounds_partial_hours_up(self):
+        for seconds, hours in ((0, 0), (1, 1), (3600, 1), (3601, 2), (86400, 24), (90000, 24)):
+            self.assertEqual(metered_hours(seconds), hours)
+
+    def test_running_intervals(self):
+        changes = [(self.at(2), 'running'), (self.at(5), 'stopped'), (self.at(22), 'running')]
+        self.assertEqual(running_intervals('stopped', changes, self.start, self.end),
+                         [(self.at(2), self.at(5)), (self.at(22), self.end)])
+        # 当天开始即停止不产生空区间；重复记录的启动不切分区间
+        changes = [(self.start, 'stopped'), (self.at(3), 'running'), (self.at(3), 'running'), (self.at(4), 'stopped')]
+        self.assertEqual(running_intervals('running', changes, self.start, self.end), [(self.at(3), self.at(4))])
+        self.assertEqual(running_intervals('running', [], self.start, self.at(6)), [(self.start, self.at(6))])
+
+    def test_merge_intervals(self):
+        def hours(*pairs):
+            return [(self.at(begin), self.at(finish)) for begin, finish in pairs]
+
+        # 重叠与相接的区间合并，无序输入先排序
+        self.assertEqual(merge_intervals(hours((7, 8), (2, 4), (1, 3), (4, 5))), hours((1, 5), (7, 8)))
+        self.assertEqual(merge_intervals(hours((1, 10), (2, 3))), hours((1, 10)))
+        self.assertEqual(merge_intervals([]), [])
+
+    def test_compute_daily_usage_merges_per_vm_and_per_system(self):
+        first = create_vm('meter', status=VirtualMachine.VMStatus.STOPPED)
+        second = VirtualMachine.objects.create(
+            name='meter-vm-2', information_system=first.information_system, openstack_id='meter-instance-2',
+            cpu_cores=2, memory_gb=4, disk_gb=20, status=VirtualMachine.VMStatus.STOPPED,
+        )
+        Source = VMStatusTransition.Source
+        record_transitions([
+            # 前一天启动，当天 6 点停止
+            (first, 'stopped', 'running', self.start - timedelta(hours=3)),
+            (first, 'running', 'stopped', self.at(6)),
+            (second, 'stopped', 'running', self.at(4)),
+            (second, 'running', 'stopped', self.at(8)),
+        ], Source.SYNC)
+        # 通知与同步先后记录同一次启动
+        record_transitions([(second, 'stopped', 'running', self.at(4) + timedelta(minutes=1))], Source.NOTIFICATION)
+
+        result = compute_daily_usage(self.day)
+        self.assertEqual((result['vm_count'], result['system_count']), (2, 1))
+
+        usage = dict(VMDailyUsage.objects.filter(usage_date=self.day).values_list('virtual_machine_id', 'running_seconds'))
+        self.assertEqual(usage, {first.pk: 6 * 3600, second.pk: 4 * 3600})
+        system_usage = SystemDailyUsage.objects.get(usage_date=self.day)
+        # 两台虚拟机的区间 [0, 6) 与 [4, 8) 合并为 8 小时
+        self.assertEqual((system_usage.running_seconds, system_usage.vm_count), (8 * 3600, 2))
+
+        # 可重复执行
+        compute_daily_usage(self.day)
+        self.assertEqual(SystemDailyUsage.objects.filter(usage_date=self.day).count(), 1)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+@mock.patch('apps.tenants.admin_resource_management.get_openstack_service')
+class ControlTransitionTests(TestCase):
+    """管理员控制操作记录状态变化，后续同步看不到差异时计量也不会遗漏"""
+
+    def setUp(self):
+        self.vm = create_vm('control')
+        user = User.objects.create_user('control-admin', password='x', is_staff=True)
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+    def post(self, action):
+        return self.client.post(f'/api/tenants/admin/vm/{self.vm.pk}/{action}/', headers=self.headers)
+
+    def test_admin_stop_and_start_record_transitions(self, openstack):
+        openstack.return_value.stop_server.return_value = True
+        openstack.return_value.start_server.return_value = True
+
+        self.assertEqual(self.post('stop').status_code, 200)
+        self.assertEqual(self.post('start').status_code, 200)
+
+        transitions = VMStatusTransition.objects.filter(virtual_machine_id=self.vm.pk).order_by('occurred_at', 'id')
+        self.assertEqual(
+            list(transitions.values_list('from_status', 'to_status', 'source')),
+            [('running', 'stopped', 'control'), ('stopped', 'running', 'control')],
+        )
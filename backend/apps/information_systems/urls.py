@@ -10,7 +10,8 @@ from .views import (
     SystemBillingRecordViewSet,
     SystemBillingRecordViewSet,
     SystemOperationLogViewSet,
-    VMSnapshotViewSet
+    VMSnapshotViewSet,
+    VMOperationJobViewSet
 )
 
 # 创建主路由器
@@ -53,6 +54,11 @@ urlpatterns = [
         path('<uuid:pk>/', VMSnapshotViewSet.as_view({'get': 'retrieve', 'delete': 'destroy'}), name='vm-snapshot-detail'),
         path('<uuid:pk>/restore/', VMSnapshotViewSet.as_view({'post': 'restore'}), name='vm-snapshot-restore'),
     ])),
+    # 虚拟机异步任务状态
+    path('vm-jobs/', include([
+        path('', VMOperationJobViewSet.as_view({'get': 'list'}), name='vm-job-list'),
+        path('<uuid:pk>/', VMOperationJobViewSet.as_view({'get': 'retrieve'}), name='vm-job-detail'),
+    ])),
     # 其他资源路由
     path('system-resources/', include([
         path('', SystemResourceViewSet.as_view({'get': 'list', 'post': 'create'})),
@@ -10,8 +10,9 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
 from .models import (
     InformationSystem, SystemResource, SystemOperationLog, SystemBillingRecord,
-    VirtualMachine, DailyBillingRecord, ResourceAdjustmentLog, VMSnapshot
+    VirtualMachine, VMSnapshot, VMOperationJob, VMStatusTransition
 )
+from .metering import record_transition
 from .serializers import (
     InformationSystemSerializer,
     SystemResourceSerializer,
@@ -20,7 +21,8 @@ from .serializers import (
     InformationSystemCreateSerializer,
     InformationSystemCreateSerializer,
     SystemResourceCreateSerializer,
-    VMSnapshotSerializer
+    VMSnapshotSerializer,
+    VMOperationJobSerializer
 )
 from ..openstack.services import get_openstack_service
 
@@ -92,23 +94,25 @@ class InformationSystemViewSet(viewsets.ModelViewSet):
         information_system = self.get_object()
 
         try:
-            openstack_service = get_openstack_service()
-            started_count = 0
-            failed_count = 0
+            from ..openstack.executor import run_server_actions
+
+            # 并发启动所有关联的虚拟机
+            vms = [
+                vm for vm in VirtualMachine.objects.filter(information_system=information_system)
+                if vm.openstack_id and vm.status != VirtualMachine.VMStatus.RUNNING
+            ]
+            results = run_server_actions('start', [vm.openstack_id for vm in vms])
+            started_ids = set(results['success'])
+            started_count = len(started_ids)
+            failed_count = len(results['failed'])
 
-            # 启动所有关联的虚拟机
-            vms = VirtualMachine.objects.filter(information_system=information_system)
             for vm in vms:
-                if vm.openstack_id and vm.status != VirtualMachine.VMStatus.RUNNING:
-                    try:
-                        success = openstack_service.start_server(vm.openstack_id)
-                        if success:
-                            vm.status = VirtualMachine.VMStatus.RUNNING
-                            vm.last_start_time = timezone.now()
-                            vm.save()
-                            started_count += 1
-                    except Exception as e:
-                        failed_count += 1
+                if vm.openstack_id in started_ids:
+                    old_status = vm.status
+                    vm.status = VirtualMachine.VMStatus.RUNNING
+                    vm.last_start_time = timezone.now()
+                    vm.save()
+                    record_transition(vm, old_status, vm.status, VMStatusTransition.Source.CONTROL, vm.last_start_time)
 
             # 更新信息系统状态
             information_system.status = InformationSystem.Status.RUNNING
@@ -186,23 +190,25 @@ class InformationSystemViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_403_FORBIDDEN)
 
         try:
-            openstack_service = get_openstack_service()
-            stopped_count = 0
-            failed_count = 0
+            from ..openstack.executor import run_server_actions
+
+            # 并发停止所有关联的虚拟机
+            vms = [
+                vm for vm in VirtualMachine.objects.filter(information_system=information_system)
+                if vm.openstack_id and vm.status == VirtualMachine.VMStatus.RUNNING
+            ]
+            results = run_server_actions('stop', [vm.openstack_id for vm in vms])
+            stopped_ids = set(results['success'])
+            stopped_count = len(stopped_ids)
+            failed_count = len(results['failed'])
 
-            # 停止所有关联的虚拟机
-            vms = VirtualMachine.objects.filter(information_system=information_system)
             for vm in vms:
-                if vm.openstack_id and vm.status == VirtualMachine.VMStatus.RUNNING:
-                    try:
-                        success = openstack_service.stop_server(vm.openstack_id)
-                        if success:
-                            vm.status = VirtualMachine.VMStatus.STOPPED
-                            vm.last_stop_time = timezone.now()
-                            vm.save()
-                            stopped_count += 1
-                    except Exception as e:
-                        failed_count += 1
+                if vm.openstack_id in stopped_ids:
+                    old_status = vm.status
+                    vm.status = VirtualMachine.VMStatus.STOPPED
+                    vm.last_stop_time = timezone.now()
+                    vm.save()
+                    record_transition(vm, old_status, vm.status, VMStatusTransition.Source.CONTROL, vm.last_stop_time)
 
             # 更新信息系统状态
             information_system.status = InformationSystem.Status.STOPPED
@@ -276,164 +282,46 @@ class InformationSystemViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def detailed_info(self, request, pk=None):
-        """获取信息系统的详细信息，包括产品、服务、虚拟机、计费记录等"""
-        information_system = self.get_object()
-
-        # 基本信息
-        basic_info = InformationSystemSerializer(information_system).data
-
-        # 关联的产品
-        products_data = []
-        for product in information_system.products.all():
-            products_data.append({
-                'id': product.id,
-                'name': product.name,
-                'product_type': product.product_type,
-                'product_type_display': product.get_product_type_display(),
-                'base_price': str(product.base_price),
-                'billing_unit': product.get_billing_unit_display(),
-                'cpu_capacity': product.cpu_capacity,
-                'memory_capacity': product.memory_capacity,
-                'storage_capacity': product.storage_capacity
-            })
-
-        # 关联的服务
-        services_data = []
-        for service in information_system.services.all():
-            services_data.append({
-                'id': service.id,
-                'name': service.name,
-                'service_type': service.service_type,
-                'service_type_display': service.get_service_type_display(),
-                'base_price': str(service.base_price),
-                'billing_cycle': service.get_billing_cycle_display(),
-                'sla_level': service.get_sla_level_display(),
-                'description': service.description
-            })
-
-        # 虚拟机列表
-        vms = VirtualMachine.objects.filter(information_system=information_system)
-        vms_data = []
-        for vm in vms:
-            vms_data.append({
-                'id': str(vm.id),
-                'name': vm.name,
-                'ip_address': vm.ip_address or '未分配',
-                'cpu_cores': vm.cpu_cores,
-                'memory_gb': vm.memory_gb,
-                'disk_gb': vm.disk_gb,
-                'status': vm.status,
-                'status_display': vm.get_status_display(),
-                'data_center_type': vm.data_center_type,
-                'data_center_type_display': vm.get_data_center_type_display(),
-                'availability_zone': vm.availability_zone or '-',
-                'region': vm.region or '-',
-                'runtime_display': vm.runtime_display,
-                'os_type': vm.os_type or '未知',
-                'last_start_time': vm.last_start_time.strftime('%Y-%m-%d %H:%M:%S') if vm.last_start_time else None,
-                'created_at': vm.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            })
-
-        # 按数据中心类型分组虚拟机
-        vms_by_datacenter = {}
-        for vm_data in vms_data:
-            dc_type = vm_data['data_center_type_display']
-            if dc_type not in vms_by_datacenter:
-                vms_by_datacenter[dc_type] = []
-            vms_by_datacenter[dc_type].append(vm_data)
-
-        # 每日计费记录（最近30天）
-        daily_billing = DailyBillingRecord.objects.filter(
-            information_system=information_system
-        ).order_by('-billing_date')[:30]
-
-        daily_billing_data = []
-        for record in daily_billing:
-            daily_billing_data.append({
-                'billing_date': record.billing_date.strftime('%Y-%m-%d'),
-                'cpu_cores': record.cpu_cores,
-                'memory_gb': record.memory_gb,
-                'storage_gb': record.storage_gb,
-                'running_hours': record.running_hours,
-                'hourly_rate': str(record.hourly_rate),
-                'daily_cost': str(record.daily_cost),
-                'actual_daily_cost': str(record.actual_daily_cost),
-                'discount_rate': str(record.discount_rate)
-            })
-
-        # 资源调整历史（最近10条）
-        adjustments = ResourceAdjustmentLog.objects.filter(
-            information_system=information_system
-        ).order_by('-adjustment_date')[:10]
-
-        adjustments_data = []
-        for adj in adjustments:
-            adjustments_data.append({
-                'adjustment_type': adj.get_adjustment_type_display(),
-                'old_cpu': adj.old_cpu_cores,
-                'new_cpu': adj.new_cpu_cores,
-                'old_memory': adj.old_memory_gb,
-                'new_memory': adj.new_memory_gb,
-                'old_storage': adj.old_storage_gb,
-                'new_storage': adj.new_storage_gb,
-                'adjustment_date': adj.adjustment_date.strftime('%Y-%m-%d %H:%M:%S'),
-                'effective_date': adj.effective_date.strftime('%Y-%m-%d'),
-                'adjustment_detail': adj.adjustment_detail,
-                'operator': adj.operator.username if adj.operator else '系统',
-                'cost_impact': str(adj.cost_impact)
-            })
-
-        # 计算当月费用
-        from datetime import date
-        current_month = date.today().replace(day=1)
-        monthly_billing = DailyBillingRecord.objects.filter(
-            information_system=information_system,
-            billing_date__gte=current_month
-        )
-
-        monthly_cost = sum([float(record.actual_daily_cost) for record in monthly_billing])
-
-        return Response({
-            'basic_info': basic_info,
-            'products': products_data,
-            'services': services_data,
-            'virtual_machines': vms_data,
-            'vms_by_datacenter': vms_by_datacenter,
-            'daily_billing': daily_billing_data,
-            'resource_adjustments': adjustments_data,
-            'monthly_cost': monthly_cost,
-            'total_vms': len(vms_data),
-            'running_vms': len([vm for vm in vms_data if vm['status'] == 'running'])
-        })
+        """
+        获取信息系统的详细信息，包括产品、服务、虚拟机、计费记录等
+
+        支持条件 GET：响应带 ETag / Last-Modified，详情未变化时返回 304
+        """
+        from django.core.exceptions import ValidationError
+        from django.http import Http404
+        from django.utils.cache import get_conditional_response
+        from django.utils.http import http_date, quote_etag
+        from .detail import detail_version, load_system_detail
+
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            version = detail_version(queryset, pk)
+        except (ValueError, ValidationError):
+            # 与 get_object_or_404 一致，格式错误的 ID 按不存在处理
+            raise Http404
+        if version is None:
+            raise Http404
+        etag = quote_etag(version.etag)
+        last_modified = int(version.last_modified.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            try:
+                detail = load_system_detail(queryset, pk)
+            except InformationSystem.DoesNotExist:
+                raise Http404
+            response = Response(detail.to_dict())
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # 浏览器每次都带上验证器重新校验
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """获取信息系统统计信息"""
-        total_systems = InformationSystem.objects.count()
-        running_systems = InformationSystem.objects.filter(
-            status=InformationSystem.Status.RUNNING
-        ).count()
-        stopped_systems = InformationSystem.objects.filter(
-            status=InformationSystem.Status.STOPPED
-        ).count()
-        maintenance_systems = InformationSystem.objects.filter(
-            status=InformationSystem.Status.MAINTENANCE
-        ).count()
-
-        # 资源总量统计
-        total_cpu = sum(system.total_cpu for system in InformationSystem.objects.all())
-        total_memory = sum(system.total_memory for system in InformationSystem.objects.all())
-        total_storage = sum(system.total_storage for system in InformationSystem.objects.all())
-
-        return Response({
-            'total_systems': total_systems,
-            'running_systems': running_systems,
-            'stopped_systems': stopped_systems,
-            'maintenance_systems': maintenance_systems,
-            'total_cpu': total_cpu,
-            'total_memory': total_memory,
-            'total_storage': total_storage
-        })
+        """获取信息系统统计信息（条件聚合，结果缓存至数据变更）"""
+        from ..monitoring.dashboard import get_dashboard_section
+        return Response(get_dashboard_section('information_systems'))
 
 
 
@@ -538,6 +426,22 @@ class SystemOperationLogViewSet(viewsets.ReadOnlyModelViewSet):
         ).all()
 
 
+class VMOperationJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """虚拟机异步任务视图集（查询任务状态与进度）"""
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = VMOperationJobSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['virtual_machine', 'job_type', 'status']
+
+    def get_queryset(self):
+        """管理员可查看全部任务，其他用户只能查看自己提交的任务"""
+        queryset = VMOperationJob.objects.select_related('virtual_machine', 'created_by')
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+
 class VMSnapshotViewSet(viewsets.ModelViewSet):
     """虚拟机快照视图集"""
 
@@ -549,37 +453,36 @@ class VMSnapshotViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return VMSnapshot.objects.select_related('virtual_machine', 'created_by').all()
 
+    def create(self, request, *args, **kwargs):
+        """创建快照（立即返回，快照由异步任务创建，响应中附带 job_id）"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = self.perform_create(serializer)
+        data = dict(serializer.data)
+        data['job_id'] = str(job.id) if job else None
+        return Response(data, status=status.HTTP_201_CREATED)
+
     def perform_create(self, serializer):
         """创建快照"""
         # 1. 保存数据库记录 (状态: creating)
         snapshot = serializer.save(created_by=self.request.user, status='creating')
         
-        # 2. 触发异步任务 (调用OpenStack)
-        # TODO: Implement Celery task
-        # create_snapshot_task.delay(snapshot.id)
-        
-        # 暂时同步调用以便测试 (后续移至Celery)
-        try:
-            openstack_service = get_openstack_service()
-            vm = snapshot.virtual_machine
-            if vm.openstack_id:
-                image_id = openstack_service.create_server_snapshot(vm.openstack_id, snapshot.name)
-                if image_id:
-                    snapshot.openstack_image_id = image_id
-                    snapshot.status = 'available'  # 成功后更新状态
-                    snapshot.save()
-                else:
-                    snapshot.status = 'error'
-                    snapshot.description = (snapshot.description or '') + " (Error: OpenStack returned no image ID)"
-                    snapshot.save()
-            else:
-                snapshot.status = 'error'
-                snapshot.description = (snapshot.description or '') + " (Error: VM has no OpenStack ID)"
-                snapshot.save()
-        except Exception as e:
+        vm = snapshot.virtual_machine
+        if not vm.openstack_id:
             snapshot.status = 'error'
-            snapshot.description = (snapshot.description or '') + f" (Error: {str(e)})"
+            snapshot.description = (snapshot.description or '') + " (Error: VM has no OpenStack ID)"
             snapshot.save()
+            return None
+
+        # 2. 触发异步任务 (调用OpenStack并等待镜像变为 active)
+        from .jobs import submit_vm_job
+        return submit_vm_job(
+            VMOperationJob.JobType.SNAPSHOT,
+            vm=vm,
+            params={'snapshot_id': str(snapshot.id)},
+            user=self.request.user,
+            lock=False
+        )
 
     @action(detail=True, methods=['post'])
     def restore(self, request, pk=None):
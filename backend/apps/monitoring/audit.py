@@ -0,0 +1,273 @@
+"""
+审计日志异步批量写入
+
+AuditLogMiddleware 在请求中只提取必要信息（路径、方法、状态码、资源名称、脱敏后的变更详情等），
+放入进程内有界队列后立即返回；后台线程把队列中的记录解析为 ActivityLog 并按批 bulk_create。
+
+- 背压：队列满时短暂等待，仍满则直接写入磁盘暂存文件，不阻塞请求
+- 数据库写入失败或暂时不可用时，整批写入磁盘暂存文件，之后由后台线程（或 flush_audit_spool 命令）补写
+- 进程正常退出时（atexit）等待后台线程结束，并把队列中剩余记录写库，写库失败则落盘
+
+暂存文件为 JSON Lines，每个进程追加写入 audit-<pid>.open，补写前先改名为 .jsonl 再认领处理。
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUDIT_CONFIG = {
+    # False 时在请求中同步写库（原有行为）
+    'ASYNC': True,
+    'QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    # 后台线程最长等待多久写一批（秒）
+    'FLUSH_INTERVAL': 1.0,
+    # 队列满时请求线程最多等待多久（秒），超时即落盘
+    'PUT_TIMEOUT': 0.05,
+    # 写库失败后多久内直接落盘、不再尝试写库（秒）
+    'RETRY_INTERVAL': 30,
+    # 进程退出时等待后台线程的时间（秒）
+    'SHUTDOWN_TIMEOUT': 10,
+    'SPOOL_DIR': '',
+}
+
+# 超过该时长未修改的 .open / 认领中文件视为进程已退出遗留，可被其他进程补写
+STALE_SPOOL_SECONDS = 300
+
+
+def get_audit_config():
+    config = {**DEFAULT_AUDIT_CONFIG, **getattr(settings, 'AUDIT_LOG', {})}
+    if not config['SPOOL_DIR']:
+        config['SPOOL_DIR'] = str(Path(settings.BASE_DIR) / 'logs' / 'audit_spool')
+    return config
+
+
+def write_entries(entries, batch_size=500):
+    """
+    把原始记录解析为 ActivityLog 并批量写入
+
+    无法解析的记录记日志后丢弃，数据库异常向上抛出（由调用方落盘）。
+
+    Returns:
+        int: 写入条数
+    """
+    from .middleware import AuditLogMiddleware
+    from .models import ActivityLog
+
+    logs = []
+    for entry in entries:
+        try:
+            logs.append(AuditLogMiddleware.build_activity_log(entry))
+        except Exception as e:
+            logger.error(f'审计日志解析失败，已丢弃: {str(e)} ({entry.get("method")} {entry.get("path")})')
+    if logs:
+        ActivityLog.objects.bulk_create(logs, batch_size=batch_size)
+    return len(logs)
+
+
+class AuditLogWriter:
+    """审计日志异步写入器（通过 get_audit_writer() 获取进程内单例）"""
+
+    def __init__(self, config=None):
+        self.config = config or get_audit_config()
+        self.spool_dir = Path(self.config['SPOOL_DIR'])
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._db_unavailable_until = 0
+        self._next_replay = 0
+
+    # ---- 请求线程 ----
+
+    def submit(self, entry):
+        """提交一条审计记录（不做解析、不访问数据库）"""
+        if not self.config['ASYNC']:
+            self._flush([entry])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put(entry, timeout=self.config['PUT_TIMEOUT'])
+        except queue.Full:
+            # 写库跟不上时不让请求排队等待，直接落盘稍后补写
+            self._spill([entry])
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # fork 出的子进程不继承父进程的线程，队列需要重建
+                self._queue = queue.Queue(maxsize=self.config['QUEUE_SIZE'])
+                self._stopping = threading.Event()
+                atexit.register(self.shutdown)
+                self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+
+    # ---- 后台线程 ----
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = self._take_batch(self.config['FLUSH_INTERVAL'])
+                if batch:
+                    self._flush(batch)
+                if time.monotonic() >= self._next_replay:
+                    self._next_replay = time.monotonic() + self.config['RETRY_INTERVAL']
+                    self.replay_spool()
+            except Exception as e:
+                logger.error(f'审计日志写入线程异常: {str(e)}', exc_info=True)
+        connection.close()
+
+    def _take_batch(self, timeout):
+        """等待第一条记录，然后不等待地取满一批"""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.config['BATCH_SIZE']:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        """写库；数据库不可用时整批落盘"""
+        if time.monotonic() < self._db_unavailable_until:
+            self._spill(batch)
+            return False
+        try:
+            write_entries(batch, self.config['BATCH_SIZE'])
+            return True
+        except Exception as e:
+            logger.error(f'审计日志写库失败，{len(batch)} 条记录已暂存到磁盘: {str(e)}')
+            self._db_unavailable_until = time.monotonic() + self.config['RETRY_INTERVAL']
+            # 丢弃可能已损坏的连接，下次写入时重新连接
+            connection.close()
+            self._spill(batch)
+            return False
+
+    # ---- 磁盘暂存 ----
+
+    def _spill(self, entries):
+        try:
+            with self._spool_lock:
+                self.spool_dir.mkdir(parents=True, exist_ok=True)
+                with open(self.spool_dir / f'audit-{os.getpid()}.open', 'a', encoding='utf-8') as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.error(f'审计日志落盘失败，丢失 {len(entries)} 条记录: {str(e)}')
+
+    def _claimable_files(self):
+        if not self.spool_dir.is_dir():
+            return []
+        now = time.time()
+        files = []
+        for path in sorted(self.spool_dir.glob('audit-*')):
+            if path.name == f'audit-{os.getpid()}.open':
+                continue
+            if path.suffix == '.jsonl' or now - path.stat().st_mtime > STALE_SPOOL_SECONDS:
+                files.append(path)
+        return files
+
+    def replay_spool(self):
+        """
+        把暂存文件补写入数据库（数据库仍不可用时保留文件，下次再试）
+
+        Returns:
+            int: 补写的记录数
+        """
+        if time.monotonic() < self._db_unavailable_until:
+            return 0
+
+        own = self.spool_dir / f'audit-{os.getpid()}.open'
+        with self._spool_lock:
+            if own.exists():
+                own.replace(self.spool_dir / f'audit-{os.getpid()}-{time.time_ns()}.jsonl')
+
+        written = 0
+        for path in self._claimable_files():
+            # 改名认领，避免多个进程重复补写
+            claimed = path.with_name(f'{path.stem}.replay-{os.getpid()}')
+            try:
+                path.replace(claimed)
+            except FileNotFoundError:
+                continue
+
+            with open(claimed, encoding='utf-8') as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            batch_size = self.config['BATCH_SIZE']
+            for start in range(0, len(entries), batch_size):
+                batch = entries[start:start + batch_size]
+                if not self._flush(batch):
+                    # 失败的这批已重新落盘，剩余部分一并放回
+                    self._spill(entries[start + batch_size:])
+                    claimed.unlink(missing_ok=True)
+                    return written
+                written += len(batch)
+            claimed.unlink(missing_ok=True)
+
+        if written:
+            logger.info(f'已从磁盘暂存文件补写 {written} 条审计日志')
+        return written
+
+    # ---- 退出 ----
+
+    def shutdown(self):
+        """停止后台线程并写完队列中剩余的记录（进程正常退出时自动调用）"""
+        if self._pid != os.getpid() or self._queue is None:
+            return
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(self.config['SHUTDOWN_TIMEOUT'])
+
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        batch_size = self.config['BATCH_SIZE']
+        for start in range(0, len(remaining), batch_size):
+            self._flush(remaining[start:start + batch_size])
+        if remaining:
+            logger.info(f'进程退出前写入剩余审计日志 {len(remaining)} 条')
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditLogWriter()
+    return _writer
+
+
+def submit_audit_entry(entry):
+    get_audit_writer().submit(entry)
+
+
+def parse_entry_time(value):
+    """记录中的时间为 ISO 格式字符串（便于落盘）"""
+    return datetime.fromisoformat(value) if value else None
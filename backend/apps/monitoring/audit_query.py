@@ -0,0 +1,233 @@
+"""
+审计日志查询
+
+- 游标分页：按 (created_at, id) 倒序做键集分页，翻页代价与页码无关；
+  按用户/操作类型过滤时使用已有的 (user, created_at) / (action_type, created_at) 索引
+- 搜索：PostgreSQL 上对 description、resource_name、request_path 拼接后的文本做
+  全文检索（simple 分词）或子串匹配（pg_trgm GIN 索引加速，适合中文和路径片段），
+  索引见迁移 0009；其他数据库退回 icontains
+- 导出：NDJSON / CSV 流式输出，按 (created_at, id) 键集逐批查询，每批渲染后立即输出，
+  不在内存中保留完整结果；ASGI（daphne）下使用异步迭代器（每批查询经 sync_to_async 执行），
+  否则 Django 会先把同步迭代器整体读入列表再发送
+"""
+
+import base64
+import csv
+import io
+import json
+from asgiref.sync import sync_to_async
+from dateutil.parser import parse
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# 与迁移 0009 中索引的表达式保持一致，否则 PostgreSQL 不会使用索引
+SEARCH_DOCUMENT_SQL = (
+    '("activity_logs"."description" || \' \' || COALESCE("activity_logs"."resource_name", \'\') '
+    '|| \' \' || COALESCE("activity_logs"."request_path", \'\'))'
+)
+
+# 导出字段（values_list 字段名, 输出列名）
+EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('created_at', 'created_at'),
+    ('user__username', 'username'),
+    ('action_type', 'action_type'),
+    ('resource_type', 'resource_type'),
+    ('resource_id', 'resource_id'),
+    ('resource_name', 'resource_name'),
+    ('description', 'description'),
+    ('status', 'status'),
+    ('error_message', 'error_message'),
+    ('ip_address', 'ip_address'),
+    ('user_agent', 'user_agent'),
+    ('request_method', 'request_method'),
+    ('request_path', 'request_path'),
+    ('changes', 'changes'),
+]
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _parse_time(value, name):
+    try:
+        return parse(value)
+    except (ValueError, OverflowError):
+        raise ValidationError({name: f'无效的时间: {value}'})
+
+
+def filter_activity_logs(queryset, params):
+    """按查询参数过滤（action_type、resource_type、resource_id、user、status、start、end、search）"""
+    for field in ('action_type', 'resource_type', 'resource_id', 'status'):
+        if params.get(field):
+            queryset = queryset.filter(**{field: params[field]})
+    if params.get('user'):
+        try:
+            user_id = int(params['user'])
+        except ValueError:
+            raise ValidationError({'user': f'无效的用户ID: {params["user"]}'})
+        queryset = queryset.filter(user_id=user_id)
+    if params.get('start'):
+        queryset = queryset.filter(created_at__gte=_parse_time(params['start'], 'start'))
+    if params.get('end'):
+        queryset = queryset.filter(created_at__lt=_parse_time(params['end'], 'end'))
+    if params.get('search'):
+        queryset = search_activity_logs(queryset, params['search'].strip())
+    return queryset
+
+
+def search_activity_logs(queryset, text):
+    if not text:
+        return queryset
+    if connection.vendor == 'postgresql':
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return queryset.extra(
+            where=[
+                f"(to_tsvector('simple', {SEARCH_DOCUMENT_SQL}) @@ plainto_tsquery('simple', %s) "
+                f"OR {SEARCH_DOCUMENT_SQL} ILIKE %s)"
+            ],
+            params=[text, pattern],
+        )
+    return queryset.filter(
+        Q(description__icontains=text) | Q(resource_name__icontains=text) | Q(request_path__icontains=text)
+    )
+
+
+class KeysetPagination(BasePagination):
+    """
+    (created_at, id) 键集分页
+
+    响应为 {'next': 下一页URL或None, 'results': [...]}；cursor 参数为不透明字符串。
+    """
+
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def encode_cursor(self, item):
+        raw = f'{item.created_at.isoformat()}|{item.id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, value):
+        try:
+            created_at, item_id = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+            return parse(created_at), int(item_id)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise ValidationError({self.cursor_query_param: '无效的分页游标'})
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-created_at', '-id')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, item_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=item_id))
+
+        items = list(queryset[:page_size + 1])
+        self.has_next = len(items) > page_size
+        items = items[:page_size]
+        self.next_cursor = self.encode_cursor(items[-1]) if self.has_next else None
+        return items
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def _export_chunks(queryset):
+    """按 (created_at, id) 倒序键集分批读取导出行，每批一次查询，批之间不占用数据库游标"""
+    fields = [field for field, _ in EXPORT_FIELDS]
+    created_at_index, id_index = fields.index('created_at'), fields.index('id')
+    queryset = queryset.order_by('-created_at', '-id')
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(Q(created_at__lt=last[0]) | Q(created_at=last[0], id__lt=last[1]))
+        rows = list(page.values_list(*fields)[:EXPORT_CHUNK_SIZE])
+        if rows:
+            yield rows
+        if len(rows) < EXPORT_CHUNK_SIZE:
+            return
+        last = (rows[-1][created_at_index], rows[-1][id_index])
+
+
+def _export_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _render_ndjson(rows):
+    names = [name for _, name in EXPORT_FIELDS]
+    lines = []
+    for row in rows:
+        record = dict(zip(names, row))
+        record['created_at'] = record['created_at'].isoformat() if record['created_at'] else None
+        lines.append(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+    return ''.join(lines)
+
+
+def _render_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_export_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def iter_export(queryset, output):
+    """同步导出迭代器：每批查询渲染为一段文本"""
+    if output == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow([name for _, name in EXPORT_FIELDS])
+        # BOM 便于 Excel 识别 UTF-8
+        yield '\ufeff' + buffer.getvalue()
+    render = _render_csv if output == 'csv' else _render_ndjson
+    for rows in _export_chunks(queryset):
+        yield render(rows)
+
+
+async def aiter_export(queryset, output):
+    """异步导出迭代器：在同步线程中逐批查询和渲染，事件循环只负责发送"""
+    chunks = iter_export(queryset, output)
+    fetch = sync_to_async(next)
+    while True:
+        chunk = await fetch(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
@@ -0,0 +1,174 @@
+"""
+审计日志请求分类
+
+- PathPrefixIndex：排除路径的前缀索引。以 '/' 结尾的前缀按路径段建成字典树，
+  判断时最多做“路径段数”次字典查找；其余前缀退回 str.startswith
+- AuditRouteClassifier：按 Django 解析出的路由（ResolverMatch.route）直接查表得到
+  (操作类型, 资源类型, 资源ID所在的 URL 参数)。表在首次使用时遍历项目 URL 配置一次性编译：
+  把每条路由还原为路径模板（参数替换为 {name}），交给原有的按路径分类规则计算一次。
+  无法解析的路由（404、无法还原为模板的正则）退回按路径逐条判断
+"""
+
+import logging
+import re
+import threading
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+_NAMED_GROUP_RE = re.compile(r'\(\?P<(\w+)>[^()]*\)')
+_CONVERTER_RE = re.compile(r'<(?:\w+:)?(\w+)>')
+_PLACEHOLDER_RE = re.compile(r'^\{(\w+)\}$')
+_REGEX_CHARS_RE = re.compile(r'[\^$()\[\]*+?|\\{}]')
+
+# 资源ID来源
+ID_NONE = None
+ID_KWARG = 'kwarg'
+ID_LITERAL = 'literal'
+
+
+class PathPrefixIndex:
+    """
+    路径前缀索引（等价于 any(path.startswith(prefix) for prefix in prefixes)）
+    """
+
+    _TERMINAL = object()
+
+    def __init__(self, prefixes):
+        self._trie = {}
+        self._depth = 0
+        fallback = []
+        for prefix in prefixes:
+            if prefix.startswith('/') and prefix.endswith('/') and len(prefix) > 1:
+                node = self._trie
+                segments = prefix[1:-1].split('/')
+                self._depth = max(self._depth, len(segments))
+                for segment in segments:
+                    node = node.setdefault(segment, {})
+                node[self._TERMINAL] = True
+            else:
+                fallback.append(prefix)
+        self._fallback = tuple(fallback)
+
+    def match(self, path):
+        if self._fallback and path.startswith(self._fallback):
+            return True
+        # 只需切分出前缀树深度内的路径段
+        segments = path.split('/', self._depth + 1)
+        if segments[0] != '':
+            return False
+        node = self._trie
+        # 前缀以 '/' 结尾，终止节点之后路径中还必须有 '/'（即后面还有元素）
+        for position in range(1, len(segments) - 1):
+            node = node.get(segments[position])
+            if node is None:
+                return False
+            if self._TERMINAL in node:
+                return True
+        return False
+
+
+def route_template(route):
+    """
+    把 ResolverMatch.route 还原为路径模板，如
+    'api/openstack/servers/(?P<pk>[^/.]+)/start/$' -> '/api/openstack/servers/{pk}/start/'
+
+    Returns:
+        str 或 None（包含无法还原的正则）
+    """
+    template = _NAMED_GROUP_RE.sub(r'{\1}', route)
+    template = _CONVERTER_RE.sub(r'{\1}', template)
+    template = template.replace('^', '').rstrip('$')
+    if template.endswith('/?'):
+        template = template[:-1]
+    template = template.replace('\\.', '.').replace('\\-', '-')
+    # 去掉合法的 {name} 占位后不应再有正则字符
+    if _REGEX_CHARS_RE.search(re.sub(r'\{\w+\}', '', template)):
+        return None
+    return '/' + template
+
+
+def iter_routes(patterns=None, prefix=''):
+    """遍历 URL 配置，按与 ResolverMatch.route 相同的规则拼出每条路由"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        route = str(pattern.pattern)
+        if prefix and route.startswith('^'):
+            route = route[1:]
+        route = prefix + route
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns, route)
+        else:
+            yield route
+
+
+class AuditRouteClassifier:
+    """
+    Args:
+        classify_path: 按路径分类的函数 (path, method) -> (action_type, resource_type, resource_id)
+        methods: 需要分类的 HTTP 方法
+    """
+
+    def __init__(self, classify_path, methods):
+        self.classify_path = classify_path
+        self.methods = tuple(methods)
+        # route -> {method: (action_type, resource_type, id_source, id_value)}，None 表示退回按路径判断
+        self._table = {}
+        self._compiled = False
+        self._lock = threading.Lock()
+
+    def compile_route(self, route):
+        template = route_template(route)
+        if template is None:
+            return None
+        entry = {}
+        for method in self.methods:
+            action_type, resource_type, resource_id = self.classify_path(template, method)
+            if resource_id is None:
+                id_source, id_value = ID_NONE, None
+            else:
+                placeholder = _PLACEHOLDER_RE.match(resource_id)
+                if placeholder:
+                    id_source, id_value = ID_KWARG, placeholder.group(1)
+                elif '{' in resource_id:
+                    # 资源ID是参数与固定文本的组合，无法直接取参数
+                    return None
+                else:
+                    id_source, id_value = ID_LITERAL, resource_id
+            entry[method] = (action_type, resource_type, id_source, id_value)
+        return entry
+
+    def compile(self, routes=None):
+        """编译全部路由（首次分类时自动执行）"""
+        with self._lock:
+            if self._compiled and routes is None:
+                return len(self._table)
+            for route in (routes if routes is not None else iter_routes()):
+                if route not in self._table:
+                    self._table[route] = self.compile_route(route)
+            self._compiled = True
+            logger.debug(f'审计路由表编译完成，共 {len(self._table)} 条路由')
+            return len(self._table)
+
+    def classify(self, path, method, route=None, route_kwargs=None):
+        """
+        Returns:
+            (action_type, resource_type, resource_id)
+        """
+        if route is not None:
+            if not self._compiled:
+                self.compile()
+            entry = self._table.get(route, False)
+            if entry is False:
+                # 动态添加的路由
+                entry = self._table[route] = self.compile_route(route)
+            if entry is not None and method in entry:
+                action_type, resource_type, id_source, id_value = entry[method]
+                if id_source == ID_KWARG:
+                    resource_id = (route_kwargs or {}).get(id_value)
+                    if resource_id is not None:
+                        return action_type, resource_type, resource_id
+                else:
+                    return action_type, resource_type, id_value
+        return self.classify_path(path, method)
@@ -0,0 +1,156 @@
+"""
+服务可用性缓存
+
+check_service_health 任务每次检查后写入缓存（写穿），仪表盘接口只读缓存，不再扫描 ServiceHealthCheck：
+  - 每个服务每个 UTC 日一个条目，包含两个 1440 位的分钟位图：checked（该分钟有检查）、healthy（该分钟检查结果健康）
+  - 最近 24 小时可用性 = 昨日位图中当前分钟之后的部分 + 今日位图中当前分钟及之前的部分，健康分钟数 / 有检查的分钟数
+  - 每个服务的最新一次检查结果单独缓存
+
+缓存为空（首次部署、缓存被清空）时从 ServiceHealthCheck 回填一次。
+"""
+
+import logging
+from datetime import timedelta, timezone as dt_timezone
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SLOTS_PER_DAY = 1440
+
+# 日位图缓存键与有效期（需覆盖昨日整天）
+DAY_CACHE_KEY = 'monitoring:availability:{service}:{day}'
+DAY_TTL = 3 * 86400
+LATEST_CACHE_KEY = 'monitoring:availability:latest:{service}'
+LATEST_TTL = 86400
+# 存在即表示已从数据库回填过
+SEEDED_CACHE_KEY = 'monitoring:availability:seeded'
+SEED_LOCK_KEY = 'monitoring:availability:seed_lock'
+
+
+def service_configs():
+    """启用的服务 [(服务标识, 显示名称, 类型)]，与健康探测一致"""
+    from .probes import get_enabled_probes
+    return [(probe.name, probe.display_name, probe.service_type) for probe in get_enabled_probes()]
+
+
+def _slot(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return moment.strftime('%Y%m%d'), moment.hour * 60 + moment.minute
+
+
+def _day_key(service, day):
+    return DAY_CACHE_KEY.format(service=service, day=day)
+
+
+def _popcount(bits):
+    # int.bit_count() 需要 Python 3.10，麒麟部署（deploy_kylin_py39.sh）仍为 3.9
+    return bin(bits).count('1')
+
+
+def record_checks(checks, now=None):
+    """
+    写入一批检查结果
+
+    Args:
+        checks: 可迭代的 {'service', 'healthy', 'checked_at'(可选), 'response_time_ms'(可选), 'error'(可选)}
+    """
+    now = now or timezone.now()
+    checks = list(checks)
+    if not checks:
+        return
+
+    keys = {_day_key(check['service'], _slot(check.get('checked_at') or now)[0]) for check in checks}
+    days = cache.get_many(list(keys))
+    latest = {}
+    for check in checks:
+        checked_at = check.get('checked_at') or now
+        day, slot = _slot(checked_at)
+        key = _day_key(check['service'], day)
+        bitmap = days.setdefault(key, {'checked': 0, 'healthy': 0})
+        bit = 1 << slot
+        bitmap['checked'] |= bit
+        # 同一分钟多次检查以最后一次为准
+        if check['healthy']:
+            bitmap['healthy'] |= bit
+        else:
+            bitmap['healthy'] &= ~bit
+        latest[LATEST_CACHE_KEY.format(service=check['service'])] = {
+            'is_healthy': check['healthy'],
+            'checked_at': checked_at.isoformat(),
+            'response_time_ms': check.get('response_time_ms'),
+            'error_message': check.get('error') or '',
+        }
+
+    cache.set_many({key: days[key] for key in keys}, DAY_TTL)
+    cache.set_many(latest, LATEST_TTL)
+
+
+def seed_from_database(now=None):
+    """从最近 24 小时的 ServiceHealthCheck 回填位图（与已有位图合并，可重复执行）"""
+    from .models import ServiceHealthCheck
+
+    now = now or timezone.now()
+    rows = ServiceHealthCheck.objects.filter(
+        checked_at__gte=now - timedelta(hours=24)
+    ).order_by('checked_at').values_list('service_name', 'checked_at', 'is_healthy', 'response_time_ms', 'error_message')
+    record_checks(({
+        'service': service,
+        'checked_at': checked_at,
+        'healthy': healthy,
+        'response_time_ms': response_time,
+        'error': error,
+    } for service, checked_at, healthy, response_time, error in rows.iterator(chunk_size=2000)), now)
+    cache.set(SEEDED_CACHE_KEY, now.isoformat(), DAY_TTL)
+
+
+def _ensure_seeded(now):
+    if cache.get(SEEDED_CACHE_KEY) is not None:
+        return
+    # 多个进程同时发现缓存为空时只回填一次
+    if not cache.add(SEED_LOCK_KEY, 1, 60):
+        return
+    try:
+        seed_from_database(now)
+        logger.info('服务可用性缓存已从健康检查记录回填')
+    except Exception as e:
+        logger.error(f'回填服务可用性缓存失败: {str(e)}')
+    finally:
+        cache.delete(SEED_LOCK_KEY)
+
+
+def get_availability(now=None):
+    """
+    各服务最近 24 小时的可用性与最新检查结果
+
+    Returns:
+        dict: {service: {'checked': 有检查的分钟数, 'healthy': 健康分钟数, 'latest': 最新结果或 None}}
+    """
+    now = now or timezone.now()
+    _ensure_seeded(now)
+
+    today, slot = _slot(now)
+    yesterday = _slot(now - timedelta(days=1))[0]
+    # 今日取 [0, slot]，昨日取 (slot, 1439]
+    today_mask = (1 << (slot + 1)) - 1
+    yesterday_mask = ((1 << SLOTS_PER_DAY) - 1) ^ today_mask
+
+    services = [service for service, _, _ in service_configs()]
+    keys = []
+    for service in services:
+        keys += [_day_key(service, today), _day_key(service, yesterday), LATEST_CACHE_KEY.format(service=service)]
+    values = cache.get_many(keys)
+
+    result = {}
+    for service in services:
+        empty = {'checked': 0, 'healthy': 0}
+        today_bits = values.get(_day_key(service, today), empty)
+        yesterday_bits = values.get(_day_key(service, yesterday), empty)
+        result[service] = {
+            'checked': _popcount(today_bits['checked'] & today_mask)
+                       + _popcount(yesterday_bits['checked'] & yesterday_mask),
+            'healthy': _popcount(today_bits['healthy'] & today_mask)
+                       + _popcount(yesterday_bits['healthy'] & yesterday_mask),
+            'latest': values.get(LATEST_CACHE_KEY.format(service=service)),
+        }
+    return result
@@ -0,0 +1,291 @@
+"""
+虚拟机监控指标批量采集
+
+每个采集周期：
+  1. 一次性列出全部服务器详情（取规格ID），规格信息使用目录缓存中的规格列表，本轮内复用
+  2. 以有限并发拉取各虚拟机的诊断数据（每台只需一次 API 调用）
+  3. CPU 使用率和网络速率由本次与上次采样的累计计数差值计算，上次采样保存在共享缓存中
+  4. 本轮全部记录通过一次 bulk_create 写入 VMMetricHistory，随后交给流式告警评估器
+
+整轮采集有总时限（默认 50 秒），超时未返回的虚拟机本轮跳过，保证 1 分钟周期不会堆积。
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.core.cache import cache
+from django.utils import timezone
+
+from .streaming import evaluate_samples
+
+logger = logging.getLogger(__name__)
+
+# 上次采样的缓存键与有效期（超过有效期的采样不再用于计算差值）
+SAMPLE_CACHE_KEY = 'monitoring:metric_sample:{vm_id}'
+SAMPLE_TTL = 600
+
+# 整轮采集的默认时限（秒）
+DEFAULT_DEADLINE = 50
+
+
+def parse_diagnostics(diagnostics):
+    """
+    解析诊断数据中的累计计数
+
+    兼容两种格式：
+      - 2.48 之前（libvirt 原始键）：cpu0_time(ns)、memory/memory-actual/memory-unused(KiB)、tapxxx_rx/tapxxx_tx(bytes)
+      - 2.48 及之后：cpu_details/memory_details(MiB)/nic_details
+
+    Returns:
+        dict: {'cpu_time', 'num_cpus', 'memory_used_mb', 'memory_total_mb', 'rx_bytes', 'tx_bytes'}，
+        无法获得的项为 None
+    """
+    result = {
+        'cpu_time': None,
+        'num_cpus': None,
+        'memory_used_mb': None,
+        'memory_total_mb': None,
+        'rx_bytes': None,
+        'tx_bytes': None,
+    }
+    if not diagnostics:
+        return result
+
+    if 'cpu_details' in diagnostics or 'nic_details' in diagnostics:
+        cpu_details = diagnostics.get('cpu_details') or []
+        cpu_times = [cpu.get('time') for cpu in cpu_details if cpu.get('time') is not None]
+        if cpu_times:
+            result['cpu_time'] = float(sum(cpu_times))
+        result['num_cpus'] = diagnostics.get('num_cpus') or len(cpu_details) or None
+
+        memory = diagnostics.get('memory_details') or {}
+        result['memory_used_mb'] = memory.get('used')
+        result['memory_total_mb'] = memory.get('maximum')
+
+        nics = diagnostics.get('nic_details') or []
+        if nics:
+            result['rx_bytes'] = float(sum(nic.get('rx_octets') or 0 for nic in nics))
+            result['tx_bytes'] = float(sum(nic.get('tx_octets') or 0 for nic in nics))
+        return result
+
+    cpu_times = [float(value) for key, value in diagnostics.items() if key.startswith('cpu') and key.endswith('_time')]
+    if cpu_times:
+        result['cpu_time'] = sum(cpu_times)
+        result['num_cpus'] = len(cpu_times)
+
+    total_kb = diagnostics.get('memory-actual') or diagnostics.get('memory')
+    if total_kb:
+        result['memory_total_mb'] = float(total_kb) / 1024
+        if diagnostics.get('memory-unused') is not None and diagnostics.get('memory-available'):
+            used_kb = float(diagnostics['memory-available']) - float(diagnostics['memory-unused'])
+        else:
+            used_kb = diagnostics.get('memory-rss')
+        if used_kb is not None:
+            result['memory_used_mb'] = float(used_kb) / 1024
+
+    rx_values = [float(value) for key, value in diagnostics.items() if key.endswith('_rx') or 'rx_bytes' in key]
+    tx_values = [float(value) for key, value in diagnostics.items() if key.endswith('_tx') or 'tx_bytes' in key]
+    if rx_values:
+        result['rx_bytes'] = sum(rx_values)
+    if tx_values:
+        result['tx_bytes'] = sum(tx_values)
+    return result
+
+
+def _rate(current, previous, elapsed):
+    """累计计数的每秒增量；计数回绕（如虚拟机重启）时返回 None"""
+    if current is None or previous is None or elapsed <= 0 or current < previous:
+        return None
+    return (current - previous) / elapsed
+
+
+def compute_metrics(counters, previous, now, vcpus=None, ram_mb=None):
+    """
+    由本次和上次采样计算监控指标
+
+    Args:
+        counters: parse_diagnostics 的结果
+        previous: 上次采样（{'ts', 'cpu_time', 'rx_bytes', 'tx_bytes'}）或 None
+        now: 本次采样时间戳（秒）
+        vcpus / ram_mb: 规格中的 CPU 数和内存大小，诊断数据缺失时使用
+
+    Returns:
+        dict: VMMetricHistory 字段值；没有可用的上次采样（首次采样）时返回 None
+    """
+    if not previous:
+        return None
+    elapsed = now - previous['ts']
+
+    cpu_rate = _rate(counters['cpu_time'], previous.get('cpu_time'), elapsed)
+    if cpu_rate is None:
+        return None
+    num_cpus = counters['num_cpus'] or vcpus or 1
+    cpu_usage = min(100.0, cpu_rate / (num_cpus * 1e9) * 100)
+
+    memory_total = counters['memory_total_mb'] or ram_mb
+    memory_usage = 0.0
+    if counters['memory_used_mb'] is not None and memory_total:
+        memory_usage = min(100.0, counters['memory_used_mb'] / memory_total * 100)
+
+    rx_rate = _rate(counters['rx_bytes'], previous.get('rx_bytes'), elapsed) or 0
+    tx_rate = _rate(counters['tx_bytes'], previous.get('tx_bytes'), elapsed) or 0
+
+    return {
+        'cpu_usage': round(cpu_usage, 1),
+        'memory_usage': round(memory_usage, 1),
+        'network_in_rate': round(rx_rate / 1024, 2),
+        'network_out_rate': round(tx_rate / 1024, 2),
+    }
+
+
+class MetricCollector:
+    """
+    虚拟机监控指标批量采集器
+
+    Args:
+        openstack_service: OpenStackService 实例，默认使用全局单例
+        max_workers: 拉取诊断数据的最大并发数，默认不超过 OpenStack 连接池大小
+        deadline: 整轮采集时限（秒）
+    """
+
+    def __init__(self, openstack_service=None, max_workers=None, deadline=DEFAULT_DEADLINE):
+        from apps.openstack.services import get_openstack_service
+
+        self.openstack_service = openstack_service or get_openstack_service()
+        self.max_workers = max_workers or self.openstack_service.pool.max_size
+        self.deadline = deadline
+
+    def _load_specs(self):
+        """一次列表调用取得 {server_id: (vcpus, ram_mb)}，失败时返回空字典（退回使用本地规格）"""
+        try:
+            servers = self.openstack_service.list_servers_detailed(all_tenants=True)
+        except Exception as e:
+            logger.warning(f'获取服务器列表失败，使用本地规格计算: {str(e)}')
+            return {}
+
+        flavor_map = {flavor['id']: flavor for flavor in self.openstack_service.list_flavors() if flavor.get('id')}
+        specs = {}
+        for server in servers:
+            flavor = server.get('flavor') or {}
+            if flavor.get('id') in flavor_map:
+                flavor = flavor_map[flavor['id']]
+            if flavor.get('vcpus'):
+                specs[server.get('id')] = (flavor.get('vcpus'), flavor.get('ram'))
+        return specs
+
+    def _fetch(self, openstack_id):
+        with self.openstack_service.checkout():
+            return self.openstack_service.get_server_diagnostics(openstack_id), time.time()
+
+    def collect(self, vms=None):
+        """
+        采集一轮监控数据
+
+        Args:
+            vms: 要采集的虚拟机，默认所有运行中且已绑定 OpenStack 的虚拟机
+
+        Returns:
+            dict: {'total', 'collected', 'warming'(首次采样，下轮起产生数据), 'failed', 'records'}
+        """
+        from apps.information_systems.models import VirtualMachine
+        from .models import VMMetricHistory
+
+        started = time.time()
+        if vms is None:
+            vms = VirtualMachine.objects.filter(status='running', openstack_id__isnull=False).exclude(openstack_id='')
+        vms = [vm for vm in vms if vm.openstack_id]
+        result = {'total': len(vms), 'collected': 0, 'warming': 0, 'failed': 0, 'records': []}
+        if not vms:
+            return result
+
+        if self.openstack_service.get_connection() is None:
+            # 无法连接 OpenStack 时沿用 get_server_metrics 的模拟数据
+            return self._collect_fallback(vms, result)
+
+        specs = self._load_specs()
+        sample_keys = {vm.id: SAMPLE_CACHE_KEY.format(vm_id=vm.id) for vm in vms}
+        previous_samples = cache.get_many(list(sample_keys.values()))
+
+        executor = ThreadPoolExecutor(max_workers=min(len(vms), self.max_workers), thread_name_prefix='metric-collector')
+        futures = {executor.submit(self._fetch, vm.openstack_id): vm for vm in vms}
+        done, not_done = wait(futures, timeout=max(1, self.deadline - (time.time() - started)))
+        for future in not_done:
+            future.cancel()
+        executor.shutdown(wait=False)
+        if not_done:
+            logger.warning(f'监控采集超时，本轮跳过 {len(not_done)} 台虚拟机')
+        result['failed'] += len(not_done)
+
+        timestamp = timezone.now()
+        new_samples = {}
+        records = []
+        for future in done:
+            vm = futures[future]
+            try:
+                diagnostics, sampled_at = future.result()
+            except Exception as e:
+                logger.warning(f'采集虚拟机 {vm.name} 的监控数据失败: {str(e)}')
+                result['failed'] += 1
+                continue
+            if not diagnostics:
+                result['failed'] += 1
+                continue
+
+            counters = parse_diagnostics(diagnostics)
+            key = sample_keys[vm.id]
+            new_samples[key] = {
+                'ts': sampled_at,
+                'cpu_time': counters['cpu_time'],
+                'rx_bytes': counters['rx_bytes'],
+                'tx_bytes': counters['tx_bytes'],
+            }
+            vcpus, ram_mb = specs.get(vm.openstack_id, (vm.cpu_cores, vm.memory_gb * 1024 if vm.memory_gb else None))
+            metrics = compute_metrics(counters, previous_samples.get(key), sampled_at, vcpus, ram_mb)
+            if metrics is None:
+                result['warming'] += 1
+                continue
+            records.append(VMMetricHistory(virtual_machine=vm, timestamp=timestamp, **metrics))
+
+        if new_samples:
+            cache.set_many(new_samples, SAMPLE_TTL)
+        if records:
+            VMMetricHistory.objects.bulk_create(records, batch_size=1000)
+
+        result['collected'] = len(records)
+        result['records'] = records
+        # 新采样立即参与告警评估
+        evaluate_samples(records)
+        logger.info(
+            f"监控数据采集完成: {result['collected']}/{result['total']} 台，首次采样 {result['warming']} 台，"
+            f"失败 {result['failed']} 台，耗时 {time.time() - started:.1f}s"
+        )
+        return result
+
+    def _collect_fallback(self, vms, result):
+        from .models import VMMetricHistory
+
+        timestamp = timezone.now()
+        records = []
+        for vm in vms:
+            metrics = self.openstack_service.get_server_metrics(vm.openstack_id)
+            if not metrics:
+                result['failed'] += 1
+                continue
+            records.append(VMMetricHistory(
+                virtual_machine=vm,
+                cpu_usage=metrics.get('cpu_usage_percent', 0),
+                memory_usage=metrics.get('memory_usage_percent', 0),
+                network_in_rate=metrics.get('network_in_bytes', 0) / 1024,
+                network_out_rate=metrics.get('network_out_bytes', 0) / 1024,
+                timestamp=timestamp
+            ))
+        VMMetricHistory.objects.bulk_create(records, batch_size=1000)
+        result['collected'] = len(records)
+        result['records'] = records
+        evaluate_samples(records)
+        return result
+
+
+def collect_vm_metrics(vms=None):
+    """采集一轮虚拟机监控数据（供定时任务和手动采集接口使用）"""
+    return MetricCollector().collect(vms)
@@ -6,7 +6,7 @@ import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from rest_framework_simplejwt.tokens import AccessToken
-from django.contrib.auth.models import User
+from apps.tenants.context import load_user
 from urllib.parse import parse_qs
 
 logger = logging.getLogger(__name__)
@@ -23,8 +23,8 @@ class VMStatusConsumer(AsyncWebsocketConsumer):
             access_token = AccessToken(token_string)
             user_id = access_token['user_id']
             
-            # 获取用户对象
-            user = User.objects.get(id=user_id)
+            # 获取用户对象（用户上下文缓存，命中时不查询数据库）
+            user = load_user(user_id)
             if user.is_active:
                 return user
             else:
@@ -111,3 +111,13 @@ class VMStatusConsumer(AsyncWebsocketConsumer):
             }))
         except Exception as e:
             logger.error(f"发送VM状态更新失败: {str(e)}")
+
+    async def alert_notification(self, event):
+        """接收告警触发/恢复事件并发送给客户端"""
+        try:
+            await self.send(text_data=json.dumps({
+                'type': 'alert_notification',
+                'data': event['data']
+            }))
+        except Exception as e:
+            logger.error(f"发送告警通知失败: {str(e)}")
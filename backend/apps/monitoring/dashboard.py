@@ -0,0 +1,202 @@
+"""
+管理仪表盘汇总
+
+各模块统计（信息系统、租户、合同、产品、产品订阅）用条件聚合（Count(filter=Q(...))）计算，
+每个模型一条查询；汇总结果按模块缓存，相关模型保存/删除后（事务提交时）失效，下次读取时重新计算。
+
+失效通过刷新模块的代号实现：缓存键包含代号，计算期间发生的写入会更换代号，
+因此计算完成后写回的旧结果不会被读到。queryset.update() 等不触发信号的批量写入由 SUMMARY_TTL 兜底。
+"""
+
+import logging
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+GENERATION_CACHE_KEY = 'monitoring:dashboard:generation:{section}'
+SUMMARY_CACHE_KEY = 'monitoring:dashboard:{section}:{generation}'
+SUMMARY_TTL = 600
+
+
+def _count_by(field, choices, suffix='_count', extra=None):
+    """{'<值><suffix>': Count('pk', filter=Q(field=值))}"""
+    condition = extra or Q()
+    return {
+        f'{value}{suffix}': Count('pk', filter=condition & Q(**{field: value}))
+        for value in choices.values
+    }
+
+
+def information_system_statistics(queryset=None):
+    from apps.information_systems.models import InformationSystem
+
+    queryset = InformationSystem.objects.all() if queryset is None else queryset
+    stats = queryset.aggregate(
+        total_systems=Count('pk'),
+        **_count_by('status', InformationSystem.Status, suffix='_systems'),
+        total_cpu=Sum('total_cpu'),
+        total_memory=Sum('total_memory'),
+        total_storage=Sum('total_storage'),
+    )
+    for field in ('total_cpu', 'total_memory', 'total_storage'):
+        stats[field] = stats[field] or 0
+    return stats
+
+
+def tenant_statistics(queryset=None):
+    from apps.tenants.models import Tenant
+
+    queryset = Tenant.objects.all() if queryset is None else queryset
+    stats = queryset.aggregate(
+        total_count=Count('pk'),
+        **_count_by('status', Tenant.Status),
+        **_count_by('level', Tenant.TenantLevel),
+        **_count_by('tenant_type', Tenant.TenantType),
+        total_vcpus=Sum('quota_vcpus'),
+        total_memory=Sum('quota_memory'),
+        total_disk=Sum('quota_disk'),
+        total_instances=Sum('quota_instances'),
+    )
+    for field in ('total_vcpus', 'total_memory', 'total_disk', 'total_instances'):
+        stats[field] = stats[field] or 0
+    return stats
+
+
+def contract_statistics(queryset=None):
+    from apps.contracts.models import Contract
+
+    queryset = Contract.objects.all() if queryset is None else queryset
+    stats = queryset.aggregate(
+        total_count=Count('pk'),
+        **_count_by('status', Contract.Status),
+        **_count_by('contract_type', Contract.ContractType),
+        total_contract_amount=Sum('total_amount'),
+        total_paid_amount=Sum('paid_amount'),
+    )
+    stats['total_contract_amount'] = stats['total_contract_amount'] or 0
+    stats['total_paid_amount'] = stats['total_paid_amount'] or 0
+    stats['total_remaining_amount'] = stats['total_contract_amount'] - stats['total_paid_amount']
+    return stats
+
+
+def product_statistics():
+    from apps.products.models import Product
+
+    active = Q(status=Product.Status.ACTIVE)
+    counts = Product.objects.aggregate(
+        total_products=Count('pk'),
+        **_count_by('status', Product.Status, suffix='_products'),
+        **_count_by('product_type', Product.ProductType, suffix='_type', extra=active),
+        **_count_by('pricing_model', Product.PricingModel, suffix='_pricing', extra=active),
+    )
+    # 类型与定价模型仅统计启用的产品，按显示名称输出
+    return {
+        'total_products': counts['total_products'],
+        **{f'{value}_products': counts[f'{value}_products'] for value in Product.Status.values},
+        'product_types': {
+            str(label): counts[f'{value}_type'] for value, label in Product.ProductType.choices
+        },
+        'pricing_models': {
+            str(label): counts[f'{value}_pricing'] for value, label in Product.PricingModel.choices
+        },
+    }
+
+
+def subscription_statistics():
+    from apps.products.models import Product, ProductSubscription
+    from apps.tenants.models import Tenant
+
+    Status = ProductSubscription.SubscriptionStatus
+    stats = ProductSubscription.objects.aggregate(
+        total_subscriptions=Count('pk'),
+        **_count_by('status', Status, suffix='_subscriptions'),
+    )
+    # 没有订阅的产品/租户也要列出（计数为 0），因此从产品/租户一侧做 LEFT JOIN 分组
+    stats['subscription_by_product'] = dict(
+        Product.objects.annotate(
+            active_count=Count('subscriptions', filter=Q(subscriptions__status=Status.ACTIVE))
+        ).values_list('name', 'active_count')
+    )
+    stats['subscription_by_tenant'] = dict(
+        Tenant.objects.annotate(
+            active_count=Count('product_subscriptions', filter=Q(product_subscriptions__status=Status.ACTIVE))
+        ).values_list('name', 'active_count')
+    )
+    return stats
+
+
+SECTIONS = {
+    'information_systems': information_system_statistics,
+    'tenants': tenant_statistics,
+    'contracts': contract_statistics,
+    'products': product_statistics,
+    'subscriptions': subscription_statistics,
+}
+
+# 模型（app_label.ModelName） -> 受影响的模块
+SECTION_DEPENDENCIES = {
+    'information_systems.InformationSystem': ['information_systems'],
+    'tenants.Tenant': ['tenants', 'subscriptions'],
+    'contracts.Contract': ['contracts'],
+    'products.Product': ['products', 'subscriptions'],
+    'products.ProductSubscription': ['subscriptions'],
+}
+
+
+def get_dashboard_summary(sections=None):
+    """
+    读取（必要时重新计算）汇总
+
+    Returns:
+        dict: {模块: 统计数据}
+    """
+    sections = list(sections or SECTIONS)
+    generations = cache.get_many([GENERATION_CACHE_KEY.format(section=section) for section in sections])
+    keys = {
+        section: SUMMARY_CACHE_KEY.format(
+            section=section,
+            generation=generations.get(GENERATION_CACHE_KEY.format(section=section), 0),
+        )
+        for section in sections
+    }
+    cached = cache.get_many(list(keys.values()))
+
+    summary, computed = {}, {}
+    for section in sections:
+        if keys[section] in cached:
+            summary[section] = cached[keys[section]]
+        else:
+            summary[section] = computed[keys[section]] = SECTIONS[section]()
+    if computed:
+        cache.set_many(computed, SUMMARY_TTL)
+    return summary
+
+
+def get_dashboard_section(section):
+    return get_dashboard_summary([section])[section]
+
+
+def invalidate_sections(sections):
+    generation = time.time_ns()
+    cache.set_many(
+        {GENERATION_CACHE_KEY.format(section=section): generation for section in sections},
+        None,
+    )
+
+
+def invalidate_for_model(model):
+    """模型数据变更后使相关模块失效（在事务提交后执行）"""
+    sections = SECTION_DEPENDENCIES.get(model._meta.label)
+    if sections:
+        transaction.on_commit(lambda: invalidate_sections(sections))
+
+
+def dashboard_payload():
+    return {
+        **get_dashboard_summary(),
+        'timestamp': timezone.now().isoformat(),
+    }
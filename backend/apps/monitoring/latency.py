@@ -0,0 +1,187 @@
+"""
+服务探测延迟直方图
+
+HDR 风格的对数-线性分桶：每个 2 的幂区间再等分 32 个子桶，相对误差不超过约 3%，
+任意数量的样本只占用固定数量的桶，不同窗口的直方图可以直接按桶相加合并。
+数值单位为微秒；每个服务每小时一条 ServiceLatencyHistogram 记录，查询时按需合并。
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+# 直方图窗口长度（秒）与保留天数
+WINDOW_SECONDS = 3600
+LATENCY_RETENTION_DAYS = 365
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def bucket_index(value):
+    value = max(0, int(value))
+    if value < SUB_BUCKET_COUNT * 2:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKET_COUNT + (value >> shift) - SUB_BUCKET_COUNT
+
+
+def bucket_range(index):
+    """桶对应的数值区间 [low, high]"""
+    if index < SUB_BUCKET_COUNT * 2:
+        return index, index
+    shift = index // SUB_BUCKET_COUNT - 1
+    mantissa = index % SUB_BUCKET_COUNT + SUB_BUCKET_COUNT
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """延迟直方图（微秒）"""
+
+    def __init__(self, counts=None, total=0, value_sum=0, minimum=None, maximum=None):
+        self.counts = {int(index): count for index, count in (counts or {}).items()}
+        self.total = total
+        self.sum = value_sum
+        self.min = minimum
+        self.max = maximum
+
+    def record(self, value, count=1):
+        value = max(0, int(value))
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        """百分位数（取所在桶的中点，并限制在 [min, max] 内），没有样本时为 None"""
+        if not self.total:
+            return None
+        rank = max(1, q * self.total)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                low, high = bucket_range(index)
+                return min(max((low + high) // 2, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.total if self.total else None
+
+    def summary(self):
+        """{'count', 'min', 'max', 'mean', 'p50', 'p95', 'p99'}，单位毫秒"""
+        def to_ms(value):
+            return round(value / 1000, 3) if value is not None else None
+
+        result = {
+            'count': self.total,
+            'min': to_ms(self.min),
+            'max': to_ms(self.max),
+            'mean': to_ms(self.mean()),
+        }
+        for q in PERCENTILES:
+            result[f'p{int(q * 100)}'] = to_ms(self.percentile(q))
+        return result
+
+    def to_json(self):
+        return {str(index): count for index, count in self.counts.items()}
+
+    @classmethod
+    def from_model(cls, row):
+        return cls(row.counts, row.sample_count, row.value_sum, row.min_value, row.max_value)
+
+
+def window_start(moment):
+    epoch = int(moment.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % WINDOW_SECONDS, tz=dt_timezone.utc)
+
+
+def record_latencies(samples, now=None):
+    """
+    把一批探测延迟合并进当前窗口的直方图（一次查询读取 + 一次批量写入）
+
+    Args:
+        samples: 可迭代的 (service, latency_ms)
+    """
+    from .models import ServiceLatencyHistogram
+
+    now = now or timezone.now()
+    window = window_start(now)
+    samples = list(samples)
+    if not samples:
+        return
+
+    existing = {
+        row.service_name: row for row in ServiceLatencyHistogram.objects.filter(
+            window_start=window, service_name__in={service for service, _ in samples}
+        )
+    }
+    histograms = {service: LatencyHistogram.from_model(row) for service, row in existing.items()}
+    for service, latency_ms in samples:
+        histograms.setdefault(service, LatencyHistogram()).record(latency_ms * 1000)
+
+    rows = []
+    for service, histogram in histograms.items():
+        summary = histogram.summary()
+        rows.append(ServiceLatencyHistogram(
+            service_name=service,
+            window_start=window,
+            counts=histogram.to_json(),
+            sample_count=histogram.total,
+            value_sum=histogram.sum,
+            min_value=histogram.min,
+            max_value=histogram.max,
+            p50_ms=summary['p50'],
+            p95_ms=summary['p95'],
+            p99_ms=summary['p99'],
+        ))
+    ServiceLatencyHistogram.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['service_name', 'window_start'],
+        update_fields=['counts', 'sample_count', 'value_sum', 'min_value', 'max_value', 'p50_ms', 'p95_ms', 'p99_ms'],
+    )
+
+
+def latency_report(hours=24, service=None, now=None):
+    """
+    最近 hours 小时的延迟分布
+
+    Returns:
+        dict: {service: {'overall': 汇总, 'windows': [{'window_start', 'count', 'p50', 'p95', 'p99', ...}]}}
+    """
+    from .models import ServiceLatencyHistogram
+
+    now = now or timezone.now()
+    queryset = ServiceLatencyHistogram.objects.filter(
+        window_start__gte=window_start(now - timedelta(hours=hours))
+    ).order_by('service_name', 'window_start')
+    if service:
+        queryset = queryset.filter(service_name=service)
+
+    report = {}
+    for row in queryset:
+        histogram = LatencyHistogram.from_model(row)
+        entry = report.setdefault(row.service_name, {'overall': LatencyHistogram(), 'windows': []})
+        entry['overall'].merge(histogram)
+        entry['windows'].append({'window_start': row.window_start.isoformat(), **histogram.summary()})
+    for entry in report.values():
+        entry['overall'] = entry['overall'].summary()
+    return report
@@ -0,0 +1 @@
+# This file makes the management/commands directory a Python package
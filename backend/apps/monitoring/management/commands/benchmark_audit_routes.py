@@ -0,0 +1,103 @@
+"""
+Django管理命令：审计日志请求分类耗时对比
+对比逐条前缀判断/逐条路径规则判断与前缀索引/路由表查表的单次耗时，并校验两者结果一致
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from django.urls import Resolver404, resolve
+from apps.monitoring.audit_routes import iter_routes, route_template
+from apps.monitoring.middleware import AuditLogMiddleware
+from apps.monitoring.models import ActivityLog
+
+
+class Command(BaseCommand):
+    help = '对比审计日志请求分类（排除判断 + 操作/资源分类）在路由表前后的单次耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            help='请求语料文件，每行 "METHOD /path/"；默认使用已记录的审计日志',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=5000,
+            help='从审计日志读取的最近请求数（默认 5000）',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='语料重复次数（默认 20）',
+        )
+
+    def handle(self, *args, **options):
+        corpus = self._load_corpus(options)
+        if not corpus:
+            self.stdout.write(self.style.WARNING('没有可用的请求语料'))
+            return
+
+        # 路由解析在请求中已由 Django 完成，不计入耗时
+        requests = []
+        for method, path in corpus:
+            try:
+                match = resolve(path)
+                requests.append((method, path, match.route, {key: str(value) for key, value in match.kwargs.items()}))
+            except Resolver404:
+                requests.append((method, path, None, None))
+
+        classifier = AuditLogMiddleware.get_route_classifier()
+        compiled = classifier.compile()
+        excluded = AuditLogMiddleware._excluded
+        exclude_paths = AuditLogMiddleware.EXCLUDE_PATHS
+        classify_path = AuditLogMiddleware._classify_path
+        iterations = options['iterations']
+        total = len(requests) * iterations
+
+        def timed(func):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                for request in requests:
+                    func(*request)
+            return (time.perf_counter() - started) / total * 1e9
+
+        before_exclude = timed(lambda method, path, route, kwargs: any(path.startswith(prefix) for prefix in exclude_paths))
+        after_exclude = timed(lambda method, path, route, kwargs: excluded.match(path))
+        before_classify = timed(lambda method, path, route, kwargs: classify_path(path, method))
+        after_classify = timed(lambda method, path, route, kwargs: classifier.classify(path, method, route, kwargs))
+
+        mismatches = []
+        for method, path, route, kwargs in requests:
+            if any(path.startswith(prefix) for prefix in exclude_paths) != excluded.match(path):
+                mismatches.append(('exclude', method, path))
+            if classify_path(path, method) != classifier.classify(path, method, route, kwargs):
+                mismatches.append(('classify', method, path))
+
+        resolved = sum(1 for request in requests if request[2] is not None)
+        templated = sum(1 for route in set(iter_routes()) if route_template(route) is not None)
+        self.stdout.write(f'语料: {len(requests)} 条请求（可解析路由 {resolved} 条），重复 {iterations} 次')
+        self.stdout.write(f'路由表: {compiled} 条路由，其中 {templated} 条可还原为路径模板')
+        self.stdout.write(f'排除判断: {before_exclude:.0f} ns -> {after_exclude:.0f} ns')
+        self.stdout.write(f'操作/资源分类: {before_classify:.0f} ns -> {after_classify:.0f} ns')
+        if mismatches:
+            self.stdout.write(self.style.WARNING(f'{len(mismatches)} 条结果不一致（路由参数与路径规则的差异）:'))
+            for kind, method, path in mismatches[:20]:
+                self.stdout.write(f'  [{kind}] {method} {path}')
+        else:
+            self.stdout.write(self.style.SUCCESS('前后分类结果一致'))
+
+    def _load_corpus(self, options):
+        if options.get('file'):
+            corpus = []
+            with open(options['file'], encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 2:
+                        corpus.append((parts[0].upper(), parts[1]))
+            return corpus
+        return [
+            (method, path) for method, path in ActivityLog.objects.filter(
+                request_path__isnull=False, request_method__isnull=False
+            ).order_by('-created_at').values_list('request_method', 'request_path')[:options['limit']]
+        ]
@@ -0,0 +1,25 @@
+"""
+Django管理命令：补写磁盘暂存的审计日志
+数据库长时间不可用后，也可以不等后台线程，手动执行一次补写
+"""
+
+from django.core.management.base import BaseCommand
+from apps.monitoring.audit import AuditLogWriter
+
+
+class Command(BaseCommand):
+    help = '把队列满或数据库不可用时暂存到磁盘的审计日志写入数据库'
+
+    def handle(self, *args, **options):
+        writer = AuditLogWriter()
+        if not writer.spool_dir.is_dir():
+            self.stdout.write(f'暂存目录 {writer.spool_dir} 不存在，无需补写')
+            return
+
+        written = writer.replay_spool()
+        remaining = list(writer.spool_dir.glob('audit-*'))
+        self.stdout.write(self.style.SUCCESS(f'已补写 {written} 条审计日志'))
+        if remaining:
+            self.stdout.write(self.style.WARNING(
+                f'仍有 {len(remaining)} 个暂存文件（正在写入中或数据库仍不可用）'
+            ))
@@ -0,0 +1,72 @@
+"""
+Django管理命令：维护监控分区表
+提前创建 vm_metric_history / service_health_checks 未来的按天分区，并删除已过保留期的分区
+"""
+
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.monitoring.partitions import (
+    DEFAULT_DAYS_AHEAD, PARTITIONED_TABLES, drop_expired_partitions, ensure_partitions,
+    is_partitioned, is_supported, list_partitions, retention_days,
+)
+
+
+class Command(BaseCommand):
+    help = '提前创建监控表的按天分区并删除过期分区（仅 PostgreSQL）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days-ahead',
+            type=int,
+            default=DEFAULT_DAYS_AHEAD,
+            help=f'提前创建的分区天数（默认 {DEFAULT_DAYS_AHEAD}）',
+        )
+        parser.add_argument(
+            '--create-only',
+            action='store_true',
+            help='只创建分区，不删除过期分区',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='仅显示会创建/删除的分区',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='列出现有分区',
+        )
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            self.stdout.write(self.style.WARNING('当前数据库不是 PostgreSQL，不支持分区表'))
+            return
+
+        dry_run = options['dry_run']
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN 模式 - 不会实际修改数据库'))
+
+        now = timezone.now()
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(table):
+                self.stdout.write(self.style.WARNING(f'{table} 不是分区表（请先执行 migrate），跳过'))
+                continue
+
+            if options['list']:
+                self.stdout.write(f'\n{table}:')
+                for name, lower, upper in list_partitions(table):
+                    self.stdout.write(f'  {name}: {lower or "MINVALUE/DEFAULT"} ~ {upper or ""}')
+                continue
+
+            created = ensure_partitions(table, options['days_ahead'], now, dry_run)
+            for name in created:
+                self.stdout.write(self.style.SUCCESS(f'  ✓ {"将创建" if dry_run else "创建"}分区 {name}'))
+
+            if not options['create_only']:
+                cutoff = now - timedelta(days=retention_days(table))
+                dropped = drop_expired_partitions(table, cutoff, dry_run)
+                for name in dropped:
+                    self.stdout.write(self.style.WARNING(f'  ✗ {"将删除" if dry_run else "删除"}过期分区 {name}'))
+
+            self.stdout.write(self.style.SUCCESS(f'{table}: 分区维护完成'))
@@ -1,10 +1,17 @@
 """
 审计日志中间件
 自动记录API请求的审计日志
+
+请求线程中按方法和状态码只解析需要的请求体/响应体（不超过 MAX_CAPTURE_BYTES），
+提取资源名称、脱敏后的变更详情和错误信息后交给后台写入器（apps.monitoring.audit），
+原始请求体/响应体不进入队列或暂存文件；生成 ActivityLog 与写库在后台线程中进行。
 """
 import json
 import logging
+from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
+from apps.monitoring.audit import parse_entry_time, submit_audit_entry
+from apps.monitoring.audit_routes import AuditRouteClassifier, PathPrefixIndex
 from apps.monitoring.models import ActivityLog
 
 logger = logging.getLogger(__name__)
@@ -32,72 +39,146 @@ class AuditLogMiddleware(MiddlewareMixin):
     
     # 敏感字段（记录时脱敏）
     SENSITIVE_FIELDS = ['password', 'token', 'secret', 'key']
+
+    _excluded = PathPrefixIndex(EXCLUDE_PATHS)
+    _route_classifier = None
+
+    # 超过该大小的响应体不保留（只用于取资源名称和错误信息）
+    MAX_CAPTURE_BYTES = 64 * 1024
     
     def process_request(self, request):
         """在请求处理前记录请求开始"""
-        # 保存原始请求体（用于后续记录）
+        # 保存原始请求体（用于后续记录）；超过大小上限的请求体（如文件上传）不读取
+        request._audit_body = None
         if request.method in self.AUDIT_METHODS:
             try:
-                # Django会消费request.body，这里先读取并缓存
-                request._audit_body = request.body
+                if int(request.META.get('CONTENT_LENGTH') or 0) <= self.MAX_CAPTURE_BYTES:
+                    # Django会消费request.body，这里先读取并缓存
+                    request._audit_body = request.body
             except Exception:
                 request._audit_body = None
         return None
     
     def process_response(self, request, response):
-        """在响应返回后记录审计日志"""
+        """在响应返回后提交审计记录（由后台线程解析并批量写库）"""
         # 检查是否需要记录
         if not self._should_audit(request):
             return response
         
         try:
-            # 提取请求信息
-            user = request.user if request.user.is_authenticated else None
-            ip_address = self._get_client_ip(request)
-            user_agent = request.META.get('HTTP_USER_AGENT', '')[:500]
-            request_path = request.path
-            request_method = request.method
-            
-            # 确定操作类型和资源信息
-            action_type, resource_type, resource_id, resource_name = self._parse_request(request, response)
-            
-            # 提取变更详情
-            changes = self._extract_changes(request, response)
-            
-            # 确定状态
-            status = 'success' if 200 <= response.status_code < 400 else 'failed'
-            error_message = None
-            if status == 'failed':
-                try:
-                    error_data = json.loads(response.content)
-                    error_message = str(error_data.get('error') or error_data.get('detail') or '')[:500]
-                except:
-                    error_message = f'HTTP {response.status_code}'
-            
-            # 生成描述
-            description = self._generate_description(action_type, resource_type, resource_name, request)
-            
-            # 记录审计日志
-            ActivityLog.log_activity(
-                action_type=action_type,
-                description=description,
-                user=user,
-                ip_address=ip_address,
-                resource_type=resource_type,
-                resource_id=resource_id,
-                resource_name=resource_name,
-                changes=changes,
-                status=status,
-                error_message=error_message,
-                user_agent=user_agent,
-                request_path=request_path,
-                request_method=request_method
-            )
+            submit_audit_entry(self._capture(request, response))
         except Exception as e:
             # 审计日志记录失败不应影响正常请求
             logger.error(f'审计日志记录失败: {str(e)}')
         
         return response
+
+    def _capture(self, request, response):
+        """
+        提取请求/响应信息（可 JSON 序列化，便于落盘）
+
+        记录进入队列（以及可能落盘）之前就已脱敏：只保留资源名称、脱敏后的变更详情和错误信息，
+        原始请求体/响应体不离开请求线程。DELETE 的请求体、成功的 POST 的响应体（请求体可解析时）
+        用不到，不解析。
+        """
+        method, status_code = request.method, response.status_code
+        body_data = None
+        if method in ('POST', 'PUT', 'PATCH'):
+            body_data = self._load_json(getattr(request, '_audit_body', None))
+        response_data = None
+        if self._needs_response(method, status_code, body_data) and not getattr(response, 'streaming', False) \
+                and len(response.content) <= self.MAX_CAPTURE_BYTES:
+            response_data = self._load_json(response.content)
+        match = getattr(request, 'resolver_match', None)
+        return {
+            'user_id': request.user.pk if request.user.is_authenticated else None,
+            'ip_address': self._get_client_ip(request),
+            'user_agent': request.META.get('HTTP_USER_AGENT', '')[:500],
+            'path': request.path,
+            'method': method,
+            'status_code': status_code,
+            **self._summarize(method, status_code, body_data, response_data),
+            'route': match.route if match else None,
+            'route_kwargs': {key: str(value) for key, value in match.kwargs.items()} if match else None,
+            'created_at': timezone.now().isoformat(),
+        }
+
+    @staticmethod
+    def _needs_response(method, status_code, body_data):
+        """_summarize 是否会用到响应体：失败时取错误信息，成功时请求体中没有名称再从响应体取"""
+        if not 200 <= status_code < 400:
+            return True
+        if status_code not in (200, 201):
+            return False
+        return method != 'POST' or body_data is None
+
+    @classmethod
+    def _summarize(cls, method, status_code, body_data, response_data):
+        """由请求体/响应体提取资源名称、（脱敏后的）变更详情和错误信息"""
+        resource_name = None
+        if method == 'POST' and body_data is not None:
+            if isinstance(body_data, dict):
+                resource_name = body_data.get('name') or body_data.get('title')
+        elif status_code in [200, 201] and isinstance(response_data, dict):
+            resource_name = response_data.get('name') or response_data.get('title')
+
+        error_message = None
+        if not 200 <= status_code < 400:
+            if isinstance(response_data, dict):
+                error_message = str(response_data.get('error') or response_data.get('detail') or '')[:500]
+            else:
+                error_message = f'HTTP {status_code}'
+
+        return {
+            'resource_name': str(resource_name)[:255] if resource_name is not None else None,
+            'changes': cls._extract_changes(method, body_data),
+            'error_message': error_message,
+        }
+
+    @classmethod
+    def build_activity_log(cls, entry):
+        """由 _capture 提取的信息生成（未保存的）ActivityLog"""
+        path = entry['path']
+        method = entry['method']
+        status_code = entry['status_code']
+
+        # 确定操作类型和资源信息
+        action_type, resource_type, resource_id = cls._parse_request(
+            path, method, entry.get('route'), entry.get('route_kwargs')
+        )
+        resource_name = entry.get('resource_name')
+
+        # 确定状态
+        status = 'success' if 200 <= status_code < 400 else 'failed'
+
+        # 生成描述
+        description = cls._generate_description(action_type, resource_type, resource_name)
+
+        return ActivityLog(
+            action_type=action_type,
+            description=description,
+            user_id=entry.get('user_id'),
+            ip_address=entry.get('ip_address'),
+            resource_type=resource_type,
+            resource_id=resource_id,
+            resource_name=resource_name,
+            changes=entry.get('changes'),
+            status=status,
+            error_message=entry.get('error_message'),
+            user_agent=entry.get('user_agent'),
+            request_path=path,
+            request_method=method,
+            created_at=parse_entry_time(entry.get('created_at')) or timezone.now(),
+        )
+
+    @staticmethod
+    def _load_json(text):
+        if not text:
+            return None
+        try:
+            return json.loads(text)
+        except (ValueError, UnicodeDecodeError):
+            return None
     
     def _should_audit(self, request):
         """判断是否需要记录审计日志"""
@@ -106,11 +187,7 @@ class AuditLogMiddleware(MiddlewareMixin):
             return False
         
         # 检查是否在排除列表中
-        for exclude_path in self.EXCLUDE_PATHS:
-            if request.path.startswith(exclude_path):
-                return False
-        
-        return True
+        return not self._excluded.match(request.path)
     
     def _get_client_ip(self, request):
         """获取客户端IP地址"""
@@ -121,11 +198,21 @@ class AuditLogMiddleware(MiddlewareMixin):
             ip = request.META.get('REMOTE_ADDR')
         return ip
     
-    def _parse_request(self, request, response):
-        """解析请求，提取操作类型和资源信息"""
-        path = request.path
-        method = request.method
-        
+    @classmethod
+    def get_route_classifier(cls):
+        """按路由查表的分类器（首次使用时编译，进程内复用）"""
+        if cls._route_classifier is None:
+            cls._route_classifier = AuditRouteClassifier(cls._classify_path, cls.AUDIT_METHODS)
+        return cls._route_classifier
+
+    @classmethod
+    def _parse_request(cls, path, method, route=None, route_kwargs=None):
+        """解析请求，提取操作类型、资源类型和资源ID"""
+        return cls.get_route_classifier().classify(path, method, route, route_kwargs)
+
+    @staticmethod
+    def _classify_path(path, method):
+        """按路径判断操作类型、资源类型和资源ID（路由表的编译规则，也用于无法解析路由的请求）"""
         # 根据路径和方法确定操作类型
         action_type_map = {
             'POST': 'create',
@@ -138,7 +225,6 @@ class AuditLogMiddleware(MiddlewareMixin):
         # 解析资源类型和ID
         resource_type = 'other'
         resource_id = None
-        resource_name = None
         
         # 虚拟机相关
         if '/virtual-machines/' in path or '/vms/' in path:
@@ -273,51 +359,37 @@ class AuditLogMiddleware(MiddlewareMixin):
                     resource_id = parts[i + 1]
                     break
         
-        # 尝试从请求/响应中获取资源名称
-        try:
-            if method == 'POST' and hasattr(request, '_audit_body') and request._audit_body:
-                body_data = json.loads(request._audit_body)
-                resource_name = body_data.get('name') or body_data.get('title')
-            elif response.status_code in [200, 201]:
-                response_data = json.loads(response.content)
-                resource_name = response_data.get('name') or response_data.get('title')
-        except:
-            pass
-        
-        return action_type, resource_type, resource_id, resource_name
+        return action_type, resource_type, resource_id
     
-    def _extract_changes(self, request, response):
+    @classmethod
+    def _extract_changes(cls, method, body_data):
         """提取变更详情"""
-        if request.method not in ['PUT', 'PATCH']:
+        if method not in ['PUT', 'PATCH'] or not body_data:
             return None
-        
-        try:
-            if hasattr(request, '_audit_body') and request._audit_body:
-                changes = json.loads(request._audit_body)
-                # 脱敏处理
-                return self._sanitize_data(changes)
-        except:
-            return None
-        
-        return None
+        # 脱敏处理
+        return cls._sanitize_data(body_data)
     
-    def _sanitize_data(self, data):
-        """脱敏处理敏感字段"""
+    @classmethod
+    def _sanitize_data(cls, data):
+        """脱敏处理敏感字段（包括列表中嵌套的字典）"""
+        if isinstance(data, list):
+            return [cls._sanitize_data(value) for value in data]
         if not isinstance(data, dict):
             return data
         
         sanitized = {}
         for key, value in data.items():
-            if any(sensitive in key.lower() for sensitive in self.SENSITIVE_FIELDS):
+            if any(sensitive in str(key).lower() for sensitive in cls.SENSITIVE_FIELDS):
                 sanitized[key] = '***'
-            elif isinstance(value, dict):
-                sanitized[key] = self._sanitize_data(value)
+            elif isinstance(value, (dict, list)):
+                sanitized[key] = cls._sanitize_data(value)
             else:
                 sanitized[key] = value
         
         return sanitized
     
-    def _generate_description(self, action_type, resource_type, resource_name, request):
+    @staticmethod
+    def _generate_description(action_type, resource_type, resource_name):
         """生成操作描述"""
         action_map = {
             'create': '创建',
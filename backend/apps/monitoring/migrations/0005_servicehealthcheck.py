@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-17 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0004_activitylog_changes_activitylog_error_message_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceHealthCheck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_name', models.CharField(choices=[('django', 'Django应用服务'), ('database', '数据库服务'), ('cache', '缓存服务'), ('celery', '任务队列服务')], max_length=50, verbose_name='服务名称')),
+                ('is_healthy', models.BooleanField(default=True, verbose_name='是否健康')),
+                ('response_time_ms', models.IntegerField(blank=True, null=True, verbose_name='响应时间(毫秒)')),
+                ('error_message', models.TextField(blank=True, default='', verbose_name='错误信息')),
+                ('checked_at', models.DateTimeField(auto_now_add=True, verbose_name='检查时间')),
+            ],
+            options={
+                'verbose_name': '服务健康检查',
+                'verbose_name_plural': '服务健康检查',
+                'db_table': 'service_health_checks',
+                'ordering': ['-checked_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='activitylog',
+            name='resource_type',
+            field=models.CharField(choices=[('vm', '虚拟机'), ('image', '镜像'), ('network', '网络'), ('snapshot', '快照'), ('tenant', '租户'), ('user', '用户'), ('system', '信息系统'), ('alert_rule', '告警规则'), ('security_group', '安全组'), ('floating_ip', '浮动IP'), ('flavor', '规格'), ('contract', '合同'), ('order', '订单'), ('other', '其他')], default='other', max_length=20, verbose_name='资源类型'),
+        ),
+        migrations.AddIndex(
+            model_name='servicehealthcheck',
+            index=models.Index(fields=['service_name', 'checked_at'], name='service_hea_service_f42ea2_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-17 02:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('information_systems', '0007_vmoperationjob'),
+        ('monitoring', '0005_servicehealthcheck'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VMMetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('5m', '5分钟'), ('1h', '1小时'), ('1d', '1天')], max_length=4, verbose_name='粒度')),
+                ('bucket', models.DateTimeField(verbose_name='时间段起点')),
+                ('sample_count', models.IntegerField(default=0, verbose_name='原始样本数')),
+                ('cpu_min', models.FloatField(default=0, verbose_name='CPU最小值(%)')),
+                ('cpu_avg', models.FloatField(default=0, verbose_name='CPU平均值(%)')),
+                ('cpu_max', models.FloatField(default=0, verbose_name='CPU最大值(%)')),
+                ('cpu_p95', models.FloatField(default=0, verbose_name='CPU P95(%)')),
+                ('memory_min', models.FloatField(default=0, verbose_name='内存最小值(%)')),
+                ('memory_avg', models.FloatField(default=0, verbose_name='内存平均值(%)')),
+                ('memory_max', models.FloatField(default=0, verbose_name='内存最大值(%)')),
+                ('memory_p95', models.FloatField(default=0, verbose_name='内存P95(%)')),
+                ('network_in_min', models.FloatField(default=0, verbose_name='入流量最小值(KB/s)')),
+                ('network_in_avg', models.FloatField(default=0, verbose_name='入流量平均值(KB/s)')),
+                ('network_in_max', models.FloatField(default=0, verbose_name='入流量最大值(KB/s)')),
+                ('network_in_p95', models.FloatField(default=0, verbose_name='入流量P95(KB/s)')),
+                ('network_out_min', models.FloatField(default=0, verbose_name='出流量最小值(KB/s)')),
+                ('network_out_avg', models.FloatField(default=0, verbose_name='出流量平均值(KB/s)')),
+                ('network_out_max', models.FloatField(default=0, verbose_name='出流量最大值(KB/s)')),
+                ('network_out_p95', models.FloatField(default=0, verbose_name='出流量P95(KB/s)')),
+                ('virtual_machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='information_systems.virtualmachine', verbose_name='虚拟机')),
+            ],
+            options={
+                'verbose_name': '虚拟机监控降采样数据',
+                'verbose_name_plural': '虚拟机监控降采样数据',
+                'db_table': 'vm_metric_rollup',
+                'ordering': ['-bucket'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='vmmetricrollup',
+            index=models.Index(fields=['resolution', 'bucket'], name='vm_metric_r_resolut_779cf9_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='vmmetricrollup',
+            unique_together={('virtual_machine', 'resolution', 'bucket')},
+        ),
+    ]
@@ -0,0 +1,29 @@
+"""
+把 vm_metric_history 和 service_health_checks 转换为按天范围分区的表（仅 PostgreSQL）
+
+原表数据不复制，整体作为 <表名>_legacy 分区挂载，见 apps.monitoring.partitions。
+其他数据库不做任何改动。
+"""
+
+from django.db import migrations
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from apps.monitoring.partitions import PARTITIONED_TABLES, convert_to_partitioned, is_partitioned
+
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(table):
+            convert_to_partitioned(table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0006_vmmetricrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-17 02:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0007_partition_metric_tables'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activitylog',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+"""
+审计日志搜索索引（仅 PostgreSQL）
+
+对 description、resource_name、request_path 拼接后的文本建立：
+  - 全文检索 GIN 索引（simple 分词）
+  - pg_trgm GIN 索引，加速 ILIKE '%关键字%' 子串匹配（数据库需为 UTF8 编码，中文才能参与三元组）
+表达式需与 apps.monitoring.audit_query.SEARCH_DOCUMENT_SQL 一致。
+索引并发创建（不阻塞审计日志写入），因此本迁移不在事务中执行。
+没有权限创建 pg_trgm 扩展时跳过三元组索引，搜索仍可用，只是子串匹配无法走索引。
+"""
+
+import logging
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DOCUMENT = (
+    "(description || ' ' || COALESCE(resource_name, '') || ' ' || COALESCE(request_path, ''))"
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS activity_logs_search_fts '
+            f"ON activity_logs USING gin (to_tsvector('simple', {SEARCH_DOCUMENT}))"
+        )
+        try:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except Exception as e:
+            logger.warning(f'无法创建 pg_trgm 扩展，跳过三元组索引: {str(e)}')
+            return
+        cursor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS activity_logs_search_trgm '
+            f'ON activity_logs USING gin ({SEARCH_DOCUMENT} gin_trgm_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP INDEX CONCURRENTLY IF EXISTS activity_logs_search_trgm')
+        cursor.execute('DROP INDEX CONCURRENTLY IF EXISTS activity_logs_search_fts')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('monitoring', '0008_activitylog_created_at_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-17 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0009_activitylog_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='servicehealthcheck',
+            name='service_name',
+            field=models.CharField(choices=[('django', 'Django应用服务'), ('database', '数据库服务'), ('cache', '缓存服务'), ('celery', '任务队列服务'), ('channel_layer', 'WebSocket消息通道'), ('disk', '磁盘空间'), ('keystone', 'OpenStack认证服务'), ('nova', 'OpenStack计算服务'), ('glance', 'OpenStack镜像服务')], max_length=50, verbose_name='服务名称'),
+        ),
+        migrations.CreateModel(
+            name='ServiceLatencyHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_name', models.CharField(choices=[('django', 'Django应用服务'), ('database', '数据库服务'), ('cache', '缓存服务'), ('celery', '任务队列服务'), ('channel_layer', 'WebSocket消息通道'), ('disk', '磁盘空间'), ('keystone', 'OpenStack认证服务'), ('nova', 'OpenStack计算服务'), ('glance', 'OpenStack镜像服务')], max_length=50, verbose_name='服务名称')),
+                ('window_start', models.DateTimeField(verbose_name='窗口开始时间')),
+                ('counts', models.JSONField(default=dict, verbose_name='分桶计数')),
+                ('sample_count', models.IntegerField(default=0, verbose_name='样本数')),
+                ('value_sum', models.BigIntegerField(default=0, verbose_name='延迟合计(微秒)')),
+                ('min_value', models.BigIntegerField(blank=True, null=True, verbose_name='最小延迟(微秒)')),
+                ('max_value', models.BigIntegerField(blank=True, null=True, verbose_name='最大延迟(微秒)')),
+                ('p50_ms', models.FloatField(blank=True, null=True, verbose_name='P50(毫秒)')),
+                ('p95_ms', models.FloatField(blank=True, null=True, verbose_name='P95(毫秒)')),
+                ('p99_ms', models.FloatField(blank=True, null=True, verbose_name='P99(毫秒)')),
+            ],
+            options={
+                'verbose_name': '服务延迟直方图',
+                'verbose_name_plural': '服务延迟直方图',
+                'db_table': 'service_latency_histograms',
+                'ordering': ['-window_start'],
+                'unique_together': {('service_name', 'window_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-17 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0010_servicelatencyhistogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VMMetricRollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('5m', '5分钟'), ('1h', '1小时'), ('1d', '1天')], max_length=4, unique=True, verbose_name='粒度')),
+                ('rolled_up_to', models.DateTimeField(verbose_name='已聚合到')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '降采样水位线',
+                'verbose_name_plural': '降采样水位线',
+                'db_table': 'vm_metric_rollup_watermark',
+            },
+        ),
+    ]
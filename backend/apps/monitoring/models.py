@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -96,7 +97,8 @@ class ActivityLog(models.Model):
     error_message = models.TextField('错误信息', null=True, blank=True)
     
     # 时间戳
-    created_at = models.DateTimeField('创建时间', auto_now_add=True, db_index=True)
+    # 审计日志异步批量写入，时间取请求发生时而非写库时
+    created_at = models.DateTimeField('创建时间', default=timezone.now, db_index=True)
 
     class Meta:
         db_table = 'activity_logs'
@@ -174,6 +176,65 @@ class VMMetricHistory(models.Model):
         return f"{self.virtual_machine.name} - {self.timestamp}"
 
 
+class VMMetricRollup(models.Model):
+    """虚拟机监控降采样数据（5分钟/1小时/1天），由 VMMetricHistory 原始数据聚合而来"""
+    RESOLUTIONS = (
+        ('5m', '5分钟'),
+        ('1h', '1小时'),
+        ('1d', '1天'),
+    )
+
+    virtual_machine = models.ForeignKey('information_systems.VirtualMachine', on_delete=models.CASCADE, verbose_name='虚拟机')
+    resolution = models.CharField('粒度', max_length=4, choices=RESOLUTIONS)
+    bucket = models.DateTimeField('时间段起点')
+    sample_count = models.IntegerField('原始样本数', default=0)
+
+    cpu_min = models.FloatField('CPU最小值(%)', default=0)
+    cpu_avg = models.FloatField('CPU平均值(%)', default=0)
+    cpu_max = models.FloatField('CPU最大值(%)', default=0)
+    cpu_p95 = models.FloatField('CPU P95(%)', default=0)
+    memory_min = models.FloatField('内存最小值(%)', default=0)
+    memory_avg = models.FloatField('内存平均值(%)', default=0)
+    memory_max = models.FloatField('内存最大值(%)', default=0)
+    memory_p95 = models.FloatField('内存P95(%)', default=0)
+    network_in_min = models.FloatField('入流量最小值(KB/s)', default=0)
+    network_in_avg = models.FloatField('入流量平均值(KB/s)', default=0)
+    network_in_max = models.FloatField('入流量最大值(KB/s)', default=0)
+    network_in_p95 = models.FloatField('入流量P95(KB/s)', default=0)
+    network_out_min = models.FloatField('出流量最小值(KB/s)', default=0)
+    network_out_avg = models.FloatField('出流量平均值(KB/s)', default=0)
+    network_out_max = models.FloatField('出流量最大值(KB/s)', default=0)
+    network_out_p95 = models.FloatField('出流量P95(KB/s)', default=0)
+
+    class Meta:
+        db_table = 'vm_metric_rollup'
+        verbose_name = '虚拟机监控降采样数据'
+        verbose_name_plural = verbose_name
+        unique_together = ['virtual_machine', 'resolution', 'bucket']
+        indexes = [
+            models.Index(fields=['resolution', 'bucket']),
+        ]
+        ordering = ['-bucket']
+
+    def __str__(self):
+        return f"{self.virtual_machine.name} - {self.resolution} - {self.bucket}"
+
+
+class VMMetricRollupWatermark(models.Model):
+    """降采样水位线：各粒度已聚合到的时间（之前的时间段均已结束并写入，不再重新计算）"""
+    resolution = models.CharField('粒度', max_length=4, choices=VMMetricRollup.RESOLUTIONS, unique=True)
+    rolled_up_to = models.DateTimeField('已聚合到')
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+
+    class Meta:
+        db_table = 'vm_metric_rollup_watermark'
+        verbose_name = '降采样水位线'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.resolution} - {self.rolled_up_to}"
+
+
 class AlertRule(models.Model):
     """告警规则"""
     METRIC_TYPES = (
@@ -245,6 +306,11 @@ class ServiceHealthCheck(models.Model):
         ('database', '数据库服务'),
         ('cache', '缓存服务'),
         ('celery', '任务队列服务'),
+        ('channel_layer', 'WebSocket消息通道'),
+        ('disk', '磁盘空间'),
+        ('keystone', 'OpenStack认证服务'),
+        ('nova', 'OpenStack计算服务'),
+        ('glance', 'OpenStack镜像服务'),
     )
     
     service_name = models.CharField('服务名称', max_length=50, choices=SERVICE_TYPES)
@@ -265,3 +331,28 @@ class ServiceHealthCheck(models.Model):
     def __str__(self):
         status = '健康' if self.is_healthy else '异常'
         return f"{self.get_service_name_display()} - {status} ({self.checked_at.strftime('%Y-%m-%d %H:%M')})"
+
+
+class ServiceLatencyHistogram(models.Model):
+    """服务探测延迟直方图（每个服务每小时一条，桶结构见 apps.monitoring.latency）"""
+
+    service_name = models.CharField('服务名称', max_length=50, choices=ServiceHealthCheck.SERVICE_TYPES)
+    window_start = models.DateTimeField('窗口开始时间')
+    counts = models.JSONField('分桶计数', default=dict)
+    sample_count = models.IntegerField('样本数', default=0)
+    value_sum = models.BigIntegerField('延迟合计(微秒)', default=0)
+    min_value = models.BigIntegerField('最小延迟(微秒)', null=True, blank=True)
+    max_value = models.BigIntegerField('最大延迟(微秒)', null=True, blank=True)
+    p50_ms = models.FloatField('P50(毫秒)', null=True, blank=True)
+    p95_ms = models.FloatField('P95(毫秒)', null=True, blank=True)
+    p99_ms = models.FloatField('P99(毫秒)', null=True, blank=True)
+
+    class Meta:
+        db_table = 'service_latency_histograms'
+        verbose_name = '服务延迟直方图'
+        verbose_name_plural = verbose_name
+        ordering = ['-window_start']
+        unique_together = ('service_name', 'window_start')
+
+    def __str__(self):
+        return f"{self.get_service_name_display()} - {self.window_start.strftime('%Y-%m-%d %H:%M')}"
@@ -0,0 +1,276 @@
+"""
+监控表按天分区（仅 PostgreSQL）
+
+vm_metric_history 和 service_health_checks 是只追加、按时间查询、按时间过期的表，
+改为按天范围分区后：
+  - 写入和按时间范围查询只涉及最近的几个分区
+  - 过期数据整分区 DROP，不再执行大范围 DELETE，不产生表膨胀，也不会长时间锁表
+
+分区命名为 <表名>_pYYYYMMDD（UTC 日期），另有 <表名>_default 兜底分区接收超出已建分区范围的数据；
+转换前的历史数据整体作为 <表名>_legacy 分区挂载，在其数据全部过期后一并删除。
+分区由 manage_metric_partitions 命令或 maintain_metric_partitions 定时任务提前创建。
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+from dateutil.parser import parse
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 表名 -> 分区列
+PARTITIONED_TABLES = {
+    'vm_metric_history': 'timestamp',
+    'service_health_checks': 'checked_at',
+}
+
+# 默认提前创建的分区天数
+DEFAULT_DAYS_AHEAD = 7
+
+# 健康检查记录保留天数（足够计算24小时可用性）
+HEALTH_CHECK_RETENTION_DAYS = 7
+
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def retention_days(table):
+    """各分区表的保留天数"""
+    if table == 'vm_metric_history':
+        from .rollup import get_retention_days
+        return get_retention_days('raw')
+    return HEALTH_CHECK_RETENTION_DAYS
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(table):
+    """表是否已转换为分区表"""
+    if not is_supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relname = %s AND n.nspname = current_schema()",
+            [table]
+        )
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def _day_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, value.day, tzinfo=dt_timezone.utc)
+
+
+def _partition_name(table, day):
+    return f'{table}_p{day:%Y%m%d}'
+
+
+def _parse_bound(value):
+    value = value.strip()
+    if value.upper() in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return parse(value.strip("'"))
+
+
+def list_partitions(table):
+    """
+    列出分区
+
+    Returns:
+        list: [(分区名, 下界, 上界)]，按下界排序；默认分区的上下界为 None，MINVALUE 下界为 None
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+            [table]
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound or '')
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+        else:
+            partitions.append((name, None, None))
+    return sorted(partitions, key=lambda item: (item[1] is not None, item[1] or datetime.min.replace(tzinfo=dt_timezone.utc)))
+
+
+def _create_partition(cursor, table, column, start, end):
+    """
+    创建 [start, end) 分区
+
+    先建普通表、把默认分区中落在该范围的数据移入，再挂载为分区，
+    这样即使默认分区中已有该范围的数据也能创建成功。
+    """
+    name = _partition_name(table, start)
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    default = f'{table}_default'
+    cursor.execute("SELECT to_regclass(%s)", [default])
+    if cursor.fetchone()[0]:
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{default}" WHERE "{column}" >= %s AND "{column}" < %s RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            [start, end]
+        )
+        if cursor.rowcount:
+            logger.info(f'已从 {default} 移动 {cursor.rowcount} 条记录到 {name}')
+    cursor.execute(
+        f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+        [start, end]
+    )
+    return name
+
+
+def ensure_partitions(table, days_ahead=DEFAULT_DAYS_AHEAD, now=None, dry_run=False):
+    """
+    创建从今天起 days_ahead 天内缺失的分区
+
+    Returns:
+        list: 新建（dry-run 下为将新建）的分区名
+    """
+    column = PARTITIONED_TABLES[table]
+    today = _day_start(now or timezone.now())
+    existing = list_partitions(table)
+    covered_until = max((upper for _, _, upper in existing if upper is not None), default=None)
+
+    created = []
+    for offset in range(days_ahead + 1):
+        start = today + timedelta(days=offset)
+        end = start + timedelta(days=1)
+        # 转换时的 legacy 分区可能已覆盖今天之后的时间
+        if covered_until is not None and end <= covered_until:
+            continue
+        if any(lower is not None and lower <= start < upper for _, lower, upper in existing):
+            continue
+        if dry_run:
+            created.append(_partition_name(table, start))
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            created.append(_create_partition(cursor, table, column, start, end))
+    if created and not dry_run:
+        logger.info(f'{table}: 新建分区 {", ".join(created)}')
+    return created
+
+
+def drop_expired_partitions(table, cutoff, dry_run=False):
+    """
+    删除上界不晚于 cutoff 的分区（整分区数据均已过期）
+
+    Returns:
+        list: 删除（dry-run 下为将删除）的分区名
+    """
+    dropped = []
+    for name, lower, upper in list_partitions(table):
+        if upper is None or upper > cutoff:
+            continue
+        if not dry_run:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS "{name}"')
+        dropped.append(name)
+    if dropped and not dry_run:
+        logger.info(f'{table}: 删除过期分区 {", ".join(dropped)}')
+    return dropped
+
+
+def maintain_partitions(days_ahead=DEFAULT_DAYS_AHEAD, now=None, dry_run=False):
+    """
+    为所有已分区的表提前建分区并删除过期分区
+
+    Returns:
+        dict: {表名: {'created': [...], 'dropped': [...]}}，未分区的表不出现在结果中
+    """
+    now = now or timezone.now()
+    results = {}
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(table):
+            continue
+        results[table] = {
+            'created': ensure_partitions(table, days_ahead, now, dry_run),
+            'dropped': drop_expired_partitions(table, now - timedelta(days=retention_days(table)), dry_run),
+        }
+    return results
+
+
+def convert_to_partitioned(table, days_ahead=DEFAULT_DAYS_AHEAD, now=None):
+    """
+    把普通表转换为按天分区的表（在迁移中执行，不复制数据）
+
+    原表改名为 <表名>_legacy，其中的全部历史数据作为一个 [MINVALUE, 明天) 的分区挂载；
+    新父表沿用原表的列、索引名和外键，主键改为 (id, 分区列)（分区表的唯一约束必须包含分区列），
+    id 改由独立序列生成并从原表最大值之后继续。
+    """
+    column = PARTITIONED_TABLES[table]
+    legacy = f'{table}_legacy'
+    sequence = f'{table}_id_part_seq'
+
+    with connection.cursor() as cursor:
+        # 原表的二级索引、外键和 id 最大值
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'u'))",
+            [table, table]
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0), MAX("{column}") FROM "{table}"')
+        max_id, max_value = cursor.fetchone()
+
+        # 1. 原表及其索引、主键改名，释放原名称
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [legacy]
+        )
+        for (pkey,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE "{legacy}" RENAME CONSTRAINT "{pkey}" TO "{legacy}_pkey"')
+        for position, (index_name, _) in enumerate(indexes):
+            cursor.execute(f'ALTER INDEX "{index_name}" RENAME TO "{legacy}_idx{position}"')
+
+        # 2. id 改由独立序列生成
+        cursor.execute(f'ALTER TABLE "{legacy}" ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute(f'ALTER TABLE "{legacy}" ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'CREATE SEQUENCE "{sequence}" START WITH {max_id + 1}')
+
+        # 3. 新建分区父表
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) PARTITION BY RANGE ("{column}")'
+        )
+        cursor.execute(f'''ALTER TABLE "{table}" ALTER COLUMN id SET DEFAULT nextval('"{sequence}"')''')
+        cursor.execute(f'ALTER SEQUENCE "{sequence}" OWNED BY "{table}".id')
+
+        # 4. 历史数据整体作为一个分区挂载（先加 CHECK 约束，挂载时无需再次扫描）
+        boundary = _day_start(now or timezone.now()) + timedelta(days=1)
+        if max_value is not None and max_value >= boundary:
+            boundary = _day_start(max_value) + timedelta(days=1)
+        cursor.execute(
+            f'ALTER TABLE "{legacy}" ADD CONSTRAINT "{legacy}_bound" CHECK ("{column}" IS NOT NULL AND "{column}" < %s)',
+            [boundary]
+        )
+        cursor.execute(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{legacy}" FOR VALUES FROM (MINVALUE) TO (%s)', [boundary]
+        )
+        cursor.execute(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{legacy}_bound"')
+
+        # 5. 主键、索引、外键建在父表上（自动作用于所有分区，已有的等价索引/外键直接复用）
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, "{column}")')
+        for index_name, index_def in indexes:
+            # 索引定义取自改名前，名称与表名均为原名
+            cursor.execute(index_def)
+        for constraint_name, constraint_def in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{constraint_name}" {constraint_def}')
+
+        # 6. 默认分区兜底
+        cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+    ensure_partitions(table, days_ahead, now)
+    logger.info(f'{table} 已转换为按天分区表，历史数据保留在 {legacy} 分区')
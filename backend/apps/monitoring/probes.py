@@ -0,0 +1,229 @@
+"""
+服务健康探测
+
+每个探测是一个注册到 PROBES 的 Probe 子类，check() 正常返回即健康，抛出异常即异常。
+run_probes() 并发执行所有启用的探测，每个探测有独立的超时时间，超时视为异常（延迟记为超时时间）；
+卡住的探测线程不会阻塞本轮结果。
+
+启用的探测由 settings.MONITORING_HEALTH_PROBES 指定（默认全部）。
+新增探测：继承 Probe，设置 name/display_name/service_type，实现 check()，并用 @register_probe 注册；
+同时在 ServiceHealthCheck.SERVICE_TYPES 中加入服务名称。
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 5
+
+# 磁盘使用率超过该值视为异常
+DISK_USAGE_THRESHOLD = 90
+
+PROBES = {}
+
+
+def register_probe(cls):
+    PROBES[cls.name] = cls
+    return cls
+
+
+class Probe:
+    name = None
+    display_name = None
+    service_type = None
+    timeout = DEFAULT_TIMEOUT
+
+    def check(self):
+        """执行探测；返回值不使用，抛出异常表示异常"""
+        raise NotImplementedError
+
+    def run(self):
+        """
+        执行探测并计时（在线程池中运行，结束时关闭本线程的数据库连接）
+
+        Returns:
+            dict: {'service', 'healthy', 'response_time_ms', 'error'}
+        """
+        from django.db import connections
+
+        started = time.perf_counter()
+        try:
+            self.check()
+            healthy, error = True, ''
+        except Exception as e:
+            healthy, error = False, str(e)
+        finally:
+            connections.close_all()
+        return {
+            'service': self.name,
+            'healthy': healthy,
+            'response_time_ms': round((time.perf_counter() - started) * 1000, 3),
+            'error': error,
+        }
+
+
+@register_probe
+class DjangoProbe(Probe):
+    name = 'django'
+    display_name = 'Django应用服务'
+    service_type = 'application'
+
+    def check(self):
+        # Django 运行中就是健康的
+        return True
+
+
+@register_probe
+class DatabaseProbe(Probe):
+    name = 'database'
+    display_name = '数据库服务'
+    service_type = 'database'
+
+    def check(self):
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+
+@register_probe
+class CacheProbe(Probe):
+    name = 'cache'
+    display_name = '缓存服务'
+    service_type = 'cache'
+
+    def check(self):
+        from django.core.cache import cache
+        cache.set('health_check', 'ok', timeout=10)
+        if cache.get('health_check') != 'ok':
+            raise Exception("Cache read/write failed")
+
+
+@register_probe
+class CeleryProbe(Probe):
+    name = 'celery'
+    display_name = '任务队列服务'
+    service_type = 'queue'
+
+    def check(self):
+        from celery import current_app
+        # 检查 broker 连接
+        conn = current_app.connection()
+        try:
+            conn.ensure_connection(max_retries=1)
+        finally:
+            conn.close()
+
+
+@register_probe
+class ChannelLayerProbe(Probe):
+    name = 'channel_layer'
+    display_name = 'WebSocket消息通道'
+    service_type = 'queue'
+
+    def check(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            raise Exception('未配置 CHANNEL_LAYERS')
+        # 向没有成员的组发送消息，只验证与消息通道后端的往返
+        async_to_sync(channel_layer.group_send)('health_check', {'type': 'health.check'})
+
+
+@register_probe
+class DiskProbe(Probe):
+    name = 'disk'
+    display_name = '磁盘空间'
+    service_type = 'storage'
+
+    def check(self):
+        import psutil
+        usage = psutil.disk_usage('/')
+        if usage.percent >= DISK_USAGE_THRESHOLD:
+            raise Exception(f'磁盘使用率 {usage.percent}% 超过 {DISK_USAGE_THRESHOLD}%')
+
+
+class OpenStackProbe(Probe):
+    """请求 OpenStack 服务的版本根路径（不需要查询任何资源）"""
+    proxy = None
+    service_type = 'openstack'
+    timeout = 10
+
+    def check(self):
+        from apps.openstack.services import get_openstack_service
+
+        with get_openstack_service().checkout() as conn:
+            if conn is None:
+                raise Exception('无法连接 OpenStack')
+            response = getattr(conn, self.proxy).get('/')
+            if response.status_code >= 400:
+                raise Exception(f'HTTP {response.status_code}')
+
+
+@register_probe
+class KeystoneProbe(OpenStackProbe):
+    name = 'keystone'
+    display_name = 'OpenStack认证服务'
+    proxy = 'identity'
+
+
+@register_probe
+class NovaProbe(OpenStackProbe):
+    name = 'nova'
+    display_name = 'OpenStack计算服务'
+    proxy = 'compute'
+
+
+@register_probe
+class GlanceProbe(OpenStackProbe):
+    name = 'glance'
+    display_name = 'OpenStack镜像服务'
+    proxy = 'image'
+
+
+def get_enabled_probes():
+    """按 settings.MONITORING_HEALTH_PROBES 的顺序返回启用的探测实例"""
+    names = getattr(settings, 'MONITORING_HEALTH_PROBES', None) or list(PROBES)
+    probes = []
+    for name in names:
+        if name not in PROBES:
+            logger.warning(f'未知的健康探测: {name}')
+            continue
+        probes.append(PROBES[name]())
+    return probes
+
+
+def run_probes(probes=None):
+    """
+    并发执行探测
+
+    Returns:
+        list: 每个探测一条 {'service', 'healthy', 'response_time_ms', 'error'}，顺序与 probes 相同
+    """
+    probes = probes if probes is not None else get_enabled_probes()
+    if not probes:
+        return []
+
+    executor = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix='health-probe')
+    started = time.perf_counter()
+    futures = [(probe, executor.submit(probe.run)) for probe in probes]
+    results = []
+    for probe, future in futures:
+        # 所有探测同时开始，各自的剩余时间从共同的起点计算
+        remaining = probe.timeout - (time.perf_counter() - started)
+        try:
+            results.append(future.result(timeout=max(0, remaining)))
+        except FutureTimeoutError:
+            results.append({
+                'service': probe.name,
+                'healthy': False,
+                'response_time_ms': probe.timeout * 1000,
+                'error': f'探测超时（{probe.timeout}秒）',
+            })
+    executor.shutdown(wait=False, cancel_futures=True)
+    return results
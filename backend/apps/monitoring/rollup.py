@@ -0,0 +1,373 @@
+"""
+虚拟机监控数据降采样
+
+原始数据（VMMetricHistory，约每分钟一条）保留较短时间，定时任务把已结束的时间段
+聚合为 5分钟 / 1小时 / 1天 三级降采样数据（VMMetricRollup，每个指标的 min/avg/max/p95），
+各级数据按 settings.VM_METRIC_RETENTION 分别保留。
+
+  - 5分钟数据由原始数据聚合（精确 P95）
+  - 1小时数据由 5分钟数据、1天数据由 1小时数据用一条 GROUP BY 聚合：min/max 取极值，
+    avg 按样本数加权，P95 取子时间段 P95 的最大值（偏保守的近似）
+  - 每级粒度的水位线（VMMetricRollupWatermark）记录已聚合到的时间，已结束并经过等待时间的
+    时间段只聚合一次；上一级粒度尚未聚合到的时间段不会提前聚合
+
+图表接口按查询时间范围自动选择粒度，使返回的点数不超过 MAX_POINTS，与时间范围长短无关。
+"""
+
+import logging
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Max, Min, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import VMMetricHistory, VMMetricRollup, VMMetricRollupWatermark
+
+logger = logging.getLogger(__name__)
+
+# 粒度 -> 时间段长度（秒）；raw 为原始采集数据（按 1 分钟估算点数）
+RESOLUTION_SECONDS = {
+    'raw': 60,
+    '5m': 300,
+    '1h': 3600,
+    '1d': 86400,
+}
+ROLLUP_RESOLUTIONS = ['5m', '1h', '1d']
+
+# 粒度 -> 聚合来源粒度
+SOURCE_RESOLUTION = {
+    '5m': 'raw',
+    '1h': '5m',
+    '1d': '1h',
+}
+
+# 由降采样数据聚合时的截断单位（按 UTC 对齐，与 floor_bucket 一致）
+TRUNC_KIND = {
+    '1h': 'hour',
+    '1d': 'day',
+}
+
+STATS = ('min', 'avg', 'max', 'p95')
+
+# 各级数据默认保留天数
+DEFAULT_RETENTION_DAYS = {
+    'raw': 7,
+    '5m': 30,
+    '1h': 180,
+    '1d': 730,
+}
+
+# 图表接口返回的最大点数
+MAX_POINTS = 500
+
+# 时间段结束后等待迟到数据的时间（秒）
+SETTLE_DELAY = 120
+
+# 单次任务最多补算的时间段数量（首次运行或长时间停摆后分多次追赶）
+MAX_BUCKETS_PER_RUN = {
+    '5m': 288,
+    '1h': 48,
+    '1d': 7,
+}
+
+# 指标名 -> VMMetricHistory 字段
+METRIC_FIELDS = {
+    'cpu': 'cpu_usage',
+    'memory': 'memory_usage',
+    'network_in': 'network_in_rate',
+    'network_out': 'network_out_rate',
+}
+
+
+def get_retention_days(resolution):
+    return {**DEFAULT_RETENTION_DAYS, **getattr(settings, 'VM_METRIC_RETENTION', {})}[resolution]
+
+
+def floor_bucket(value, resolution):
+    """把时间向下取整到所在时间段起点（按 UTC 对齐）"""
+    seconds = RESOLUTION_SECONDS[resolution]
+    epoch = int(value.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=dt_timezone.utc)
+
+
+def percentile(sorted_values, q):
+    """线性插值百分位数（sorted_values 需已排序且非空）"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * q
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(values):
+    """计算一组样本的 (min, avg, max, p95)"""
+    ordered = sorted(values)
+    return (
+        ordered[0],
+        sum(ordered) / len(ordered),
+        ordered[-1],
+        percentile(ordered, 0.95),
+    )
+
+
+def _aggregate(rows, resolution):
+    """
+    按 (虚拟机, 时间段) 聚合原始样本
+
+    Args:
+        rows: 可迭代的 (vm_id, timestamp, cpu, memory, network_in, network_out)
+
+    Returns:
+        dict: {(vm_id, bucket): {'sample_count': n, 'cpu_min': ..., ...}}
+    """
+    samples = {}
+    for vm_id, timestamp, *values in rows:
+        group = samples.setdefault((vm_id, floor_bucket(timestamp, resolution)), [[] for _ in METRIC_FIELDS])
+        for series, value in zip(group, values):
+            series.append(value or 0)
+
+    result = {}
+    for key, series_list in samples.items():
+        fields = {'sample_count': len(series_list[0])}
+        for metric, series in zip(METRIC_FIELDS, series_list):
+            fields[f'{metric}_min'], fields[f'{metric}_avg'], fields[f'{metric}_max'], fields[f'{metric}_p95'] = summarize(series)
+        result[key] = fields
+    return result
+
+
+def raw_rows(start, end, vm_id=None):
+    """按 (vm_id, timestamp, cpu, memory, network_in, network_out) 逐行读取 [start, end) 内的原始数据"""
+    queryset = VMMetricHistory.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    if vm_id:
+        queryset = queryset.filter(virtual_machine_id=vm_id)
+    return queryset.order_by().values_list(
+        'virtual_machine_id', 'timestamp', *METRIC_FIELDS.values()
+    ).iterator(chunk_size=5000)
+
+
+def _rollup_from_rollups(resolution, start, end):
+    """
+    把 [start, end) 内的上一级降采样数据按 (虚拟机, 时间段) GROUP BY 聚合
+
+    Returns:
+        dict: {(vm_id, bucket): {'sample_count': n, 'cpu_min': ..., ...}}
+    """
+    aggregates = {'agg_sample_count': Sum('sample_count')}
+    for metric in METRIC_FIELDS:
+        aggregates[f'agg_{metric}_min'] = Min(f'{metric}_min')
+        aggregates[f'agg_{metric}_avg'] = ExpressionWrapper(
+            Sum(F(f'{metric}_avg') * F('sample_count'), output_field=FloatField()) / Sum('sample_count'),
+            output_field=FloatField(),
+        )
+        aggregates[f'agg_{metric}_max'] = Max(f'{metric}_max')
+        aggregates[f'agg_{metric}_p95'] = Max(f'{metric}_p95')
+
+    rows = VMMetricRollup.objects.filter(
+        resolution=SOURCE_RESOLUTION[resolution], bucket__gte=start, bucket__lt=end, sample_count__gt=0
+    ).annotate(
+        target=Trunc('bucket', TRUNC_KIND[resolution], tzinfo=dt_timezone.utc)
+    ).order_by().values('virtual_machine_id', 'target').annotate(**aggregates)
+
+    return {
+        (row['virtual_machine_id'], row['target']): {
+            name[len('agg_'):]: value for name, value in row.items() if name.startswith('agg_')
+        }
+        for row in rows
+    }
+
+
+def rollup_range(resolution, start, end):
+    """
+    聚合 [start, end) 内的时间段并写入（已存在的时间段覆盖更新，可重复执行）
+
+    5分钟粒度读取原始数据，更粗的粒度读取上一级降采样数据。
+
+    Returns:
+        int: 写入的降采样记录数
+    """
+    if SOURCE_RESOLUTION[resolution] == 'raw':
+        aggregated = _aggregate(raw_rows(start, end), resolution)
+    else:
+        aggregated = _rollup_from_rollups(resolution, start, end)
+    if not aggregated:
+        return 0
+
+    objects = [
+        VMMetricRollup(virtual_machine_id=vm_id, resolution=resolution, bucket=bucket, **fields)
+        for (vm_id, bucket), fields in aggregated.items()
+    ]
+    update_fields = ['sample_count'] + [f'{metric}_{stat}' for metric in METRIC_FIELDS for stat in STATS]
+    VMMetricRollup.objects.bulk_create(
+        objects,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['virtual_machine', 'resolution', 'bucket'],
+        update_fields=update_fields,
+    )
+    return len(objects)
+
+
+def _initial_watermark(resolution):
+    """
+    没有水位线时的起点：已有降采样数据时从最新时间段之后开始（此前版本写入的时间段均已结束），
+    否则从来源数据的最早时间开始
+    """
+    latest = VMMetricRollup.objects.filter(resolution=resolution).aggregate(latest=Max('bucket'))['latest']
+    if latest is not None:
+        return latest + timedelta(seconds=RESOLUTION_SECONDS[resolution])
+
+    source = SOURCE_RESOLUTION[resolution]
+    if source == 'raw':
+        earliest = VMMetricHistory.objects.aggregate(earliest=Min('timestamp'))['earliest']
+    else:
+        earliest = VMMetricRollup.objects.filter(resolution=source).aggregate(earliest=Min('bucket'))['earliest']
+    return floor_bucket(earliest, resolution) if earliest is not None else None
+
+
+def rollup_metrics(now=None):
+    """
+    按水位线聚合所有已结束但尚未聚合的时间段
+
+    Returns:
+        dict: {resolution: 写入记录数}
+    """
+    now = now or timezone.now()
+    watermarks = dict(VMMetricRollupWatermark.objects.values_list('resolution', 'rolled_up_to'))
+    results = {}
+    for resolution in ROLLUP_RESOLUTIONS:
+        results[resolution] = 0
+        step = timedelta(seconds=RESOLUTION_SECONDS[resolution])
+        # 只聚合已结束并经过等待时间的时间段
+        end = floor_bucket(now - timedelta(seconds=SETTLE_DELAY), resolution)
+
+        source = SOURCE_RESOLUTION[resolution]
+        if source != 'raw':
+            # 来源粒度聚合到哪里，这一级最多聚合到哪里
+            if source not in watermarks:
+                continue
+            end = min(end, floor_bucket(watermarks[source], resolution))
+
+        start = watermarks.get(resolution) or _initial_watermark(resolution)
+        if start is None:
+            continue
+
+        # 从水位线向前追赶，单次最多处理 MAX_BUCKETS_PER_RUN 个时间段
+        end = min(end, start + step * MAX_BUCKETS_PER_RUN[resolution])
+        if start >= end:
+            continue
+
+        with transaction.atomic():
+            results[resolution] = rollup_range(resolution, start, end)
+            VMMetricRollupWatermark.objects.update_or_create(
+                resolution=resolution, defaults={'rolled_up_to': end}
+            )
+        watermarks[resolution] = end
+    return results
+
+
+def prune_metrics(now=None):
+    """
+    按各级保留期清理监控数据（vm_metric_history 已分区时改为删除过期分区）
+
+    Returns:
+        dict: {resolution: 删除记录数}
+    """
+    from .partitions import drop_expired_partitions, is_partitioned
+
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=get_retention_days('raw'))
+    deleted = {}
+    if is_partitioned(VMMetricHistory._meta.db_table):
+        # 分区表整分区删除，返回值为删除的分区数
+        deleted['raw_partitions'] = len(drop_expired_partitions(VMMetricHistory._meta.db_table, cutoff))
+        deleted['raw'] = 0
+    else:
+        deleted['raw'] = VMMetricHistory.objects.filter(timestamp__lt=cutoff).delete()[0]
+    for resolution in ROLLUP_RESOLUTIONS:
+        deleted[resolution] = VMMetricRollup.objects.filter(
+            resolution=resolution,
+            bucket__lt=now - timedelta(days=get_retention_days(resolution))
+        ).delete()[0]
+    return deleted
+
+
+def choose_resolution(start, end, max_points=MAX_POINTS, now=None):
+    """
+    选择满足点数上限且在保留期内的最细粒度
+
+    Returns:
+        str: 'raw' / '5m' / '1h' / '1d'
+    """
+    now = now or timezone.now()
+    span = (end - start).total_seconds()
+    for resolution in ['raw'] + ROLLUP_RESOLUTIONS:
+        if start < now - timedelta(days=get_retention_days(resolution)):
+            continue
+        if span / RESOLUTION_SECONDS[resolution] <= max_points:
+            return resolution
+    return '1d'
+
+
+def _point(bucket, fields):
+    return {
+        'timestamp': bucket.isoformat(),
+        'cpu_usage': round(fields['cpu_avg'], 2),
+        'memory_usage': round(fields['memory_avg'], 2),
+        'network_in': round(fields['network_in_avg'], 2),
+        'network_out': round(fields['network_out_avg'], 2),
+        'cpu_max': round(fields['cpu_max'], 2),
+        'cpu_p95': round(fields['cpu_p95'], 2),
+        'memory_max': round(fields['memory_max'], 2),
+        'memory_p95': round(fields['memory_p95'], 2),
+        'network_in_max': round(fields['network_in_max'], 2),
+        'network_out_max': round(fields['network_out_max'], 2),
+        'sample_count': fields['sample_count'],
+    }
+
+
+def query_series(vm_id, start, end, resolution=None):
+    """
+    查询单台虚拟机的监控时间序列
+
+    降采样粒度下，已聚合的时间段读 VMMetricRollup，尚未聚合的最近一段从原始数据现场聚合。
+
+    Returns:
+        (resolution, [点]) 点的 cpu_usage/memory_usage/network_in/network_out 为平均值，
+        降采样粒度额外包含 *_max/*_p95 和 sample_count
+    """
+    resolution = resolution or choose_resolution(start, end)
+
+    if resolution == 'raw':
+        rows = VMMetricHistory.objects.filter(
+            virtual_machine_id=vm_id, timestamp__gte=start, timestamp__lte=end
+        ).order_by('timestamp').values_list('timestamp', *METRIC_FIELDS.values())
+        return resolution, [{
+            'timestamp': timestamp.isoformat(),
+            'cpu_usage': cpu,
+            'memory_usage': memory,
+            'network_in': network_in,
+            'network_out': network_out,
+        } for timestamp, cpu, memory, network_in, network_out in rows]
+
+    bucket_start = floor_bucket(start, resolution)
+    rollups = list(VMMetricRollup.objects.filter(
+        virtual_machine_id=vm_id, resolution=resolution, bucket__gte=bucket_start, bucket__lte=end
+    ).order_by('bucket'))
+    points = [_point(rollup.bucket, {
+        field: getattr(rollup, field) for field in ['sample_count'] + [
+            f'{metric}_{stat}' for metric in METRIC_FIELDS for stat in STATS
+        ]
+    }) for rollup in rollups]
+
+    # 最近尚未聚合的部分
+    tail_start = rollups[-1].bucket + timedelta(seconds=RESOLUTION_SECONDS[resolution]) if rollups else bucket_start
+    if tail_start <= end:
+        tail = _aggregate(raw_rows(tail_start, end + timedelta(microseconds=1), vm_id), resolution)
+        points.extend(_point(bucket, fields) for (_, bucket), fields in sorted(tail.items(), key=lambda item: item[0][1]))
+
+    return resolution, points
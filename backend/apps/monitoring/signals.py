@@ -1,9 +1,11 @@
 """
-Signal handlers for automatic activity logging
+Signal handlers for automatic activity logging and dashboard summary invalidation
 """
 from django.contrib.auth.signals import user_logged_in, user_logged_out
-from django.db.models.signals import post_save
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from .dashboard import SECTION_DEPENDENCIES, invalidate_for_model
 from .models import ActivityLog
 
 
@@ -30,3 +32,14 @@ def log_user_logout(sender, request, user, **kwargs):
             user=user,
             ip_address=ip_address
         )
+
+
+def invalidate_dashboard_summary(sender, **kwargs):
+    """统计相关模型变更后使仪表盘汇总缓存失效"""
+    invalidate_for_model(sender)
+
+
+for label in SECTION_DEPENDENCIES:
+    model = apps.get_model(label)
+    post_save.connect(invalidate_dashboard_summary, sender=model, dispatch_uid=f'dashboard_summary_save_{label}')
+    post_delete.connect(invalidate_dashboard_summary, sender=model, dispatch_uid=f'dashboard_summary_delete_{label}')
@@ -0,0 +1,287 @@
+"""
+流式告警评估
+
+监控采集器每写入一批 VMMetricHistory 就调用 evaluate_samples()，告警在采样当时即可触发/恢复，
+不必等待下一次 check_vm_alerts 定时任务。判定规则与 check_vm_alerts 相同：
+持续时间窗口内全部采样点都满足条件（gt: 大于阈值，lt: 小于阈值）即触发，否则恢复。
+
+每台虚拟机在进程内保留一个环形缓冲区（长度按最长规则持续时间计算），每个 (规则, 虚拟机)
+只记录最近一次"不满足条件"的采样时间，新采样到来时 O(1) 更新：
+最近一次不满足条件的时间早于窗口起点，即窗口内全部满足。
+进程内没有状态的虚拟机（worker 重启、由其他进程采集过）从数据库一次性载入窗口数据。
+
+Celery prefork 下相邻两轮采集可能由不同进程评估，进程内缓冲区会缺少其他进程评估过的采样。
+每轮评估后把本轮采样时间写入共享缓存（LAST_TICK_CACHE_KEY）；下一轮评估时，
+最后缓冲时间早于上一轮采样时间的虚拟机视为缺少采样，丢弃进程内状态后从数据库重新载入窗口数据。
+check_vm_alerts 定时任务继续保留作为兜底。
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .utils import ALERT_METRIC_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# 告警规则重新载入间隔（秒）
+RULE_REFRESH_INTERVAL = 60
+
+# 环形缓冲区按每分钟一个采样估算长度，多留余量
+SAMPLES_PER_MINUTE = 2
+
+# 最近一轮评估的采样时间（所有进程共享）
+LAST_TICK_CACHE_KEY = 'monitoring:streaming_alerts:last_tick'
+LAST_TICK_TTL = 3600
+
+
+def streaming_enabled():
+    return getattr(settings, 'MONITORING_STREAMING_ALERTS', True)
+
+
+class StreamingAlertEvaluator:
+    """进程内流式告警评估器（通过 get_evaluator() 获取单例）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = []
+        self._rules_loaded_at = 0
+        self._max_duration = 0
+        # vm_id -> deque[(timestamp, {字段: 值})]
+        self._buffers = {}
+        # (rule_id, vm_id) -> 最近一次不满足条件的采样时间（None 表示缓冲区内全部满足）
+        self._last_violation = {}
+
+    def _refresh_rules(self):
+        from .models import AlertRule
+
+        if time.monotonic() - self._rules_loaded_at < RULE_REFRESH_INTERVAL:
+            return
+        rules = list(AlertRule.objects.filter(enabled=True, metric_type__in=ALERT_METRIC_FIELDS.keys()))
+        signature = [(rule.id, rule.metric_type, rule.operator, rule.threshold, rule.duration, rule.virtual_machine_id) for rule in rules]
+        if signature != [(rule.id, rule.metric_type, rule.operator, rule.threshold, rule.duration, rule.virtual_machine_id) for rule in self._rules]:
+            # 规则变化后由缓冲区重新计算每条规则的状态
+            self._rules = rules
+            self._max_duration = max((rule.duration for rule in rules), default=0)
+            self._last_violation = {}
+            for vm_id, buffer in self._buffers.items():
+                self._resize(vm_id)
+                for timestamp, values in buffer:
+                    self._track(vm_id, timestamp, values)
+        # 清理已不再采集（已停止/已删除）的虚拟机
+        expired_before = timezone.now() - timedelta(minutes=self._max_duration * 2)
+        for vm_id in [vm_id for vm_id, buffer in self._buffers.items() if not buffer or buffer[-1][0] < expired_before]:
+            del self._buffers[vm_id]
+        self._rules_loaded_at = time.monotonic()
+
+    def _resize(self, vm_id):
+        maxlen = max(self._max_duration * SAMPLES_PER_MINUTE, 1)
+        buffer = self._buffers.get(vm_id)
+        if buffer is None or buffer.maxlen != maxlen:
+            self._buffers[vm_id] = deque(buffer or [], maxlen=maxlen)
+        return self._buffers[vm_id]
+
+    def _rules_for(self, vm_id):
+        return [rule for rule in self._rules if rule.virtual_machine_id in (None, vm_id)]
+
+    @staticmethod
+    def _satisfied(rule, value):
+        if rule.operator == 'gt':
+            return value > rule.threshold
+        return value < rule.threshold
+
+    def _track(self, vm_id, timestamp, values):
+        """把一个采样计入各规则状态（O(规则数)）"""
+        for rule in self._rules_for(vm_id):
+            if not self._satisfied(rule, values[ALERT_METRIC_FIELDS[rule.metric_type]] or 0):
+                self._last_violation[(rule.id, vm_id)] = timestamp
+
+    def _forget(self, vm_id):
+        """丢弃虚拟机的进程内状态"""
+        self._buffers.pop(vm_id, None)
+        for key in [key for key in self._last_violation if key[1] == vm_id]:
+            del self._last_violation[key]
+
+    def _stale(self, vm_ids, previous_tick):
+        """进程内缓冲区缺少上一轮（由其他进程评估的）采样的虚拟机"""
+        if previous_tick is None:
+            return []
+        return [
+            vm_id for vm_id in vm_ids
+            if vm_id in self._buffers and (not self._buffers[vm_id] or self._buffers[vm_id][-1][0] < previous_tick)
+        ]
+
+    def _warm(self, vm_ids, now):
+        """从数据库载入没有进程内状态的虚拟机的窗口数据（一次查询）"""
+        from .models import VMMetricHistory
+
+        rows = VMMetricHistory.objects.filter(
+            virtual_machine_id__in=vm_ids,
+            timestamp__gte=now - timedelta(minutes=self._max_duration)
+        ).order_by('timestamp').values_list('virtual_machine_id', 'timestamp', *ALERT_METRIC_FIELDS.values())
+        for vm_id in vm_ids:
+            self._resize(vm_id)
+        for vm_id, timestamp, *values in rows:
+            values = dict(zip(ALERT_METRIC_FIELDS.values(), values))
+            self._buffers[vm_id].append((timestamp, values))
+            self._track(vm_id, timestamp, values)
+
+    def _firing(self, rule, vm_id, now):
+        """窗口内有采样且最近一次不满足条件的采样早于窗口起点"""
+        buffer = self._buffers.get(vm_id)
+        window_start = now - timedelta(minutes=rule.duration)
+        if not buffer or buffer[-1][0] < window_start:
+            return False
+        last_violation = self._last_violation.get((rule.id, vm_id))
+        return last_violation is None or last_violation < window_start
+
+    def evaluate(self, records):
+        """
+        评估一批新写入的监控数据（VMMetricHistory 实例，需已入库）
+
+        Returns:
+            (新触发的告警列表, 恢复的告警列表)
+        """
+        from .models import AlertHistory
+
+        if not records:
+            return [], []
+
+        with self._lock:
+            self._refresh_rules()
+            if not self._rules:
+                return [], []
+
+            vms = {record.virtual_machine_id: record.virtual_machine for record in records}
+            now = max(record.timestamp for record in records)
+            tick = min(record.timestamp for record in records)
+
+            previous_tick = cache.get(LAST_TICK_CACHE_KEY)
+            if previous_tick is not None and previous_tick >= tick:
+                # 重新评估同一轮或更早的采样时不据此判断
+                previous_tick = None
+            for vm_id in self._stale(vms, previous_tick):
+                self._forget(vm_id)
+            cold = [vm_id for vm_id in vms if vm_id not in self._buffers]
+            if cold:
+                self._warm(cold, now)
+            for record in records:
+                buffer = self._resize(record.virtual_machine_id)
+                # 从数据库载入的窗口数据可能已包含本批采样
+                if buffer and buffer[-1][0] >= record.timestamp:
+                    continue
+                values = {field: getattr(record, field) for field in ALERT_METRIC_FIELDS.values()}
+                buffer.append((record.timestamp, values))
+                self._track(record.virtual_machine_id, record.timestamp, values)
+
+            firing = {
+                (rule.id, vm_id): rule
+                for vm_id in vms for rule in self._rules_for(vm_id)
+                if self._firing(rule, vm_id, now)
+            }
+            latest = {record.virtual_machine_id: record for record in records}
+            cache.set(LAST_TICK_CACHE_KEY, tick, LAST_TICK_TTL)
+
+        active = {}
+        for alert in AlertHistory.objects.filter(
+            virtual_machine_id__in=vms.keys(), rule__in=self._rules, status='active'
+        ).select_related('rule', 'virtual_machine'):
+            active.setdefault((alert.rule_id, alert.virtual_machine_id), []).append(alert)
+
+        new_alerts = []
+        for (rule_id, vm_id), rule in firing.items():
+            if (rule_id, vm_id) in active:
+                continue
+            vm = vms[vm_id]
+            value = getattr(latest[vm_id], ALERT_METRIC_FIELDS[rule.metric_type])
+            operator_text = '大于' if rule.operator == 'gt' else '小于'
+            new_alerts.append(AlertHistory(
+                rule=rule,
+                virtual_machine=vm,
+                metric_value=value,
+                message=f"虚拟机 {vm.name} 的 {rule.get_metric_type_display()} "
+                       f"{operator_text} {rule.threshold}%，当前值: {value}%，"
+                       f"已持续 {rule.duration} 分钟",
+                status='active'
+            ))
+        if new_alerts:
+            new_alerts = AlertHistory.objects.bulk_create(new_alerts)
+
+        resolved = [
+            alert for key, alerts in active.items() if key not in firing
+            for alert in alerts
+        ]
+        if resolved:
+            resolved_at = timezone.now()
+            AlertHistory.objects.filter(id__in=[alert.id for alert in resolved]).update(
+                status='resolved', resolved_at=resolved_at
+            )
+            for alert in resolved:
+                alert.status = 'resolved'
+                alert.resolved_at = resolved_at
+
+        for alert in new_alerts:
+            logger.warning(f"告警触发: {alert.message}")
+        for alert in resolved:
+            logger.info(f"告警已恢复: {alert.message}")
+        if new_alerts or resolved:
+            push_alert_notifications(new_alerts, resolved)
+        return new_alerts, resolved
+
+
+def push_alert_notifications(triggered, resolved):
+    """通过 WebSocket 推送告警触发/恢复事件"""
+    try:
+        from channels.layers import get_channel_layer
+        from asgiref.sync import async_to_sync
+
+        channel_layer = get_channel_layer()
+        if not channel_layer:
+            return
+
+        for alert in list(triggered) + list(resolved):
+            async_to_sync(channel_layer.group_send)('vm_status_updates', {
+                'type': 'alert_notification',
+                'data': {
+                    'alert_id': alert.id,
+                    'rule_id': alert.rule_id,
+                    'rule_name': alert.rule.name,
+                    'vm_id': str(alert.virtual_machine_id),
+                    'vm_name': alert.virtual_machine.name,
+                    'status': alert.status,
+                    'metric_value': alert.metric_value,
+                    'message': alert.message,
+                    'timestamp': (alert.resolved_at or alert.started_at or timezone.now()).isoformat(),
+                }
+            })
+    except Exception as e:
+        logger.error(f"推送告警通知失败: {str(e)}")
+
+
+_evaluator = None
+_evaluator_lock = threading.Lock()
+
+
+def get_evaluator():
+    global _evaluator
+    if _evaluator is None:
+        with _evaluator_lock:
+            if _evaluator is None:
+                _evaluator = StreamingAlertEvaluator()
+    return _evaluator
+
+
+def evaluate_samples(records):
+    """评估新写入的监控数据（未启用 MONITORING_STREAMING_ALERTS 时不做任何事）"""
+    if not streaming_enabled() or not records:
+        return [], []
+    try:
+        return get_evaluator().evaluate(records)
+    except Exception as e:
+        logger.error(f"流式告警评估失败: {str(e)}", exc_info=True)
+        return [], []
@@ -34,46 +34,19 @@ def check_alerts_task():
 def collect_vm_metrics_task():
     """
     采集虚拟机监控数据任务
-    定期从OpenStack获取虚拟机监控指标并保存到数据库
+    定期从OpenStack并发获取虚拟机诊断数据，计算指标后批量保存到数据库
     """
-    from apps.information_systems.models import VirtualMachine
-    from apps.openstack.services import OpenStackService
-    from .models import VMMetricHistory
-    from django.utils import timezone
+    from .collector import collect_vm_metrics
     
     logger.info("开始采集虚拟机监控数据")
     
     try:
-        openstack_service = OpenStackService()
-        # 只采集运行中的虚拟机
-        running_vms = VirtualMachine.objects.filter(status='running')
-        
-        collected_count = 0
-        for vm in running_vms:
-            if not vm.openstack_id:
-                continue
-                
-            try:
-                metrics = openstack_service.get_server_metrics(vm.openstack_id)
-                if metrics:
-                    # 保存监控数据
-                    VMMetricHistory.objects.create(
-                        virtual_machine=vm,
-                        cpu_usage=metrics.get('cpu_usage_percent', 0),
-                        memory_usage=metrics.get('memory_usage_percent', 0),
-                        network_in_rate=metrics.get('network_in_bytes', 0) / 1024,  # 转KB
-                        network_out_rate=metrics.get('network_out_bytes', 0) / 1024,
-                        timestamp=timezone.now()
-                    )
-                    collected_count += 1
-            except Exception as e:
-                logger.warning(f"采集虚拟机 {vm.name} 的监控数据失败: {str(e)}")
-                continue
-        
-        logger.info(f"监控数据采集完成，成功采集 {collected_count} 个虚拟机")
+        result = collect_vm_metrics()
         return {
             'status': 'success',
-            'collected_count': collected_count
+            'collected_count': result['collected'],
+            'warming_count': result['warming'],
+            'failed_count': result['failed']
         }
     except Exception as e:
         logger.error(f"监控数据采集任务执行失败: {str(e)}")
@@ -83,36 +56,71 @@ def collect_vm_metrics_task():
         }
 
 
+@shared_task(name='rollup_vm_metrics')
+def rollup_vm_metrics_task():
+    """
+    监控数据降采样任务
+    把已结束的时间段聚合为 5分钟/1小时/1天 粒度，供长时间范围的图表查询
+    """
+    from .rollup import rollup_metrics
+    
+    try:
+        results = rollup_metrics()
+        if any(results.values()):
+            logger.info(f"监控数据降采样完成: {results}")
+        return {
+            'status': 'success',
+            'rollups': results
+        }
+    except Exception as e:
+        logger.error(f"监控数据降采样任务执行失败: {str(e)}")
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
+
+
 @shared_task(name='cleanup_old_metrics')
 def cleanup_old_metrics_task():
     """
     清理旧的监控数据任务
-    保留最近30天的数据，删除更早的数据
+    原始数据和各级降采样数据按 settings.VM_METRIC_RETENTION 分别保留，
+    健康检查记录（未分区时逐行删除）与服务延迟直方图按各自的保留天数清理
     """
-    from .models import VMMetricHistory, ServiceHealthCheck
+    from .latency import LATENCY_RETENTION_DAYS
+    from .models import ServiceHealthCheck, ServiceLatencyHistogram
+    from .partitions import HEALTH_CHECK_RETENTION_DAYS, drop_expired_partitions, is_partitioned
+    from .rollup import prune_metrics
     from django.utils import timezone
     from datetime import timedelta
     
     logger.info("开始清理旧的监控数据")
     
     try:
-        # 删除30天前的监控数据
-        cutoff_date = timezone.now() - timedelta(days=30)
-        deleted_count, _ = VMMetricHistory.objects.filter(
-            timestamp__lt=cutoff_date
-        ).delete()
+        deleted = prune_metrics()
         
         # 同时清理7天前的健康检查记录（保留足够计算24小时可用性）
-        health_cutoff = timezone.now() - timedelta(days=7)
-        health_deleted, _ = ServiceHealthCheck.objects.filter(
-            checked_at__lt=health_cutoff
+        health_cutoff = timezone.now() - timedelta(days=HEALTH_CHECK_RETENTION_DAYS)
+        if is_partitioned(ServiceHealthCheck._meta.db_table):
+            health_deleted = 0
+            drop_expired_partitions(ServiceHealthCheck._meta.db_table, health_cutoff)
+        else:
+            health_deleted, _ = ServiceHealthCheck.objects.filter(
+                checked_at__lt=health_cutoff
+            ).delete()
+        
+        # 延迟直方图每服务每小时一条，保留较长时间供容量规划使用
+        latency_deleted, _ = ServiceLatencyHistogram.objects.filter(
+            window_start__lt=timezone.now() - timedelta(days=LATENCY_RETENTION_DAYS)
         ).delete()
         
-        logger.info(f"清理完成，删除了 {deleted_count} 条旧监控数据，{health_deleted} 条健康检查记录")
+        logger.info(f"清理完成，删除了 {deleted} 条旧监控数据，{health_deleted} 条健康检查记录")
         return {
             'status': 'success',
-            'deleted_count': deleted_count,
-            'health_deleted': health_deleted
+            'deleted_count': deleted['raw'],
+            'rollup_deleted': {resolution: count for resolution, count in deleted.items() if resolution != 'raw'},
+            'health_deleted': health_deleted,
+            'latency_deleted': latency_deleted
         }
     except Exception as e:
         logger.error(f"清理监控数据任务执行失败: {str(e)}")
@@ -122,106 +130,64 @@ def cleanup_old_metrics_task():
         }
 
 
+@shared_task(name='maintain_metric_partitions')
+def maintain_metric_partitions_task():
+    """
+    监控分区表维护任务
+    提前创建未来几天的分区，并整分区删除过期数据（仅 PostgreSQL 且已分区时生效）
+    """
+    from .partitions import maintain_partitions
+    
+    try:
+        results = maintain_partitions()
+        return {
+            'status': 'success',
+            'tables': results
+        }
+    except Exception as e:
+        logger.error(f"监控分区表维护失败: {str(e)}")
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
+
+
 @shared_task(name='check_service_health')
 def check_service_health_task():
     """
     服务健康检查任务
-    定期检测各个服务的运行状态，用于计算真实可用性
+    并发执行各服务探测（见 probes），结果一次批量写入，并更新可用性缓存和延迟直方图
     """
+    from django.utils import timezone
+    from .availability import record_checks
+    from .latency import record_latencies
     from .models import ServiceHealthCheck
-    import time
+    from .probes import run_probes
     
     logger.info("开始执行服务健康检查")
-    results = []
-    
-    # 1. 检查 Django 应用服务（通过检查自身响应）
-    try:
-        start_time = time.time()
-        # Django 运行中就是健康的
-        response_time = int((time.time() - start_time) * 1000)
-        ServiceHealthCheck.objects.create(
-            service_name='django',
-            is_healthy=True,
-            response_time_ms=response_time
-        )
-        results.append({'service': 'django', 'healthy': True})
-    except Exception as e:
-        ServiceHealthCheck.objects.create(
-            service_name='django',
-            is_healthy=False,
-            error_message=str(e)
-        )
-        results.append({'service': 'django', 'healthy': False, 'error': str(e)})
+    checked_at = timezone.now()
+    results = run_probes()
     
-    # 2. 检查数据库服务
-    try:
-        from django.db import connection
-        start_time = time.time()
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-        response_time = int((time.time() - start_time) * 1000)
-        ServiceHealthCheck.objects.create(
-            service_name='database',
-            is_healthy=True,
-            response_time_ms=response_time
-        )
-        results.append({'service': 'database', 'healthy': True})
-    except Exception as e:
-        ServiceHealthCheck.objects.create(
-            service_name='database',
-            is_healthy=False,
-            error_message=str(e)
+    ServiceHealthCheck.objects.bulk_create([
+        ServiceHealthCheck(
+            service_name=result['service'],
+            is_healthy=result['healthy'],
+            response_time_ms=int(result['response_time_ms']),
+            error_message=result['error'],
         )
-        results.append({'service': 'database', 'healthy': False, 'error': str(e)})
+        for result in results
+    ])
     
-    # 3. 检查缓存服务（Redis）
+    # 写穿可用性缓存，仪表盘接口直接读取
     try:
-        from django.core.cache import cache
-        start_time = time.time()
-        cache.set('health_check', 'ok', timeout=10)
-        result = cache.get('health_check')
-        response_time = int((time.time() - start_time) * 1000)
-        
-        if result == 'ok':
-            ServiceHealthCheck.objects.create(
-                service_name='cache',
-                is_healthy=True,
-                response_time_ms=response_time
-            )
-            results.append({'service': 'cache', 'healthy': True})
-        else:
-            raise Exception("Cache read/write failed")
+        record_checks([{**result, 'checked_at': checked_at} for result in results], checked_at)
     except Exception as e:
-        ServiceHealthCheck.objects.create(
-            service_name='cache',
-            is_healthy=False,
-            error_message=str(e)
-        )
-        results.append({'service': 'cache', 'healthy': False, 'error': str(e)})
+        logger.error(f"更新服务可用性缓存失败: {str(e)}")
     
-    # 4. 检查 Celery 任务队列（通过检查 broker 连接）
     try:
-        from celery import current_app
-        start_time = time.time()
-        # 检查 broker 连接
-        conn = current_app.connection()
-        conn.ensure_connection(max_retries=1)
-        conn.close()
-        response_time = int((time.time() - start_time) * 1000)
-        
-        ServiceHealthCheck.objects.create(
-            service_name='celery',
-            is_healthy=True,
-            response_time_ms=response_time
-        )
-        results.append({'service': 'celery', 'healthy': True})
+        record_latencies([(result['service'], result['response_time_ms']) for result in results], checked_at)
     except Exception as e:
-        ServiceHealthCheck.objects.create(
-            service_name='celery',
-            is_healthy=False,
-            error_message=str(e)
-        )
-        results.append({'service': 'celery', 'healthy': False, 'error': str(e)})
+        logger.error(f"更新服务延迟直方图失败: {str(e)}")
     
     healthy_count = sum(1 for r in results if r['healthy'])
     logger.info(f"服务健康检查完成: {healthy_count}/{len(results)} 服务健康")
@@ -0,0 +1,256 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.information_systems.models import InformationSystem, VirtualMachine
+from apps.monitoring.audit import AuditLogWriter, get_audit_config
+from apps.monitoring.models import ActivityLog, AlertHistory, AlertRule, VMMetricHistory
+from apps.monitoring.streaming import StreamingAlertEvaluator
+from apps.tenants.models import Tenant
+
+
+@mock.patch('apps.monitoring.streaming.push_alert_notifications')
+class StreamingAlertEvaluatorTests(TestCase):
+    """流式告警评估：持续时间窗口判定与多进程（prefork）下的缓冲区一致性"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        tenant = Tenant.objects.create(
+            name='告警测试租户', code='alert-test', contact_person='测试', contact_phone='1',
+            start_time=now, end_time=now + timedelta(days=365),
+        )
+        system = InformationSystem.objects.create(name='告警测试系统', code='alert-test', tenant=tenant)
+        cls.vm = VirtualMachine.objects.create(
+            name='alert-vm', information_system=system, openstack_id='alert-vm',
+            cpu_cores=2, memory_gb=4, disk_gb=20, status='running',
+        )
+        cls.rule = AlertRule.objects.create(
+            name='CPU过高', metric_type='cpu', threshold=80, operator='gt', duration=3,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.start = timezone.now().replace(second=0, microsecond=0) - timedelta(minutes=30)
+        self.minute = 0
+
+    def tick(self, evaluator, cpu):
+        """模拟一轮采集：写入一条采样并交给评估器"""
+        record = VMMetricHistory.objects.create(
+            virtual_machine=self.vm, cpu_usage=cpu, memory_usage=10,
+            timestamp=self.start + timedelta(minutes=self.minute),
+        )
+        self.minute += 1
+        return evaluator.evaluate([record])
+
+    def active_alerts(self):
+        return AlertHistory.objects.filter(rule=self.rule, virtual_machine=self.vm, status='active')
+
+    def test_fires_after_duration_and_resolves(self, push):
+        evaluator = StreamingAlertEvaluator()
+        for cpu in (50, 90, 90, 90):
+            fired, _ = self.tick(evaluator, cpu)
+            self.assertEqual(fired, [])
+        # 窗口（3 分钟）内已全部大于阈值
+        fired, _ = self.tick(evaluator, 95)
+        self.assertEqual(len(fired), 1)
+        self.assertEqual(fired[0].metric_value, 95)
+
+        # 已有活动告警时不重复触发
+        fired, _ = self.tick(evaluator, 95)
+        self.assertEqual(fired, [])
+
+        _, resolved = self.tick(evaluator, 20)
+        self.assertEqual(len(resolved), 1)
+        self.assertFalse(self.active_alerts().exists())
+
+    def test_single_violation_inside_window_prevents_firing(self, push):
+        evaluator = StreamingAlertEvaluator()
+        for cpu in (50, 90, 90, 50, 90, 90, 90):
+            fired, _ = self.tick(evaluator, cpu)
+            self.assertEqual(fired, [])
+        fired, _ = self.tick(evaluator, 90)
+        self.assertEqual(len(fired), 1)
+
+    def test_cold_process_warms_window_from_database(self, push):
+        for cpu in (90, 90, 50, 90):
+            VMMetricHistory.objects.create(
+                virtual_machine=self.vm, cpu_usage=cpu, memory_usage=10,
+                timestamp=self.start + timedelta(minutes=self.minute),
+            )
+            self.minute += 1
+        evaluator = StreamingAlertEvaluator()
+        for _ in range(2):
+            fired, _ = self.tick(evaluator, 90)
+            self.assertEqual(fired, [])
+        fired, _ = self.tick(evaluator, 90)
+        self.assertEqual(len(fired), 1)
+
+    def test_alternating_processes_see_each_others_samples(self, push):
+        """prefork 下相邻两轮由不同进程评估：缓冲区过期时从数据库重新载入，不会误触发或反复恢复"""
+        first, second = StreamingAlertEvaluator(), StreamingAlertEvaluator()
+        for evaluator, cpu in ((first, 50), (second, 50), (first, 90), (second, 50)):
+            fired, _ = self.tick(evaluator, cpu)
+            self.assertEqual(fired, [])
+        # first 自己的缓冲区里最近的违规是第 0 分钟，上一轮 second 评估的 50 仍在窗口内
+        for evaluator in (first, second, first):
+            fired, _ = self.tick(evaluator, 90)
+            self.assertEqual(fired, [])
+        fired, _ = self.tick(second, 90)
+        self.assertEqual(len(fired), 1)
+
+        # 告警持续期间交替评估不应恢复
+        for evaluator in (first, second, first, second):
+            fired, resolved = self.tick(evaluator, 90)
+            self.assertEqual((fired, resolved), ([], []))
+        self.assertEqual(self.active_alerts().count(), 1)
+
+        _, resolved = self.tick(first, 10)
+        self.assertEqual(len(resolved), 1)
+        # 另一个进程看到恢复后的采样，不会立即再次触发
+        for evaluator in (second, first):
+            fired, _ = self.tick(evaluator, 90)
+            self.assertEqual(fired, [])
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'],
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+@mock.patch('apps.monitoring.audit_query.EXPORT_CHUNK_SIZE', 2)
+class ActivityLogExportTests(TestCase):
+    """审计日志导出：按批查询，ASGI 下返回异步迭代器"""
+
+    url = '/api/monitoring/activity-logs/export/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('audit-admin', password='x', is_staff=True)
+        now = timezone.now()
+        ActivityLog.objects.bulk_create([
+            ActivityLog(action_type='update', description=f'更新 {index}', user=cls.admin,
+                        status='success', created_at=now - timedelta(minutes=index))
+            for index in range(5)
+        ])
+
+    def setUp(self):
+        token = str(RefreshToken.for_user(self.admin).access_token)
+        self.headers = {'headers': {'Authorization': f'Bearer {token}'}}
+
+    def test_wsgi_export_streams_all_rows_in_order(self):
+        response = self.client.get(self.url, {'output': 'ndjson'}, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        chunks = list(response.streaming_content)
+        # 5 行按每批 2 行分 3 批输出
+        self.assertEqual(len(chunks), 3)
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual([json.loads(line)['description'] for line in lines], [f'更新 {index}' for index in range(5)])
+
+    async def test_asgi_export_uses_async_iterator(self):
+        response = await self.async_client.get(self.url, {'output': 'csv'}, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        # 表头 + 3 批
+        self.assertEqual(len(chunks), 4)
+        rows = b''.join(chunks).decode('utf-8-sig').splitlines()
+        self.assertTrue(rows[0].startswith('id,created_at,username'))
+        self.assertEqual(len(rows), 6)
+
+    def test_invalid_user_filter_is_rejected(self):
+        response = self.client.get('/api/monitoring/activity-logs/', {'user': 'abc'}, **self.headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'user': 'abc'}, **self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch('apps.monitoring.audit.atexit.register')
+class AuditLogWriterTests(TestCase):
+    """审计日志写入器：队列满时落盘、数据库不可用时落盘、补写与退出时写完队列"""
+
+    def setUp(self):
+        self.spool_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+        self.writer = AuditLogWriter({
+            **get_audit_config(), 'QUEUE_SIZE': 2, 'PUT_TIMEOUT': 0, 'RETRY_INTERVAL': 30,
+            'SHUTDOWN_TIMEOUT': 1, 'SPOOL_DIR': str(self.spool_dir),
+        })
+        # 不启动真正的后台线程，队列只由测试消费
+        patcher = mock.patch.object(self.writer, '_run')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def entry(self, index):
+        return {
+            'user_id': None, 'ip_address': '10.0.0.1', 'user_agent': 'test', 'path': f'/api/orders/{index}/',
+            'method': 'DELETE', 'status_code': 204, 'resource_name': None, 'changes': None, 'error_message': None,
+            'route': None, 'route_kwargs': None, 'created_at': timezone.now().isoformat(),
+        }
+
+    def spooled_lines(self):
+        return [line for path in self.spool_dir.iterdir() for line in path.read_text(encoding='utf-8').splitlines()]
+
+    def logged_paths(self):
+        return set(ActivityLog.objects.values_list('request_path', flat=True))
+
+    def test_full_queue_spills_and_replays(self, register):
+        for index in range(5):
+            self.writer.submit(self.entry(index))
+
+        # 队列上限 2 条，其余 3 条不等待直接落盘
+        self.assertEqual(self.writer._queue.qsize(), 2)
+        self.assertEqual(
+            [json.loads(line)['path'] for line in self.spooled_lines()],
+            ['/api/orders/2/', '/api/orders/3/', '/api/orders/4/'],
+        )
+        self.assertEqual([path.name for path in self.spool_dir.iterdir()], [f'audit-{os.getpid()}.open'])
+
+        self.assertEqual(self.writer.replay_spool(), 3)
+        self.assertEqual(list(self.spool_dir.iterdir()), [])
+        self.assertEqual(self.logged_paths(), {f'/api/orders/{index}/' for index in (2, 3, 4)})
+
+        # 退出时把队列中剩余的记录写库
+        self.writer.shutdown()
+        self.assertEqual(self.writer._queue.qsize(), 0)
+        self.assertEqual(self.logged_paths(), {f'/api/orders/{index}/' for index in range(5)})
+
+    def test_database_failure_spills_until_retry_interval(self, register):
+        with mock.patch('apps.monitoring.audit.write_entries', side_effect=Exception('database is down')), \
+                mock.patch('apps.monitoring.audit.connection.close'):
+            self.assertFalse(self.writer._flush([self.entry(0), self.entry(1)]))
+        self.assertEqual(len(self.spooled_lines()), 2)
+
+        # 重试间隔内直接落盘，不再尝试写库
+        with mock.patch('apps.monitoring.audit.write_entries') as write:
+            self.writer._flush([self.entry(2)])
+            self.assertEqual(self.writer.replay_spool(), 0)
+            write.assert_not_called()
+        self.assertEqual(len(self.spooled_lines()), 3)
+
+        self.writer._db_unavailable_until = 0
+        self.assertEqual(self.writer.replay_spool(), 3)
+        self.assertEqual(self.logged_paths(), {f'/api/orders/{index}/' for index in range(3)})
+
+    def test_other_process_spool_is_claimed_only_when_stale(self, register):
+        # 其他进程仍在追加的 .open 文件不认领，超过 STALE_SPOOL_SECONDS 未修改后才补写
+        orphan = self.spool_dir / 'audit-999999.open'
+        orphan.write_text(json.dumps(self.entry(7)) + '\n', encoding='utf-8')
+        self.assertEqual(self.writer.replay_spool(), 0)
+        self.assertTrue(orphan.exists())
+
+        stale = orphan.stat().st_mtime - 3600
+        os.utime(orphan, (stale, stale))
+        self.assertEqual(self.writer.replay_spool(), 1)
+        self.assertFalse(orphan.exists())
+        self.assertEqual(self.logged_paths(), {'/api/orders/7/'})
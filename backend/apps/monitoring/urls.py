@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import MonitoringViewSet, AlertRuleViewSet, AlertHistoryViewSet
+from .views import MonitoringViewSet, AlertRuleViewSet, AlertHistoryViewSet, ActivityLogViewSet
 
 router = DefaultRouter()
 router.register(r'alert-rules', AlertRuleViewSet, basename='alert-rules')
 router.register(r'alert-history', AlertHistoryViewSet, basename='alert-history')
+router.register(r'activity-logs', ActivityLogViewSet, basename='activity-logs')
 router.register(r'', MonitoringViewSet, basename='monitoring')
 
 urlpatterns = [
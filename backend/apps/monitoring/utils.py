@@ -1,8 +1,11 @@
 """
 系统监控工具函数
 """
+import os
 import psutil
 import shutil
+import threading
+import time
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
@@ -11,82 +14,131 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# 系统资源采样间隔（秒）与 SystemMetrics 落库间隔（秒，多进程共享）
+RESOURCE_SAMPLE_INTERVAL = 5
+SYSTEM_METRICS_PERSIST_INTERVAL = 60
+
+
+def _empty_resources():
+    return {
+        'cpu_usage': 0,
+        'memory_usage': 0,
+        'disk_usage': 0,
+        'cpu_cores': 0,
+        'memory_total': 0,
+        'memory_available': 0,
+        'disk_total': 0,
+        'disk_free': 0,
+    }
+
+
+def _sample_resources(cpu_interval=None):
+    """采集一次系统资源（cpu_interval 为 None 时 CPU 使用率取自上次调用以来的平均值，不阻塞）"""
+    cpu_percent = psutil.cpu_percent(interval=cpu_interval)
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage('/')
+    return {
+        'cpu_usage': round(cpu_percent, 1),
+        'memory_usage': round(memory.percent, 1),
+        'disk_usage': round(disk.percent, 1),
+        'cpu_cores': psutil.cpu_count(),
+        'memory_total': round(memory.total / (1024**3), 2),  # GB
+        'memory_available': round(memory.available / (1024**3), 2),  # GB
+        'disk_total': round(disk.total / (1024**3), 2),  # GB
+        'disk_free': round(disk.free / (1024**3), 2),  # GB
+    }
+
+
+class SystemResourceSampler:
+    """
+    后台定时采集系统资源，接口直接返回最近一次快照
+
+    每个进程一个采样线程（首次读取时启动，fork 后在子进程中重新启动），
+    各进程中最多一个每分钟把快照写入 SystemMetrics。
+    """
+
+    def __init__(self, interval=RESOURCE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._snapshot = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._snapshot = None
+                self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='system-resource-sampler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self._snapshot = _sample_resources()
+                self._persist(self._snapshot)
+            except Exception as e:
+                logger.warning(f'系统资源采样失败: {str(e)}')
+
+    def _persist(self, snapshot):
+        from django.core.cache import cache
+        from django.db import close_old_connections
+        from .models import SystemMetrics
+
+        if not cache.add('monitoring:system_metrics:persisted', 1, SYSTEM_METRICS_PERSIST_INTERVAL):
+            return
+        close_old_connections()
+        SystemMetrics.objects.create(
+            cpu_usage=snapshot['cpu_usage'],
+            memory_usage=snapshot['memory_usage'],
+            disk_usage=snapshot['disk_usage']
+        )
+
+    def get(self):
+        self._ensure_started()
+        snapshot = self._snapshot
+        if snapshot is None:
+            # 本进程尚未完成第一次采样：短暂阻塞取一次（每个进程只发生一次）
+            snapshot = self._snapshot = _sample_resources(cpu_interval=0.1)
+        return snapshot
+
+
+_resource_sampler = SystemResourceSampler()
+
+
 def get_system_resources():
-    """获取系统资源使用情况"""
+    """获取系统资源使用情况（后台采样的最近快照）"""
     try:
-        # CPU使用率
-        cpu_percent = psutil.cpu_percent(interval=1)
-        
-        # 内存使用率
-        memory = psutil.virtual_memory()
-        memory_percent = memory.percent
-        
-        # 磁盘使用率
-        disk = psutil.disk_usage('/')
-        disk_percent = disk.percent
-        
-        return {
-            'cpu_usage': round(cpu_percent, 1),
-            'memory_usage': round(memory_percent, 1),
-            'disk_usage': round(disk_percent, 1),
-            'cpu_cores': psutil.cpu_count(),
-            'memory_total': round(memory.total / (1024**3), 2),  # GB
-            'memory_available': round(memory.available / (1024**3), 2),  # GB
-            'disk_total': round(disk.total / (1024**3), 2),  # GB
-            'disk_free': round(disk.free / (1024**3), 2),  # GB
-        }
+        return dict(_resource_sampler.get())
     except Exception as e:
         # 如果获取失败，返回默认值
-        return {
-            'cpu_usage': 0,
-            'memory_usage': 0,
-            'disk_usage': 0,
-            'cpu_cores': 0,
-            'memory_total': 0,
-            'memory_available': 0,
-            'disk_total': 0,
-            'disk_free': 0,
-        }
+        return _empty_resources()
 
 
 def get_service_status():
-    """获取服务状态 - 基于真实健康检查数据计算可用性"""
-    from .models import ServiceHealthCheck
-    from django.db.models import Count, Q
+    """获取服务状态 - 基于健康检查任务写入的可用性缓存（见 availability）"""
+    from .availability import get_availability, service_configs
     
     services = []
+    availability_data = get_availability()
     
-    # 服务配置
-    service_configs = [
-        ('django', 'Django应用服务', 'application'),
-        ('database', '数据库服务', 'database'),
-        ('cache', '缓存服务', 'cache'),
-        ('celery', '任务队列服务', 'queue'),
-    ]
-    
-    # 获取最近24小时的健康检查记录
-    time_threshold = timezone.now() - timedelta(hours=24)
-    
-    for service_key, service_name, service_type in service_configs:
-        # 查询该服务的健康检查记录
-        checks = ServiceHealthCheck.objects.filter(
-            service_name=service_key,
-            checked_at__gte=time_threshold
-        )
-        
-        total_checks = checks.count()
-        healthy_checks = checks.filter(is_healthy=True).count()
-        
-        # 获取最新状态
-        latest_check = checks.first()  # 已按 checked_at 降序排列
+    for service_key, service_name, service_type in service_configs():
+        data = availability_data[service_key]
+        total_checks = data['checked']
+        latest_check = data['latest']
         
         if total_checks > 0:
             # 计算真实可用性百分比
-            availability = (healthy_checks / total_checks) * 100
+            availability = (data['healthy'] / total_checks) * 100
             uptime = f"{availability:.1f}%"
             
             # 基于最新检查确定当前状态
-            if latest_check and latest_check.is_healthy:
+            if latest_check and latest_check['is_healthy']:
                 status = 'running'
             else:
                 status = 'error' if availability < 50 else 'warning'
@@ -158,121 +210,164 @@ def calculate_system_health():
         return 0.0
 
 
+# 告警指标类型 -> VMMetricHistory 字段
+ALERT_METRIC_FIELDS = {
+    'cpu': 'cpu_usage',
+    'memory': 'memory_usage',
+    'network_in': 'network_in_rate',
+    'network_out': 'network_out_rate',
+}
+
+
+def _window_aggregates(duration, now, vm_ids=None):
+    """
+    一条分组聚合查询取得窗口内每台虚拟机各指标的最小/最大值
+
+    Returns:
+        dict: {vm_id: {'cpu_usage__min': ..., 'cpu_usage__max': ..., ...}}
+    """
+    from .models import VMMetricHistory
+    from django.db.models import Max, Min
+
+    queryset = VMMetricHistory.objects.filter(timestamp__gte=now - timedelta(minutes=duration))
+    if vm_ids is not None:
+        queryset = queryset.filter(virtual_machine_id__in=vm_ids)
+
+    aggregates = {}
+    for field in ALERT_METRIC_FIELDS.values():
+        aggregates[f'{field}__min'] = Min(field)
+        aggregates[f'{field}__max'] = Max(field)
+    return {
+        row['virtual_machine_id']: row
+        for row in queryset.order_by().values('virtual_machine_id').annotate(**aggregates)
+    }
+
+
+def _latest_values(vm_ids, since):
+    """取得每台虚拟机窗口内最新一条监控数据（只针对需要新建告警的虚拟机）"""
+    from .models import VMMetricHistory
+
+    latest = {}
+    rows = VMMetricHistory.objects.filter(
+        virtual_machine_id__in=vm_ids, timestamp__gte=since
+    ).order_by('virtual_machine_id', '-timestamp').values('virtual_machine_id', *ALERT_METRIC_FIELDS.values())
+    for row in rows:
+        latest.setdefault(row['virtual_machine_id'], row)
+    return latest
+
+
 def check_vm_alerts(vm_id=None):
     """
     检查虚拟机告警规则
     
+    所有规则一次性批量评估：每种持续时间一条分组聚合查询得到窗口内各指标的最小/最大值
+    （gt 规则要求窗口最小值大于阈值，lt 规则要求窗口最大值小于阈值），
+    活跃告警一次查询载入，新告警批量创建，已恢复告警批量更新，查询数与虚拟机数量无关。
+    
     Args:
         vm_id: 可选，指定虚拟机ID。如果为None，检查所有虚拟机
     
     Returns:
         list: 触发的告警列表
     """
-    from .models import AlertRule, AlertHistory, VMMetricHistory
+    from .models import AlertRule, AlertHistory
     from apps.information_systems.models import VirtualMachine
     from django.db import models
     
-    triggered_alerts = []
-    
     try:
-        # 获取所有启用的告警规则
-        rules = AlertRule.objects.filter(enabled=True)
+        now = timezone.now()
         
+        # 获取所有启用的告警规则
+        rules = AlertRule.objects.filter(enabled=True, metric_type__in=ALERT_METRIC_FIELDS.keys())
         if vm_id:
             # 过滤特定虚拟机的规则（全局规则 + 该VM专属规则）
             rules = rules.filter(
                 models.Q(virtual_machine_id=vm_id) | models.Q(virtual_machine__isnull=True)
             )
+        rules = list(rules)
+        if not rules:
+            return []
+        
+        # 确定要检查的虚拟机：全局规则检查所有运行中的虚拟机（或指定虚拟机），专属规则检查其关联虚拟机
+        specific_vm_ids = {rule.virtual_machine_id for rule in rules if rule.virtual_machine_id}
+        if vm_id:
+            vm_filter = models.Q(id=vm_id)
+        else:
+            vm_filter = models.Q(status='running') | models.Q(id__in=specific_vm_ids)
+        vms = {vm.id: vm for vm in VirtualMachine.objects.filter(vm_filter).only('id', 'name', 'status')}
+        global_vm_ids = [
+            vm.id for vm in vms.values()
+            if vm_id or vm.status == VirtualMachine.VMStatus.RUNNING
+        ]
+        
+        # 每种持续时间一条聚合查询
+        windows = {
+            duration: _window_aggregates(duration, now, list(vms.keys()))
+            for duration in {rule.duration for rule in rules}
+        }
+        
+        # 一次载入相关的活跃告警
+        active_alerts = {}
+        for alert in AlertHistory.objects.filter(
+            rule__in=rules, virtual_machine_id__in=vms.keys(), status='active'
+        ).select_related('rule'):
+            active_alerts.setdefault((alert.rule_id, alert.virtual_machine_id), []).append(alert)
         
+        to_trigger = []
+        to_resolve = []
         for rule in rules:
-            # 确定要检查的虚拟机列表
-            vms_to_check = []
-            if rule.virtual_machine:
-                vms_to_check = [rule.virtual_machine]
-            else:
-                # 全局规则：检查所有虚拟机
-                if vm_id:
-                    vms_to_check = [VirtualMachine.objects.get(id=vm_id)]
-                else:
-                    vms_to_check = VirtualMachine.objects.filter(status='running')
+            field_name = ALERT_METRIC_FIELDS[rule.metric_type]
+            target_ids = [rule.virtual_machine_id] if rule.virtual_machine_id else global_vm_ids
+            window = windows[rule.duration]
             
-            for vm in vms_to_check:
-                # 获取该虚拟机最近的监控数据
-                duration_ago = timezone.now() - timedelta(minutes=rule.duration)
-                recent_metrics = VMMetricHistory.objects.filter(
-                    virtual_machine=vm,
-                    timestamp__gte=duration_ago
-                ).order_by('-timestamp')
-                
-                if not recent_metrics.exists():
-                    continue
-                
-                # 检查是否持续超过阈值
-                metric_field_map = {
-                    'cpu': 'cpu_usage',
-                    'memory': 'memory_usage',
-                    'network_in': 'network_in_rate',
-                    'network_out': 'network_out_rate',
-                }
-                
-                field_name = metric_field_map.get(rule.metric_type)
-                if not field_name:
+            for target_id in target_ids:
+                stats = window.get(target_id)
+                if target_id not in vms or stats is None:
+                    # 窗口内没有监控数据，保持现状
                     continue
                 
                 # 检查是否所有采样点都满足告警条件
-                all_exceed = True
-                latest_value = None
-                
-                for metric in recent_metrics:
-                    value = getattr(metric, field_name, 0)
-                    if latest_value is None:
-                        latest_value = value
-                    
-                    if rule.operator == 'gt':
-                        if value <= rule.threshold:
-                            all_exceed = False
-                            break
-                    elif rule.operator == 'lt':
-                        if value >= rule.threshold:
-                            all_exceed = False
-                            break
-                
-                # 如果触发告警
-                if all_exceed and latest_value is not None:
-                    # 检查是否已有活跃告警
-                    existing_alert = AlertHistory.objects.filter(
-                        rule=rule,
-                        virtual_machine=vm,
-                        status='active'
-                    ).first()
-                    
-                    if not existing_alert:
-                        # 创建新告警
-                        operator_text = '大于' if rule.operator == 'gt' else '小于'
-                        alert = AlertHistory.objects.create(
-                            rule=rule,
-                            virtual_machine=vm,
-                            metric_value=latest_value,
-                            message=f"虚拟机 {vm.name} 的 {rule.get_metric_type_display()} "
-                                   f"{operator_text} {rule.threshold}%，当前值: {latest_value}%，"
-                                   f"已持续 {rule.duration} 分钟",
-                            status='active'
-                        )
-                        triggered_alerts.append(alert)
-                        logger.warning(f"告警触发: {alert.message}")
+                if rule.operator == 'gt':
+                    all_exceed = stats[f'{field_name}__min'] > rule.threshold
+                else:
+                    all_exceed = stats[f'{field_name}__max'] < rule.threshold
                 
-                # 如果不再触发，恢复已有的活跃告警
-                elif not all_exceed:
-                    active_alerts = AlertHistory.objects.filter(
-                        rule=rule,
-                        virtual_machine=vm,
-                        status='active'
-                    )
-                    for alert in active_alerts:
-                        alert.status = 'resolved'
-                        alert.resolved_at = timezone.now()
-                        alert.save()
-                        logger.info(f"告警已恢复: {alert.message}")
+                existing = active_alerts.get((rule.id, target_id))
+                if all_exceed and not existing:
+                    to_trigger.append((rule, vms[target_id]))
+                elif not all_exceed and existing:
+                    to_resolve.extend(existing)
+        
+        # 批量创建新告警
+        triggered_alerts = []
+        if to_trigger:
+            since = now - timedelta(minutes=max(rule.duration for rule, _ in to_trigger))
+            latest = _latest_values({vm.id for _, vm in to_trigger}, since)
+            for rule, vm in to_trigger:
+                latest_value = latest.get(vm.id, {}).get(ALERT_METRIC_FIELDS[rule.metric_type])
+                if latest_value is None:
+                    continue
+                operator_text = '大于' if rule.operator == 'gt' else '小于'
+                triggered_alerts.append(AlertHistory(
+                    rule=rule,
+                    virtual_machine=vm,
+                    metric_value=latest_value,
+                    message=f"虚拟机 {vm.name} 的 {rule.get_metric_type_display()} "
+                           f"{operator_text} {rule.threshold}%，当前值: {latest_value}%，"
+                           f"已持续 {rule.duration} 分钟",
+                    status='active'
+                ))
+            triggered_alerts = AlertHistory.objects.bulk_create(triggered_alerts)
+            for alert in triggered_alerts:
+                logger.warning(f"告警触发: {alert.message}")
+        
+        # 批量恢复不再触发的告警
+        if to_resolve:
+            AlertHistory.objects.filter(id__in=[alert.id for alert in to_resolve]).update(
+                status='resolved', resolved_at=now
+            )
+            for alert in to_resolve:
+                logger.info(f"告警已恢复: {alert.message}")
         
         return triggered_alerts
         
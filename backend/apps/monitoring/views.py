@@ -2,11 +2,14 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import timedelta
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import SystemMetrics, ActivityLog, VMMetricHistory, AlertRule, AlertHistory
-from .serializers import AlertRuleSerializer, AlertHistorySerializer
+from .models import ActivityLog, VMMetricHistory, AlertRule, AlertHistory
+from .serializers import ActivityLogSerializer, AlertRuleSerializer, AlertHistorySerializer
+from .audit_query import EXPORT_FORMATS, KeysetPagination, aiter_export, filter_activity_logs, iter_export
 from .utils import get_system_resources, get_service_status, calculate_system_health
 import logging
 
@@ -25,17 +28,8 @@ class MonitoringViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def resources(self, request):
-        """获取系统资源使用情况"""
-        resources = get_system_resources()
-        
-        # 保存到数据库（可选）
-        SystemMetrics.objects.create(
-            cpu_usage=resources['cpu_usage'],
-            memory_usage=resources['memory_usage'],
-            disk_usage=resources['disk_usage']
-        )
-        
-        return Response(resources)
+        """获取系统资源使用情况（后台采样快照，SystemMetrics 由采样线程每分钟保存）"""
+        return Response(get_system_resources())
 
     @action(detail=False, methods=['get'])
     def services(self, request):
@@ -47,6 +41,16 @@ class MonitoringViewSet(viewsets.ViewSet):
             'running': sum(1 for s in services if s['status'] == 'running')
         })
 
+    @action(detail=False, methods=['get'], url_path='service-latency')
+    def service_latency(self, request):
+        """服务探测延迟分布（每小时窗口的 p50/p95/p99 及整体汇总，单位毫秒）"""
+        from .latency import latency_report
+        try:
+            hours = min(max(int(request.query_params.get('hours', 24)), 1), 24 * 90)
+        except ValueError:
+            return Response({'error': 'hours 必须为整数'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(latency_report(hours, request.query_params.get('service')))
+
     @action(detail=False, methods=['get'])
     def health(self, request):
         """获取系统健康度"""
@@ -59,7 +63,11 @@ class MonitoringViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def activities(self, request):
         """获取最近活动"""
-        limit = int(request.query_params.get('limit', 10))
+        # 大范围浏览和导出请使用 activity-logs 接口（游标分页/流式导出）
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 500)
+        except ValueError:
+            limit = 10
         full_details = request.query_params.get('full', 'false').lower() == 'true'
         
         # 支持过滤
@@ -169,6 +177,12 @@ class MonitoringViewSet(viewsets.ViewSet):
             'timestamp': timezone.now().isoformat()
         })
 
+    @action(detail=False, methods=['get'])
+    def dashboard(self, request):
+        """管理仪表盘汇总（信息系统、租户、合同、产品、订阅统计，一次请求获取）"""
+        from .dashboard import dashboard_payload
+        return Response(dashboard_payload())
+
     @action(detail=False, methods=['get'], url_path='vm-history')
     def vm_history(self, request):
         """获取虚拟机历史监控数据"""
@@ -197,27 +211,23 @@ class MonitoringViewSet(viewsets.ViewSet):
             start_time = now - timedelta(hours=4)
         elif time_range == '7d':
             start_time = now - timedelta(days=7)
+        elif time_range == '30d':
+            start_time = now - timedelta(days=30)
         else:  # 24h
             start_time = now - timedelta(hours=24)
-            
-        history = VMMetricHistory.objects.filter(
-            virtual_machine_id=vm_id,
-            timestamp__gte=start_time
-        ).order_by('timestamp')
         
-        data = [{
-            'timestamp': h.timestamp.isoformat(),
-            'cpu_usage': h.cpu_usage,
-            'memory_usage': h.memory_usage,
-            'network_in': h.network_in_rate,
-            'network_out': h.network_out_rate
-        } for h in history]
+        # 按时间范围自动选择粒度（raw/5m/1h/1d），也可通过 resolution 参数指定
+        from .rollup import query_series, RESOLUTION_SECONDS
+        resolution = request.query_params.get('resolution')
+        if resolution not in RESOLUTION_SECONDS:
+            resolution = None
+        resolution, data = query_series(vm_id, start_time, now, resolution)
         
         # 如果没有历史数据，获取实时数据
         if not data:
             try:
-                from apps.openstack.services import OpenStackService
-                openstack_service = OpenStackService()
+                from apps.openstack.services import get_openstack_service
+                openstack_service = get_openstack_service()
                 
                 # 获取虚拟机的 OpenStack ID
                 if vm.openstack_id:
@@ -234,7 +244,9 @@ class MonitoringViewSet(viewsets.ViewSet):
             except Exception as e:
                 logger.warning(f"无法获取虚拟机 {vm_id} 的实时监控数据: {e}")
         
-        return Response(data)
+        response = Response(data)
+        response['X-Metric-Resolution'] = resolution
+        return response
 
 
 class AlertRuleViewSet(viewsets.ModelViewSet):
@@ -267,3 +279,33 @@ class AlertHistoryViewSet(viewsets.ReadOnlyModelViewSet):
             return AlertHistory.objects.all()
         return AlertHistory.objects.none()
 
+
+class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    审计日志查询（游标分页）
+
+    查询参数: action_type、resource_type、resource_id、user、status、start、end、search、
+    page_size、cursor（取上一页响应中的 next）
+    """
+    serializer_class = ActivityLogSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = KeysetPagination
+    # 排序固定为 (created_at, id) 倒序，过滤与搜索见 audit_query
+    filter_backends = []
+
+    def get_queryset(self):
+        return filter_activity_logs(ActivityLog.objects.select_related('user'), self.request.query_params)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """流式导出（output=ndjson|csv），过滤条件与列表相同"""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response({'error': 'output 只支持 ndjson 或 csv'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = filter_activity_logs(ActivityLog.objects.all(), request.query_params)
+        timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
+        # ASGI 下同步迭代器会被整体读入内存后才发送，需要异步迭代器
+        content = aiter_export(queryset, output) if isinstance(request._request, ASGIRequest) else iter_export(queryset, output)
+        response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="activity_logs_{timestamp}.{output}"'
+        return response
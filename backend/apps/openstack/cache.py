@@ -0,0 +1,103 @@
+"""
+OpenStack目录数据缓存
+
+规格、镜像、网络、可用区等目录数据变化很少，却位于门户创建虚拟机等热点路径上。
+这里提供基于 Django 缓存（Redis，多进程共享）的读穿透缓存：
+  - 每类资源一个版本号，写操作只需递增版本号即可让该类资源的全部缓存失效
+  - 每类资源独立的 TTL，可通过 settings.OPENSTACK_CACHE_TTL 覆盖
+  - 空结果（失败时服务方法返回 []/None）以及无连接时的模拟数据不写入缓存
+"""
+
+import functools
+import hashlib
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# 各类资源默认缓存时长（秒）
+DEFAULT_CACHE_TTL = {
+    'flavors': 3600,
+    'images': 300,
+    'networks': 300,
+    'availability_zones': 600,
+    'security_groups': 120,
+}
+
+CACHE_PREFIX = 'openstack:catalog'
+
+
+def _region():
+    return settings.OPENSTACK_CONFIG.get('REGION_NAME') or 'default'
+
+
+def _version_key(resource):
+    return f'{CACHE_PREFIX}:{_region()}:{resource}:version'
+
+
+def _get_version(resource):
+    """获取资源当前的缓存版本号（不存在时以毫秒时间戳初始化，避免与已失效的旧版本重复）"""
+    return cache.get_or_set(_version_key(resource), lambda: int(time.time() * 1000), timeout=None)
+
+
+def get_ttl(resource):
+    ttl_config = getattr(settings, 'OPENSTACK_CACHE_TTL', {})
+    return ttl_config.get(resource, DEFAULT_CACHE_TTL.get(resource, 300))
+
+
+def invalidate(*resources):
+    """使指定资源类型的全部缓存失效"""
+    for resource in resources:
+        try:
+            cache.incr(_version_key(resource))
+        except ValueError:
+            # 版本号不存在（从未缓存或已被淘汰），无需处理
+            pass
+        except Exception as e:
+            logger.warning(f'清除OpenStack {resource} 缓存失败: {str(e)}')
+
+
+def cached_catalog(resource, timeout=None):
+    """
+    OpenStackService 方法的读穿透缓存装饰器
+
+    缓存键由资源类型、版本号、方法名和调用参数组成。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                arg_digest = hashlib.md5(repr((args, sorted(kwargs.items()))).encode('utf-8')).hexdigest()
+                key = f'{CACHE_PREFIX}:{_region()}:{resource}:{_get_version(resource)}:{func.__name__}:{arg_digest}'
+                value = cache.get(key)
+            except Exception as e:
+                logger.warning(f'读取OpenStack {resource} 缓存失败: {str(e)}')
+                return func(self, *args, **kwargs)
+
+            if value is not None:
+                return value
+
+            value = func(self, *args, **kwargs)
+            if value and self.connection is not None:
+                try:
+                    cache.set(key, value, timeout or get_ttl(resource))
+                except Exception as e:
+                    logger.warning(f'写入OpenStack {resource} 缓存失败: {str(e)}')
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidates_catalog(*resources):
+    """写操作装饰器：方法执行后（无论成功与否）使相关资源缓存失效"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                invalidate(*resources)
+        return wrapper
+    return decorator
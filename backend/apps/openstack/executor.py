@@ -0,0 +1,139 @@
+"""
+OpenStack批量电源操作执行器
+
+批量启动/停止/重启/删除虚拟机时，先以有限并发把所有操作一次性提交给 Nova，
+再统一轮询这一批虚拟机直到全部到达目标状态（或超时），
+总耗时约等于最慢的一台，而不是逐台等待的累加。
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .services import get_openstack_service
+
+logger = logging.getLogger(__name__)
+
+# 轮询间隔（秒）
+POLL_INTERVAL = 1
+
+# 各操作等待完成的超时时间（秒），None 表示提交后不等待
+ACTION_TIMEOUTS = {
+    'start': 60,
+    'stop': 60,
+    'reboot': 120,
+    'delete': None,
+}
+
+
+def _submit(service, action_type, server_id, options):
+    """在工作线程中提交单个操作（不等待完成）"""
+    with service.checkout():
+        if action_type == 'start':
+            return service.start_server(server_id, wait=False)
+        if action_type == 'stop':
+            return service.stop_server(server_id, wait=False)
+        if action_type == 'reboot':
+            return service.reboot_server(server_id, options.get('reboot_type', 'SOFT'), wait=False)
+        if action_type == 'delete':
+            return service.delete_server(server_id)
+
+
+def _fetch_status(service, server_id):
+    with service.checkout():
+        server = service.get_server(server_id)
+        return server.get('status') if server else None
+
+
+def _is_done(action_type, status, seen_transition, elapsed):
+    """判断单台虚拟机的操作是否已完成"""
+    if status == 'ERROR':
+        return True
+    if action_type == 'start':
+        return status == 'ACTIVE'
+    if action_type == 'stop':
+        return status == 'SHUTOFF'
+    if action_type == 'reboot':
+        # 重启时先变为 REBOOT/HARD_REBOOT，再回到 ACTIVE；
+        # 5秒后仍是 ACTIVE 可能没有观察到中间状态，也认为完成
+        return status == 'ACTIVE' and (seen_transition or elapsed > 5)
+    return True
+
+
+def run_server_actions(action_type, server_ids, wait=True, timeout=None, max_workers=None, **options):
+    """
+    并发执行批量电源操作
+
+    Args:
+        action_type: start / stop / reboot / delete
+        server_ids: OpenStack 服务器 ID 列表
+        wait: 是否等待这一批虚拟机到达目标状态
+        timeout: 等待超时时间（秒），默认按操作类型取 ACTION_TIMEOUTS
+        max_workers: 最大并发数，默认不超过 OpenStack 连接池大小
+        **options: 操作参数（如 reboot_type）
+
+    Returns:
+        dict: {'success': [server_id, ...], 'failed': [{'id': server_id, 'error': str}, ...], 'total': int}
+        等待超时不视为失败（与逐台调用 wait=True 时的行为一致）
+    """
+    results = {
+        'success': [],
+        'failed': [],
+        'total': len(server_ids)
+    }
+    if not server_ids:
+        return results
+
+    if action_type not in ACTION_TIMEOUTS:
+        results['failed'] = [{'id': server_id, 'error': '未知操作类型'} for server_id in server_ids]
+        return results
+
+    service = get_openstack_service()
+    workers = min(len(server_ids), max_workers or service.pool.max_size)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'openstack-{action_type}') as executor:
+        # 1. 一次性提交全部操作
+        futures = {
+            server_id: executor.submit(_submit, service, action_type, server_id, options)
+            for server_id in server_ids
+        }
+        for server_id, future in futures.items():
+            try:
+                if future.result():
+                    results['success'].append(server_id)
+                else:
+                    results['failed'].append({'id': server_id, 'error': '操作失败'})
+            except Exception as e:
+                results['failed'].append({'id': server_id, 'error': str(e)})
+
+        timeout = timeout if timeout is not None else ACTION_TIMEOUTS[action_type]
+        if not wait or not timeout or not results['success']:
+            return results
+
+        # 2. 统一等待这一批虚拟机完成
+        pending = set(results['success'])
+        seen_transition = set()
+        start_time = time.time()
+        while pending and time.time() - start_time < timeout:
+            time.sleep(POLL_INTERVAL)
+            elapsed = time.time() - start_time
+            status_futures = {
+                server_id: executor.submit(_fetch_status, service, server_id) for server_id in pending
+            }
+            for server_id, future in status_futures.items():
+                try:
+                    server_status = future.result()
+                except Exception as e:
+                    logger.warning(f"查询服务器状态失败: {server_id}, {str(e)}")
+                    continue
+                if server_status in ('REBOOT', 'HARD_REBOOT'):
+                    seen_transition.add(server_id)
+                if _is_done(action_type, server_status, server_id in seen_transition, elapsed):
+                    pending.discard(server_id)
+
+        if pending:
+            logger.warning(f"等待批量{action_type}操作完成超时，仍有 {len(pending)} 台未完成: {sorted(pending)}")
+        else:
+            logger.info(f"批量{action_type}操作完成: {len(results['success'])} 台，耗时 {time.time() - start_time:.1f}s")
+
+    return results
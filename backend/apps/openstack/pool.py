@@ -0,0 +1,160 @@
+"""
+OpenStack连接池
+
+每个 openstack.connection.Connection 持有一个已认证的 keystoneauth 会话（HTTP 连接池 + token）。
+连接池维护有上限的一组连接，借出时检查 token 是否即将过期并提前刷新，归还后供其他线程复用，
+使并发的 API 请求和 Celery 任务既不必重复认证，也不会争用同一个 HTTP 会话。
+"""
+
+import logging
+import os
+import threading
+import time
+import openstack
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """
+    有界的 OpenStack 连接池（后进先出，优先复用最近使用过的连接）
+
+    Args:
+        config: settings.OPENSTACK_CONFIG
+        max_size: 最多同时存在的连接（会话）数
+        checkout_timeout: 连接全部借出时等待归还的最长时间（秒）
+        refresh_margin: token 剩余有效期小于该值（秒）时在借出前重新认证
+        retry_interval: 创建连接失败后，在该时间（秒）内不再尝试连接 Keystone
+    """
+
+    def __init__(self, config, max_size=10, checkout_timeout=10, refresh_margin=300, retry_interval=30):
+        self.config = config
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self._reset()
+
+    def _reset(self):
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._retry_at = 0
+        self._pid = os.getpid()
+        # 每次重置递增，用于识别重置前借出的连接
+        self.generation = getattr(self, 'generation', 0) + 1
+
+    def _check_fork(self):
+        """fork 出的子进程（如 Celery prefork worker）不能复用父进程的 HTTP 连接"""
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _create(self):
+        """创建并认证一个新连接，失败时返回 None"""
+        try:
+            conn = openstack.connect(
+                auth={
+                    'auth_url': self.config['AUTH_URL'],
+                    'username': self.config['USERNAME'],
+                    'password': self.config['PASSWORD'],
+                    'project_name': self.config['PROJECT_NAME'],
+                    'user_domain_name': self.config['USER_DOMAIN_NAME'],
+                    'project_domain_name': self.config['PROJECT_DOMAIN_NAME'],
+                },
+                region_name=self.config['REGION_NAME'],
+                interface=self.config['INTERFACE'],
+                identity_api_version=self.config['IDENTITY_API_VERSION'],
+            )
+            conn.authorize()
+            logger.info("OpenStack连接成功")
+            return conn
+        except Exception as e:
+            logger.warning(f"OpenStack连接失败，将使用模拟数据: {str(e)}")
+            logger.warning(f"连接配置: AUTH_URL={self.config['AUTH_URL']}, USERNAME={self.config['USERNAME']}, PROJECT_NAME={self.config['PROJECT_NAME']}")
+            return None
+
+    def _ensure_fresh(self, conn):
+        """token 即将过期时提前重新认证，失败返回 False"""
+        try:
+            auth = conn.session.auth
+            auth_ref = getattr(auth, 'auth_ref', None)
+            if auth_ref is None or auth_ref.will_expire_soon(self.refresh_margin):
+                auth.invalidate()
+                conn.authorize()
+                logger.debug("OpenStack token 即将过期，已重新认证")
+            return True
+        except Exception as e:
+            logger.warning(f"刷新OpenStack token失败: {str(e)}")
+            return False
+
+    def acquire(self):
+        """
+        借出一个连接
+
+        Returns:
+            Connection 或 None（无法连接 OpenStack 或等待超时）
+        """
+        self._check_fork()
+        deadline = time.monotonic() + self.checkout_timeout
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    if time.monotonic() < self._retry_at:
+                        return None
+                    # 先占位再在锁外创建，避免认证过程阻塞其他线程归还/借出
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"OpenStack连接池已耗尽（{self.max_size} 个连接均在使用中），等待超时")
+                    return None
+                self._cond.wait(remaining)
+
+        if conn is None:
+            conn = self._create()
+            if conn is None:
+                with self._cond:
+                    self._size -= 1
+                    self._retry_at = time.monotonic() + self.retry_interval
+                    self._cond.notify()
+            return conn
+
+        if not self._ensure_fresh(conn):
+            self.discard(conn)
+            return self.acquire()
+        return conn
+
+    def release(self, conn, generation=None):
+        """归还连接"""
+        if generation is not None and generation != self.generation:
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def discard(self, conn, generation=None):
+        """丢弃已损坏的连接，释放其占用的名额"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        if generation is not None and generation != self.generation:
+            return
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def stats(self):
+        """连接池状态"""
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            }
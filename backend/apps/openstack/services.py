@@ -3,62 +3,88 @@ OpenStack服务集成
 """
 
 import logging
+import threading
+import weakref
+from contextlib import contextmanager
 from typing import Dict, List, Optional, Any
+from celery.signals import task_postrun
 from django.conf import settings
+from django.core.signals import request_finished
 from django.utils import timezone
 import openstack
 from openstack.config import cloud_region
 from openstack import connection
 from openstack.exceptions import SDKException
 
+from .cache import cached_catalog, invalidates_catalog
+from .pool import ConnectionPool
+
 logger = logging.getLogger(__name__)
 
 
-class OpenStackService:
-    """OpenStack服务类"""
+class _Checkout:
+    """当前线程借出的连接；线程结束被回收时自动归还连接池"""
 
-    def __init__(self):
-        """初始化OpenStack连接"""
-        self.config = settings.OPENSTACK_CONFIG
-        self.connection = None
-        self._connect()
-
-    def _connect(self):
-        """创建OpenStack连接"""
-        try:
-            # 创建连接配置
-            auth_args = {
-                'auth_url': self.config['AUTH_URL'],
-                'username': self.config['USERNAME'],
-                'password': self.config['PASSWORD'],
-                'project_name': self.config['PROJECT_NAME'],
-                'user_domain_name': self.config['USER_DOMAIN_NAME'],
-                'project_domain_name': self.config['PROJECT_DOMAIN_NAME'],
-            }
+    def __init__(self, pool, conn):
+        self.connection = conn
+        self.finalizer = weakref.finalize(self, pool.release, conn, pool.generation)
 
-            # 创建连接
-            self.connection = openstack.connect(
-                auth=auth_args,
-                region_name=self.config['REGION_NAME'],
-                interface=self.config['INTERFACE'],
-                identity_api_version=self.config['IDENTITY_API_VERSION'],
-            )
 
-            # 验证连接
-            self.connection.authorize()
-            logger.info("OpenStack连接成功")
+class OpenStackService:
+    """OpenStack服务类
 
-        except Exception as e:
-            logger.warning(f"OpenStack连接失败，将使用模拟数据: {str(e)}")
-            logger.warning(f"连接配置: AUTH_URL={self.config['AUTH_URL']}, USERNAME={self.config['USERNAME']}, PROJECT_NAME={self.config['PROJECT_NAME']}")
-            # 不抛出异常，允许使用模拟数据
-            self.connection = None
+    连接由连接池管理：每个线程在第一次调用 API 时借出一个已认证的连接并一直使用到
+    release_connection()（请求结束 / Celery 任务结束时自动调用，线程退出时也会自动归还）。
+    """
 
-    def get_connection(self) -> connection.Connection:
-        """获取OpenStack连接"""
-        if self.connection is None:
-            self._connect()
-        return self.connection
+    def __init__(self):
+        """初始化OpenStack连接池"""
+        self.config = settings.OPENSTACK_CONFIG
+        pool_config = getattr(settings, 'OPENSTACK_POOL', {})
+        self.pool = ConnectionPool(
+            self.config,
+            max_size=pool_config.get('MAX_SIZE', 10),
+            checkout_timeout=pool_config.get('CHECKOUT_TIMEOUT', 10),
+            refresh_margin=pool_config.get('TOKEN_REFRESH_MARGIN', 300),
+            retry_interval=pool_config.get('RETRY_INTERVAL', 30),
+        )
+        self._local = threading.local()
+
+    def get_connection(self) -> Optional[connection.Connection]:
+        """获取当前线程的OpenStack连接（首次调用时从连接池借出）"""
+        checkout = getattr(self._local, 'checkout', None)
+        if checkout is not None and checkout.finalizer.alive:
+            return checkout.connection
+
+        conn = self.pool.acquire()
+        if conn is not None:
+            self._local.checkout = _Checkout(self.pool, conn)
+        return conn
+
+    def release_connection(self):
+        """将当前线程借出的连接归还连接池"""
+        checkout = getattr(self._local, 'checkout', None)
+        if checkout is not None:
+            self._local.checkout = None
+            checkout.finalizer()
+
+    @contextmanager
+    def checkout(self):
+        """
+        在代码块内为当前线程借出连接，退出时归还（用于自建线程/线程池中的任务）
+        如果当前线程已持有连接，则沿用且退出时不归还
+        """
+        owned = getattr(self._local, 'checkout', None) is None
+        try:
+            yield self.get_connection()
+        finally:
+            if owned:
+                self.release_connection()
+
+    @property
+    def connection(self) -> Optional[connection.Connection]:
+        """当前线程使用的连接（无法连接时为 None）"""
+        return self.get_connection()
 
     # ==================== 项目管理 ====================
 
@@ -117,6 +143,7 @@ class OpenStackService:
 
     # ==================== 计算服务 ====================
 
+    @cached_catalog('availability_zones')
     def list_availability_zones(self) -> List[Dict[str, Any]]:
         """获取可用区列表"""
         try:
@@ -191,11 +218,13 @@ class OpenStackService:
     # ==================== 实例管理 ====================
 
     def create_server(self, name: str, image_id: str, flavor_id: str,
-                      network_ids: List[str], **kwargs) -> Dict[str, Any]:
+                      network_ids: List[str], wait: bool = True, **kwargs) -> Dict[str, Any]:
         """创建服务器实例（从镜像启动）
         
         使用传统方式：直接传入 image_id，让 Nova 自动处理启动方式
         这与 Horizon 的"不创建新卷"选项行为一致
+
+        wait=False 时提交后立即返回（状态为 BUILD），由调用方轮询完成状态
         """
         try:
             conn = self.get_connection()
@@ -221,7 +250,8 @@ class OpenStackService:
             )
 
             # 等待服务器创建完成
-            conn.compute.wait_for_server(server)
+            if wait:
+                conn.compute.wait_for_server(server)
 
             logger.info(f"创建服务器成功: {server.name} ({server.id})")
             return server.to_dict()
@@ -259,6 +289,31 @@ class OpenStackService:
             logger.error(f"列出服务器失败: {str(e)}")
             return []
 
+    def list_servers_detailed(self, all_tenants: bool = True, changes_since: str = None) -> List[Dict[str, Any]]:
+        """一次性列出服务器详情（用于批量对账）
+
+        与 list_servers 不同，连接不可用或请求失败时抛出异常而不是返回空列表/模拟数据，
+        避免对账时把"获取失败"误判为"虚拟机已被删除"。
+
+        Args:
+            all_tenants: 是否查询所有租户的服务器
+            changes_since: ISO 8601 时间，只返回该时间之后发生变化的服务器（包括已删除的，状态为 DELETED）
+        """
+        conn = self.get_connection()
+        if conn is None:
+            raise SDKException("OpenStack连接不可用")
+
+        query = {'all_tenants': all_tenants}
+        if changes_since:
+            query['changes_since'] = changes_since
+
+        try:
+            servers = conn.compute.servers(details=True, **query)
+            return [server.to_dict() for server in servers]
+        except Exception as e:
+            logger.error(f"列出服务器详情失败: {str(e)}")
+            raise SDKException(f"列出服务器详情失败: {str(e)}")
+
     def get_server(self, server_id: str) -> Optional[Dict[str, Any]]:
         """获取服务器详情"""
         try:
@@ -544,6 +599,7 @@ class OpenStackService:
 
     # ==================== 镜像管理 ====================
 
+    @cached_catalog('images')
     def list_images(self, include_snapshots: bool = False) -> List[Dict[str, Any]]:
         """列出镜像
         
@@ -627,6 +683,7 @@ class OpenStackService:
             logger.error(f"获取镜像失败: {str(e)}")
             return None
 
+    @invalidates_catalog('images')
     def create_image(self, name: str, disk_format: str = 'qcow2', 
                     container_format: str = 'bare', visibility: str = 'private',
                     min_disk: int = 0, min_ram: int = 0, 
@@ -655,6 +712,7 @@ class OpenStackService:
             logger.error(f"创建镜像失败: {str(e)}")
             raise SDKException(f"创建镜像失败: {str(e)}")
 
+    @invalidates_catalog('images')
     def upload_image(self, image_id: str, data) -> bool:
         """上传镜像数据
         
@@ -717,6 +775,7 @@ class OpenStackService:
                 except Exception as e:
                     logger.warning(f"删除临时文件失败: {e}")
 
+    @invalidates_catalog('images')
     def update_image(self, image_id: str, **kwargs) -> Dict[str, Any]:
         """更新镜像元数据"""
         try:
@@ -728,6 +787,7 @@ class OpenStackService:
             logger.error(f"更新镜像失败: {str(e)}")
             raise SDKException(f"更新镜像失败: {str(e)}")
 
+    @invalidates_catalog('images')
     def delete_image(self, image_id: str) -> bool:
         """删除镜像"""
         try:
@@ -741,6 +801,7 @@ class OpenStackService:
 
     # ==================== 规格管理 ====================
 
+    @cached_catalog('flavors')
     def list_flavors(self) -> List[Dict[str, Any]]:
         """列出实例规格"""
         try:
@@ -751,6 +812,7 @@ class OpenStackService:
             logger.error(f"列出实例规格失败: {str(e)}")
             return []
 
+    @cached_catalog('flavors')
     def get_flavor(self, flavor_id: str) -> Optional[Dict[str, Any]]:
         """获取实例规格详情"""
         try:
@@ -855,7 +917,7 @@ class OpenStackService:
             return False
 
     def create_server_from_volume(self, name: str, volume_id: str, flavor_id: str,
-                                  network_ids: List[str], **kwargs) -> Optional[Dict[str, Any]]:
+                                  network_ids: List[str], wait: bool = True, **kwargs) -> Optional[Dict[str, Any]]:
         """从现有卷创建服务器实例
         
         使用现有卷作为启动盘，不创建新卷。
@@ -886,7 +948,8 @@ class OpenStackService:
             )
             
             # 等待服务器创建完成
-            conn.compute.wait_for_server(server)
+            if wait:
+                conn.compute.wait_for_server(server)
             
             logger.info(f"从卷创建服务器成功: {name} ({server.id})")
             return server.to_dict()
@@ -896,7 +959,7 @@ class OpenStackService:
 
     def create_server_from_snapshot(self, name: str, snapshot_id: str, flavor_id: str,
                                     network_ids: List[str], volume_size: int = None,
-                                    **kwargs) -> Optional[Dict[str, Any]]:
+                                    wait: bool = True, **kwargs) -> Optional[Dict[str, Any]]:
         """从卷快照创建服务器实例
         
         从快照恢复创建新卷作为启动盘（这是OpenStack机制，无法避免）。
@@ -938,7 +1001,8 @@ class OpenStackService:
             )
             
             # 等待服务器创建完成
-            conn.compute.wait_for_server(server)
+            if wait:
+                conn.compute.wait_for_server(server)
             
             logger.info(f"从卷快照创建服务器成功: {name} ({server.id})")
             return server.to_dict()
@@ -949,6 +1013,7 @@ class OpenStackService:
     # ==================== 网络管理 ====================
 
 
+    @cached_catalog('networks')
     def list_networks(self, project_id: str = None) -> List[Dict[str, Any]]:
         """列出网络"""
         try:
@@ -1011,6 +1076,7 @@ class OpenStackService:
             return None
 
 
+    @invalidates_catalog('networks')
     def create_network(self, name: str, project_id: str = None, **kwargs) -> Dict[str, Any]:
         """创建网络"""
         try:
@@ -1111,6 +1177,7 @@ class OpenStackService:
 
     # ==================== 安全组管理 ====================
 
+    @cached_catalog('security_groups')
     def list_security_groups(self, project_id: str = None) -> List[Dict[str, Any]]:
         """列出安全组"""
         try:
@@ -1134,6 +1201,7 @@ class OpenStackService:
             logger.error(f"获取安全组详情失败: {str(e)}")
             return None
 
+    @invalidates_catalog('security_groups')
     def create_security_group(self, name: str, description: str = "", project_id: str = None) -> Dict[str, Any]:
         """创建安全组"""
         try:
@@ -1149,6 +1217,7 @@ class OpenStackService:
             logger.error(f"创建安全组失败: {str(e)}")
             raise SDKException(f"创建安全组失败: {str(e)}")
 
+    @invalidates_catalog('security_groups')
     def delete_security_group(self, sg_id: str) -> bool:
         """删除安全组"""
         try:
@@ -1160,6 +1229,7 @@ class OpenStackService:
             logger.error(f"删除安全组失败: {str(e)}")
             return False
 
+    @invalidates_catalog('security_groups')
     def create_security_group_rule(self, sg_id: str, **kwargs) -> Dict[str, Any]:
         """创建安全组规则"""
         try:
@@ -1175,6 +1245,7 @@ class OpenStackService:
             logger.error(f"创建安全组规则失败: {str(e)}")
             raise SDKException(f"创建安全组规则失败: {str(e)}")
 
+    @invalidates_catalog('security_groups')
     def delete_security_group_rule(self, rule_id: str) -> bool:
         """删除安全组规则"""
         try:
@@ -1459,6 +1530,21 @@ class OpenStackService:
             logger.error(f"获取服务器指标失败: {str(e)}")
             return {}
 
+    def get_server_diagnostics(self, server_id: str) -> Optional[Dict[str, Any]]:
+        """获取服务器诊断数据（原始响应，兼容 2.48 前后两种格式），失败返回 None"""
+        try:
+            conn = self.get_connection()
+            if conn is None:
+                return None
+            response = conn.compute.get(f'/servers/{server_id}/diagnostics')
+            if response.status_code != 200:
+                logger.warning(f"获取服务器 {server_id} 诊断数据失败: HTTP {response.status_code}")
+                return None
+            return response.json()
+        except Exception as e:
+            logger.warning(f"获取服务器 {server_id} 诊断数据失败: {str(e)}")
+            return None
+
     def get_project_resource_summary(self, project_id: str) -> Dict[str, Any]:
         """获取项目资源汇总信息"""
         try:
@@ -1526,6 +1612,7 @@ class OpenStackService:
 
     # ==================== 快照与恢复 ====================
 
+    @invalidates_catalog('images')
     def create_server_snapshot(self, server_id: str, name: str, wait: bool = True, timeout: int = 300) -> Optional[str]:
         """创建服务器快照
         
@@ -1569,6 +1656,7 @@ class OpenStackService:
             logger.error(f"创建快照失败: {str(e)}")
             raise SDKException(f"创建快照失败: {str(e)}")
 
+    @invalidates_catalog('images')
     def delete_image(self, image_id: str) -> bool:
         """删除镜像/快照"""
         try:
@@ -1622,11 +1710,24 @@ class OpenStackService:
 
 # 全局OpenStack服务实例
 openstack_service = None
+_service_lock = threading.Lock()
 
 
 def get_openstack_service() -> OpenStackService:
-    """获取OpenStack服务实例（单例模式）"""
+    """获取OpenStack服务实例（单例，内部按线程从连接池借出连接）"""
     global openstack_service
     if openstack_service is None:
-        openstack_service = OpenStackService()
+        with _service_lock:
+            if openstack_service is None:
+                openstack_service = OpenStackService()
     return openstack_service
+
+
+def release_thread_connection(**kwargs):
+    """请求/任务结束时归还当前线程借出的连接"""
+    if openstack_service is not None:
+        openstack_service.release_connection()
+
+
+request_finished.connect(release_thread_connection, dispatch_uid='openstack_release_on_request_finished')
+task_postrun.connect(release_thread_connection, dispatch_uid='openstack_release_on_task_postrun')
@@ -614,7 +614,8 @@ class OpenStackServerViewSet(ViewSet):
     def _sync_vm_status_from_openstack(self, openstack_id):
         """从OpenStack同步单个VM的状态到数据库"""
         try:
-            from apps.information_systems.models import VirtualMachine
+            from apps.information_systems.metering import record_transition
+            from apps.information_systems.models import VirtualMachine, VMStatusTransition
             from channels.layers import get_channel_layer
             from asgiref.sync import async_to_sync
             
@@ -646,6 +647,7 @@ class OpenStackServerViewSet(ViewSet):
                 if old_status != new_status:
                     vm.status = new_status
                     vm.save(update_fields=['status'])
+                    record_transition(vm, old_status, new_status, VMStatusTransition.Source.SYNC)
                     logger.info(f"已同步VM {vm.name} 状态: {old_status} -> {new_status}")
                     
                     # 【WebSocket推送】通过WebSocket实时推送状态变化
@@ -677,7 +679,6 @@ class OpenStackServerViewSet(ViewSet):
     def batch_action(self, request):
         """批量操作VM"""
         try:
-            service = get_openstack_service()
             action_type = request.data.get('action')  # start, stop, reboot, delete
             vm_ids = request.data.get('vm_ids', [])
             
@@ -687,33 +688,13 @@ class OpenStackServerViewSet(ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            results = {
-                'success': [],
-                'failed': [],
-                'total': len(vm_ids)
-            }
-            
-            for vm_id in vm_ids:
-                try:
-                    if action_type == 'start':
-                        success = service.start_server(vm_id)
-                    elif action_type == 'stop':
-                        success = service.stop_server(vm_id)
-                    elif action_type == 'reboot':
-                        reboot_type = request.data.get('reboot_type', 'SOFT')
-                        success = service.reboot_server(vm_id, reboot_type)
-                    elif action_type == 'delete':
-                        success = service.delete_server(vm_id)
-                    else:
-                        results['failed'].append({'id': vm_id, 'error': '未知操作类型'})
-                        continue
-                    
-                    if success:
-                        results['success'].append(vm_id)
-                    else:
-                        results['failed'].append({'id': vm_id, 'error': '操作失败'})
-                except Exception as e:
-                    results['failed'].append({'id': vm_id, 'error': str(e)})
+            # 并发提交全部操作后统一等待完成
+            from .executor import run_server_actions
+            results = run_server_actions(
+                action_type,
+                vm_ids,
+                reboot_type=request.data.get('reboot_type', 'SOFT')
+            )
             
             return Response({
                 'message': f'批量操作完成: 成功{len(results["success"])}个，失败{len(results["failed"])}个',
@@ -1480,8 +1461,13 @@ class SecurityGroupViewSet(ViewSet):
 def network_traffic_stats(request):
     """获取网络流量统计（Phase 4）"""
     try:
-        from apps.monitoring.models import VMMetricHistory
-        from django.db.models import Avg, Sum, Max
+        from apps.monitoring.models import VMMetricRollup
+        from apps.monitoring.rollup import (
+            RESOLUTION_SECONDS, choose_resolution, floor_bucket, query_series, raw_rows
+        )
+        from apps.information_systems.models import VirtualMachine
+        from django.db.models import Sum, F
+        from django.utils import timezone
         from datetime import datetime, timedelta
         
         # 获取参数
@@ -1489,51 +1475,66 @@ def network_traffic_stats(request):
         hours = int(request.query_params.get('hours', 24))
         
         # 计算时间范围
-        end_time = datetime.now()
+        end_time = timezone.now()
         start_time = end_time - timedelta(hours=hours)
+        resolution = choose_resolution(start_time, end_time)
         
-        # 查询指标
-        queryset = VMMetricHistory.objects.filter(
-            timestamp__gte=start_time,
-            timestamp__lte=end_time
-        )
+        # 聚合数据：已聚合的时间段读降采样表（按样本数加权），其余部分读原始数据
+        totals = {}
+        covered_until = start_time
+        if resolution != 'raw':
+            rollups = VMMetricRollup.objects.filter(
+                resolution=resolution,
+                bucket__gte=floor_bucket(start_time, resolution),
+                bucket__lte=end_time
+            )
+            if vm_id:
+                rollups = rollups.filter(virtual_machine_id=vm_id)
+            for row in rollups.values('virtual_machine_id').annotate(
+                samples=Sum('sample_count'),
+                sum_in=Sum(F('network_in_avg') * F('sample_count')),
+                sum_out=Sum(F('network_out_avg') * F('sample_count')),
+            ):
+                totals[row['virtual_machine_id']] = [row['samples'] or 0, row['sum_in'] or 0, row['sum_out'] or 0]
+            latest = rollups.order_by('-bucket').values_list('bucket', flat=True).first()
+            if latest is not None:
+                covered_until = latest + timedelta(seconds=RESOLUTION_SECONDS[resolution])
         
-        if vm_id:
-            queryset = queryset.filter(virtual_machine_id=vm_id)
+        for row_vm_id, _, _, _, network_in, network_out in raw_rows(covered_until, end_time, vm_id):
+            total = totals.setdefault(row_vm_id, [0, 0, 0])
+            total[0] += 1
+            total[1] += network_in or 0
+            total[2] += network_out or 0
         
-        # 聚合数据
-        stats = queryset.values('virtual_machine_id', 'virtual_machine__name').annotate(
-            avg_network_in=Avg('network_in_rate'),
-            avg_network_out=Avg('network_out_rate'),
-            total_network_in=Sum('network_in_rate'),
-            total_network_out=Sum('network_out_rate')
-        )
+        vm_names = dict(VirtualMachine.objects.filter(id__in=totals.keys()).values_list('id', 'name'))
         
         # 格式化结果
         result = []
-        for stat in stats:
+        for stat_vm_id, (samples, sum_in, sum_out) in totals.items():
+            avg_network_in = sum_in / samples if samples else 0
+            avg_network_out = sum_out / samples if samples else 0
             result.append({
-                'vm_id': stat['virtual_machine_id'],
-                'vm_name': stat['virtual_machine__name'],
+                'vm_id': stat_vm_id,
+                'vm_name': vm_names.get(stat_vm_id),
                 # network_in_rate and network_out_rate are in KB/s, convert to Mbps
-                'avg_rx_mbps': round((stat['avg_network_in'] or 0) / 1024, 2),
-                'avg_tx_mbps': round((stat['avg_network_out'] or 0) / 1024, 2),
+                'avg_rx_mbps': round(avg_network_in / 1024, 2),
+                'avg_tx_mbps': round(avg_network_out / 1024, 2),
                 # For total, we approximate using average * duration
-                'total_rx_gb': round((stat['avg_network_in'] or 0) * hours * 3600 / 1024 / 1024, 2),
-                'total_tx_gb': round((stat['avg_network_out'] or 0) * hours * 3600 / 1024 / 1024, 2)
+                'total_rx_gb': round(avg_network_in * hours * 3600 / 1024 / 1024, 2),
+                'total_tx_gb': round(avg_network_out * hours * 3600 / 1024 / 1024, 2)
             })
         
-        # 获取时间序列数据（用于图表）
+        # 获取时间序列数据（用于图表），点数与时间范围长短无关
         time_series = []
         if vm_id:
-            # 获取最近的记录用于绘制趋势图
-            recent_metrics = queryset.filter(virtual_machine_id=vm_id).order_by('-timestamp')[:50]
-            for metric in reversed(list(recent_metrics)):
+            _, points = query_series(vm_id, start_time, end_time, resolution)
+            time_format = '%H:%M:%S' if resolution in ('raw', '5m') else '%m-%d %H:%M'
+            for point in points:
                 time_series.append({
-                    'time': metric.timestamp.strftime('%H:%M:%S'),
+                    'time': timezone.localtime(datetime.fromisoformat(point['timestamp'])).strftime(time_format),
                     # network_in_rate and network_out_rate are in KB/s, convert to Mbps
-                    'rx_mbps': round((metric.network_in_rate or 0) / 1024, 2),
-                    'tx_mbps': round((metric.network_out_rate or 0) / 1024, 2)
+                    'rx_mbps': round((point['network_in'] or 0) / 1024, 2),
+                    'tx_mbps': round((point['network_out'] or 0) / 1024, 2)
                 })
         
         return Response({
@@ -1542,6 +1543,7 @@ def network_traffic_stats(request):
                 'end': end_time.isoformat(),
                 'hours': hours
             },
+            'resolution': resolution,
             'stats': result,
             'time_series': time_series
         })
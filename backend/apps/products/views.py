@@ -84,37 +84,8 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """获取产品统计信息"""
-        total_products = Product.objects.count()
-        active_products = Product.objects.filter(status=Product.Status.ACTIVE).count()
-        inactive_products = Product.objects.filter(status=Product.Status.INACTIVE).count()
-        draft_products = Product.objects.filter(status=Product.Status.DRAFT).count()
-
-        # 按产品类型统计
-        product_types = {}
-        for product_type in Product.ProductType.choices:
-            count = Product.objects.filter(
-                product_type=product_type[0],
-                status=Product.Status.ACTIVE
-            ).count()
-            product_types[str(product_type[1])] = count
-
-        # 按定价模型统计
-        pricing_models = {}
-        for pricing_model in Product.PricingModel.choices:
-            count = Product.objects.filter(
-                pricing_model=pricing_model[0],
-                status=Product.Status.ACTIVE
-            ).count()
-            pricing_models[str(pricing_model[1])] = count
-
-        return Response({
-            'total_products': total_products,
-            'active_products': active_products,
-            'inactive_products': inactive_products,
-            'draft_products': draft_products,
-            'product_types': product_types,
-            'pricing_models': pricing_models
-        })
+        from ..monitoring.dashboard import get_dashboard_section
+        return Response(get_dashboard_section('products'))
 
 
 class DiscountLevelViewSet(viewsets.ModelViewSet):
@@ -307,48 +278,8 @@ class ProductSubscriptionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """获取订阅统计信息"""
-        total_subscriptions = ProductSubscription.objects.count()
-        pending_subscriptions = ProductSubscription.objects.filter(
-            status=ProductSubscription.SubscriptionStatus.PENDING
-        ).count()
-        active_subscriptions = ProductSubscription.objects.filter(
-            status=ProductSubscription.SubscriptionStatus.ACTIVE
-        ).count()
-        suspended_subscriptions = ProductSubscription.objects.filter(
-            status=ProductSubscription.SubscriptionStatus.SUSPENDED
-        ).count()
-        terminated_subscriptions = ProductSubscription.objects.filter(
-            status=ProductSubscription.SubscriptionStatus.TERMINATED
-        ).count()
-
-        # 按产品类型统计订阅
-        subscription_by_product = {}
-        for product in Product.objects.all():
-            count = ProductSubscription.objects.filter(
-                product=product,
-                status=ProductSubscription.SubscriptionStatus.ACTIVE
-            ).count()
-            subscription_by_product[product.name] = count
-
-        # 按租户统计订阅
-        subscription_by_tenant = {}
-        from ..tenants.models import Tenant
-        for tenant in Tenant.objects.all():
-            count = ProductSubscription.objects.filter(
-                tenant=tenant,
-                status=ProductSubscription.SubscriptionStatus.ACTIVE
-            ).count()
-            subscription_by_tenant[tenant.name] = count
-
-        return Response({
-            'total_subscriptions': total_subscriptions,
-            'pending_subscriptions': pending_subscriptions,
-            'active_subscriptions': active_subscriptions,
-            'suspended_subscriptions': suspended_subscriptions,
-            'terminated_subscriptions': terminated_subscriptions,
-            'subscription_by_product': subscription_by_product,
-            'subscription_by_tenant': subscription_by_tenant
-        })
+        from ..monitoring.dashboard import get_dashboard_section
+        return Response(get_dashboard_section('subscriptions'))
 
 
 class PricingTierViewSet(viewsets.ModelViewSet):
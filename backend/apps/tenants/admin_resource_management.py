@@ -10,7 +10,8 @@ from django.utils import timezone
 from django.db import transaction
 import logging
 
-from ..information_systems.models import InformationSystem, VirtualMachine, VMOperationLog
+from ..information_systems.metering import record_transition
+from ..information_systems.models import InformationSystem, VirtualMachine, VMOperationLog, VMStatusTransition
 from ..tenants.models import Tenant
 from ..openstack.services import get_openstack_service
 
@@ -225,6 +226,7 @@ def admin_create_virtual_machine(request):
                 vm.status = VirtualMachine.VMStatus.STOPPED  # 创建中
             
             vm.save()
+            record_transition(vm, '', vm.status, VMStatusTransition.Source.CONTROL)
             
             logger.info(f"管理员 {request.user.username} 为租户 {system.tenant.name} 创建虚拟机: {vm.name} (OpenStack ID: {vm.openstack_id})")
             
@@ -295,9 +297,11 @@ def admin_start_virtual_machine(request, vm_id):
                     }, status=status.HTTP_400_BAD_REQUEST)
             
             # 更新虚拟机状态
+            old_status = vm.status
             vm.status = VirtualMachine.VMStatus.RUNNING
             vm.last_start_time = timezone.now()
             vm.save()
+            record_transition(vm, old_status, vm.status, VMStatusTransition.Source.CONTROL, vm.last_start_time)
             
             # 记录操作日志
             VMOperationLog.objects.create(
@@ -352,18 +356,22 @@ def admin_start_information_system(request, system_id):
                 'error': '信息系统已在运行状态'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # 启动所有关联的服务器资源
-        openstack_service = get_openstack_service()
-        for resource in system.resources.filter(
-            openstack_resource_type='server',
-            status='inactive'
-        ):
-            if resource.openstack_resource_id:
-                success = openstack_service.start_server(resource.openstack_resource_id)
-                if success:
-                    resource.status = SystemResource.ResourceStatus.ACTIVE
-                    resource.start_time = timezone.now()
-                    resource.save()
+        # 并发启动所有关联的服务器资源
+        from ..openstack.executor import run_server_actions
+        resources = [
+            resource for resource in system.resources.filter(
+                openstack_resource_type='server',
+                status='inactive'
+            )
+            if resource.openstack_resource_id
+        ]
+        results = run_server_actions('start', [resource.openstack_resource_id for resource in resources])
+        started_ids = set(results['success'])
+        for resource in resources:
+            if resource.openstack_resource_id in started_ids:
+                resource.status = SystemResource.ResourceStatus.ACTIVE
+                resource.start_time = timezone.now()
+                resource.save()
         
         # 更新信息系统状态
         system.status = InformationSystem.Status.RUNNING
@@ -470,8 +478,11 @@ def admin_stop_virtual_machine(request, vm_id):
                     }, status=status.HTTP_400_BAD_REQUEST)
             
             # 更新虚拟机状态
+            old_status = vm.status
             vm.status = VirtualMachine.VMStatus.STOPPED
+            vm.last_stop_time = timezone.now()
             vm.save()
+            record_transition(vm, old_status, vm.status, VMStatusTransition.Source.CONTROL, vm.last_stop_time)
             
             # 记录操作日志
             VMOperationLog.objects.create(
@@ -532,6 +543,7 @@ def admin_delete_virtual_machine(request, vm_id):
                 # 继续删除数据库记录
         
         # 删除数据库记录
+        record_transition(vm, vm.status, VMStatusTransition.DELETED, VMStatusTransition.Source.CONTROL)
         vm.delete()
         
         logger.info(f"管理员 {request.user.username} 删除虚拟机: {vm_name} (租户: {tenant_name})")
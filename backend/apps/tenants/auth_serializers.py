@@ -107,18 +107,15 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
     @classmethod
     def get_token(cls, user):
-        """添加自定义声明到token"""
+        """添加自定义声明到token（租户ID与角色，客户端无需再查询）"""
         token = super().get_token(user)
 
         try:
             profile = user.profile
             token['user_type'] = profile.user_type
+            token['role'] = profile.user_type
             token['user_id'] = str(user.id)
-
-            if profile.tenant:
-                token['tenant_id'] = str(profile.tenant.id)
-            else:
-                token['tenant_id'] = None
+            token['tenant_id'] = str(profile.tenant_id) if profile.tenant_id else None
 
         except UserProfile.DoesNotExist:
             pass
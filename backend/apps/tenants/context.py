@@ -0,0 +1,98 @@
+"""
+用户/租户上下文
+
+认证与权限判断需要的用户、UserProfile、租户三者一次查询加载（select_related），
+按用户 ID 短时间缓存；UserProfile、User、Tenant 保存或删除时（事务提交后）清除相关用户的缓存。
+缓存的 User 实例已填充 profile / profile.tenant 关联，request.user.profile.tenant 不再产生查询。
+
+get_tenant_context(request) 在一次请求内只解析一次，供视图与权限类共用。
+"""
+
+import logging
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_CACHE_KEY = 'tenants:user_context:{user_id}'
+CONTEXT_TTL = 60
+
+
+def load_user(user_id):
+    """
+    按 ID 加载用户（带 profile 与租户），优先读缓存
+
+    Raises:
+        User.DoesNotExist: 用户不存在
+    """
+    key = CONTEXT_CACHE_KEY.format(user_id=user_id)
+    user = cache.get(key)
+    if user is None:
+        # 密码哈希不进入缓存
+        user = User.objects.select_related('profile__tenant').defer('password').get(pk=user_id)
+        cache.set(key, user, CONTEXT_TTL)
+    return user
+
+
+def invalidate_user_context(user_ids):
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if user_ids:
+        transaction.on_commit(
+            lambda: cache.delete_many([CONTEXT_CACHE_KEY.format(user_id=user_id) for user_id in user_ids])
+        )
+
+
+class TenantContext:
+    """当前用户的租户与角色"""
+
+    def __init__(self, user):
+        self.user = user
+        try:
+            self.profile = user.profile
+        except (AttributeError, ObjectDoesNotExist):
+            self.profile = None
+        self.tenant = self.profile.tenant if self.profile else None
+
+    @property
+    def tenant_id(self):
+        return self.profile.tenant_id if self.profile else None
+
+    @property
+    def role(self):
+        return self.profile.user_type if self.profile else None
+
+    @property
+    def is_admin(self):
+        return self.profile is not None and self.profile.is_admin
+
+    @property
+    def is_tenant_user(self):
+        return self.profile is not None and self.profile.is_tenant_user
+
+    @property
+    def is_active(self):
+        return self.profile is not None and self.profile.is_active
+
+
+def _with_relations(user):
+    """未经 CachedJWTAuthentication 认证的用户（如 Session 认证）换成缓存中带关联的实例"""
+    if not getattr(user, 'is_authenticated', False) or 'profile' in user._state.fields_cache:
+        return user
+    try:
+        return load_user(user.pk)
+    except User.DoesNotExist:
+        return user
+
+
+def get_tenant_context(request):
+    """当前请求的租户上下文（每个请求只解析一次）"""
+    raw = getattr(request, '_request', request)
+    user = request.user
+    cached = getattr(raw, '_tenant_context', None)
+    # 请求中途切换了用户（如 force_authenticate）时重新解析
+    if cached is None or cached[0] is not user:
+        cached = (user, TenantContext(_with_relations(user)))
+        raw._tenant_context = cached
+    return cached[1]
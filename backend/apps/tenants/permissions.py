@@ -3,7 +3,7 @@
 """
 
 from rest_framework import permissions
-from .user_models import UserProfile
+from .context import get_tenant_context
 
 
 class IsAdminUser(permissions.BasePermission):
@@ -13,11 +13,8 @@ class IsAdminUser(permissions.BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
 
-        try:
-            profile = request.user.profile
-            return profile.is_admin and profile.is_active
-        except UserProfile.DoesNotExist:
-            return False
+        context = get_tenant_context(request)
+        return context.is_admin and context.is_active
 
 
 class IsTenantUser(permissions.BasePermission):
@@ -27,11 +24,8 @@ class IsTenantUser(permissions.BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
 
-        try:
-            profile = request.user.profile
-            return profile.is_tenant_user and profile.is_active
-        except UserProfile.DoesNotExist:
-            return False
+        context = get_tenant_context(request)
+        return context.is_tenant_user and context.is_active
 
 
 class IsAdminOrReadOnly(permissions.BasePermission):
@@ -41,17 +35,14 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
 
-        try:
-            profile = request.user.profile
-            if not profile.is_active:
-                return False
+        context = get_tenant_context(request)
+        if not context.is_active:
+            return False
 
-            if request.method in permissions.SAFE_METHODS:
-                return True
+        if request.method in permissions.SAFE_METHODS:
+            return True
 
-            return profile.is_admin
-        except UserProfile.DoesNotExist:
-            return False
+        return context.is_admin
 
 
 class IsTenantOwnerOrAdmin(permissions.BasePermission):
@@ -61,17 +52,15 @@ class IsTenantOwnerOrAdmin(permissions.BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
 
-        try:
-            profile = request.user.profile
-            if not profile.is_active:
-                return False
+        context = get_tenant_context(request)
+        if not context.is_active:
+            return False
 
-            if profile.is_admin:
-                return True
+        if context.is_admin:
+            return True
 
-            if hasattr(obj, 'tenant'):
-                return obj.tenant == profile.tenant
+        # 比较外键值，不加载对象的租户
+        if hasattr(obj, 'tenant_id'):
+            return obj.tenant_id == context.tenant_id
 
-            return False
-        except UserProfile.DoesNotExist:
-            return False
\ No newline at end of file
+        return False
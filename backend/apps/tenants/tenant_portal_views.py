@@ -15,9 +15,10 @@ from contextlib import contextmanager
 import logging
 import random
 
+from .context import get_tenant_context
 from .models import Tenant, Stakeholder
-from .user_models import UserProfile
-from ..information_systems.models import InformationSystem, VirtualMachine, VMOperationLog
+from ..information_systems.metering import record_transition
+from ..information_systems.models import InformationSystem, VirtualMachine, VMOperationLog, VMStatusTransition
 from ..products.models import Product, ProductSubscription
 from ..services.models import Service, ServiceSubscription
 from ..openstack.services import get_openstack_service
@@ -61,7 +62,7 @@ def vm_operation_lock(vm_id, timeout=60):
         cache.delete(lock_key)
 
 
-def push_vm_status_update(vm, action=None, operating=False):
+def push_vm_status_update(vm, action=None, operating=False, job=None):
     """
     通过 WebSocket 推送 VM 状态更新
     
@@ -69,6 +70,7 @@ def push_vm_status_update(vm, action=None, operating=False):
         vm: VirtualMachine 实例
         action: 正在执行的操作（start/stop/reboot等）
         operating: 是否正在操作中
+        job: 关联的异步任务 VMOperationJob（推送任务进度时传入）
     """
     try:
         from channels.layers import get_channel_layer
@@ -91,6 +93,15 @@ def push_vm_status_update(vm, action=None, operating=False):
             'action': action,
             'timestamp': timezone.now().isoformat(),
         }
+        if job is not None:
+            message['job'] = {
+                'id': str(job.id),
+                'type': job.job_type,
+                'status': job.status,
+                'progress': job.progress,
+                'message': job.message,
+                'error': job.error_message,
+            }
         
         # 推送到租户组
         async_to_sync(channel_layer.group_send)(
@@ -208,20 +219,18 @@ def get_default_network(tenant):
         return None
 
 
-def get_user_tenant(user):
-    """获取用户关联的租户"""
+def get_user_tenant(request):
+    """获取当前用户关联的租户（来自请求的租户上下文，缓存命中时不查询数据库）"""
     try:
-        logger.info(f"获取用户租户: user={user}, user.id={user.id}")
-        profile = user.profile
-        logger.info(f"用户profile: profile_id={profile.id}, tenant={profile.tenant}")
-        if profile.tenant:
-            return profile.tenant
+        context = get_tenant_context(request)
+        if context.profile is None:
+            # 如果用户没有profile，返回None
+            logger.error(f"用户{request.user.username}没有profile")
+            return None
+        if context.tenant:
+            return context.tenant
         # 如果用户profile没有租户，返回None
-        logger.warning(f"用户{user.username}的profile没有关联租户")
-        return None
-    except UserProfile.DoesNotExist:
-        # 如果用户没有profile，返回None
-        logger.error(f"用户{user.username}没有profile")
+        logger.warning(f"用户{request.user.username}的profile没有关联租户")
         return None
     except Exception as e:
         logger.error(f"获取用户租户异常: {str(e)}", exc_info=True)
@@ -233,7 +242,7 @@ def get_user_tenant(user):
 def tenant_profile(request):
     """获取当前租户的基本信息和干系人信息"""
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
 
         if not tenant:
             return Response({'error': '未找到租户信息，请联系管理员'}, status=status.HTTP_404_NOT_FOUND)
@@ -284,7 +293,7 @@ def tenant_profile(request):
 def tenant_systems_overview(request):
     """获取租户的信息系统概览"""
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
 
         if not tenant:
             return Response({'error': '未找到租户信息'}, status=status.HTTP_404_NOT_FOUND)
@@ -338,7 +347,7 @@ def tenant_systems_overview(request):
 def tenant_orders(request):
     """获取租户的订单信息 - 包括虚拟机、存储、网络等资源"""
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
 
         if not tenant:
             return Response({'error': '未找到租户信息'}, status=status.HTTP_404_NOT_FOUND)
@@ -420,12 +429,60 @@ def tenant_orders(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _submit_restart_job(request, tenant, vm_id):
+    """校验并提交虚拟机重启异步任务"""
+    from ..information_systems.jobs import submit_vm_job, VMJobConflictError
+    from ..information_systems.models import VMOperationJob
+
+    try:
+        vm = VirtualMachine.objects.select_related('information_system__tenant').get(id=vm_id)
+    except VirtualMachine.DoesNotExist:
+        return Response({'error': '虚拟机不存在'}, status=status.HTTP_404_NOT_FOUND)
+
+    if vm.information_system.tenant != tenant:
+        return Response({'error': '无权操作此资源'}, status=status.HTTP_403_FORBIDDEN)
+    if not vm.openstack_id:
+        return Response({
+            'error': '虚拟机未绑定 OpenStack 实例，无法执行操作'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if vm.status == VirtualMachine.VMStatus.STOPPED:
+        return Response({
+            'error': '虚拟机已停止，无法重启，请先启动'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if vm.status == VirtualMachine.VMStatus.ERROR:
+        return Response({
+            'error': '虚拟机处于错误状态，无法重启，请联系管理员'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        job = submit_vm_job(
+            VMOperationJob.JobType.REBOOT,
+            vm=vm,
+            params={'reboot_type': 'SOFT', 'ip_address': request.META.get('REMOTE_ADDR')},
+            user=request.user
+        )
+    except VMJobConflictError as e:
+        logger.warning(f"VM 操作冲突: {str(e)}")
+        return Response({'error': str(e)}, status=409)
+
+    return Response({
+        'success': True,
+        'message': f'虚拟机 {vm.name} 重启任务已提交',
+        'job_id': str(job.id),
+        'resource_id': vm_id,
+        'resource_type': 'vm',
+        'action': 'restart',
+        'status': vm.status,
+        'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+    }, status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def control_resource(request):
     """控制资源的启停 - 通过 OpenStack API"""
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
         if not tenant:
             return Response({'error': '未找到租户信息'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -436,6 +493,10 @@ def control_resource(request):
         if not all([resource_id, resource_type, action]):
             return Response({'error': '缺少必要参数'}, status=status.HTTP_400_BAD_REQUEST)
 
+        # 重启耗时较长，提交异步任务后立即返回
+        if resource_type == 'vm' and action == 'restart':
+            return _submit_restart_job(request, tenant, resource_id)
+
         # 处理虚拟机控制
         if resource_type == 'vm':
             try:
@@ -534,6 +595,7 @@ def control_resource(request):
                         # 保存虚拟机状态
                         if operation_success:
                             vm.save()
+                            record_transition(vm, current_status, vm.status, VMStatusTransition.Source.CONTROL)
                             # 推送最终状态到前端
                             push_vm_status_update(vm)
 
@@ -626,7 +688,7 @@ def control_resource(request):
 def tenant_subscriptions(request):
     """获取租户的产品和服务订阅情况"""
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
 
         if not tenant:
             return Response({'error': '未找到租户信息'}, status=status.HTTP_404_NOT_FOUND)
@@ -678,7 +740,7 @@ def tenant_subscriptions(request):
 def create_information_system(request):
     """租户创建信息系统"""
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
 
         if not tenant:
             return Response({'error': '未找到租户信息'}, status=status.HTTP_404_NOT_FOUND)
@@ -749,7 +811,7 @@ def available_products(request):
 def subscribe_product(request):
     """订阅产品"""
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
 
         if not tenant:
             return Response({'error': '未找到租户信息'}, status=status.HTTP_404_NOT_FOUND)
@@ -793,7 +855,7 @@ def create_virtual_machine(request):
     """创建虚拟机 - 通过 OpenStack API"""
     vm = None
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
         if not tenant:
             return Response({'error': '未找到租户信息'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -936,140 +998,47 @@ def create_virtual_machine(request):
             created_by=request.user
         )
 
-        # 在 OpenStack 中创建虚拟机实例
-        logger.info(f"在 OpenStack 中创建虚拟机: {vm_name}")
+        # 提交异步创建任务：OpenStack 创建与构建状态轮询由 Celery 执行，进度通过 WebSocket 推送
+        logger.info(f"提交创建虚拟机任务: {vm_name}")
         logger.info(f"使用 flavor: {flavor.get('name')} ({flavor.get('id')})")
         logger.info(f"使用 network: {network.get('name')} ({network.get('id')})")
         logger.info(f"启动源类型: {source_type}")
 
-        try:
-            openstack_service = get_openstack_service()
-            
-            # 只有当 availability_zone 有值时才传递
-            az = data.get('availability_zone')
-            extra_kwargs = {}
-            if az:
-                extra_kwargs['availability_zone'] = az
-            
-            # 根据 source_type 调用不同的创建方法
-            if source_type in ['image', 'instance_snapshot']:
-                # 从镜像或实例快照创建
-                logger.info(f"使用 image: {image.get('name')} ({image.get('id')})")
-                server = openstack_service.create_server(
-                    name=vm_name,
-                    image_id=image.get('id'),
-                    flavor_id=flavor.get('id'),
-                    network_ids=[network.get('id')],
-                    **extra_kwargs
-                )
-            elif source_type == 'volume':
-                # 从卷创建
-                logger.info(f"从卷创建: volume_id={volume_id}")
-                server = openstack_service.create_server_from_volume(
-                    name=vm_name,
-                    volume_id=volume_id,
-                    flavor_id=flavor.get('id'),
-                    network_ids=[network.get('id')],
-                    **extra_kwargs
-                )
-            elif source_type == 'volume_snapshot':
-                # 从卷快照创建
-                logger.info(f"从卷快照创建: snapshot_id={snapshot_id}")
-                server = openstack_service.create_server_from_snapshot(
-                    name=vm_name,
-                    snapshot_id=snapshot_id,
-                    flavor_id=flavor.get('id'),
-                    network_ids=[network.get('id')],
-                    **extra_kwargs
-                )
-            else:
-                raise Exception(f"不支持的启动源类型: {source_type}")
-
-            # 更新虚拟机的 OpenStack ID 和网络信息
-            vm.openstack_id = server.get('id')
-
-            # 获取分配的 IP 地址
-            addresses = server.get('addresses', {})
-            if addresses:
-                # 获取第一个网络的第一个 IP 地址
-                for network_name, addr_list in addresses.items():
-                    if addr_list and len(addr_list) > 0:
-                        vm.ip_address = addr_list[0].get('addr')
-                        if 'OS-EXT-IPS-MAC:mac_addr' in addr_list[0]:
-                            vm.mac_address = addr_list[0].get('OS-EXT-IPS-MAC:mac_addr')
-                        break
-
-            # 根据 OpenStack 返回的状态更新虚拟机状态
-            openstack_status = server.get('status', '').upper()
-            if openstack_status == 'ACTIVE':
-                vm.status = VirtualMachine.VMStatus.RUNNING
-                vm.last_start_time = timezone.now()
-            elif openstack_status == 'SHUTOFF':
-                vm.status = VirtualMachine.VMStatus.STOPPED
-            elif openstack_status == 'ERROR':
-                vm.status = VirtualMachine.VMStatus.ERROR
-
-            vm.save()
-
-            # 记录操作日志
-            VMOperationLog.objects.create(
-                virtual_machine=vm,
-                operation_type='create',
-                operator=request.user,
-                operation_detail=f'在 OpenStack 中创建虚拟机 {vm.name}，实例ID: {vm.openstack_id}',
-                success=True
-            )
-            
-            # 记录活动日志（用于Dashboard显示）
-            try:
-                from apps.monitoring.models import ActivityLog
-                ActivityLog.log_activity(
-                    action_type='create',
-                    description=f'{request.user.username} 创建了虚拟机 {vm.name}',
-                    user=request.user,
-                    ip_address=request.META.get('REMOTE_ADDR')
-                )
-            except Exception as e:
-                logger.warning(f'记录活动日志失败: {str(e)}')
-
-            logger.info(f"虚拟机创建成功: {vm.name} (OpenStack ID: {vm.openstack_id})")
-
-            return Response({
-                'success': True,
-                'message': '虚拟机创建成功',
-                'vm': {
-                    'id': str(vm.id),
-                    'name': vm.name,
-                    'cpu_cores': vm.cpu_cores,
-                    'memory_gb': vm.memory_gb,
-                    'disk_gb': vm.disk_gb,
-                    'ip_address': vm.ip_address or '分配中',
-                    'mac_address': vm.mac_address or '分配中',
-                    'status': vm.status,
-                    'status_display': vm.get_status_display(),
-                    'openstack_id': vm.openstack_id
-                }
-            }, status=status.HTTP_201_CREATED)
-
-        except Exception as openstack_error:
-            # OpenStack 创建失败，删除数据库记录
-            logger.error(f"OpenStack 创建虚拟机失败: {str(openstack_error)}")
-
-            # 记录失败日志
-            VMOperationLog.objects.create(
-                virtual_machine=vm,
-                operation_type='create',
-                operator=request.user,
-                operation_detail=f'在 OpenStack 中创建虚拟机失败: {str(openstack_error)}',
-                success=False
-            )
-
-            # 删除数据库记录
-            vm.delete()
+        from ..information_systems.jobs import submit_vm_job
+        from ..information_systems.models import VMOperationJob
+        job = submit_vm_job(
+            VMOperationJob.JobType.CREATE,
+            vm=vm,
+            params={
+                'source_type': source_type,
+                'image_id': image.get('id') if image else None,
+                'volume_id': volume_id,
+                'snapshot_id': snapshot_id,
+                'flavor_id': flavor.get('id'),
+                'network_id': network.get('id'),
+                'availability_zone': data.get('availability_zone') or '',
+                'ip_address': request.META.get('REMOTE_ADDR'),
+            },
+            user=request.user
+        )
 
-            return Response({
-                'error': f'创建虚拟机失败: {str(openstack_error)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({
+            'success': True,
+            'message': '虚拟机创建任务已提交',
+            'job_id': str(job.id),
+            'vm': {
+                'id': str(vm.id),
+                'name': vm.name,
+                'cpu_cores': vm.cpu_cores,
+                'memory_gb': vm.memory_gb,
+                'disk_gb': vm.disk_gb,
+                'ip_address': '分配中',
+                'mac_address': '分配中',
+                'status': vm.status,
+                'status_display': vm.get_status_display(),
+                'openstack_id': vm.openstack_id
+            }
+        }, status=status.HTTP_202_ACCEPTED)
 
     except Exception as e:
         logger.error(f"创建虚拟机失败: {str(e)}", exc_info=True)
@@ -1092,7 +1061,7 @@ def create_virtual_machine(request):
 def get_virtual_machine_detail(request, vm_id):
     """获取虚拟机详细信息"""
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
         if not tenant:
             return Response({'error': '未找到租户信息'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -1188,6 +1157,7 @@ def delete_virtual_machine(request, vm_id):
         )
         
         # 删除本地记录
+        record_transition(vm, vm.status, VMStatusTransition.DELETED, VMStatusTransition.Source.CONTROL)
         vm.delete()
         
         return Response({'success': True, 'message': '虚拟机删除成功'})
@@ -1215,7 +1185,7 @@ def get_availability_zones(request):
 def resize_virtual_machine(request, vm_id):
     """调整虚拟机配置"""
     try:
-        tenant = get_user_tenant(request.user)
+        tenant = get_user_tenant(request)
         if not tenant:
             return Response({'error': '未找到租户信息'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -1250,22 +1220,44 @@ def resize_virtual_machine(request, vm_id):
             return Response({'error': '配置未发生变化'}, status=status.HTTP_400_BAD_REQUEST)
         
         # 查找合适的 flavor
-        from ..tenants.utils import find_suitable_flavor
         new_flavor = find_suitable_flavor(new_cpu, new_memory, new_disk)
         if not new_flavor:
             return Response({
                 'error': f'未找到合适的规格配置 (CPU:{new_cpu}核, 内存:{new_memory}GB, 磁盘:{new_disk}GB)'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # 如果有 OpenStack ID，执行 resize
+        # 如果有 OpenStack ID，提交异步 resize 任务（完成后由任务更新数据库并记录日志）
         if vm.openstack_id:
-            openstack_service = get_openstack_service()
-            success = openstack_service.resize_server(vm.openstack_id, new_flavor['id'])
+            from ..information_systems.jobs import submit_vm_job, VMJobConflictError
+            from ..information_systems.models import VMOperationJob
+            try:
+                job = submit_vm_job(
+                    VMOperationJob.JobType.RESIZE,
+                    vm=vm,
+                    params={
+                        'flavor_id': new_flavor['id'],
+                        'cpu_cores': new_cpu,
+                        'memory_gb': new_memory,
+                        'disk_gb': new_disk,
+                        'ip_address': request.META.get('REMOTE_ADDR'),
+                    },
+                    user=request.user
+                )
+            except VMJobConflictError as e:
+                return Response({'error': str(e)}, status=409)
             
-            if not success:
-                return Response({
-                    'error': 'OpenStack 配置调整失败'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({
+                'success': True,
+                'message': '虚拟机配置调整任务已提交',
+                'job_id': str(job.id),
+                'vm': {
+                    'id': str(vm.id),
+                    'name': vm.name,
+                    'cpu_cores': vm.cpu_cores,
+                    'memory_gb': vm.memory_gb,
+                    'disk_gb': vm.disk_gb
+                }
+            }, status=status.HTTP_202_ACCEPTED)
         
         # 更新数据库
         old_config = f'{vm.cpu_cores}核/{vm.memory_gb}GB/{vm.disk_gb}GB'
@@ -83,7 +83,7 @@ class UserProfile(models.Model):
 
 
 # Signal to automatically create stakeholder when UserProfile is created
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from .models import Stakeholder
 import logging
@@ -119,4 +119,23 @@ def create_stakeholder_for_user(sender, instance, created, **kwargs):
             logger.info(f"Auto-created stakeholder for user {instance.user.username} in tenant {instance.tenant.name}")
         except Exception as e:
             # Log error but don't fail user creation
-            logger.error(f"Failed to create stakeholder for user {instance.user.username}: {e}")
\ No newline at end of file
+            logger.error(f"Failed to create stakeholder for user {instance.user.username}: {e}")
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_profile_context(sender, instance, **kwargs):
+    """用户配置变更后清除该用户的上下文缓存"""
+    from .context import invalidate_user_context
+    invalidate_user_context([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_context_on_user_change(sender, instance, **kwargs):
+    from .context import invalidate_user_context
+    invalidate_user_context([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Tenant)
+def invalidate_tenant_users_context(sender, instance, **kwargs):
+    """租户变更后清除其所有用户的上下文缓存"""
+    from .context import invalidate_user_context
+    invalidate_user_context(list(UserProfile.objects.filter(tenant_id=instance.pk).values_list('user_id', flat=True)))
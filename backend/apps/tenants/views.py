@@ -167,53 +167,14 @@ class TenantViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """获取租户统计信息"""
+        from ..monitoring.dashboard import get_dashboard_section, tenant_statistics
         queryset = self.get_queryset()
 
-        # 基本统计
-        total_count = queryset.count()
-        active_count = queryset.filter(status=Tenant.Status.ACTIVE).count()
-        suspended_count = queryset.filter(status=Tenant.Status.SUSPENDED).count()
-        terminated_count = queryset.filter(status=Tenant.Status.TERMINATED).count()
-        pending_count = queryset.filter(status=Tenant.Status.PENDING).count()
-
-        # 按级别统计
-        superior_count = queryset.filter(level=Tenant.TenantLevel.SUPERIOR).count()
-        important_count = queryset.filter(level=Tenant.TenantLevel.IMPORTANT).count()
-        ordinary_count = queryset.filter(level=Tenant.TenantLevel.ORDINARY).count()
-
-        # 按类型统计
-        virtual_count = queryset.filter(tenant_type=Tenant.TenantType.VIRTUAL).count()
-        virtual_physical_count = queryset.filter(tenant_type=Tenant.TenantType.VIRTUAL_PHYSICAL).count()
-        virtual_physical_network_count = queryset.filter(tenant_type=Tenant.TenantType.VIRTUAL_PHYSICAL_NETWORK).count()
-        datacenter_cabinet_count = queryset.filter(tenant_type=Tenant.TenantType.DATACENTER_CABINET).count()
-
-        # 资源统计
-        from django.db.models import Sum
-        resource_stats = queryset.aggregate(
-            total_vcpus=Sum('quota_vcpus'),
-            total_memory=Sum('quota_memory'),
-            total_disk=Sum('quota_disk'),
-            total_instances=Sum('quota_instances')
-        )
-
-        stats_data = {
-            'total_count': total_count,
-            'active_count': active_count,
-            'suspended_count': suspended_count,
-            'terminated_count': terminated_count,
-            'pending_count': pending_count,
-            'superior_count': superior_count,
-            'important_count': important_count,
-            'ordinary_count': ordinary_count,
-            'virtual_count': virtual_count,
-            'virtual_physical_count': virtual_physical_count,
-            'virtual_physical_network_count': virtual_physical_network_count,
-            'datacenter_cabinet_count': datacenter_cabinet_count,
-            'total_vcpus': resource_stats['total_vcpus'] or 0,
-            'total_memory': resource_stats['total_memory'] or 0,
-            'total_disk': resource_stats['total_disk'] or 0,
-            'total_instances': resource_stats['total_instances'] or 0,
-        }
+        # 租户用户只统计本租户（直接查询），管理员使用缓存的全局汇总
+        if queryset.query.has_filters():
+            stats_data = tenant_statistics(queryset)
+        else:
+            stats_data = get_dashboard_section('tenants')
 
         serializer = TenantStatisticsSerializer(data=stats_data)
         serializer.is_valid(raise_exception=True)
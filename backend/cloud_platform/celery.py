@@ -26,19 +26,25 @@ app.conf.beat_schedule = {
         'schedule': crontab(hour=0, minute=10),
         'options': {'queue': 'billing'}
     },
+    # 月末出账 - 每月1日凌晨2:30为上月出账（按租户分片派发）
+    'month-close': {
+        'task': 'apps.billing.tasks.close_month',
+        'schedule': crontab(hour=2, minute=30, day_of_month=1),
+        'options': {'queue': 'billing'}
+    },
     # 资源变更检测任务 - 每小时执行一次
     'detect-resource-changes': {
         'task': 'apps.information_systems.tasks.detect_resource_changes',
         'schedule': crontab(minute=0),  # 每小时的0分执行
         'options': {'queue': 'monitoring'}
     },
-    # 虚拟机状态同步 - 每5秒执行一次
+    # 虚拟机状态同步 - 每5秒执行一次（changes-since 增量同步，定期全量对账）
     'sync-vm-status': {
         'task': 'apps.information_systems.tasks.sync_vm_status',
         'schedule': 5.0,  # 每5秒执行
         'options': {'queue': 'monitoring'}
     },
-    # 全量同步 OpenStack 虚拟机 - 每5秒执行一次
+    # 同步 OpenStack 虚拟机 - 每5秒执行一次（与上面共用水位线，同一时刻只执行一个）
     'sync-all-openstack-vms': {
         'task': 'apps.information_systems.tasks.sync_all_openstack_vms',
         'schedule': 5.0,  # 每5秒执行
@@ -60,11 +66,28 @@ app.conf.beat_schedule = {
     'collect-vm-metrics-every-5-min': {
         'task': 'collect_vm_metrics',
         'schedule': 60.0,  # 1分钟
+        'options': {'queue': 'monitoring'}
     },
     
+    # 监控数据降采样（5分钟/1小时/1天） - 每5分钟执行一次
+    'rollup-vm-metrics-every-5-min': {
+        'task': 'rollup_vm_metrics',
+        'schedule': 300.0,
+        'options': {'queue': 'monitoring'}
+    },
+
+    # 监控分区表维护（提前建分区、删除过期分区） - 每天凌晨1点执行
+    'maintain-metric-partitions-daily': {
+        'task': 'maintain_metric_partitions',
+        'schedule': crontab(hour=1, minute=0),
+        'options': {'queue': 'maintenance'}
+    },
+
+    # 清理过期监控数据（指标、健康检查记录、延迟直方图） - 每天凌晨2点执行
     'cleanup-old-metrics-daily': {
         'task': 'cleanup_old_metrics',
         'schedule': crontab(hour=2, minute=0),
+        'options': {'queue': 'maintenance'}
     },
 
     # 告警检查任务 - 每分钟执行一次
@@ -85,7 +108,10 @@ app.conf.beat_schedule = {
 
 # Celery任务配置
 app.conf.task_routes = {
+    # 虚拟机异步操作需要轮询 OpenStack 数分钟，不与计费任务共用队列（精确名称优先于通配规则）
+    'apps.information_systems.tasks.run_vm_job': {'queue': 'maintenance'},
     'apps.information_systems.tasks.*': {'queue': 'billing'},
+    'apps.billing.tasks.*': {'queue': 'billing'},
 }
 
 # 时区设置